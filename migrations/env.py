@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -10,6 +11,15 @@ target_metadata = Base.metadata
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# DATABASE_URL が設定されていればalembic.iniより優先（SQLiteでのローカル実行用）
+if os.getenv('DATABASE_URL'):
+    config.set_main_option("sqlalchemy.url", os.getenv('DATABASE_URL'))
+
+
+def is_sqlite(url: str) -> bool:
+    # SQLiteはALTER TABLEの制限があるためバッチモードでマイグレーションする
+    return url.startswith("sqlite")
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -17,7 +27,8 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
-        compare_type=True
+        compare_type=True,
+        render_as_batch=is_sqlite(url)
     )
 
     with context.begin_transaction():
@@ -36,7 +47,8 @@ def run_migrations_online() -> None:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
-            compare_type=True
+            compare_type=True,
+            render_as_batch=connection.dialect.name == "sqlite"
         )
 
         with context.begin_transaction():
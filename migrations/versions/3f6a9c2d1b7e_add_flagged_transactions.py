@@ -0,0 +1,34 @@
+"""add flagged_transactions
+
+Revision ID: 3f6a9c2d1b7e
+Revises: dc334021b2b1
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6a9c2d1b7e'
+down_revision: Union[str, None] = 'dc334021b2b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('flagged_transactions',
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('flag_type', sa.String(length=50), nullable=True),
+    sa.Column('flagged_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('transaction_id')
+    )
+    op.create_index('ix_flagged_transactions_expires_at', 'flagged_transactions', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_flagged_transactions_expires_at', table_name='flagged_transactions')
+    op.drop_table('flagged_transactions')
@@ -0,0 +1,27 @@
+"""add transaction history indexes
+
+Revision ID: c4d2a9e61f35
+Revises: 8b1e4d7a2c90
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d2a9e61f35'
+down_revision: Union[str, None] = '8b1e4d7a2c90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_from_address_timestamp', 'transactions', ['from_address', 'timestamp', 'id'], unique=False)
+    op.create_index('ix_transactions_to_address_timestamp', 'transactions', ['to_address', 'timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_to_address_timestamp', table_name='transactions')
+    op.drop_index('ix_transactions_from_address_timestamp', table_name='transactions')
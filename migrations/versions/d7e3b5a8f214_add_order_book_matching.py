@@ -0,0 +1,33 @@
+"""add order book matching
+
+Revision ID: d7e3b5a8f214
+Revises: c4d2a9e61f35
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e3b5a8f214'
+down_revision: Union[str, None] = 'c4d2a9e61f35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 0.01 PARC単位の部分約定を記録できるようにする（SQLiteはテーブルを作り直す）
+    with op.batch_alter_table('orders') as batch_op:
+        batch_op.alter_column('amount', existing_type=sa.BigInteger(), type_=sa.Float(), existing_nullable=True)
+        batch_op.alter_column('filled_amount', existing_type=sa.BigInteger(), type_=sa.Float(), existing_nullable=True)
+    op.create_index('ix_orders_book', 'orders', ['side', 'status', 'price', 'timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_book', table_name='orders')
+    with op.batch_alter_table('orders') as batch_op:
+        batch_op.alter_column('filled_amount', existing_type=sa.Float(), type_=sa.BigInteger(), existing_nullable=True)
+        batch_op.alter_column('amount', existing_type=sa.Float(), type_=sa.BigInteger(), existing_nullable=True)
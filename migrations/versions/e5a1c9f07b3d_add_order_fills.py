@@ -0,0 +1,38 @@
+"""add order fills
+
+Revision ID: e5a1c9f07b3d
+Revises: d7e3b5a8f214
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c9f07b3d'
+down_revision: Union[str, None] = 'd7e3b5a8f214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_fills',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('fee', sa.Float(), nullable=True),
+    sa.Column('source', sa.String(length=20), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_fills_order_id', 'order_fills', ['order_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_fills_order_id', table_name='order_fills')
+    op.drop_table('order_fills')
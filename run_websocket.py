@@ -1,8 +1,12 @@
+import os
+
+# APIサーバー用のDB接続プロファイル（Botとプールを分けて計測する）
+os.environ.setdefault('DB_PROFILE', 'api')
+
 import uvicorn
 from src.websocket.market_socket import app
 import asyncio
 import logging
-import os
 from datetime import datetime
 
 # ログ設定
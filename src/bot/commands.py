@@ -3,22 +3,27 @@ from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import commands
 from discord import Embed, User, Interaction, Color
-from ..database.database import SessionLocal
+from ..database.database import SessionLocal, run_db, get_pool_stats, get_db_executor_stats
 from ..utils.embed_builder import EmbedBuilder
 from ..utils.logger import Logger
 from datetime import datetime, timedelta
-from datetime import timezone
 from ..database.models import User, Wallet, Transaction, DailyStats, HistoryPaginationView, Order, PriceHistory, PriceAlert, LastTradeTimestamp
+from ..database import ledger
+from ..database.ledger import Posting, InsufficientBalance
+from ..database.trade_pipeline import trade_pipeline
+from ..utils.order_matching import execute_market_order
+from ..utils.order_lifecycle import OPEN_STATUSES, CANCELLED, escrow_jpy, refund_on_cancel
 from ..utils.config import Config
 from ..utils.config import DISCORD_ADMIN_USER_ID
 from ..utils.wallet_utils import generate_wallet_address
 from ..utils.event_types import EventTypes
-from sqlalchemy import or_, func
-from sqlalchemy.orm import joinedload
 from dotenv import load_dotenv
 from ..utils.price_predictor import PricePredictor
 from ..utils.price_calculator import PriceCalculator
 from ..utils.trading_hours import TradingHours
+from ..utils.identity_cache import identity_cache
+from ..utils.transaction_history import history_page, page_cursor, transaction_counts
+from ..utils.market_stats import market_stats
 import os
 import time
 import uuid
@@ -41,6 +46,20 @@ class ParaccoliCommands(commands.Cog):
         self.logger = Logger(__name__)
         self.start_time = datetime.now()
         self.config = Config()
+        self._background_tasks = set()  # 応答後に走らせる処理（完了まで参照を保持）
+
+    def _observe_trade_later(self, price_calculator, trade: tuple):
+        """約定した売買を市場操作の検出器へ渡す（イベントループを塞がないよう DB スレッドで実行）"""
+        async def observe():
+            try:
+                async with run_db() as db:
+                    await db.run(price_calculator.observe_trade, *trade)
+            except Exception as e:
+                self.logger.error(f"取引ストリーム検出エラー: {str(e)}")
+
+        task = asyncio.create_task(observe())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
 
     def cleanup_old_backups(self, backup_dir: str):
         """古いバックアップファイルを削除"""
@@ -131,6 +150,7 @@ class ParaccoliCommands(commands.Cog):
             db.add(bonus_tx)
             
             db.commit()
+            identity_cache.invalidate(str(interaction.user.id))
 
             # 結果表示
             embed = EmbedBuilder.success(
@@ -181,8 +201,8 @@ class ParaccoliCommands(commands.Cog):
                 return
 
             # ユーザー情報取得
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            identity = identity_cache.lookup(db, str(interaction.user.id))
+            if not identity or not identity.wallet_address:
                 await interaction.response.send_message(
                     embed=EmbedBuilder.error(
                         "ウォレットが見つかりません",
@@ -191,6 +211,7 @@ class ParaccoliCommands(commands.Cog):
                     ephemeral=True
                 )
                 return
+            user = db.get(User, identity.user_id)
 
             # 最終ログイン日時チェック
             now = datetime.now()
@@ -227,18 +248,16 @@ class ParaccoliCommands(commands.Cog):
             }
             bonus_amount = streak_bonus.get(user.login_streak, 100)
 
-            # ボーナス付与
+            # ボーナス付与とトランザクション記録
             user.last_daily = now
-            user.wallet.parc_balance += bonus_amount
-
-            # トランザクション記録
+            address = identity.wallet_address
             tx = Transaction(
-                to_address=user.wallet.address,
+                to_address=address,
                 amount=bonus_amount,
                 transaction_type="daily_bonus",
                 timestamp=now
             )
-            db.add(tx)
+            balances = ledger.apply(db, [Posting(address, parc=bonus_amount)], [tx])
             db.commit()
 
             # 結果表示
@@ -253,7 +272,7 @@ class ParaccoliCommands(commands.Cog):
             )
             embed.add_field(
                 name="💰 現在の残高",
-                value=f"{user.wallet.parc_balance} PARC",
+                value=f"{balances[address].parc} PARC",
                 inline=True
             )
             if user.login_streak < 7:
@@ -293,8 +312,8 @@ class ParaccoliCommands(commands.Cog):
 
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            identity = identity_cache.lookup(db, str(interaction.user.id))
+            if not identity or not identity.wallet_address:
                 await interaction.response.send_message(
                     embed=EmbedBuilder.error(
                         "ウォレットが見つかりません",
@@ -303,6 +322,7 @@ class ParaccoliCommands(commands.Cog):
                     ephemeral=True
                 )
                 return
+            user = db.get(User, identity.user_id)
 
             # クールダウンチェック
             now = datetime.now()
@@ -319,43 +339,44 @@ class ParaccoliCommands(commands.Cog):
                     )
                     return
 
-            # 現在のメッセージカウントを保存
-            current_messages = user.message_count
-
-            # 報酬計算
-            base_reward = min(current_messages * 2, 1000)  # 上限1000PARC
-            reward = base_reward
-
-            # トランザクション記録
-            tx = Transaction(
-                to_address=user.wallet.address,
-                amount=reward,
-                transaction_type="mining",
-                timestamp=now
-            )
-            db.add(tx)
-
-            # ウォレットの残高を更新
-            user.wallet.parc_balance += reward
-
-            # ユーザー情報更新
-            user.last_mining = now
-            user.total_mined += reward
-
-            # 統計情報更新
-            daily_stat = db.query(DailyStats)\
-                .filter(DailyStats.date == now.date())\
-                .first()
-            if daily_stat:
-                daily_stat.total_mined += reward
+            # 未反映分を取り出して報酬に含める（コミットまでに失敗したらカウンターに戻す）
+            with self.bot.message_counter.claim(str(interaction.user.id)) as unflushed:
+                # 現在のメッセージカウントを保存
+                stored_messages = user.message_count or 0
+                current_messages = stored_messages + unflushed
+
+                # 報酬計算
+                base_reward = min(current_messages * 2, 1000)  # 上限1000PARC
+                reward = base_reward
+
+                # ウォレットの残高を更新してトランザクションを記録
+                address = identity.wallet_address
+                tx = Transaction(
+                    to_address=address,
+                    amount=reward,
+                    transaction_type="mining",
+                    timestamp=now
+                )
+                balances = ledger.apply(db, [Posting(address, parc=reward)], [tx])
+
+                # ユーザー情報更新
+                user.last_mining = now
+                user.total_mined += reward
+
+                # 統計情報更新
+                daily_stat = db.query(DailyStats)\
+                    .filter(DailyStats.date == now.date())\
+                    .first()
+                if daily_stat:
+                    daily_stat.total_mined += reward
 
-            # 結果表示用の変数を保存
-            display_message_count = current_messages
+                # 結果表示用の変数を保存
+                display_message_count = current_messages
 
-            # メッセージカウントをリセット
-            user.message_count = 0
+                # メッセージカウントをリセット（読み取り後に反映された分は残す）
+                user.message_count = User.message_count - stored_messages
 
-            db.commit()
+                db.commit()
 
             # マイニング成功時のみephemeral=False
             embed = EmbedBuilder.success(
@@ -369,7 +390,7 @@ class ParaccoliCommands(commands.Cog):
             )
             embed.add_field(
                 name="💰 現在の残高",
-                value=f"{user.wallet.parc_balance:,} PARC",
+                value=f"{balances[address].parc:,} PARC",
                 inline=True
             )
             embed.add_field(
@@ -396,61 +417,61 @@ class ParaccoliCommands(commands.Cog):
         """ウォレット情報を表示"""
         await interaction.response.defer(ephemeral=True)
         
-        db = SessionLocal()
         try:
-            # トランザクションを明示的に開始
-            with db.begin():
-                # ユーザー情報取得（ウォレット情報も同時に取得）
-                user = db.query(User).options(joinedload(User.wallet)).filter(
-                    User.discord_id == str(interaction.user.id)
-                ).first()
+            # ユーザー情報取得（ウォレット情報も同時に取得）はDBスレッドで実行
+            async with run_db(commit=False) as db:
+                wallet, price = await db.run(self._load_wallet_info, str(interaction.user.id))
 
-                if not user or not user.wallet:
-                    await interaction.followup.send(
-                        embed=EmbedBuilder.error(
-                            "ウォレットが見つかりません",
-                            "まずは /register でウォレットを作成してください"
-                        )
+            if not wallet:
+                await interaction.followup.send(
+                    embed=EmbedBuilder.error(
+                        "ウォレットが見つかりません",
+                        "まずは /register でウォレットを作成してください"
                     )
-                    return
+                )
+                return
 
-                await self._display_wallet_info(interaction, user, db)
+            await self._display_wallet_info(interaction, wallet, price)
 
         except Exception as e:
             self.logger.error(f"Wallet command error: {e}", exc_info=True)
-            db.rollback()
             await interaction.followup.send(
                 embed=EmbedBuilder.error("エラー", "ウォレット情報の取得に失敗しました")
             )
-        finally:
-            db.close()
 
-    async def _display_wallet_info(self, interaction: discord.Interaction, user: User, db: Session):
-        """ウォレット情報の表示処理"""
+    @staticmethod
+    def _load_wallet_info(db: Session, discord_id: str):
+        """ウォレットと最新価格を取得"""
+        wallet = identity_cache.wallet(db, discord_id)
+
         current_price = db.query(PriceHistory)\
             .order_by(PriceHistory.timestamp.desc())\
             .first()
         
         price = current_price.price if current_price else 100.0
-        parc_value = math.floor(user.wallet.parc_balance * price)  # 小数点以下切り捨て
-        total_value = parc_value + user.wallet.jpy_balance
+        return wallet, price
+
+    async def _display_wallet_info(self, interaction: discord.Interaction, wallet: Wallet, price: float):
+        """ウォレット情報の表示処理"""
+        parc_value = math.floor(wallet.parc_balance * price)  # 小数点以下切り捨て
+        total_value = parc_value + wallet.jpy_balance
 
         embed = discord.Embed(
             title="👛 ウォレット情報",
-            description=f"アドレス: `{user.wallet.address}`",
+            description=f"アドレス: `{wallet.address}`",
             color=discord.Color.gold(),
             timestamp=datetime.now()
         )
 
         embed.add_field(
             name="🪙 PARC残高",
-            value=f"`{user.wallet.parc_balance:,}` PARC\n(¥{parc_value:,})",  # 円換算値は整数表示
+            value=f"`{wallet.parc_balance:,}` PARC\n(¥{parc_value:,})",  # 円換算値は整数表示
             inline=True
         )
 
         embed.add_field(
             name="💴 JPY残高",
-            value=f"¥`{user.wallet.jpy_balance:,}`",  # 整数表示
+            value=f"¥`{wallet.jpy_balance:,}`",  # 整数表示
             inline=True
         )
 
@@ -475,11 +496,9 @@ class ParaccoliCommands(commands.Cog):
         db = SessionLocal()
         try:
             # 送金元ユーザー情報取得
-            sender = db.query(User).filter(
-                User.discord_id == str(interaction.user.id)
-            ).first()
+            sender = identity_cache.lookup(db, str(interaction.user.id))
             
-            if not sender or not sender.wallet:
+            if not sender or not sender.wallet_address:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error(
                         "ウォレットが見つかりません",
@@ -490,23 +509,21 @@ class ParaccoliCommands(commands.Cog):
 
             # 送金先アドレスの特定
             to_address = None
+            recipient_discord_id = None
             # メンション形式の場合
             if target.startswith('<@') and target.endswith('>'):
                 discord_id = target[2:-1]
                 if (discord_id.startswith('!')):
                     discord_id = discord_id[1:]
-                recipient = db.query(User).filter(
-                    User.discord_id == discord_id
-                ).first()
-                if recipient and recipient.wallet:
-                    to_address = recipient.wallet.address
+                recipient = identity_cache.lookup(db, discord_id)
+                if recipient and recipient.wallet_address:
+                    to_address = recipient.wallet_address
+                    recipient_discord_id = discord_id
             # アドレス形式の場合
             else:
-                wallet = db.query(Wallet).filter(
-                    Wallet.address == target
-                ).first()
-                if wallet:
-                    to_address = wallet.address
+                recipient_discord_id = identity_cache.discord_id_for_address(db, target)
+                if recipient_discord_id:
+                    to_address = target
 
             if not to_address:
                 await interaction.followup.send(
@@ -527,23 +544,13 @@ class ParaccoliCommands(commands.Cog):
                 )
                 return
 
-            # 残高チェック
             fee = math.ceil(amount * 0.001)  # 0.1%の手数料
             total = amount + fee
-            
-            if sender.wallet.parc_balance < total:
-                await interaction.followup.send(
-                    embed=EmbedBuilder.error(
-                        "残高不足",
-                        f"必要金額: {total:,} PARC（手数料込み）\n"
-                        f"残高: {sender.wallet.parc_balance:,} PARC"
-                    )
-                )
-                return
+            sender_address = sender.wallet_address
 
-            # トランザクション実行
+            # トランザクション実行（残高が足りる場合だけ送金元から引き落とす）
             tx = Transaction(
-                from_address=sender.wallet.address,
+                from_address=sender_address,
                 to_address=to_address,
                 amount=amount,
                 fee=fee,
@@ -551,14 +558,22 @@ class ParaccoliCommands(commands.Cog):
                 timestamp=datetime.now(),
                 status="completed"
             )
-            db.add(tx)
-
-            # 残高更新
-            sender.wallet.parc_balance -= total
-            recipient_wallet = db.query(Wallet).filter(
-                Wallet.address == to_address
-            ).first()
-            recipient_wallet.parc_balance += amount
+            try:
+                balances = ledger.apply(
+                    db,
+                    [Posting(sender_address, parc=-total), Posting(to_address, parc=amount)],
+                    [tx]
+                )
+            except InsufficientBalance as e:
+                db.rollback()
+                await interaction.followup.send(
+                    embed=EmbedBuilder.error(
+                        "残高不足",
+                        f"必要金額: {total:,} PARC（手数料込み）\n"
+                        f"残高: {e.available:,} PARC"
+                    )
+                )
+                return
 
             db.commit()
 
@@ -581,16 +596,16 @@ class ParaccoliCommands(commands.Cog):
             )
             embed.add_field(
                 name="💳 残高",
-                value=f"{sender.wallet.parc_balance:,} PARC",
+                value=f"{balances[sender_address].parc:,} PARC",
                 inline=True
             )
             await interaction.followup.send(embed=embed)
 
             # 送金者へのDM通知
             try:
-                sender_user = await self.bot.fetch_user(int(sender.discord_id))
+                sender_user = await self.bot.fetch_user(interaction.user.id)
                 if sender_user:
-                    recipient_name = f"<@{recipient_wallet.user.discord_id}>" if recipient_wallet.user else "Unknown"
+                    recipient_name = f"<@{recipient_discord_id}>" if recipient_discord_id else "Unknown"
                     sender_dm = discord.Embed(
                         title="📤 送金完了通知",
                         description=f"{amount:,} PARCの送金が完了しました",
@@ -613,7 +628,7 @@ class ParaccoliCommands(commands.Cog):
                     )
                     sender_dm.add_field(
                         name="💰 現在の残高",
-                        value=f"{sender.wallet.parc_balance:,} PARC",
+                        value=f"{balances[sender_address].parc:,} PARC",
                         inline=False
                     )
                     sender_dm.set_footer(text="取引ID: " + str(tx.id))
@@ -622,11 +637,11 @@ class ParaccoliCommands(commands.Cog):
                 self.logger.error(f"Failed to send DM to sender: {e}")
 
             # 受取人へのDM通知
-            if recipient_wallet.user:
+            if recipient_discord_id:
                 try:
-                    recipient_user = await self.bot.fetch_user(int(recipient_wallet.user.discord_id))
+                    recipient_user = await self.bot.fetch_user(int(recipient_discord_id))
                     if recipient_user:
-                        sender_name = f"<@{sender.discord_id}>"
+                        sender_name = f"<@{interaction.user.id}>"
                         embed = discord.Embed(
                             title="📥 入金通知",
                             description=f"{amount:,} PARCを受け取りました",
@@ -635,12 +650,12 @@ class ParaccoliCommands(commands.Cog):
                         )
                         embed.add_field(
                             name="📤 送金元",
-                            value=f"{sender_name}\n`{sender.wallet.address}`",
+                            value=f"{sender_name}\n`{sender_address}`",
                             inline=False
                         )
                         embed.add_field(
                             name="💳 残高",
-                            value=f"{recipient_wallet.parc_balance:,} PARC",
+                            value=f"{balances[to_address].parc:,} PARC",
                             inline=True
                         )
                         await recipient_user.send(embed=embed)
@@ -663,75 +678,61 @@ class ParaccoliCommands(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         ITEMS_PER_PAGE = 5
 
-        async def get_page_data(page_num: int) -> discord.Embed:
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-                transactions = db.query(Transaction)\
-                    .filter(or_(
-                        Transaction.from_address == user.wallet.address,
-                        Transaction.to_address == user.wallet.address
-                    ))\
-                    .order_by(Transaction.timestamp.desc())\
-                    .offset((page_num - 1) * ITEMS_PER_PAGE)\
-                    .limit(ITEMS_PER_PAGE)\
-                    .all()
+        def build_page(db, address: str, total_tx: int, page_num: int, cursor):
+            # 起点が分かっていればキーセット、分からない深いページへの直接指定だけ OFFSET
+            transactions = history_page(
+                db, address, ITEMS_PER_PAGE, before=cursor,
+                offset=0 if cursor is not None else (page_num - 1) * ITEMS_PER_PAGE
+            )
 
-                embed = discord.Embed(
-                    title="📋 取引履歴",
-                    color=discord.Color.blue(),
-                    timestamp=datetime.now()
-                )
+            embed = discord.Embed(
+                title="📋 取引履歴",
+                color=discord.Color.blue(),
+                timestamp=datetime.now()
+            )
 
-                for tx in transactions:
-                    is_send = tx.from_address == user.wallet.address
-                    tx_type_map = {
-                        "transfer": "💸 送金",
-                        "mining": "⛏️ 採掘",
-                        "daily_bonus": "🎁 デイリー",
-                        "buy": "🛍️ 購入",
-                        "sell": "💰 売却",
-                        "fee": "💱 手数料",
-                        "bonus": "🎯 ボーナス"
-                    }
-                    
-                    title = f"{tx_type_map.get(tx.transaction_type, '❓ ' + tx.transaction_type)}"
-                    
-                    value = []
-                    value.append(f"{'送信' if is_send else '受信'}: {tx.amount:,} PARC")
-                    if tx.price:
-                        value.append(f"価格: ¥{tx.price:,.2f}")
-                    if tx.fee:
-                        value.append(f"手数料: {tx.fee:,} PARC")
-                    value.append(f"日時: {tx.timestamp.strftime('%Y/%m/%d %H:%M')}")
-                    
-                    addr = tx.to_address if is_send else tx.from_address
-                    if addr:
-                        value.append(f"相手: `{addr[:8]}...{addr[-6:]}`")
+            for tx in transactions:
+                is_send = tx.from_address == address
+                tx_type_map = {
+                    "transfer": "💸 送金",
+                    "mining": "⛏️ 採掘",
+                    "daily_bonus": "🎁 デイリー",
+                    "buy": "🛍️ 購入",
+                    "sell": "💰 売却",
+                    "fee": "💱 手数料",
+                    "bonus": "🎯 ボーナス"
+                }
+                
+                title = f"{tx_type_map.get(tx.transaction_type, '❓ ' + tx.transaction_type)}"
+                
+                value = []
+                value.append(f"{'送信' if is_send else '受信'}: {tx.amount:,} PARC")
+                if tx.price:
+                    value.append(f"価格: ¥{tx.price:,.2f}")
+                if tx.fee:
+                    value.append(f"手数料: {tx.fee:,} PARC")
+                value.append(f"日時: {tx.timestamp.strftime('%Y/%m/%d %H:%M')}")
+                
+                addr = tx.to_address if is_send else tx.from_address
+                if addr:
+                    value.append(f"相手: `{addr[:8]}...{addr[-6:]}`")
 
-                    embed.add_field(
-                        name=title,
-                        value="\n".join(value),
-                        inline=False
-                    )
+                embed.add_field(
+                    name=title,
+                    value="\n".join(value),
+                    inline=False
+                )
 
-                total_tx = db.query(Transaction)\
-                    .filter(or_(
-                        Transaction.from_address == user.wallet.address,
-                        Transaction.to_address == user.wallet.address
-                    ))\
-                    .count()
-                total_pages = math.ceil(total_tx / ITEMS_PER_PAGE)
-                embed.set_footer(text=f"📄 ページ {page_num}/{total_pages} • 全{total_tx}件の取引")
+            total_pages = math.ceil(total_tx / ITEMS_PER_PAGE)
+            embed.set_footer(text=f"📄 ページ {page_num}/{total_pages} • 全{total_tx}件の取引")
 
-                return embed
-            finally:
-                db.close()
+            return embed, page_cursor(transactions)
 
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            identity = identity_cache.lookup(db, str(interaction.user.id))
+            address = identity.wallet_address if identity else None
+            if not address:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error(
                         "🚫 ウォレットが見つかりません",
@@ -740,12 +741,8 @@ class ParaccoliCommands(commands.Cog):
                 )
                 return
 
-            total_tx = db.query(Transaction)\
-                .filter(or_(
-                    Transaction.from_address == user.wallet.address,
-                    Transaction.to_address == user.wallet.address
-                ))\
-                .count()
+            # 件数は書き込み時に更新されるキャッシュから取得（ページ移動ごとに数えない）
+            total_tx = transaction_counts.get(db, address)
 
             if total_tx == 0:
                 await interaction.followup.send(
@@ -757,8 +754,17 @@ class ParaccoliCommands(commands.Cog):
                 return
 
             total_pages = math.ceil(total_tx / ITEMS_PER_PAGE)
-            embed = await get_page_data(page)
-            view = HistoryPaginationView(page, total_pages, get_page_data)
+            page = min(max(page, 1), total_pages)
+
+            async def get_page_data(page_num: int, cursor):
+                page_db = SessionLocal()
+                try:
+                    return build_page(page_db, address, total_tx, page_num, cursor)
+                finally:
+                    page_db.close()
+
+            embed, next_cursor = build_page(db, address, total_tx, page, None)
+            view = HistoryPaginationView(page, total_pages, get_page_data, next_cursor)
             await interaction.followup.send(embed=embed, view=view)
 
         except Exception as e:
@@ -903,9 +909,7 @@ class ParaccoliCommands(commands.Cog):
         db = SessionLocal()
         try:
             with db.begin():
-                user = db.query(User).filter(
-                    User.discord_id == str(interaction.user.id)
-                ).first()
+                user = identity_cache.lookup(db, str(interaction.user.id))
 
                 if not user:
                     await interaction.followup.send(
@@ -918,7 +922,7 @@ class ParaccoliCommands(commands.Cog):
 
                 # アラート件数チェック
                 alert_count = db.query(PriceAlert).filter(
-                    PriceAlert.user_id == user.id,
+                    PriceAlert.user_id == user.user_id,
                     PriceAlert.active == True
                 ).count()
 
@@ -938,7 +942,7 @@ class ParaccoliCommands(commands.Cog):
 
                 # アラート登録
                 alert = PriceAlert(
-                    user_id=user.id,
+                    user_id=user.user_id,
                     price=price,
                     condition=condition,
                     active=True,
@@ -991,6 +995,7 @@ class ParaccoliCommands(commands.Cog):
         """PARC購入処理"""
         await interaction.response.defer(ephemeral=True)
         db = SessionLocal()
+        observed_trade = None  # コミット後に検出器へ渡す成行取引
 
         try:
             # 取引時間外の場合、指値注文以外は拒否
@@ -1015,9 +1020,9 @@ class ParaccoliCommands(commands.Cog):
                 )
                 return
 
-            # ユーザー情報の確認
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            # ユーザー情報の確認（残高の確認は台帳の記帳時に行う）
+            wallet = identity_cache.wallet(db, str(interaction.user.id))
+            if not wallet:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error("エラー", "ウォレットが見つかりません")
                 )
@@ -1042,41 +1047,25 @@ class ParaccoliCommands(commands.Cog):
                 return
 
             if price is None:  # 成行注文
-                fee = math.ceil(total_cost * 0.001)  # 0.1%の手数料
-                total_with_fee = total_cost + fee
-
-                # 残高チェック
-                if user.wallet.jpy_balance < total_with_fee:
+                # 板の売り注文と価格・時間優先で約定させ、残りを現在価格で約定（ほかの取引とまとめてコミットされる）
+                try:
+                    execution = await trade_pipeline.submit(
+                        execute_market_order, wallet.address, "buy", amount, current_market_price
+                    )
+                except InsufficientBalance as e:
                     await interaction.followup.send(
                         embed=EmbedBuilder.error(
                             "残高不足",
-                            f"必要金額: ¥{total_with_fee:,.0f}（手数料込み）\n"
-                            f"残高: ¥{user.wallet.jpy_balance:,.0f}"
+                            f"必要金額: ¥{e.required:,.0f}（手数料込み）\n"
+                            f"残高: ¥{e.available:,.0f}"
                         )
                     )
                     return
-
-                # 残高更新
-                user.wallet.jpy_balance -= total_with_fee
-                user.wallet.parc_balance += amount
-
-                # 取引トランザクションを記録
-                transaction = Transaction(
-                    from_address=None,
-                    to_address=user.wallet.address,
-                    amount=amount,
-                    fee=fee,
-                    price=current_market_price,
-                    timestamp=datetime.now(),
-                    transaction_type="buy",
-                    order_type="market",
-                    status="completed"
-                )
-                db.add(transaction)
-                db.flush()  # トランザクションIDを取得するためにflush
+                balances = {wallet.address: execution.balance}
+                observed_trade = (execution.transaction_id, "buy", wallet.address, amount)
 
                 # トランザクションIDをハッシュのように表示
-                tx_id = f"0x{transaction.id:x}{uuid.uuid4().hex[:8]}"
+                tx_id = f"0x{execution.transaction_id:x}{uuid.uuid4().hex[:8]}"
 
                 # 結果表示用のEmbed作成
                 embed = discord.Embed(
@@ -1090,9 +1079,9 @@ class ParaccoliCommands(commands.Cog):
                     name="💰 取引詳細",
                     value=(
                         f"数量: {amount:,} PARC\n"
-                        f"単価: ¥{current_market_price:,.2f}/PARC\n"
-                        f"合計: ¥{total_cost:,}\n"
-                        f"手数料: ¥{fee:,}"
+                        f"平均単価: ¥{execution.average_price:,.2f}/PARC\n"
+                        f"合計: ¥{execution.gross:,}\n"
+                        f"手数料: ¥{execution.fee:,}"
                     ),
                     inline=False
                 )
@@ -1101,7 +1090,8 @@ class ParaccoliCommands(commands.Cog):
                 embed.add_field(
                     name="💹 取引価格情報",
                     value=(
-                        f"取引価格: ¥{current_market_price:,.2f}/PARC\n"
+                        f"板で約定: {execution.matched_amount:,} PARC（{len(execution.fills)}件の売り注文）\n"
+                        f"現在価格: ¥{current_market_price:,.2f}/PARC\n"
                         f"基準価格: ¥{price_info['base']:,.2f}\n"
                         f"変動率: {price_info['change']:+.2f}%"
                     ),
@@ -1111,8 +1101,8 @@ class ParaccoliCommands(commands.Cog):
                 embed.add_field(
                     name="💳 新しい残高",
                     value=(
-                        f"PARC: {user.wallet.parc_balance:,}\n"
-                        f"JPY: ¥{user.wallet.jpy_balance:,}"
+                        f"PARC: {balances[wallet.address].parc:,}\n"
+                        f"JPY: ¥{balances[wallet.address].jpy:,}"
                     ),
                     inline=False
                 )
@@ -1140,23 +1130,12 @@ class ParaccoliCommands(commands.Cog):
                     )
                     return
 
-                limit_cost = math.floor(amount * price)
-                limit_fee = math.ceil(limit_cost * 0.001)  # 0.1%の手数料
-                limit_total = limit_cost + limit_fee
-
-                if user.wallet.jpy_balance < limit_total:
-                    await interaction.followup.send(
-                        embed=EmbedBuilder.error(
-                            "残高不足",
-                            f"必要金額: ¥{limit_total:,.0f}（手数料込み）\n"
-                            f"残高: ¥{user.wallet.jpy_balance:,.0f}"
-                        )
-                    )
-                    return
+                # 指値 × 数量 + 0.1%の手数料を拘束（約定・取消時はこの拘束分から精算する）
+                limit_total = escrow_jpy(amount, price)
 
                 # 指値注文の作成
                 order = Order(
-                    wallet_address=user.wallet.address,
+                    wallet_address=wallet.address,
                     amount=amount,
                     price=price,
                     timestamp=datetime.now(),
@@ -1164,11 +1143,20 @@ class ParaccoliCommands(commands.Cog):
                     side="buy",
                     status="pending"
                 )
-                db.add(order)
-                db.flush()  # OrderIDを取得するためにflush
-                
-                # 残高の更新
-                user.wallet.jpy_balance -= limit_total
+                # 注文の登録と残高の更新（不足なら注文ごと取り消す）
+                try:
+                    balances = await trade_pipeline.submit(
+                        ledger.apply, [Posting(wallet.address, jpy=-limit_total)], [order]
+                    )
+                except InsufficientBalance as e:
+                    await interaction.followup.send(
+                        embed=EmbedBuilder.error(
+                            "残高不足",
+                            f"必要金額: ¥{limit_total:,.0f}（手数料込み）\n"
+                            f"残高: ¥{e.available:,.0f}"
+                        )
+                    )
+                    return
                 
                 # 注文IDをハッシュのように表示
                 order_id = f"0x{order.id:x}{uuid.uuid4().hex[:8]}"
@@ -1206,8 +1194,8 @@ class ParaccoliCommands(commands.Cog):
                 embed.add_field(
                     name="💳 現在の残高",
                     value=(
-                        f"PARC: {user.wallet.parc_balance:,}\n"
-                        f"JPY: ¥{user.wallet.jpy_balance:,}"
+                        f"PARC: {balances[wallet.address].parc:,}\n"
+                        f"JPY: ¥{balances[wallet.address].jpy:,}"
                     ),
                     inline=False
                 )
@@ -1221,6 +1209,9 @@ class ParaccoliCommands(commands.Cog):
             # 変更をコミットしてメッセージを送信
             db.commit()
             await interaction.followup.send(embed=embed)
+            if observed_trade:
+                # 市場操作のストリーム検出（応答の後に DB スレッドで行う）
+                self._observe_trade_later(price_calculator, observed_trade)
 
         except Exception as e:
             self.logger.error(f"Buy error: {str(e)}", exc_info=True)
@@ -1270,8 +1261,8 @@ class ParaccoliCommands(commands.Cog):
                 return
 
             # ユーザー情報確認
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            wallet = identity_cache.wallet(db, str(interaction.user.id))
+            if not wallet:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error("エラー", "ウォレットが見つかりません")
                 )
@@ -1286,8 +1277,8 @@ class ParaccoliCommands(commands.Cog):
 
             amount = round(amount, 2)
 
-            # 残高チェック
-            if amount > user.wallet.parc_balance:
+            # 残高チェック（確定は台帳の記帳時）
+            if amount > wallet.parc_balance:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error("エラー", "残高が不足しています")
                 )
@@ -1299,39 +1290,21 @@ class ParaccoliCommands(commands.Cog):
             current_market_price = price_info['current']
 
             if price is None:  # 成行注文の場合
-                # 売却金額の計算
-                sale_amount = math.floor(amount * current_market_price)
-                fee = math.ceil(sale_amount * 0.001)  # 0.1%の手数料
-                total_amount = sale_amount - fee
-
-                # 残高更新
-                user.wallet.parc_balance -= amount
-                user.wallet.jpy_balance += total_amount
-
-                # 売却トランザクションを記録
-                sell_tx = Transaction(
-                    from_address=user.wallet.address,
-                    amount=amount,
-                    price=current_market_price,
-                    fee=fee,
-                    transaction_type="sell",
-                    timestamp=datetime.now(),
-                    status="completed"
-                )
-                db.add(sell_tx)
-                db.flush()  # トランザクションIDを取得するためにflush
+                # 板の買い注文と価格・時間優先で約定させ、残りを現在価格で約定（ほかの取引とまとめてコミットされる）
+                try:
+                    execution = await trade_pipeline.submit(
+                        execute_market_order, wallet.address, "sell", amount, current_market_price
+                    )
+                except InsufficientBalance:
+                    await interaction.followup.send(
+                        embed=EmbedBuilder.error("エラー", "残高が不足しています")
+                    )
+                    return
+                balances = {wallet.address: execution.balance}
+                observed_trade = (execution.transaction_id, "sell", wallet.address, amount)
 
                 # トランザクションIDをハッシュのように表示
-                tx_id = f"0x{sell_tx.id:x}{uuid.uuid4().hex[:8]}"
-
-                # 手数料トランザクションを記録
-                fee_tx = Transaction(
-                    from_address=user.wallet.address,
-                    amount=fee,
-                    transaction_type="fee",
-                    timestamp=datetime.now()
-                )
-                db.add(fee_tx)
+                tx_id = f"0x{execution.transaction_id:x}{uuid.uuid4().hex[:8]}"
                 db.commit()
 
                 # ゲームクリアチェック
@@ -1358,10 +1331,10 @@ class ParaccoliCommands(commands.Cog):
                     name="💰 取引詳細",
                     value=(
                         f"数量: {amount:,} PARC\n"
-                        f"単価: ¥{current_market_price:,.2f}/PARC\n"
-                        f"売却額: ¥{sale_amount:,}\n"
-                        f"手数料: ¥{fee:,}\n"
-                        f"受取金額: ¥{total_amount:,}"
+                        f"平均単価: ¥{execution.average_price:,.2f}/PARC\n"
+                        f"売却額: ¥{execution.gross:,}\n"
+                        f"手数料: ¥{execution.fee:,}\n"
+                        f"受取金額: ¥{execution.net:,}"
                     ),
                     inline=False
                 )
@@ -1370,7 +1343,8 @@ class ParaccoliCommands(commands.Cog):
                 embed.add_field(
                     name="💹 取引価格情報",
                     value=(
-                        f"取引価格: ¥{current_market_price:,.2f}/PARC\n"
+                        f"板で約定: {execution.matched_amount:,} PARC（{len(execution.fills)}件の買い注文）\n"
+                        f"現在価格: ¥{current_market_price:,.2f}/PARC\n"
                         f"基準価格: ¥{price_info['base']:,.2f}\n"
                         f"変動率: {price_info['change']:+.2f}%"
                     ),
@@ -1380,8 +1354,8 @@ class ParaccoliCommands(commands.Cog):
                 embed.add_field(
                     name="💳 新しい残高",
                     value=(
-                        f"PARC: {user.wallet.parc_balance:,}\n"
-                        f"JPY: ¥{user.wallet.jpy_balance:,}"
+                        f"PARC: {balances[wallet.address].parc:,}\n"
+                        f"JPY: ¥{balances[wallet.address].jpy:,}"
                     ),
                     inline=False
                 )
@@ -1393,6 +1367,8 @@ class ParaccoliCommands(commands.Cog):
                 )
 
                 await interaction.followup.send(embed=embed)
+                # 市場操作のストリーム検出（応答の後に DB スレッドで行う）
+                self._observe_trade_later(price_calculator, observed_trade)
 
             else:  # 指値注文の場合
                 # 指値価格チェック
@@ -1414,7 +1390,7 @@ class ParaccoliCommands(commands.Cog):
 
                 # 指値注文の作成
                 order = Order(
-                    wallet_address=user.wallet.address,
+                    wallet_address=wallet.address,
                     amount=amount,
                     price=price,
                     timestamp=datetime.now(),
@@ -1423,11 +1399,16 @@ class ParaccoliCommands(commands.Cog):
                     status="pending"
                 )
 
-                # PARCをロック
-                user.wallet.parc_balance -= amount
-
-                db.add(order)
-                db.flush()  # OrderIDを取得するためにflush
+                # 注文の登録とPARCのロック
+                try:
+                    balances = await trade_pipeline.submit(
+                        ledger.apply, [Posting(wallet.address, parc=-amount)], [order]
+                    )
+                except InsufficientBalance:
+                    await interaction.followup.send(
+                        embed=EmbedBuilder.error("エラー", "残高が不足しています")
+                    )
+                    return
                 
                 # 注文IDをハッシュのように表示
                 order_id = f"0x{order.id:x}{uuid.uuid4().hex[:8]}"
@@ -1468,8 +1449,8 @@ class ParaccoliCommands(commands.Cog):
                 embed.add_field(
                     name="💳 現在の残高",
                     value=(
-                        f"PARC: {user.wallet.parc_balance:,}\n"
-                        f"JPY: ¥{user.wallet.jpy_balance:,}"
+                        f"PARC: {balances[wallet.address].parc:,}\n"
+                        f"JPY: ¥{balances[wallet.address].jpy:,}"
                     ),
                     inline=False
                 )
@@ -1498,7 +1479,7 @@ class ParaccoliCommands(commands.Cog):
         
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
+            user = identity_cache.lookup(db, str(interaction.user.id))
             if not user:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error(
@@ -1511,7 +1492,7 @@ class ParaccoliCommands(commands.Cog):
             # アクティブなアラート取得
             alerts = db.query(PriceAlert)\
                 .filter(
-                    PriceAlert.user_id == user.id,
+                    PriceAlert.user_id == user.user_id,
                     PriceAlert.active == True
                 )\
                 .all()
@@ -1566,7 +1547,7 @@ class ParaccoliCommands(commands.Cog):
         """アラート削除処理"""
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
+            user = identity_cache.lookup(db, str(interaction.user.id))
             if not user:
                 await interaction.response.send_message(
                     embed=EmbedBuilder.error("エラー", "ユーザーが見つかりません"),
@@ -1578,7 +1559,7 @@ class ParaccoliCommands(commands.Cog):
             alert = db.query(PriceAlert)\
                 .filter(
                     PriceAlert.id == alert_id,
-                    PriceAlert.user_id == user.id,
+                    PriceAlert.user_id == user.user_id,
                     PriceAlert.active == True
                 )\
                 .first()
@@ -1615,31 +1596,55 @@ class ParaccoliCommands(commands.Cog):
         finally:
             db.close()
 
+    @app_commands.command(name="dm", description="イベント通知DMの受信を設定します")
+    @app_commands.describe(enabled="DMを受け取る場合は True")
+    async def dm(self, interaction: discord.Interaction, enabled: bool):
+        """イベント通知DMの受信設定"""
+        db = SessionLocal()
+        try:
+            user = identity_cache.lookup(db, str(interaction.user.id))
+            if not user:
+                await interaction.response.send_message(
+                    embed=EmbedBuilder.error("エラー", "ユーザーが見つかりません"),
+                    ephemeral=True
+                )
+                return
+
+            # 一斉送信の宛先はSQLで dm_opt_out を除外する
+            db.query(User).filter(User.id == user.user_id).update({User.dm_opt_out: not enabled})
+            db.commit()
+
+            await interaction.response.send_message(
+                embed=EmbedBuilder.success(
+                    "✅ DM設定を更新しました",
+                    "イベント通知をDMで受け取ります" if enabled else "イベント通知のDMを停止しました"
+                ),
+                ephemeral=True
+            )
+
+        except Exception as e:
+            self.logger.error(f"DM setting error: {str(e)}", exc_info=True)
+            db.rollback()
+            await interaction.response.send_message(
+                embed=EmbedBuilder.error("エラー", "DM設定の更新に失敗しました"),
+                ephemeral=True
+            )
+        finally:
+            db.close()
+
     @app_commands.command(name="stats", description="システム全体の統計情報を表示します")
     async def stats(self, interaction: discord.Interaction):
         """システム統計情報の表示"""
         await interaction.response.defer(ephemeral=True)
         
-        db = SessionLocal()
         try:
-            # 基本統計情報
-            total_users = db.query(func.count(User.id)).scalar() or 0
-            total_wallets = db.query(func.count(Wallet.id)).scalar() or 0
-            total_supply = db.query(func.sum(Wallet.parc_balance)).scalar() or 0
-            
-            # 現在価格を取得
-            current_price = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .first()
-            price = current_price.price if current_price else 100.0
-
-            # 取引統計
-            yesterday = datetime.now() - timedelta(days=1)
-            volume_24h = db.query(func.sum(Transaction.amount))\
-                .filter(
-                    Transaction.timestamp >= yesterday,
-                    Transaction.transaction_type.in_(['buy', 'sell'])
-                ).scalar() or 0
+            # 集計済みのスナップショットを使う（1分ごとにバックグラウンドで更新）
+            snapshot = await market_stats.get()
+            total_users = snapshot.total_users
+            total_wallets = snapshot.total_wallets
+            total_supply = snapshot.total_supply
+            price = snapshot.price
+            volume_24h = snapshot.volume_24h
 
             # システム稼働時間
             uptime = datetime.now() - self.start_time
@@ -1649,24 +1654,12 @@ class ParaccoliCommands(commands.Cog):
             uptime_str = f"{int(days)}日 {int(hours)}時間 {int(minutes)}分"
             
             # 最高値・最安値（全期間）
-            all_time_high = db.query(func.max(PriceHistory.price)).scalar() or price
-            all_time_low = db.query(func.min(PriceHistory.price)).scalar() or price
-            
-            # 総取引件数
-            total_transactions = db.query(func.count(Transaction.id)).scalar() or 0
-            
-            # 注文情報
-            pending_orders = db.query(func.count(Order.id))\
-                .filter(Order.status == 'pending')\
-                .scalar() or 0
-            
-            # システム採掘情報
-            total_mined = db.query(func.sum(User.total_mined)).scalar() or 0
-            
-            # 最もアクティブなユーザー（メッセージ数ベース）
-            most_active_user = db.query(User)\
-                .order_by(User.message_count.desc())\
-                .first()
+            all_time_high = snapshot.all_time_high
+            all_time_low = snapshot.all_time_low
+            total_transactions = snapshot.total_transactions
+            pending_orders = snapshot.pending_orders
+            total_mined = snapshot.total_mined
+            most_active_user = snapshot.most_active
             
             # 統計情報を表示
             embed = discord.Embed(
@@ -1693,7 +1686,7 @@ class ParaccoliCommands(commands.Cog):
                 value=(
                     f"総ユーザー数: {total_users:,}\n"
                     f"総ウォレット数: {total_wallets:,}\n"
-                    f"最もアクティブ: <@{most_active_user.discord_id}> ({most_active_user.message_count:,}メッセージ)" if most_active_user else "データなし"
+                    f"最もアクティブ: <@{most_active_user[0]}> ({most_active_user[1]:,}メッセージ)" if most_active_user else "データなし"
                 ),
                 inline=False
             )
@@ -1736,6 +1729,27 @@ class ParaccoliCommands(commands.Cog):
                 inline=False
             )
 
+            # DB接続プール情報
+            pool_stats = get_pool_stats()
+            executor_stats = get_db_executor_stats()
+            pipeline_stats = trade_pipeline.stats()
+            embed.add_field(
+                name="🗄️ DB接続プール",
+                value=(
+                    f"プロファイル: {pool_stats['profile']}\n"
+                    f"使用中: {pool_stats['checked_out']}/{pool_stats['pool_size']} "
+                    f"(ピーク {pool_stats['peak_checked_out']}, オーバーフロー {pool_stats['overflow']})\n"
+                    f"接続待ち: 平均 {pool_stats['avg_wait_ms']:.1f}ms / p95 {pool_stats['p95_wait_ms']:.1f}ms "
+                    f"(タイムアウト {pool_stats['timeouts']}回)\n"
+                    f"DBスレッド: 待ち p95 {executor_stats['p95_wait_ms']:.1f}ms / "
+                    f"クエリ p95 {executor_stats['p95_query_ms']:.1f}ms\n"
+                    f"取引コミット: {pipeline_stats['batches']:,}回 "
+                    f"(平均 {pipeline_stats['avg_batch']:.1f}件 / 最大 {pipeline_stats['largest_batch']}件)"
+                ),
+                inline=False
+            )
+
+            embed.set_footer(text=f"集計: {snapshot.refreshed_at.strftime('%H:%M:%S')}")
             await interaction.followup.send(embed=embed, ephemeral=True)
 
         except Exception as e:
@@ -1743,8 +1757,6 @@ class ParaccoliCommands(commands.Cog):
             await interaction.followup.send(
                 embed=EmbedBuilder.error("エラー", "統計情報の取得に失敗しました")
             )
-        finally:
-            db.close()
 
     @app_commands.command(name="form", description="開発者へ問い合わせを送信します")
     @app_commands.describe(
@@ -1768,7 +1780,7 @@ class ParaccoliCommands(commands.Cog):
         
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
+            user = identity_cache.lookup(db, str(interaction.user.id))
             if not user:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error(
@@ -1854,8 +1866,8 @@ class ParaccoliCommands(commands.Cog):
         
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            identity = identity_cache.lookup(db, str(interaction.user.id))
+            if not identity or not identity.wallet_address:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error(
                         "ウォレットが見つかりません",
@@ -1867,8 +1879,8 @@ class ParaccoliCommands(commands.Cog):
             # 現在の注文を取得
             orders = db.query(Order)\
                 .filter(
-                    Order.wallet_address == user.wallet.address,
-                    Order.status == 'pending'
+                    Order.wallet_address == identity.wallet_address,
+                    Order.status.in_(OPEN_STATUSES)
                 )\
                 .order_by(Order.timestamp.desc())\
                 .all()
@@ -1897,10 +1909,12 @@ class ParaccoliCommands(commands.Cog):
 
             for order in orders:
                 side = "買い" if order.side == "buy" else "売り"
+                filled = order.filled_amount or 0
                 embed.add_field(
                     name=f"注文 #{order.id}",
                     value=(
-                        f"{side}注文: {order.amount:,} PARC\n"
+                        f"{side}注文: {order.amount:,} PARC"
+                        + (f"（約定済み {filled:,} PARC）" if filled else "") + "\n"
                         f"指値: ¥{order.price:,.2f}\n"
                         f"日時: {order.timestamp.strftime('%Y/%m/%d %H:%M')}"
                     ),
@@ -1931,8 +1945,8 @@ class ParaccoliCommands(commands.Cog):
         db = SessionLocal()
         try:
             # ユーザー情報取得
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
-            if not user or not user.wallet:
+            wallet = identity_cache.wallet(db, str(interaction.user.id))
+            if not wallet:
                 await interaction.response.send_message(
                     embed=EmbedBuilder.error(
                         "ウォレットが見つかりません",
@@ -1945,13 +1959,14 @@ class ParaccoliCommands(commands.Cog):
             # 注文IDをリストに変換
             id_list = [int(id.strip()) for id in order_ids.split(',')]
             
-            # 注文情報取得 - ここを'pending'に修正
+            # 未約定分が残っている注文を取得（二重返却を防ぐため注文の行をロック）
             orders = db.query(Order)\
                 .filter(
                     Order.id.in_(id_list),
-                    Order.wallet_address == user.wallet.address,
-                    Order.status == 'pending'  # 'open'から'pending'に修正
+                    Order.wallet_address == wallet.address,
+                    Order.status.in_(OPEN_STATUSES)
                 )\
+                .with_for_update()\
                 .all()
 
             if not orders:
@@ -1966,18 +1981,15 @@ class ParaccoliCommands(commands.Cog):
 
             # キャンセル処理
             cancelled_orders = []
+            refunds = []
             for order in orders:
-                # 残高返却
-                if order.side == "buy":
-                    total_cost = order.amount * order.price
-                    fee = math.ceil(total_cost * 0.001)
-                    user.wallet.jpy_balance += total_cost + fee
-                else:
-                    user.wallet.parc_balance += order.amount
-
-                order.status = "cancelled"
+                # 拘束分の返却（部分約定した分は除く）
+                refunds.append(refund_on_cancel(order))
+
+                order.status = CANCELLED
                 cancelled_orders.append(order)
 
+            ledger.apply(db, refunds)
             db.commit()
 
             # 結果通知
@@ -1999,8 +2011,8 @@ class ParaccoliCommands(commands.Cog):
             embed.add_field(
                 name="💳 現在の残高",
                 value=(
-                    f"PARC: {user.wallet.parc_balance:,}\n"
-                    f"JPY: ¥{user.wallet.jpy_balance:,}"
+                    f"PARC: {wallet.parc_balance:,}\n"
+                    f"JPY: ¥{wallet.jpy_balance:,}"
                 ),
                 inline=False
             )
@@ -2030,29 +2042,10 @@ class ParaccoliCommands(commands.Cog):
         """資産ランキングの表示"""
         await interaction.response.defer(ephemeral=True)
         
-        db = SessionLocal()
         try:
-            # 現在価格を取得
-            current_price = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .first()
-            price = current_price.price if current_price else 100.0
-
-            # PARC保有ランキング取得
-            parc_ranking = db.query(User, Wallet)\
-                .join(Wallet)\
-                .filter(Wallet.parc_balance > 0)\
-                .order_by(Wallet.parc_balance.desc())\
-                .limit(3)\
-                .all()
-
-            # JPY保有ランキング取得
-            jpy_ranking = db.query(User, Wallet)\
-                .join(Wallet)\
-                .filter(Wallet.jpy_balance > 0)\
-                .order_by(Wallet.jpy_balance.desc())\
-                .limit(3)\
-                .all()
+            # 集計済みのランキングを使う（1分ごとにバックグラウンドで更新）
+            snapshot = await market_stats.get()
+            price = snapshot.price
 
             # Embed作成
             embed = discord.Embed(
@@ -2063,12 +2056,12 @@ class ParaccoliCommands(commands.Cog):
 
             # PARC保有ランキング表示
             parc_ranking_text = []
-            for i, (user, wallet) in enumerate(parc_ranking, 1):
+            for i, entry in enumerate(snapshot.parc_ranking, 1):
                 medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
-                value_jpy = wallet.parc_balance * price
+                value_jpy = entry.parc_balance * price
                 parc_ranking_text.append(
-                    f"{medal} <@{user.discord_id}>\n"
-                    f"└ {wallet.parc_balance:,} PARC (¥{value_jpy:,.0f})"
+                    f"{medal} <@{entry.discord_id}>\n"
+                    f"└ {entry.parc_balance:,} PARC (¥{value_jpy:,.0f})"
                 )
 
             embed.add_field(
@@ -2079,11 +2072,11 @@ class ParaccoliCommands(commands.Cog):
 
             # JPY保有ランキング表示
             jpy_ranking_text = []
-            for i, (user, wallet) in enumerate(jpy_ranking, 1):
+            for i, entry in enumerate(snapshot.jpy_ranking, 1):
                 medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
                 jpy_ranking_text.append(
-                    f"{medal} <@{user.discord_id}>\n"
-                    f"└ ¥{wallet.jpy_balance:,}"
+                    f"{medal} <@{entry.discord_id}>\n"
+                    f"└ ¥{entry.jpy_balance:,}"
                 )
 
             embed.add_field(
@@ -2092,7 +2085,23 @@ class ParaccoliCommands(commands.Cog):
                 inline=False
             )
 
-            embed.set_footer(text=f"現在価格: ¥{price:,.2f}")
+            # 総資産ランキング表示（PARC時価 + JPY）
+            asset_ranking_text = []
+            for i, entry in enumerate(snapshot.asset_ranking[:3], 1):
+                medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉"
+                cleared = " 👑" if entry.has_cleared else ""
+                asset_ranking_text.append(
+                    f"{medal} <@{entry.discord_id}>{cleared}\n"
+                    f"└ ¥{entry.total_assets:,.0f}"
+                )
+
+            embed.add_field(
+                name="💎 総資産ランキング",
+                value="\n".join(asset_ranking_text) if asset_ranking_text else "データなし",
+                inline=False
+            )
+
+            embed.set_footer(text=f"現在価格: ¥{price:,.2f} • 集計: {snapshot.refreshed_at.strftime('%H:%M:%S')}")
             await interaction.followup.send(embed=embed, ephemeral=True)
 
         except Exception as e:
@@ -2103,8 +2112,6 @@ class ParaccoliCommands(commands.Cog):
                     "ランキングの取得に失敗しました"
                 )
             )
-        finally:
-            db.close()
 
     @app_commands.guild_only()
     @app_commands.default_permissions(administrator=True)
@@ -2169,7 +2176,7 @@ class ParaccoliCommands(commands.Cog):
             
             # 市場操作検出フラグの永続保存
             if hasattr(self.bot, 'price_calculator'):
-                self.bot.price_calculator._save_permanent_flags()
+                self.bot.price_calculator._save_permanent_flags(compact=True)
                 self.logger.info("市場操作検出フラグをファイルに保存しました")
             
             # 設定ファイル保存
@@ -2331,7 +2338,7 @@ class ParaccoliCommands(commands.Cog):
             # イベントマネージャーに設定
             self.bot.event_manager.current_event = event_info
             self.bot.event_manager.remaining_effects = EventTypes.split_effect(change_percent)
-            self.bot.event_manager.last_event_time = datetime.now(timezone.utc)
+            self.bot.event_manager.last_event_time = datetime.now()
 
             # イベント通知を送信
             await self.bot.event_manager._notify_event(event_info)
@@ -2459,6 +2466,8 @@ class ParaccoliCommands(commands.Cog):
 
             # 環境変数を更新
             os.environ[target.value] = new_id
+            # ユーザーIDの対応が変わりうるため識別情報キャッシュを破棄
+            identity_cache.invalidate()
 
             # 結果を表示
             embed = discord.Embed(
@@ -2521,7 +2530,7 @@ class ParaccoliCommands(commands.Cog):
         try:
             # 市場操作検出フラグの永続保存
             if hasattr(self.bot, 'price_calculator'):
-                self.bot.price_calculator._save_permanent_flags()
+                self.bot.price_calculator._save_permanent_flags(compact=True)
                 self.logger.info("再起動前に市場操作検出フラグをファイルに保存しました")
                 
             # 再起動メッセージを送信
@@ -2615,11 +2624,9 @@ class ParaccoliCommands(commands.Cog):
         db = SessionLocal()
         try:
             # 対象ユーザーの取得
-            target_user = db.query(User).filter(
-                User.discord_id == str(user.id)
-            ).first()
+            target_wallet = identity_cache.wallet(db, str(user.id))
 
-            if not target_user or not target_user.wallet:
+            if not target_wallet:
                 await interaction.followup.send(
                     embed=EmbedBuilder.error(
                         "エラー",
@@ -2640,21 +2647,21 @@ class ParaccoliCommands(commands.Cog):
 
             # 残高の更新
             if currency.value == "parc":
-                target_user.wallet.parc_balance += amount
+                posting = Posting(target_wallet.address, parc=amount)
                 currency_symbol = "PARC"
             else:  # jpy
-                target_user.wallet.jpy_balance += amount
+                posting = Posting(target_wallet.address, jpy=amount)
                 currency_symbol = "JPY"
 
             # トランザクション記録
             tx = Transaction(
-                to_address=target_user.wallet.address,
+                to_address=target_wallet.address,
                 amount=amount,
                 transaction_type="admin_add",
                 timestamp=datetime.now(),
                 status="completed"
             )
-            db.add(tx)
+            ledger.apply(db, [posting], [tx])
             
             db.commit()
 
@@ -2666,8 +2673,8 @@ class ParaccoliCommands(commands.Cog):
             embed.add_field(
                 name="💰 現在の残高",
                 value=(
-                    f"PARC: {target_user.wallet.parc_balance:,}\n"
-                    f"JPY: ¥{target_user.wallet.jpy_balance:,}"
+                    f"PARC: {target_wallet.parc_balance:,}\n"
+                    f"JPY: ¥{target_wallet.jpy_balance:,}"
                 ),
                 inline=False
             )
@@ -2685,8 +2692,8 @@ class ParaccoliCommands(commands.Cog):
                 user_embed.add_field(
                     name="現在の残高",
                     value=(
-                        f"PARC: {target_user.wallet.parc_balance:,}\n"
-                        f"JPY: ¥{target_user.wallet.jpy_balance:,}"
+                        f"PARC: {target_wallet.parc_balance:,}\n"
+                        f"JPY: ¥{target_wallet.jpy_balance:,}"
                     ),
                     inline=False
                 )
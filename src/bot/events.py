@@ -3,10 +3,13 @@ from ..database.database import SessionLocal
 from ..database.models import User, DailyStats, Wallet
 from datetime import datetime, timedelta
 from ..utils.logger import Logger
-from collections import defaultdict
 from ..utils.config import Config
 from ..utils.embed_builder import EmbedBuilder
+from ..utils.identity_cache import identity_cache
+from ..utils.spam_guard import SpamGuard, WarningCounter
 from ..database.models import Transaction
+from ..database import ledger
+from ..database.ledger import Posting, InsufficientBalance
 import discord
 
 class ParaccoliEvents(commands.Cog):
@@ -15,15 +18,12 @@ class ParaccoliEvents(commands.Cog):
         self.logger = Logger(__name__)
         self.config = Config()  # Configインスタンスを作成
         self.start_time = datetime.now()
-        self.message_history = defaultdict(list)  # ユーザーごとのメッセージ履歴
-        self.warning_count = defaultdict(int)     # ユーザーごとの警告回数
+        # スパム検知（直近5件の固定長ウィンドウ。しばらく発言のないユーザーの状態は捨てる）
+        self.spam_guard = SpamGuard()
+        self.spam_warnings = WarningCounter(reset_seconds=3600)  # スパム警告回数（1時間でリセット）
         self.clear_messages = {}  # クリアメッセージのIDとユーザーIDを保存
-        self.mining_warnings = {}  # ユーザーごとの警告回数
-        self.last_warning = {}     # 最後の警告時刻
-        self.daily_warnings = {}  # ユーザーごとの日次警告回数
-        self.last_daily_warning = {}  # 最後の日次警告時刻
-        self.form_warnings = {}  # サポートチャンネル用の警告カウンター
-        self.last_form_warning = {}  # サポートチャンネル用の最終警告時間
+        self.mining_warnings = WarningCounter(reset_seconds=600)  # マイニングチャンネルの警告回数（10分でリセット）
+        self.daily_warnings = WarningCounter(reset_seconds=600)  # デイリー・初心者ガイドチャンネルの警告回数
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -43,7 +43,6 @@ class ParaccoliEvents(commands.Cog):
                 await self._handle_warning(
                     message,
                     self.mining_warnings,
-                    self.last_warning,
                     "mine",
                     "マイニング"
                 )
@@ -55,7 +54,6 @@ class ParaccoliEvents(commands.Cog):
                 await self._handle_warning(
                     message,
                     self.daily_warnings,
-                    self.last_daily_warning,
                     "daily",
                     "デイリーボーナス"
                 )
@@ -67,28 +65,16 @@ class ParaccoliEvents(commands.Cog):
                 await self._handle_warning(
                     message,
                     self.daily_warnings,
-                    self.last_daily_warning,
                     "register",
                     "初心者ガイド"
                 )
 
         # スパム検知（チャンネルに関係なく実行）
         user_id = message.author.id
-        current_time = datetime.now()
-        
-        # 1分以上前のメッセージを削除
-        self.message_history[user_id] = [
-            (msg, time) for msg, time in self.message_history[user_id]
-            if current_time - time < timedelta(minutes=1)
-        ]
-        
-        # 新しいメッセージを追加
-        self.message_history[user_id].append((message.content, current_time))
         
         # スパムチェック
-        if self._is_spam(user_id):
-            warning_count = self.warning_count[user_id] + 1
-            self.warning_count[user_id] = warning_count
+        if self.spam_guard.observe(user_id, message.content):
+            warning_count = self.spam_warnings.add(user_id)
             
             # スパムメッセージを削除
             try:
@@ -100,24 +86,26 @@ class ParaccoliEvents(commands.Cog):
                 # 3回警告で-100PARCペナルティ
                 db = SessionLocal()
                 try:
-                    user = db.query(User).filter(User.discord_id == str(user_id)).first()
-                    if user and user.wallet:
-                        user.wallet.parc_balance = max(0, user.wallet.parc_balance - 100)
+                    identity = identity_cache.lookup(db, str(user_id))
+                    if identity and identity.wallet_address:
                         penalty_tx = Transaction(
-                            from_address=user.wallet.address,
+                            from_address=identity.wallet_address,
                             to_address=None,
                             amount=100,
                             transaction_type="penalty",
                             timestamp=datetime.now()
                         )
-                        db.add(penalty_tx)
+                        # 残高が100未満なら0で止める
+                        ledger.apply(
+                            db, [Posting(identity.wallet_address, parc=-100, floor_at_zero=True)], [penalty_tx]
+                        )
                         db.commit()
                         
                         await message.channel.send(
                             embed=EmbedBuilder.spam_penalty(str(user_id)),
                             delete_after=30
                         )
-                        self.warning_count[user_id] = 0
+                        self.spam_warnings.reset(user_id)
                 finally:
                     db.close()
             else:
@@ -127,37 +115,22 @@ class ParaccoliEvents(commands.Cog):
                 )
                 return
 
-        # 通常のアクティビティ計測
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.discord_id == str(message.author.id)).first()
-            if user:
-                user.message_count += 1
-                db.commit()
-        except Exception as e:
-            self.logger.error(f"Message count error: {str(e)}")
-        finally:
-            db.close()
+        # 通常のアクティビティ計測（メモリに貯めて一定間隔でまとめてDBに反映）
+        self.bot.message_counter.increment(str(message.author.id))
 
-    async def _handle_warning(self, message, warnings_dict, last_warning_dict, command_type, channel_type):
+    async def _handle_warning(self, message, warnings: WarningCounter, command_type, channel_type):
         """警告処理の共通関数"""
         user_id = message.author.id
         current_time = datetime.now()
 
-        # 過去の警告をクリーンアップ (10分以上経過)
-        if user_id in last_warning_dict:
-            if (current_time - last_warning_dict[user_id]) > timedelta(minutes=10):
-                warnings_dict[user_id] = 0
-
-        # 警告回数を更新
-        warnings_dict[user_id] = warnings_dict.get(user_id, 0) + 1
-        last_warning_dict[user_id] = current_time
+        # 警告回数を更新（前回の警告から10分以上経過していればリセット済み）
+        warning_count = warnings.add(user_id)
 
         try:
-            is_third_warning = warnings_dict[user_id] >= 3
+            is_third_warning = warning_count >= 3
             
             warning_embed = EmbedBuilder.channel_restriction_warning(
-                str(user_id), command_type, warnings_dict[user_id]
+                str(user_id), command_type, warning_count
             )
             
             # 警告メッセージを送信
@@ -178,7 +151,7 @@ class ParaccoliEvents(commands.Cog):
             self.logger.error(f"警告メッセージ送信エラー: {str(e)}")
 
         # 3回警告でタイムアウト
-        if warnings_dict[user_id] >= 3:
+        if warning_count >= 3:
             try:
                 member = await message.guild.fetch_member(user_id)
                 if member:
@@ -191,28 +164,33 @@ class ParaccoliEvents(commands.Cog):
                     await message.channel.send(embed=timeout_embed, delete_after=60)
                     
                     # 警告カウントをリセット
-                    warnings_dict[user_id] = 0
+                    warnings.reset(user_id)
                     
             except Exception as e:
                 self.logger.error(f"タイムアウト適用エラー: {str(e)}")
 
-        # 3回警告でペナルティ
-        if warnings_dict[user_id] >= 3:
+        # 3回警告でペナルティ（タイムアウトを適用できた場合はリセット済み）
+        if warnings.get(user_id) >= 3:
             db = SessionLocal()
             try:
-                user = db.query(User).filter(User.discord_id == str(user_id)).first()
-                if user and user.wallet:
+                identity = identity_cache.lookup(db, str(user_id))
+                if identity and identity.wallet_address:
                     penalty_amount = 100
-                    if user.wallet.parc_balance >= penalty_amount:
-                        penalty_tx = Transaction(
-                            from_address=user.wallet.address,
-                            to_address=None,
-                            amount=penalty_amount,
-                            transaction_type="penalty",
-                            timestamp=current_time
-                        )
-                        db.add(penalty_tx)
-                        user.wallet.parc_balance -= penalty_amount
+                    penalty_tx = Transaction(
+                        from_address=identity.wallet_address,
+                        to_address=None,
+                        amount=penalty_amount,
+                        transaction_type="penalty",
+                        timestamp=current_time
+                    )
+                    try:
+                        # 残高が足りる場合だけ燃焼する
+                        ledger.apply(db, [Posting(identity.wallet_address, parc=-penalty_amount)], [penalty_tx])
+                        burned = True
+                    except InsufficientBalance:
+                        db.rollback()
+                        burned = False
+                    if burned:
                         db.commit()
 
                         penalty_embed = discord.Embed(
@@ -225,36 +203,21 @@ class ParaccoliEvents(commands.Cog):
                             delete_after=30
                         )
 
-                    warnings_dict[user_id] = 0
+                    warnings.reset(user_id)
 
             except Exception as e:
                 self.logger.error(f"ペナルティ処理エラー: {str(e)}")
             finally:
                 db.close()
 
-    def _is_spam(self, user_id: int) -> bool:
-        """スパムチェック"""
-        messages = self.message_history[user_id]
-        if len(messages) < 5:  # 5メッセージ未満は無視
-            return False
-            
-        # 直近5メッセージを確認
-        recent_messages = messages[-5:]
-        first_message = recent_messages[0][0]
-        
-        # 同一メッセージが3回以上連続で投稿されているかチェック
-        same_message_count = sum(1 for msg, _ in recent_messages if msg == first_message)
-        
-        # 5秒以内に5メッセージ以上、または同一メッセージが3回以上
-        time_diff = recent_messages[-1][1] - recent_messages[0][1]
-        return time_diff.seconds <= 5 or same_message_count >= 3
-
     async def check_game_clear(self, user_id: int, current_price: float, db_session):
         """ゲームクリア条件チェックと処理"""
         try:
-            user = db_session.query(User).filter(User.discord_id == str(user_id)).first()
-            if not user or not user.wallet:
+            identity = identity_cache.lookup(db_session, str(user_id))
+            # クリア済みならウォレットを読まずに終える
+            if not identity or identity.wallet_id is None or identity.has_cleared:
                 return
+            user = db_session.get(User, identity.user_id)
 
             total_assets = user.wallet.parc_balance * current_price + user.wallet.jpy_balance
             
@@ -263,6 +226,7 @@ class ParaccoliEvents(commands.Cog):
                 # クリア情報を更新
                 user.has_cleared = True
                 db_session.commit()
+                identity_cache.set_cleared(str(user_id), True)
 
                 # クリア通知用のEmbed作成
                 embed = discord.Embed(
@@ -355,13 +319,15 @@ class ParaccoliEvents(commands.Cog):
             # 新規スタート
             db = SessionLocal()
             try:
-                user = db.query(User).filter(User.discord_id == str(payload.user_id)).first()
+                user = identity_cache.user(db, str(payload.user_id))
                 if user:
                     # ウォレットをリセット
                     user.wallet.parc_balance = 100
                     user.wallet.jpy_balance = 100000  # 初期資金10万円
                     user.has_cleared = False
                     db.commit()
+                    # リセットしたユーザーの識別情報を破棄
+                    identity_cache.invalidate(str(payload.user_id))
 
                     # リセット通知用のEmbed
                     embed = discord.Embed(
@@ -3,19 +3,21 @@ from discord.ext import commands, tasks
 import asyncio
 from ..utils.config import Config, DISCORD_RULES_CHANNEL_ID, DISCORD_HELP_CHANNEL_ID, DISCORD_WORDS_CHANNEL_ID, DISCORD_COMMANDS_CHANNEL_ID
 from ..utils.logger import Logger, setup_logger
-from ..database.database import init_db, SessionLocal
+from ..database.database import init_db, SessionLocal, run_db, shutdown_db_executor
+from ..database.trade_pipeline import trade_pipeline
 import os
 from datetime import datetime, timedelta, timezone
-from ..database.models import Wallet, PriceHistory
 from ..utils.event_manager import EventManager
 from ..bot.tasks import ParaccoliTasks
 from ..bot.events import ParaccoliEvents
 import psutil
 from ..utils.embed_builder import EmbedBuilder
 from ..utils.price_calculator import PriceCalculator
+from ..utils.message_counter import MessageCounter
+from ..utils.broadcaster import Broadcaster
+from ..utils.market_stats import market_stats
 from ..utils.chart_builder import ChartBuilder
 import pytz
-from sqlalchemy import func
 import glob
 import json
 import shutil
@@ -57,6 +59,10 @@ class ParaccoliBot(commands.Bot):
         self.config = Config()
         self.event_manager = EventManager(self)
         self.price_calculator = PriceCalculator(self)
+        # メッセージ数はまとめてDBに反映する
+        self.message_counter = MessageCounter(SessionLocal)
+        # 全ユーザー宛てDMの送信キュー
+        self.broadcaster = Broadcaster(self)
         # タイムゾーンを設定
         self.tz = pytz.timezone('Asia/Tokyo')
         self.total_supply = 100_000_000  # 総発行上限を追加
@@ -71,9 +77,19 @@ class ParaccoliBot(commands.Bot):
             finally:
                 db.close()
 
+            # 再起動前に未完了だったDM一斉送信も続きから再開する
+            self.broadcaster.start()
+
             self.price_calculator = PriceCalculator(self)
             self.logger.info("PriceCalculator initialized")
 
+            # 市場操作検出器は最初の取引を待たずに、起動時に直近24時間の取引で埋めておく
+            try:
+                async with run_db() as db:
+                    await db.run(self.price_calculator.warm_manipulation_detector)
+            except Exception as e:
+                self.logger.error(f"市場操作検出器のウォームアップに失敗しました: {e}")
+
             # コマンドの読み込み
             await self.load_extension("src.bot.commands")
             self.logger.info("Commands loaded successfully")
@@ -105,18 +121,11 @@ class ParaccoliBot(commands.Bot):
     async def status_task(self):
         """ステータス更新タスク"""
         try:
-            db = SessionLocal()
-            
-            # 総発行量を取得
-            total_supply = db.query(func.sum(Wallet.parc_balance)).scalar() or 0
-            
-            # 現在価格を取得
-            current_price = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .first()
-            
-            # 価格が取得できない場合は初期価格を使用
-            price_display = current_price.price if current_price else 100.0
+            # /stats・/rich と共有する統計をここで1分に1回集計し直す
+            snapshot = await market_stats.refresh_async()
+            total_supply, price_display = snapshot.total_supply, snapshot.price
+            if snapshot.clear_candidates:
+                await self._check_game_clears(snapshot)
             
             # ステータス表示
             status_text = (
@@ -135,6 +144,16 @@ class ParaccoliBot(commands.Bot):
 
         except Exception as e:
             self.logger.error(f"Status update error: {e}", exc_info=True)
+
+    async def _check_game_clears(self, snapshot):
+        """価格変動で億り人に達したユーザーのクリア処理"""
+        events_cog = self.get_cog('ParaccoliEvents')
+        if not events_cog:
+            return
+        db = SessionLocal()
+        try:
+            for discord_id in snapshot.clear_candidates:
+                await events_cog.check_game_clear(int(discord_id), snapshot.price, db)
         finally:
             db.close()
 
@@ -254,7 +273,16 @@ class ParaccoliGuildBot(ParaccoliBot):
         """Botのクリーンアップ処理"""
         try:
             self.logger.info("Shutting down bot...")
+            # 送信中のDMは次回起動時に続きから送る
+            await self.broadcaster.stop()
             await super().close()
+            # 保留中の取引を書き込んでから終了する
+            await trade_pipeline.flush()
+            # 保留中の価格状態を書き出す
+            self.price_calculator._save_price_state(force=True)
+            # 未反映のメッセージ数を書き出す
+            self.message_counter.close()
+            shutdown_db_executor()
         except Exception as e:
             self.logger.error(f"Error during shutdown: {e}")
 
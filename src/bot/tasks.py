@@ -1,10 +1,10 @@
 from discord.ext import tasks, commands
-from ..database.database import SessionLocal
-from ..database.models import User, DailyStats
+from ..database.database import SessionLocal, run_db, ThreadedSession
+from ..database.models import DailyStats
 from datetime import datetime, timedelta, timezone
-import pytz
 from ..utils.embed_builder import EmbedBuilder
 from ..utils.trading_hours import TradingHours
+from ..utils.identity_cache import identity_cache
 from ..utils.logger import Logger
 from ..utils.config import Config
 from discord import Embed
@@ -21,8 +21,8 @@ import logging
 import random
 import base64
 import shutil
-from ..database.models import Order
-from ..database.models import Wallet
+from ..database.trade_pipeline import trade_pipeline
+from ..utils.order_lifecycle import LimitFill, settle_crossing_orders
 from sqlalchemy.orm import Session
 import asyncio
 
@@ -39,11 +39,12 @@ class ParaccoliTasks(commands.Cog):
         self.process_orders.start()
         self.update_price_info.start()
         self.check_daily_event.start()
-        self.save_manipulation_flags.start()  # フラグ保存タスク開始
-        self.save_flags_periodically.start()  # 新しいタスクを追加
-        self.backup_permanent_flags.start()   # 永続フラグのバックアップタスクを開始
+        self.save_permanent_flags.start()  # 永続フラグの保存タスク開始
         self.update_random_prices.start()  # 10秒ごとのランダム価格更新タスク
-        self.check_trading_hours.start()  # 取引時間監視タスクを開始
+        # 取引セッションの切り替わりはカレンダーから通知を受ける（ポーリングしない）
+        self.session_calendar = TradingHours.calendar()
+        self.session_calendar.subscribe(self._on_session_transition)
+        self.watch_trading_sessions.start()
         self.last_trading_notification = None  # 最後の通知タイプを保存
         self.last_session_price = None
         self.last_session_time = None
@@ -53,12 +54,6 @@ class ParaccoliTasks(commands.Cog):
         self.cleanup_logs_frequently.start()  # 30分ごとのログクリーンアップを追加
         self.cleanup_temp_data.start()  # 30分ごとの不要データクリーンアップを追加
         self.save_price_state.start()  # 新しいタスクを開始
-        # セッション開始・終了通知のフラグ
-        self.today_morning_open_notified = False
-        self.today_morning_close_notified = False
-        self.today_afternoon_open_notified = False
-        self.today_afternoon_close_notified = False
-        self.last_trading_state = False
 
 
     def cog_unload(self):
@@ -66,9 +61,11 @@ class ParaccoliTasks(commands.Cog):
         self.process_orders.cancel()
         self.update_price_info.cancel()
         self.check_daily_event.cancel()
+        self.save_permanent_flags.cancel()
         self.cleanup_logs_frequently.cancel()  # 追加したタスクのキャンセル
         self.cleanup_temp_data.cancel()  # 追加したタスクのキャンセル
         self.save_price_state.cancel()
+        self.watch_trading_sessions.cancel()
 
     @tasks.loop(minutes=30)  # 30分ごとに実行
     async def cleanup_logs_frequently(self):
@@ -211,60 +208,30 @@ class ParaccoliTasks(commands.Cog):
         """不要データ削除タスク開始前の処理"""
         await self.bot.wait_until_ready()
 
-    @tasks.loop(seconds=60)  # 1分おきにチェック
-    async def check_trading_hours(self):
-        """取引時間の監視と通知"""
-        if not self.bot.is_ready():
-            return
-            
-        try:
-            # 現在の時刻を取得
-            current_time = TradingHours.get_current_time()
-            self.logger.info(f"取引時間チェック: {current_time.strftime('%H:%M:%S')}")
-            
-            # 現在の取引時間状態
-            is_trading_hours = TradingHours.is_trading_hours()
-            
-            # 前場開始時刻と終了時刻を取得
-            # get_session_time がなく、エラーになっているので直接アクセス
-            morning_start = datetime.combine(current_time.date(), TradingHours.MORNING_SESSION_START)
-            morning_start = pytz.timezone('Asia/Tokyo').localize(morning_start)
-            
-            morning_end = datetime.combine(current_time.date(), TradingHours.MORNING_SESSION_END)
-            morning_end = pytz.timezone('Asia/Tokyo').localize(morning_end)
-            
-            # 後場開始時刻と終了時刻を取得
-            afternoon_start = datetime.combine(current_time.date(), TradingHours.AFTERNOON_SESSION_START)
-            afternoon_start = pytz.timezone('Asia/Tokyo').localize(afternoon_start)
-            
-            afternoon_end = datetime.combine(current_time.date(), TradingHours.AFTERNOON_SESSION_END)
-            afternoon_end = pytz.timezone('Asia/Tokyo').localize(afternoon_end)
-            
-            # 取引状態が変わったときのみ通知
-            if is_trading_hours != self.last_trading_state:
-                self.last_trading_state = is_trading_hours
-                
-                if is_trading_hours:
-                    # 取引時間開始通知
-                    session_name = "前場" if current_time.time() < TradingHours.AFTERNOON_SESSION_START else "後場"
-                    notification = f"🔔 **{session_name}の取引が開始しました**"
-                    await self._send_trading_notification(notification)
-                    self.last_trading_notification = "start"
-                else:
-                    # 取引時間終了通知
-                    session_name = "前場" if current_time.time() < TradingHours.AFTERNOON_SESSION_START else "後場"
-                    notification = f"🔔 **{session_name}の取引が終了しました**"
-                    await self._send_trading_notification(notification)
-                    self.last_trading_notification = "end"
-                    
-        except Exception as e:
-            self.logger.error(f"取引時間チェックエラー: {e}", exc_info=True)
+    @tasks.loop(count=1)
+    async def watch_trading_sessions(self):
+        """取引セッションの開始・終了を待って通知（SessionCalendar の購読）"""
+        await self.session_calendar.watch()
 
-    @check_trading_hours.before_loop
-    async def before_check_trading_hours(self):
-        """取引時間監視タスク開始前の処理"""
+    @watch_trading_sessions.before_loop
+    async def before_watch_trading_sessions(self):
+        """取引セッション監視タスク開始前の処理"""
         await self.bot.wait_until_ready()
 
+    async def _on_session_transition(self, transition):
+        """取引セッションの開始・終了時の通知"""
+        session_name = transition.session.name
+        if transition.is_start:
+            await self._send_trading_notification(f"🔔 **{session_name}の取引が開始しました**")
+            self.last_trading_notification = "start"
+            # 始値通知
+            await self._notify_session_open(session_name)
+        else:
+            await self._send_trading_notification(f"🔔 **{session_name}の取引が終了しました**")
+            self.last_trading_notification = "end"
+            # 終値通知
+            await self._notify_session_close(session_name)
+
 
     @tasks.loop(hours=24)  # 24時間に1回実行
     async def cleanup_logs(self):
@@ -504,182 +471,67 @@ class ParaccoliTasks(commands.Cog):
     @tasks.loop(minutes=1)
     async def process_orders(self):
         """指値注文の処理"""
-        db = SessionLocal()
         try:
             # 現在の価格をリアルタイムチャートの価格に変更
             price_calculator = self.bot.price_calculator if hasattr(self.bot, 'price_calculator') else PriceCalculator(self.bot)
             current_price = price_calculator.get_latest_random_price()
-            
-            # 未約定の注文を取得
-            pending_orders = db.query(Order)\
-                .filter(Order.status == 'pending')\
-                .all()
 
-            for order in pending_orders:
-                try:
-                    # 買い注文の処理
-                    if order.side == 'buy' and order.price >= current_price:
-                        await self._execute_buy_order(order, current_price, db)
-                    
-                    # 売り注文の処理
-                    elif order.side == 'sell' and order.price <= current_price:
-                        await self._execute_sell_order(order, current_price, db)
+            # 指値に届いた注文の未約定分をまとめて約定させる（書き込めない注文は飛ばしてほかを約定させる）
+            fills = await trade_pipeline.submit(settle_crossing_orders, current_price)
+            if not fills:
+                return
 
-                except Exception as e:
-                    self.logger.error(f"Order processing error: {str(e)}")
-                    continue
+            async with run_db() as db:
+                for fill in fills:
+                    await self._notify_fill(fill, db)
 
         except Exception as e:
             self.logger.error(f"Order processing loop error: {str(e)}")
-        finally:
-            db.close()
-
-    async def _execute_buy_order(self, order: Order, current_price: float, db: Session):
-        """買い注文の執行"""
-        wallet = db.query(Wallet).filter(Wallet.address == order.wallet_address).first()
-        if not wallet:
-            return
-
-        # 取引手数料の計算
-        fee = order.amount * current_price * 0.001  # 0.1%
-        total_cost = (order.amount * current_price) + fee
 
-        # 残高チェック
-        if wallet.jpy_balance < total_cost:
-            order.status = 'cancelled'
-            db.commit()
-            return
-
-        # 取引実行
-        wallet.jpy_balance -= total_cost
-        wallet.parc_balance += order.amount
-
-        # 取引記録
-        transaction = Transaction(
-            to_address=wallet.address,
-            amount=order.amount,
-            price=current_price,
-            fee=fee,
-            transaction_type="buy",
-            order_type="limit"
-        )
-        db.add(transaction)
-
-        # 手数料の記録
-        fee_transaction = Transaction(
-            from_address=wallet.address,
-            amount=fee,
-            transaction_type="fee"
-        )
-        db.add(fee_transaction)
-
-        # 注文状態の更新
-        order.status = 'filled'
-        db.commit()
+    async def _notify_fill(self, fill: LimitFill, db: ThreadedSession):
+        """約定の検出器への通知とDM"""
+        await self._observe_trade(db, fill.transaction_id, fill.side, fill.wallet_address, fill.amount)
 
-        # 通知の送信
         try:
-            user = db.query(User).filter(User.wallet.has(address=wallet.address)).first()
-            if user:
-                member = await self.bot.fetch_user(int(user.discord_id))
+            discord_id = await db.run(self._find_discord_id, fill.wallet_address)
+            if discord_id:
+                member = await self.bot.fetch_user(int(discord_id))
                 if member:
+                    action = "購入" if fill.side == 'buy' else "売却"
                     embed = EmbedBuilder.success(
                         "指値注文が約定しました 💹",
-                        f"{order.amount:,} PARCを ¥{total_cost:,.0f} で購入しました"
+                        f"{fill.amount:,} PARCを ¥{fill.total:,.0f} で{action}しました"
                     )
                     embed.add_field(
                         name="💰 取引詳細",
                         value=(
-                            f"価格: ¥{current_price:,.2f}/PARC\n"
-                            f"手数料: ¥{fee:,.0f} (0.1%)"
-                        ),
-                        inline=False
-                    )
-                    embed.add_field(
-                        name="💳 新しい残高",
-                        value=(
-                            f"PARC: {wallet.parc_balance:,}\n"
-                            f"JPY: ¥{wallet.jpy_balance:,}"
+                            f"価格: ¥{fill.price:,.2f}/PARC\n"
+                            f"手数料: ¥{fill.fee:,.0f} (0.1%)"
                         ),
                         inline=False
                     )
+                    if fill.balance is not None:
+                        embed.add_field(
+                            name="💳 新しい残高",
+                            value=(
+                                f"PARC: {fill.balance.parc:,}\n"
+                                f"JPY: ¥{fill.balance.jpy:,}"
+                            ),
+                            inline=False
+                        )
                     await member.send(embed=embed)
         except Exception as e:
             self.logger.error(f"Notification error: {str(e)}")
 
-    async def _execute_sell_order(self, order: Order, current_price: float, db: Session):
-        """売り注文の執行"""
-        wallet = db.query(Wallet).filter(Wallet.address == order.wallet_address).first()
-        if not wallet:
-            return
-
-        # PARC残高チェック
-        if wallet.parc_balance < order.amount:
-            order.status = 'cancelled'
-            db.commit()
-            return
-
-        # 取引金額と手数料の計算
-        sale_amount = order.amount * current_price
-        fee = sale_amount * 0.001  # 0.1%
-        total_amount = sale_amount - fee
-
-        # 取引実行
-        wallet.parc_balance -= order.amount
-        wallet.jpy_balance += total_amount
+    async def _observe_trade(self, db: ThreadedSession, tx_id: int, side: str, address: str, amount: float):
+        """約定した取引を市場操作のストリーム検出器へ渡す"""
+        price_calculator = self.bot.price_calculator if hasattr(self.bot, 'price_calculator') else PriceCalculator(self.bot)
+        await db.run(price_calculator.observe_trade, tx_id, side, address, amount)
 
-        # 取引記録
-        transaction = Transaction(
-            from_address=wallet.address,
-            amount=order.amount,
-            price=current_price,
-            fee=fee,
-            transaction_type="sell",
-            order_type="limit"
-        )
-        db.add(transaction)
-
-        # 手数料の記録（燃焼）
-        fee_transaction = Transaction(
-            from_address=wallet.address,
-            amount=fee,
-            transaction_type="fee"
-        )
-        db.add(fee_transaction)
-
-        # 注文状態の更新
-        order.status = 'filled'
-        db.commit()
-
-        # 通知の送信
-        try:
-            user = db.query(User).filter(User.wallet.has(address=wallet.address)).first()
-            if user:
-                member = await self.bot.fetch_user(int(user.discord_id))
-                if member:
-                    embed = EmbedBuilder.success(
-                        "指値注文が約定しました 💹",
-                        f"{order.amount:,} PARCを ¥{total_amount:,.0f} で売却しました"
-                    )
-                    embed.add_field(
-                        name="💰 取引詳細",
-                        value=(
-                            f"価格: ¥{current_price:,.2f}/PARC\n"
-                            f"手数料: ¥{fee:,.0f} (0.1%)"
-                        ),
-                        inline=False
-                    )
-                    embed.add_field(
-                        name="💳 新しい残高",
-                        value=(
-                            f"PARC: {wallet.parc_balance:,}\n"
-                            f"JPY: ¥{wallet.jpy_balance:,}"
-                        ),
-                        inline=False
-                    )
-                    await member.send(embed=embed)
-        except Exception as e:
-            self.logger.error(f"Notification error: {str(e)}")
+    @staticmethod
+    def _find_discord_id(db: Session, wallet_address: str):
+        """ウォレットアドレスから通知先のDiscord IDを取得"""
+        return identity_cache.discord_id_for_address(db, wallet_address)
 
     async def cleanup_old_charts(self, temp_dir: str = "temp", max_age: int = 300):
         """古いチャート画像を削除（5分以上経過したものを削除）"""
@@ -723,38 +575,7 @@ class ParaccoliTasks(commands.Cog):
             current_time = TradingHours.get_current_time()
             is_trading_hours = TradingHours.is_trading_hours()
             session_type = TradingHours.get_session_type()  # morning, afternoon, None
-            
-            # 日付変更時にフラグをリセット
-            if hasattr(self, '_last_check_date'):
-                if self._last_check_date != current_time.date():
-                    self.today_morning_open_notified = False
-                    self.today_morning_close_notified = False
-                    self.today_afternoon_open_notified = False
-                    self.today_afternoon_close_notified = False
-                    self._last_check_date = current_time.date()
-            else:
-                self._last_check_date = current_time.date()
-            
-            # 取引開始・終了のタイミング検出
-            if TradingHours.is_session_start("morning") and not self.today_morning_open_notified:
-                # 前場開始 - 始値通知
-                await self._notify_session_open("前場")
-                self.today_morning_open_notified = True
-            
-            elif TradingHours.is_session_end("morning") and not self.today_morning_close_notified:
-                # 前場終了 - 終値通知
-                await self._notify_session_close("前場")
-                self.today_morning_close_notified = True
-                
-            elif TradingHours.is_session_start("afternoon") and not self.today_afternoon_open_notified:
-                # 後場開始 - 始値通知
-                await self._notify_session_open("後場")
-                self.today_afternoon_open_notified = True
-                
-            elif TradingHours.is_session_end("afternoon") and not self.today_afternoon_close_notified:
-                # 後場終了 - 終値通知
-                await self._notify_session_close("後場")
-                self.today_afternoon_close_notified = True
+            # セッション開始・終了の通知は _on_session_transition で行う
             
             # 取引時間外は最新価格の計算をスキップ
             # ただし、セッション開始・終了直後は例外とする
@@ -771,47 +592,23 @@ class ParaccoliTasks(commands.Cog):
             self._calculating_price = True
             
             # 最新価格の計算とDB保存
-            db = SessionLocal()
             try:
                 now = datetime.now()
                 
                 # Botインスタンスからprize_calculatorを取得
                 price_calculator = self.bot.price_calculator if hasattr(self.bot, 'price_calculator') else PriceCalculator(self.bot)
                 
-                # 価格を1回だけ計算
+                # 価格を1回だけ計算（DB処理はスレッドプールで実行）
                 self.logger.info("1分間隔の価格計算を開始...")
-                current_price = price_calculator.calculate_price(db)
+                async with run_db() as db:
+                    current_price, volume_24h, price_change, price_history = await db.run(
+                        self._record_price_tick, price_calculator
+                    )
                 self.logger.info(f"価格計算完了: ¥{current_price:,.2f}")
                 
                 # ChartBuilderに計算価格を設定
                 from src.utils.chart_builder import ChartBuilder
                 ChartBuilder.set_calculated_price(current_price)
-                
-                # 24時間取引量を取得
-                yesterday = datetime.now() - timedelta(days=1)
-                volume_24h = db.query(func.sum(Transaction.amount))\
-                    .filter(
-                        Transaction.timestamp >= yesterday,
-                        Transaction.transaction_type.in_(['buy', 'sell'])
-                    ).scalar() or 0
-
-                # 過去の価格を取得
-                last_price = db.query(PriceHistory)\
-                    .order_by(PriceHistory.timestamp.desc())\
-                    .first()
-
-                # 変動率計算
-                price_change = ((current_price - last_price.price) / last_price.price * 100) if last_price else 0
-
-                # 新しい価格履歴を作成
-                new_price = PriceHistory(
-                    timestamp=datetime.now(),
-                    price=current_price,
-                    volume=volume_24h,
-                    market_cap=current_price * volume_24h
-                )
-                db.add(new_price)
-                db.commit()
 
                 # 取引セッションの状態を保存
                 if is_trading_hours or TradingHours.is_session_end():
@@ -819,12 +616,6 @@ class ParaccoliTasks(commands.Cog):
                     self.last_session_time = current_time
                     self.last_session_type = session_type
 
-                # チャート生成用のデータ取得(直近60分)
-                price_history = db.query(PriceHistory)\
-                    .filter(PriceHistory.timestamp >= datetime.now() - timedelta(hours=2))\
-                    .order_by(PriceHistory.timestamp.asc())\
-                    .all()
-
                 # tempディレクトリが存在しない場合は作成
                 os.makedirs("temp", exist_ok=True)
 
@@ -919,11 +710,7 @@ class ParaccoliTasks(commands.Cog):
 
             except Exception as e:
                 self.logger.error(f"チャート更新エラー: {e}", exc_info=True)
-                if db and db.is_active:
-                    db.rollback()
             finally:
-                if db:
-                    db.close()
                 # 計算完了フラグをリセット
                 self._calculating_price = False
 
@@ -942,6 +729,46 @@ class ParaccoliTasks(commands.Cog):
                 self._calculating_price = False  # エラー時もフラグをリセット
             self.logger.error(f"価格情報更新エラー: {e}", exc_info=True)
 
+    @staticmethod
+    def _record_price_tick(db: Session, price_calculator):
+        """価格計算と価格履歴の保存（DBスレッドで実行）"""
+        current_price = price_calculator.calculate_price(db)
+
+        # 24時間取引量を取得
+        yesterday = datetime.now() - timedelta(days=1)
+        volume_24h = db.query(func.sum(Transaction.amount))\
+            .filter(
+                Transaction.timestamp >= yesterday,
+                Transaction.transaction_type.in_(['buy', 'sell'])
+            ).scalar() or 0
+
+        # 過去の価格を取得
+        last_price = db.query(PriceHistory)\
+            .order_by(PriceHistory.timestamp.desc())\
+            .first()
+
+        # 変動率計算
+        price_change = ((current_price - last_price.price) / last_price.price * 100) if last_price else 0
+
+        # 新しい価格履歴を作成
+        new_price = PriceHistory(
+            timestamp=datetime.now(),
+            price=current_price,
+            volume=volume_24h,
+            market_cap=current_price * volume_24h
+        )
+        db.add(new_price)
+        db.commit()
+        price_calculator.record_price_tick(current_price, new_price.timestamp)
+
+        # チャート生成用のデータ取得(直近60分)
+        price_history = db.query(PriceHistory)\
+            .filter(PriceHistory.timestamp >= datetime.now() - timedelta(hours=2))\
+            .order_by(PriceHistory.timestamp.asc())\
+            .all()
+
+        return current_price, volume_24h, price_change, price_history
+
     async def _notify_session_open(self, session_name):
         """取引セッション開始時の始値通知"""
         try:
@@ -1021,15 +848,14 @@ class ParaccoliTasks(commands.Cog):
                 
                 # 当日のセッション開始時の価格を取得
                 today = TradingHours.get_current_time().date()
-                today_start = datetime.combine(today, TradingHours.MORNING_SESSION_START).replace(tzinfo=pytz.timezone('Asia/Tokyo'))
                 
-                # セッションに応じた時間帯を設定
-                if session_name == "前場":
-                    session_start = datetime.combine(today, TradingHours.MORNING_SESSION_START).replace(tzinfo=pytz.timezone('Asia/Tokyo'))
-                    session_end = datetime.combine(today, TradingHours.MORNING_SESSION_END).replace(tzinfo=pytz.timezone('Asia/Tokyo'))
-                else:  # 後場
-                    session_start = datetime.combine(today, TradingHours.AFTERNOON_SESSION_START).replace(tzinfo=pytz.timezone('Asia/Tokyo'))
-                    session_end = datetime.combine(today, TradingHours.AFTERNOON_SESSION_END).replace(tzinfo=pytz.timezone('Asia/Tokyo'))
+                # セッションに応じた時間帯を設定（カレンダーの前計算済みの境界を使う）
+                session = self.session_calendar.session_by_name(session_name)
+                bounds = self.session_calendar.session_bounds(today, session.key) if session else None
+                if bounds:
+                    session_start, session_end = bounds
+                else:
+                    session_start = session_end = TradingHours.get_current_time()
                 
                 # セッション開始時の価格を取得
                 session_open_data = db.query(PriceHistory)\
@@ -1091,46 +917,17 @@ class ParaccoliTasks(commands.Cog):
         """イベントチェックタスク開始前の処理"""
         await self.bot.wait_until_ready()
 
-    @tasks.loop(hours=1)
-    async def save_manipulation_flags(self):
-        """操作検出フラグを定期的に保存"""
-        try:
-            if hasattr(self.bot, 'price_calculator'):
-                self.bot.price_calculator._save_permanent_flags()
-                self.logger.info("市場操作検出フラグを定期保存しました")
-        except Exception as e:
-            self.logger.error(f"定期保存エラー: {str(e)}")
-
-    @tasks.loop(minutes=15)  # 15分ごとに保存
-    async def save_flags_periodically(self):
-        """操作検出フラグを定期的に保存"""
-        try:
-            if hasattr(self.bot, 'price_calculator'):
-                self.bot.price_calculator._save_permanent_flags()
-                self.logger.info("操作検出フラグを定期保存しました")
-        except Exception as e:
-            self.logger.error(f"フラグの定期保存に失敗しました: {e}")
-
     @tasks.loop(minutes=5)
     async def save_permanent_flags(self):
-        """永続的なフラグを定期的に保存"""
+        """永続的なフラグを定期的に保存（ジャーナルを同期し、1時間ごとにスナップショットへ統合）"""
         try:
-            if hasattr(self.bot, "price_calculator"):
-                self.bot.price_calculator._save_permanent_flags()
+            if hasattr(self.bot, "price_calculator") and self.bot.price_calculator:
+                compact = self.save_permanent_flags.current_loop % 12 == 0
+                self.bot.price_calculator._save_permanent_flags(compact=compact)
                 self.logger.info("永続フラグを定期的に保存しました")
         except Exception as e:
             self.logger.error(f"永続フラグの定期保存エラー: {e}")
 
-    @tasks.loop(minutes=10)
-    async def backup_permanent_flags(self):
-        """永続フラグを定期的に保存"""
-        try:
-            if hasattr(self.bot, 'price_calculator') and self.bot.price_calculator:
-                self.bot.price_calculator._save_permanent_flags()
-                self.logger.info("永続フラグの定期バックアップを実行しました")
-        except Exception as e:
-            self.logger.error(f"永続フラグバックアップエラー: {str(e)}")
-
     @tasks.loop(seconds=10)
     async def update_random_prices(self):
         """ランダム価格を10秒ごとに更新"""
@@ -1293,10 +1090,10 @@ class ParaccoliTasks(commands.Cog):
 
     @tasks.loop(minutes=5)
     async def save_price_state(self):
-        """価格情報を定期的に保存"""
+        """価格情報を定期的に保存（計算ごとのチェックポイントに加えた保険）"""
         try:
             if hasattr(self.bot, 'price_calculator'):
-                self.bot.price_calculator._save_price_state()
+                self.bot.price_calculator._save_price_state(force=True)
         except Exception as e:
             self.logger.error(f"価格状態の保存エラー: {e}", exc_info=True)
 
@@ -1,10 +1,17 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import os
 from dotenv import load_dotenv
 from ..utils.logger import Logger
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import asyncio
+import threading
+import time
 
 load_dotenv()
 
@@ -15,17 +22,229 @@ MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost')
 MYSQL_PORT = os.getenv('MYSQL_PORT', '3306')
 MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'paraccoli')
 
-# MySQL用のURLを作成
-DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+
+def get_database_url() -> str:
+    """接続先URLを取得（DATABASE_URL が設定されていればそちらを優先）
+
+    例: sqlite:///paraccoli_local.db（ファイル）, sqlite://（インメモリ）
+    """
+    url = os.getenv('DATABASE_URL')
+    if url:
+        return url
+    # MySQL用のURLを作成
+    return f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+
+
+def is_sqlite_url(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def is_sqlite_memory_url(url: str) -> bool:
+    return url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url
+
+
+DATABASE_URL = get_database_url()
+IS_SQLITE = is_sqlite_url(DATABASE_URL)
+
+# 用途別のエンジンプロファイル（DB_PROFILE で選択）
+ENGINE_PROFILES = {
+    # Discord Bot本体
+    'bot': {
+        'pool_size': 20,  # コネクションプール数
+        'max_overflow': 10,  # 最大オーバーフロー数
+        'pool_timeout': 30,  # タイムアウト時間
+        'pool_recycle': 1800,  # コネクション再利用時間(30分)
+        'pool_pre_ping': True,
+    },
+    # WebSocket / APIサーバー（読み取り中心なのでBotより小さく）
+    'api': {
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_timeout': 10,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+    },
+    # メンテナンススクリプト
+    'maintenance': {
+        'pool_size': 2,
+        'max_overflow': 0,
+        'pool_timeout': 60,
+        'pool_recycle': 3600,
+        'pool_pre_ping': True,
+    },
+    # テスト
+    'test': {
+        'pool_size': 5,
+        'max_overflow': 0,
+        'pool_timeout': 5,
+        'pool_recycle': -1,
+        'pool_pre_ping': False,
+    },
+}
+
+DB_PROFILE = os.getenv('DB_PROFILE', 'bot')
+
+
+def _env_bool(key: str, default: bool) -> bool:
+    value = os.getenv(key)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_engine_options(profile: str = DB_PROFILE, url: str = None) -> dict:
+    """プロファイルと環境変数からエンジン設定を組み立てる"""
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE: {profile}")
+    url = url or DATABASE_URL
+
+    options = dict(ENGINE_PROFILES[profile])
+    # 個別の環境変数で上書き可能
+    options['pool_size'] = int(os.getenv('DB_POOL_SIZE', options['pool_size']))
+    options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', options['max_overflow']))
+    options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', options['pool_timeout']))
+    options['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE', options['pool_recycle']))
+    options['pool_pre_ping'] = _env_bool('DB_POOL_PRE_PING', options['pool_pre_ping'])
+
+    # コンパイル済みSQLのキャッシュサイズ（0で無効）
+    statement_cache_size = os.getenv('DB_STATEMENT_CACHE_SIZE')
+    if statement_cache_size is not None:
+        options['query_cache_size'] = int(statement_cache_size)
+
+    if is_sqlite_url(url):
+        # DBスレッドプールから使うため同一スレッド制約を外す
+        options['connect_args'] = {'check_same_thread': False}
+        if is_sqlite_memory_url(url):
+            # インメモリDBは1接続を共有しないとテーブルが見えなくなる
+            for key in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+                options.pop(key)
+            options['poolclass'] = StaticPool
+            return options
+    else:
+        # MySQL側の接続属性にプロファイル名を載せ、どのプロセスの接続か識別できるようにする
+        options['connect_args'] = {'program_name': f"paraccoli-{profile}"}
+
+    options['poolclass'] = InstrumentedQueuePool
+    return options
+
+
+class PoolMonitor:
+    """コネクションプールの計測値（プールイベントから収集）"""
+
+    def __init__(self, profile: str, sample_size: int = 1000):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=sample_size)
+        self.pool = None
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.waits = 0  # 待ち時間を記録した回数（total_wait と同じく起動からの累計）
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def attach(self, engine):
+        """エンジンのプールにイベントリスナーを登録"""
+        self.pool = engine.pool
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            self._waits.append(wait)
+            self.waits += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        """現在の計測値を辞書で返す（時間はミリ秒）"""
+        with self._lock:
+            waits = sorted(self._waits)
+            result = {
+                'profile': self.profile,
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'avg_wait_ms': (self.total_wait / self.waits * 1000) if self.waits else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'p95_wait_ms': (waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000) if waits else 0.0,
+            }
+        pool = self.pool
+        result['pool_size'] = pool.size() if hasattr(pool, 'size') else None
+        result['overflow'] = max(0, pool.overflow()) if hasattr(pool, 'overflow') else 0
+        return result
+
+
+pool_monitor = PoolMonitor(DB_PROFILE)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """チェックアウト待ち時間を計測するQueuePool"""
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super().connect()
+        except sqlalchemy_exc.TimeoutError:
+            pool_monitor.record_wait(time.perf_counter() - started_at, timed_out=True)
+            raise
+        pool_monitor.record_wait(time.perf_counter() - started_at)
+        return connection
+
+
+ENGINE_OPTIONS = get_engine_options(DB_PROFILE, DATABASE_URL)
+
+# コネクションプール数（DB実行スレッド数もこれに合わせる）
+POOL_SIZE = ENGINE_OPTIONS.get('pool_size', ENGINE_PROFILES[DB_PROFILE]['pool_size'])
 
 # エンジン設定
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=20,  # コネクションプール数
-    max_overflow=10,  # 最大オーバーフロー数
-    pool_timeout=30,  # タイムアウト時間
-    pool_recycle=1800  # コネクション再利用時間(30分)
-)
+engine = create_engine(DATABASE_URL, **ENGINE_OPTIONS)
+pool_monitor.attach(engine)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """SQLite接続時の設定（MySQLと同様に外部キーを有効化）"""
+    if not IS_SQLITE:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    if not is_sqlite_memory_url(DATABASE_URL):
+        # 負荷試験時の書き込み待ちを減らす
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -38,7 +257,7 @@ def init_db():
     try:
         Base.metadata.create_all(bind=engine)
     except Exception as e:
-        Logger.error(f"Database initialization failed: {e}")
+        Logger(__name__).error(f"Database initialization failed: {e}")
         raise
 
 def get_db():
@@ -72,4 +291,142 @@ def db_session():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+class DBExecutorStats:
+    """DB実行スレッドプールの計測値（キュー待ち時間とクエリ時間）"""
+
+    def __init__(self, sample_size: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=sample_size)  # (待ち時間, 実行時間) の直近サンプル
+        self.total_calls = 0
+        self.total_wait = 0.0
+        self.total_query = 0.0
+        self.max_wait = 0.0
+        self.max_query = 0.0
+        self.in_flight = 0
+
+    def submitted(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def record(self, wait: float, query: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.total_calls += 1
+            self.total_wait += wait
+            self.total_query += query
+            self.max_wait = max(self.max_wait, wait)
+            self.max_query = max(self.max_query, query)
+            self._samples.append((wait, query))
+
+    @staticmethod
+    def _percentile(values, ratio):
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * ratio))]
+
+    def snapshot(self) -> dict:
+        """現在の計測値を辞書で返す（時間はミリ秒）"""
+        with self._lock:
+            samples = list(self._samples)
+            calls = self.total_calls
+            result = {
+                'calls': calls,
+                'in_flight': self.in_flight,
+                'avg_wait_ms': (self.total_wait / calls * 1000) if calls else 0.0,
+                'avg_query_ms': (self.total_query / calls * 1000) if calls else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'max_query_ms': self.max_query * 1000,
+            }
+        waits = [w for w, _ in samples]
+        queries = [q for _, q in samples]
+        result['p95_wait_ms'] = self._percentile(waits, 0.95) * 1000
+        result['p95_query_ms'] = self._percentile(queries, 0.95) * 1000
+        return result
+
+
+# ブロッキングなDB処理を実行する専用スレッドプール（プール数を超えて接続を奪い合わないよう制限）
+db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="paraccoli-db")
+db_executor_stats = DBExecutorStats()
+
+
+class ThreadedSession:
+    """専用スレッドプール上でSessionを操作するためのラッパー"""
+
+    def __init__(self):
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            # コミット後にイベントループ側で属性を参照しても再読込のI/Oが発生しないようにする
+            self._session = SessionLocal(expire_on_commit=False)
+        return self._session
+
+    async def run(self, func, *args, **kwargs):
+        """func(session, *args, **kwargs) をDBスレッドで実行して結果を返す"""
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+        db_executor_stats.submitted()
+
+        def _call():
+            started_at = time.perf_counter()
+            try:
+                return func(self._get_session(), *args, **kwargs)
+            finally:
+                db_executor_stats.record(started_at - submitted_at, time.perf_counter() - started_at)
+
+        return await loop.run_in_executor(db_executor, _call)
+
+    def add(self, instance):
+        """オブジェクトをセッションに追加（I/Oは発生しない）"""
+        self._get_session().add(instance)
+
+    async def commit(self):
+        if self._session is not None:
+            await self.run(lambda session: session.commit())
+
+    async def rollback(self):
+        if self._session is not None:
+            await self.run(lambda session: session.rollback())
+
+    async def close(self):
+        if self._session is not None:
+            await self.run(lambda session: session.close())
+            self._session = None
+
+
+@asynccontextmanager
+async def run_db(commit: bool = True):
+    """イベントループを塞がずにDB処理を行う非同期コンテキストマネージャー
+
+    使い方:
+        async with run_db() as db:
+            user = await db.run(lambda s: s.query(User).first())
+    """
+    db = ThreadedSession()
+    try:
+        yield db
+        if commit:
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
+
+
+def get_db_executor_stats() -> dict:
+    """DB実行スレッドプールの計測値を取得"""
+    return db_executor_stats.snapshot()
+
+
+def get_pool_stats() -> dict:
+    """コネクションプールの計測値を取得"""
+    return pool_monitor.snapshot()
+
+
+def shutdown_db_executor():
+    """DB実行スレッドプールを停止"""
+    db_executor.shutdown(wait=True)
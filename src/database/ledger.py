@@ -0,0 +1,158 @@
+"""残高の増減（記帳）をまとめて行う台帳
+
+ウォレット残高の変更はすべて apply() に Posting の一覧として渡す。
+- 残高は ORM 属性の読み書きではなく、1ウォレット1文の UPDATE（balance = balance + :delta）で変更する
+- 出金は WHERE balance >= :amount 付きで更新し、0行なら InsufficientBalance を送出する（行ロックと残高確認を1文で行う）
+- 更新はアドレス順に行い、同時に複数のウォレットを更新する処理同士がデッドロックしないようにする
+- 取引記録（Transaction）や注文はまとめて1回の flush で挿入する
+- 新しい残高は UPDATE ... RETURNING（非対応のDBでは1回の SELECT）で返し、セッション内の Wallet にも反映する
+
+例外時はそれまでの UPDATE が残りうるため、呼び出し側でロールバックすること。
+ただし1ウォレットだけの記帳は失敗時に何も書き込まない。
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import Transaction, Wallet
+
+wallets = Wallet.__table__
+
+
+class LedgerError(Exception):
+    """記帳の失敗"""
+
+
+class WalletNotFound(LedgerError):
+    def __init__(self, address: str):
+        super().__init__(f"ウォレットが見つかりません: {address}")
+        self.address = address
+
+
+class InsufficientBalance(LedgerError):
+    def __init__(self, address: str, currency: str, required: float, available: float):
+        super().__init__(f"残高不足: {address} {currency} 必要 {required} / 残高 {available}")
+        self.address = address
+        self.currency = currency  # "parc" or "jpy"
+        self.required = required
+        self.available = available
+
+
+@dataclass(frozen=True)
+class Posting:
+    """1ウォレットの残高の増減（負の値は出金）
+
+    floor_at_zero=True の出金は残高不足でも失敗せず、残高を0で止める（ペナルティ用）。
+    """
+    address: str
+    parc: float = 0
+    jpy: float = 0
+    floor_at_zero: bool = False
+
+
+@dataclass(frozen=True)
+class Balance:
+    parc: float
+    jpy: float
+
+
+def _merge(postings: Iterable[Posting]) -> "OrderedDict[str, Posting]":
+    """同じウォレットへの記帳を1つにまとめ、アドレス順に並べる"""
+    merged: Dict[str, Posting] = {}
+    for posting in postings:
+        previous = merged.get(posting.address)
+        if previous is not None:
+            posting = Posting(
+                posting.address,
+                previous.parc + posting.parc,
+                previous.jpy + posting.jpy,
+                previous.floor_at_zero or posting.floor_at_zero,
+            )
+        merged[posting.address] = posting
+    return OrderedDict(sorted(merged.items()))
+
+
+def _new_value(column, delta, floor_at_zero: bool):
+    if floor_at_zero and delta < 0:
+        return case((column + delta < 0, 0), else_=column + delta)
+    return column + delta
+
+
+def _update_statement(posting: Posting):
+    statement = update(wallets).where(wallets.c.address == posting.address)
+    values = {}
+    for name, delta in (('parc_balance', posting.parc), ('jpy_balance', posting.jpy)):
+        if not delta:
+            continue
+        column = wallets.c[name]
+        values[name] = _new_value(column, delta, posting.floor_at_zero)
+        if delta < 0 and not posting.floor_at_zero:
+            # 残高が足りる場合だけ更新する
+            statement = statement.where(column >= -delta)
+    return statement.values(**values) if values else None
+
+
+def _raise_failure(db: Session, posting: Posting):
+    row = db.execute(
+        select(wallets.c.parc_balance, wallets.c.jpy_balance).where(wallets.c.address == posting.address)
+    ).first()
+    if row is None:
+        raise WalletNotFound(posting.address)
+    parc, jpy = row
+    if posting.parc < 0 and (parc or 0) < -posting.parc:
+        raise InsufficientBalance(posting.address, "parc", -posting.parc, parc or 0)
+    raise InsufficientBalance(posting.address, "jpy", -posting.jpy, jpy or 0)
+
+
+def _sync_session(db: Session, balances: Dict[str, Balance]):
+    """セッションに読み込み済みの Wallet を新しい残高に合わせる（変更扱いにはしない）"""
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Wallet):
+            balance = balances.get(obj.address)
+            if balance is not None:
+                set_committed_value(obj, 'parc_balance', balance.parc)
+                set_committed_value(obj, 'jpy_balance', balance.jpy)
+
+
+def apply(db: Session, postings: Sequence[Posting], entries: Sequence[Transaction] = ()) -> Dict[str, Balance]:
+    """記帳と取引記録をまとめて行い、更新後の残高をアドレスごとに返す（コミットは呼び出し側）"""
+    merged = _merge(postings)
+    returning = db.get_bind().dialect.update_returning
+    balances: Dict[str, Balance] = {}
+
+    for address, posting in merged.items():
+        statement = _update_statement(posting)
+        if statement is None:
+            continue
+        if returning:
+            row = db.execute(statement.returning(wallets.c.parc_balance, wallets.c.jpy_balance)).first()
+            if row is None:
+                _raise_failure(db, posting)
+            balances[address] = Balance(row[0], row[1])
+        elif db.execute(statement).rowcount == 0:
+            _raise_failure(db, posting)
+
+    if not returning and merged:
+        rows = db.execute(
+            select(wallets.c.address, wallets.c.parc_balance, wallets.c.jpy_balance)
+            .where(wallets.c.address.in_(list(merged)))
+        )
+        balances = {address: Balance(parc, jpy) for address, parc, jpy in rows}
+
+    if entries:
+        db.add_all(entries)
+        db.flush()
+    _sync_session(db, balances)
+    return balances
+
+
+def balance_of(db: Session, address: str) -> Optional[Balance]:
+    """現在の残高（記帳なしで参照する場合）"""
+    row = db.execute(
+        select(wallets.c.parc_balance, wallets.c.jpy_balance).where(wallets.c.address == address)
+    ).first()
+    return Balance(row[0], row[1]) if row else None
@@ -1,5 +1,5 @@
 import discord
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, BigInteger, Index, Text
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime, timezone, timedelta
 from sqlalchemy.sql.sqltypes import Boolean
@@ -20,6 +20,7 @@ class User(Base):
     last_daily = Column(DateTime)
     login_streak = Column(Integer, default=0)
     has_cleared = Column(Boolean, default=False)  # クリアフラグを追加
+    dm_opt_out = Column(Boolean, default=False, nullable=False, server_default='0')  # DM一斉通知の受信拒否
     wallet = relationship("Wallet", back_populates="user", uselist=False)
     alerts = relationship("PriceAlert", back_populates="user")
     last_trade_timestamp = relationship("LastTradeTimestamp", back_populates="user", uselist=False)
@@ -67,6 +68,25 @@ class Transaction(Base):
     order_type = Column(String(50))  # market, limit
     status = Column(String(50), default='pending')  # pending, completed, cancelled
 
+    __table_args__ = (
+        # 取引履歴のキーセットページング用（送信側・受信側それぞれで (timestamp, id) 順に読む）
+        Index('ix_transactions_from_address_timestamp', 'from_address', 'timestamp', 'id'),
+        Index('ix_transactions_to_address_timestamp', 'to_address', 'timestamp', 'id'),
+    )
+
+class FlaggedTransaction(Base):
+    """市場操作として検出されたトランザクション（クエリ内で反結合して除外する）"""
+    __tablename__ = "flagged_transactions"
+
+    transaction_id = Column(Integer, primary_key=True)  # transactions.id
+    flag_type = Column(String(50))  # wash_trading, small_distributed_trading, high_frequency_trading
+    flagged_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=True)  # NULLは永続フラグ
+
+    __table_args__ = (
+        Index('ix_flagged_transactions_expires_at', 'expires_at'),
+    )
+
 class DailyStats(Base):
     __tablename__ = "daily_stats"
     
@@ -93,23 +113,53 @@ class Order(Base):
     
     id = Column(Integer, primary_key=True)
     wallet_address = Column(String(255), ForeignKey('wallets.address'))
-    amount = Column(BigInteger)  # 注文量
+    amount = Column(Float)  # 注文量（0.01 PARC単位）
     price = Column(Float)  # 指値価格
     timestamp = Column(DateTime, default=datetime.utcnow)
     order_type = Column(String(50))  # "limit" or "market"
     side = Column(String(50))  # "buy" or "sell"
-    status = Column(String(50), default="pending")  # "pending", "filled", "cancelled"
-    filled_amount = Column(BigInteger, default=0)  # 約定済み量
+    status = Column(String(50), default="pending")  # "pending", "partially_filled", "filled", "cancelled"
+    filled_amount = Column(Float, default=0)  # 約定済み量（成行注文との部分約定を含む）
     
     # リレーション
     wallet = relationship("Wallet", back_populates="orders")
+    fills = relationship("OrderFill", back_populates="order")
+
+    __table_args__ = (
+        # 板の価格・時間優先の読み出し用
+        Index('ix_orders_book', 'side', 'status', 'price', 'timestamp', 'id'),
+    )
+
+class OrderFill(Base):
+    """指値注文の約定1回分の記録（部分約定ごとに1行）"""
+    __tablename__ = "order_fills"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    amount = Column(Float, nullable=False)  # この約定の数量
+    price = Column(Float, nullable=False)  # 約定価格
+    fee = Column(Float, default=0)
+    source = Column(String(20))  # "book"（成行注文と約定） or "market"（チャート価格で約定）
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+    order = relationship("Order", back_populates="fills")
+
+    __table_args__ = (
+        Index('ix_order_fills_order_id', 'order_id', 'id'),
+    )
 
 class HistoryPaginationView(discord.ui.View):
-    def __init__(self, current_page: int, total_pages: int, get_page_data):
+    def __init__(self, current_page: int, total_pages: int, get_page_data, next_cursor=None):
+        """get_page_data(page, cursor) は (embed, 次ページの cursor) を返す
+
+        cursor は前ページ最後の行の位置。ページを移動するたびに記録し、
+        前後どちらに戻っても OFFSET を使わずに読めるようにする。
+        """
         super().__init__(timeout=60)
         self.current_page = current_page
         self.total_pages = total_pages
         self.get_page_data = get_page_data
+        self.cursors = {current_page + 1: next_cursor}  # ページ番号 -> そのページの起点
 
         # 前のページボタン
         self.prev_button = discord.ui.Button(
@@ -130,23 +180,23 @@ class HistoryPaginationView(discord.ui.View):
         self.add_item(self.prev_button)
         self.add_item(self.next_button)
 
-    async def prev_page(self, interaction: discord.Interaction):
-        self.current_page -= 1
-        embed = await self.get_page_data(self.current_page)
+    async def _show_page(self, interaction: discord.Interaction, page: int):
+        self.current_page = page
+        embed, next_cursor = await self.get_page_data(page, self.cursors.get(page))
+        self.cursors[page + 1] = next_cursor
         self.update_buttons()
         await interaction.response.edit_message(embed=embed, view=self)
 
+    async def prev_page(self, interaction: discord.Interaction):
+        await self._show_page(interaction, self.current_page - 1)
+
     async def next_page(self, interaction: discord.Interaction):
-        self.current_page += 1
-        embed = await self.get_page_data(self.current_page)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self._show_page(interaction, self.current_page + 1)
 
     def update_buttons(self):
         self.prev_button.disabled = self.current_page == 1
         self.next_button.disabled = self.current_page == self.total_pages
 
-
 class PriceAlert(Base):
     __tablename__ = "price_alerts"
     
@@ -166,4 +216,24 @@ class Event(Base):
     name = Column(String(255))  # 長さを指定
     description = Column(String(1000))  # 長さを指定
     change_percent = Column(Float)
-    timestamp = Column(DateTime(timezone=True), default=datetime.now())
\ No newline at end of file
+    timestamp = Column(DateTime(timezone=True), default=datetime.now())
+
+class BroadcastJob(Base):
+    """DM一斉送信ジョブ（送信済みの users.id を cursor に記録し、再起動後も続きから送る）"""
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50))  # event など
+    payload = Column(Text, nullable=False)  # Embed.to_dict() のJSON
+    status = Column(String(50), default="pending")  # "pending", "running", "completed", "cancelled"
+    cursor = Column(Integer, default=0, nullable=False)  # 送信済みの最大 users.id
+    total_recipients = Column(Integer, default=0)
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_broadcast_jobs_status', 'status', 'id'),
+    )
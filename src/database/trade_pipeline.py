@@ -0,0 +1,134 @@
+"""取引の書き込みをまとめてコミットするパイプライン（グループコミット）
+
+/buy・/sell と指値注文の約定は、それぞれコミットする代わりに submit() で記帳処理を渡す。
+最初の処理が届いてから TRADE_BATCH_WINDOW_MS の間に集まったものを1つのトランザクションで書き込む。
+- 処理は1件ずつ SAVEPOINT の中で実行し、失敗したものは自分の分だけ巻き戻して例外を呼び出し元に返す
+- 結果はコミットが終わってから Future で返すので、呼び出し元が受け取る結果は必ず確定済み
+- コミット自体が失敗した場合はバッチ全件に同じ例外を返す（どの取引も半端には残らない）
+- 書き込みは常に1バッチずつ行い、書き込み中に届いた処理は次のバッチにまとめる
+
+環境変数:
+    TRADE_BATCH_WINDOW_MS  バッチを締め切るまでの待ち時間（ミリ秒、既定2）
+    TRADE_BATCH_MAX        1回のコミットにまとめる処理数の上限（既定200）
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..utils.logger import Logger
+from .database import SessionLocal, db_executor
+
+# (func, args, future)
+_Job = Tuple[Callable[..., Any], tuple, asyncio.Future]
+
+
+class TradePipeline:
+    """記帳処理を数ミリ秒ごとのバッチにまとめて1回でコミットする"""
+
+    def __init__(self, window_ms: float = None, max_batch: int = None):
+        window_ms = float(os.getenv('TRADE_BATCH_WINDOW_MS', '2')) if window_ms is None else window_ms
+        self.window = window_ms / 1000
+        self.max_batch = int(os.getenv('TRADE_BATCH_MAX', '200')) if max_batch is None else max_batch
+        self.logger = Logger(__name__)
+        self._pending: List[_Job] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+        self.largest_batch = 0
+
+    async def submit(self, func: Callable[..., Any], *args) -> Any:
+        """func(session, *args) を次のバッチで実行し、コミット後にその戻り値を返す"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # 別のイベントループ（テストなど）に移ったら前のループの状態は捨てる
+            self._loop = loop
+            self._pending, self._timer, self._writer = [], None, None
+        future = loop.create_future()
+        self._pending.append((func, args, future))
+        if len(self._pending) >= self.max_batch:
+            self._close_batch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._close_batch)
+        return await future
+
+    def _close_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._writer is None and self._pending:
+            self._writer = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                batch = [job for job in self._pending[:self.max_batch] if not job[2].cancelled()]
+                del self._pending[:self.max_batch]
+                jobs = [(func, args) for func, args, _ in batch]
+                try:
+                    outcomes = await loop.run_in_executor(db_executor, self.write_batch, jobs)
+                except Exception as e:
+                    outcomes = [(False, e)] * len(jobs)
+                for (_, _, future), (ok, value) in zip(batch, outcomes):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._writer = None
+            if self._pending and self._timer is None:
+                self._timer = loop.call_later(self.window, self._close_batch)
+
+    def write_batch(self, jobs: List[Tuple[Callable[..., Any], tuple]]) -> List[Tuple[bool, Any]]:
+        """バッチを1トランザクションで書き込み、処理ごとに (成功したか, 戻り値または例外) を返す"""
+        db: Session = SessionLocal(expire_on_commit=False)
+        outcomes: List[Tuple[bool, Any]] = []
+        try:
+            for func, args in jobs:
+                try:
+                    with db.begin_nested():
+                        result = func(db, *args)
+                    outcomes.append((True, result))
+                except Exception as e:
+                    outcomes.append((False, e))
+            db.commit()
+        except Exception as e:
+            self.logger.error(f"取引バッチのコミットに失敗しました ({len(jobs)}件): {e}")
+            db.rollback()
+            return [(False, e)] * len(jobs)
+        finally:
+            db.close()
+
+        with self._lock:
+            self.batches += 1
+            self.jobs += len(jobs)
+            self.largest_batch = max(self.largest_batch, len(jobs))
+        return outcomes
+
+    async def flush(self):
+        """保留中の処理をすぐに書き込み、終わるまで待つ（停止時など）"""
+        while self._pending or self._writer is not None:
+            self._close_batch()
+            if self._writer is not None:
+                await asyncio.shield(self._writer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'jobs': self.jobs,
+                'avg_batch': self.jobs / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+            }
+
+
+# プロセス全体で共有するパイプライン
+trade_pipeline = TradePipeline()
@@ -0,0 +1,529 @@
+"""取引エンジンの合成負荷シミュレーター
+
+users / wallets / transactions / orders / price_history を設定した分布で投入し、
+コマンド・タスクのコルーチンを擬似Interaction・擬似Botで駆動して
+操作ごとのレイテンシ分位点とDBクエリ数を計測する。
+
+使い方:
+    python -m src.simulation.load_simulator --users 10000 --transactions 1000000 --seed 42
+"""
+import os
+
+# 本番DBや本番のdata/を触らないよう、未指定ならインメモリSQLiteで動かす
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('DB_PROFILE', 'test')
+# Configの必須項目（Discordには接続しないのでダミー値）
+for _key in (
+    'DISCORD_TOKEN', 'CLIENT_ID', 'CLIENT_SECRET', 'DISCORD_REGISTER_CHANNEL_ID',
+    'DISCORD_DAILY_CHANNEL_ID', 'DISCORD_MINING_CHANNEL_ID', 'DISCORD_LOG_CHANNEL_ID',
+    'DISCORD_CHART_CHANNEL_ID', 'DISCORD_RULES_CHANNEL_ID', 'DISCORD_HELP_CHANNEL_ID',
+    'DISCORD_WORDS_CHANNEL_ID', 'DISCORD_COMMANDS_CHANNEL_ID', 'DISCORD_EVENT_CHANNEL_ID',
+    'DISCORD_HISTORY_CHANNEL_ID', 'DISCORD_FORM_CHANNEL_ID', 'DISCORD_PREDICT_CHANNEL_ID',
+    'DISCORD_ADMIN_USER_ID', 'DISCORD_EXECUTIVE_ROLE_ID', 'DISCORD_FUNDMANAGER_ROLE_ID',
+    'DISCORD_SHAREHOLDER_ROLE_ID', 'DISCORD_EMPLOYEE_ROLE_ID', 'DISCORD_GUILD_ID',
+    'DISCORD_ROOKIE_CHANNEL_ID', 'DISCORD_REALTIME_CHART_CHANNEL_ID',
+):
+    os.environ.setdefault(_key, '1')
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import event, insert
+
+from ..database.database import engine, init_db, run_db, SessionLocal
+from ..database.models import User, Wallet, Transaction, Order, PriceHistory
+from ..utils.logger import setup_logger
+from ..utils.trading_hours import TradingHours
+from ..utils.transaction_history import transaction_counts
+
+
+@dataclass
+class SimulationConfig:
+    """シミュレーション設定"""
+    seed: int = 42
+    users: int = 10_000
+    transactions: int = 1_000_000
+    pending_orders: int = 2_000
+    price_history_minutes: int = 7 * 24 * 60
+    history_days: int = 7  # 取引履歴を分布させる期間
+    initial_price: float = 100.0
+    price_volatility: float = 0.002  # 1分あたりの価格変動（対数収益率の標準偏差）
+    activity_skew: float = 1.1  # ユーザー活動量の偏り（Zipf指数）
+    trade_size_mu: float = 2.0  # 取引量の対数正規分布パラメータ
+    trade_size_sigma: float = 1.0
+    jpy_balance_mu: float = 12.0  # 初期JPY残高の対数正規分布パラメータ（約16万円）
+    parc_balance_mu: float = 6.0  # 初期PARC残高の対数正規分布パラメータ（約400PARC）
+    transaction_mix: Dict[str, float] = field(default_factory=lambda: {
+        'buy': 0.35, 'sell': 0.30, 'transfer': 0.10, 'mining': 0.10, 'fee': 0.15,
+    })
+    operations: int = 1_000
+    operation_mix: Dict[str, float] = field(default_factory=lambda: {
+        'buy_market': 0.25,
+        'sell_market': 0.20,
+        'buy_limit': 0.10,
+        'sell_limit': 0.10,
+        'wallet': 0.15,
+        'history': 0.10,
+        'price_tick': 0.04,
+        'process_orders': 0.03,
+        'detect_wash_trading': 0.03,
+    })
+    force_trading_hours: bool = True  # 成行注文を通すため取引時間内として扱う
+    batch_size: int = 10_000
+    workdir: Optional[str] = None  # data/ 等を書き出す作業ディレクトリ（未指定なら一時ディレクトリ）
+
+
+class QueryCounter:
+    """エンジンに発行されたSQLの数を数える"""
+
+    def __init__(self, target_engine):
+        self._lock = threading.Lock()
+        self.count = 0
+        event.listen(target_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+
+
+class FakeDiscordUser:
+    """discord.User / Member の代わり"""
+
+    def __init__(self, user_id: int, name: str = "sim-user"):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, *args, **kwargs):
+        self._done = True
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+        self._interaction.record(kwargs)
+
+    async def edit_message(self, *args, **kwargs):
+        self._interaction.record(kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, *args, **kwargs):
+        self._interaction.record(kwargs)
+
+
+class FakeInteraction:
+    """discord.Interaction の代わり（送信内容を記録するだけ）"""
+
+    def __init__(self, user_id: int, channel_id: int = 1):
+        self.user = FakeDiscordUser(user_id)
+        self.channel_id = channel_id
+        self.channel = None
+        self.guild = None
+        self.guild_id = None
+        self.created_at = datetime.now()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages = []
+
+    def record(self, kwargs):
+        embed = kwargs.get('embed')
+        self.messages.append(getattr(embed, 'title', None))
+
+    async def edit_original_response(self, *args, **kwargs):
+        self.record(kwargs)
+
+    async def original_response(self):
+        return None
+
+
+class FakeBot:
+    """commands.Bot の代わり（Discordには接続しない）"""
+
+    def __init__(self):
+        self.user = FakeDiscordUser(0, "paraccoli-sim")
+        self.loop = None
+        self.price_calculator = None
+        self.event_manager = None
+        self._cogs = {}
+        self._users = {}
+
+    def is_ready(self):
+        return True
+
+    async def wait_until_ready(self):
+        return None
+
+    def get_channel(self, channel_id):
+        return None
+
+    async def fetch_channel(self, channel_id):
+        return None
+
+    def get_user(self, user_id):
+        return self._users.get(int(user_id))
+
+    async def fetch_user(self, user_id):
+        return self._users.setdefault(int(user_id), FakeDiscordUser(int(user_id)))
+
+    def get_cog(self, name):
+        return self._cogs.get(name)
+
+    async def change_presence(self, *args, **kwargs):
+        return None
+
+
+class LoadSimulator:
+    """合成データの投入と負荷シナリオの実行"""
+
+    def __init__(self, config: SimulationConfig = None):
+        self.config = config or SimulationConfig()
+        self.logger = setup_logger(__name__)
+        self.rng = np.random.default_rng(self.config.seed)
+        self.query_counter = QueryCounter(engine)
+        self.latencies = defaultdict(list)
+        self.query_counts = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.discord_ids = []
+        self.addresses = []
+        self.activity_weights = None
+
+    # ---------- データ投入 ----------
+
+    def seed_database(self):
+        """設定した分布でテーブルにデータを投入"""
+        cfg = self.config
+        random.seed(cfg.seed)
+        init_db()
+        started = time.perf_counter()
+
+        db = SessionLocal()
+        try:
+            self._seed_users(db)
+            self._seed_price_history(db)
+            self._seed_transactions(db)
+            self._seed_orders(db)
+            db.commit()
+        finally:
+            db.close()
+
+        self.logger.info(
+            f"シードデータ投入完了: users={cfg.users:,} transactions={cfg.transactions:,} "
+            f"orders={cfg.pending_orders:,} ({time.perf_counter() - started:.1f}秒)"
+        )
+
+    def _seed_users(self, db):
+        cfg = self.config
+        now = datetime.now()
+        # 活動量はZipf分布（少数のヘビーユーザーが大半の取引を行う）
+        ranks = np.arange(1, cfg.users + 1)
+        weights = 1.0 / np.power(ranks, cfg.activity_skew)
+        self.activity_weights = weights / weights.sum()
+
+        self.discord_ids = [str(10**17 + i) for i in range(cfg.users)]
+        self.addresses = [f"0x{self.rng.bytes(20).hex()}" for _ in range(cfg.users)]
+        jpy = np.floor(self.rng.lognormal(cfg.jpy_balance_mu, 1.0, cfg.users)).astype(np.int64)
+        parc = np.round(self.rng.lognormal(cfg.parc_balance_mu, 1.0, cfg.users), 2)
+        messages = self.rng.poisson(20, cfg.users)
+
+        for start in range(0, cfg.users, cfg.batch_size):
+            end = min(start + cfg.batch_size, cfg.users)
+            db.execute(insert(User), [
+                {
+                    'id': i + 1,
+                    'discord_id': self.discord_ids[i],
+                    'created_at': now - timedelta(days=cfg.history_days),
+                    'message_count': int(messages[i]),
+                    'total_mined': 0,
+                    'login_streak': 0,
+                    'has_cleared': False,
+                }
+                for i in range(start, end)
+            ])
+            db.execute(insert(Wallet), [
+                {
+                    'id': i + 1,
+                    'address': self.addresses[i],
+                    'parc_balance': float(parc[i]),
+                    'jpy_balance': int(jpy[i]),
+                    'user_id': i + 1,
+                }
+                for i in range(start, end)
+            ])
+
+    def _seed_price_history(self, db):
+        cfg = self.config
+        now = datetime.now()
+        steps = self.rng.normal(0, cfg.price_volatility, cfg.price_history_minutes)
+        prices = cfg.initial_price * np.exp(np.cumsum(steps))
+        self.last_seeded_price = float(prices[-1]) if len(prices) else cfg.initial_price
+        start_time = now - timedelta(minutes=cfg.price_history_minutes)
+
+        rows = [
+            {
+                'timestamp': start_time + timedelta(minutes=i + 1),
+                'price': round(float(price), 2),
+                'volume': float(self.rng.integers(0, 10_000)),
+                'market_cap': float(price) * 100_000_000,
+            }
+            for i, price in enumerate(prices)
+        ]
+        for start in range(0, len(rows), cfg.batch_size):
+            db.execute(insert(PriceHistory), rows[start:start + cfg.batch_size])
+
+    def _seed_transactions(self, db):
+        cfg = self.config
+        now = datetime.now()
+        types = list(cfg.transaction_mix.keys())
+        probabilities = np.array(list(cfg.transaction_mix.values()), dtype=float)
+        probabilities /= probabilities.sum()
+        window = cfg.history_days * 86400
+
+        for start in range(0, cfg.transactions, cfg.batch_size):
+            size = min(cfg.batch_size, cfg.transactions - start)
+            tx_types = self.rng.choice(types, size=size, p=probabilities)
+            actors = self.rng.choice(cfg.users, size=size, p=self.activity_weights)
+            counterparties = self.rng.integers(0, cfg.users, size=size)
+            amounts = np.round(self.rng.lognormal(cfg.trade_size_mu, cfg.trade_size_sigma, size), 2)
+            offsets = np.sort(self.rng.uniform(0, window, size))[::-1]
+            prices = cfg.initial_price * np.exp(self.rng.normal(0, 0.05, size))
+
+            rows = []
+            for tx_type, actor, other, amount, offset, price in zip(
+                tx_types, actors, counterparties, amounts, offsets, prices
+            ):
+                address = self.addresses[actor]
+                row = {
+                    'from_address': None,
+                    'to_address': None,
+                    'amount': float(amount),
+                    'fee': None,
+                    'price': None,
+                    'timestamp': now - timedelta(seconds=float(offset)),
+                    'transaction_type': str(tx_type),
+                    'order_type': None,
+                    'status': 'completed',
+                }
+                # 実際のコマンドと同じアドレスの向きで記録する
+                if tx_type == 'buy':
+                    row.update(to_address=address, price=round(float(price), 2), order_type='market')
+                elif tx_type == 'sell':
+                    row.update(from_address=address, price=round(float(price), 2), order_type='market')
+                elif tx_type == 'transfer':
+                    row.update(from_address=address, to_address=self.addresses[other])
+                elif tx_type == 'mining':
+                    row.update(to_address=address)
+                else:
+                    row.update(from_address=address)
+                rows.append(row)
+            db.execute(insert(Transaction), rows)
+        # 一括 INSERT はORMの書き込みフックを通らないため件数キャッシュを破棄する
+        transaction_counts.invalidate()
+
+    def _seed_orders(self, db):
+        cfg = self.config
+        now = datetime.now()
+        price = getattr(self, 'last_seeded_price', cfg.initial_price)
+        owners = self.rng.choice(cfg.users, size=cfg.pending_orders, p=self.activity_weights)
+        sides = self.rng.choice(['buy', 'sell'], size=cfg.pending_orders)
+        spreads = self.rng.normal(0, 0.05, cfg.pending_orders)
+        amounts = np.maximum(1, np.floor(self.rng.lognormal(cfg.trade_size_mu, cfg.trade_size_sigma, cfg.pending_orders)))
+
+        rows = [
+            {
+                'wallet_address': self.addresses[owner],
+                'amount': int(amount),
+                'price': round(price * (1 + spread), 2),
+                'timestamp': now - timedelta(minutes=int(self.rng.integers(0, 600))),
+                'order_type': 'limit',
+                'side': str(side),
+                'status': 'pending',
+                'filled_amount': 0,
+            }
+            for owner, side, spread, amount in zip(owners, sides, spreads, amounts)
+        ]
+        for start in range(0, len(rows), cfg.batch_size):
+            db.execute(insert(Order), rows[start:start + cfg.batch_size])
+
+    # ---------- 負荷シナリオ ----------
+
+    def _build_bot(self):
+        """擬似Botと各Cogを組み立てる"""
+        from ..utils.event_manager import EventManager
+        from ..utils.price_calculator import PriceCalculator
+        from ..bot.commands import ParaccoliCommands
+        from ..bot.tasks import ParaccoliTasks
+
+        bot = FakeBot()
+        try:
+            bot.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            bot.loop = None  # ループ外（ベンチマーク等）から組み立てる場合
+        bot.event_manager = EventManager(bot)
+
+        # シングルトンを作り直して今回のDB・作業ディレクトリから初期化する
+        PriceCalculator._instance = None
+        PriceCalculator._initialized = False
+        bot.price_calculator = PriceCalculator(bot)
+
+        commands_cog = ParaccoliCommands(bot)
+        # タスクループは起動せずにコルーチンだけを直接呼び出す
+        tasks_cog = ParaccoliTasks.__new__(ParaccoliTasks)
+        tasks_cog.bot = bot
+        tasks_cog.logger = setup_logger(ParaccoliTasks.__module__)
+        tasks_cog.config = commands_cog.config
+        tasks_cog.event_manager = bot.event_manager
+        bot._cogs = {'ParaccoliCommands': commands_cog, 'ParaccoliTasks': tasks_cog}
+        return bot, commands_cog, tasks_cog
+
+    def _pick_user(self) -> int:
+        return int(self.rng.choice(self.config.users, p=self.activity_weights))
+
+    async def _run_operation(self, name, bot, commands_cog, tasks_cog):
+        cfg = self.config
+        user_index = self._pick_user()
+        interaction = FakeInteraction(int(self.discord_ids[user_index]))
+        amount = float(round(max(0.01, self.rng.lognormal(cfg.trade_size_mu - 1, cfg.trade_size_sigma)), 2))
+        market_price = bot.price_calculator.get_latest_random_price()
+
+        if name == 'buy_market':
+            await commands_cog.buy.callback(commands_cog, interaction, amount, None)
+        elif name == 'sell_market':
+            await commands_cog.sell.callback(commands_cog, interaction, amount, None)
+        elif name == 'buy_limit':
+            limit = round(market_price * (1 - abs(self.rng.normal(0, 0.03))), 2)
+            await commands_cog.buy.callback(commands_cog, interaction, amount, limit)
+        elif name == 'sell_limit':
+            limit = round(market_price * (1 + abs(self.rng.normal(0, 0.03))), 2)
+            await commands_cog.sell.callback(commands_cog, interaction, amount, limit)
+        elif name == 'wallet':
+            await commands_cog.wallet.callback(commands_cog, interaction)
+        elif name == 'history':
+            await commands_cog.history.callback(commands_cog, interaction, int(self.rng.integers(1, 20)))
+        elif name == 'price_tick':
+            async with run_db() as db:
+                await db.run(tasks_cog._record_price_tick, bot.price_calculator)
+        elif name == 'process_orders':
+            await tasks_cog.process_orders.coro(tasks_cog)
+        elif name == 'detect_wash_trading':
+            async with run_db() as db:
+                await db.run(bot.price_calculator._detect_wash_trading)
+        else:
+            raise ValueError(f"Unknown operation: {name}")
+
+    async def run_operations(self):
+        """設定した操作ミックスで順番に実行し、計測値を記録"""
+        cfg = self.config
+        random.seed(cfg.seed)
+        bot, commands_cog, tasks_cog = self._build_bot()
+
+        names = list(cfg.operation_mix.keys())
+        probabilities = np.array(list(cfg.operation_mix.values()), dtype=float)
+        probabilities /= probabilities.sum()
+        schedule = self.rng.choice(names, size=cfg.operations, p=probabilities)
+
+        for name in schedule:
+            queries_before = self.query_counter.count
+            started = time.perf_counter()
+            try:
+                await self._run_operation(str(name), bot, commands_cog, tasks_cog)
+            except Exception as e:
+                self.errors[str(name)] += 1
+                self.logger.error(f"シミュレーション操作エラー ({name}): {e}")
+            self.latencies[str(name)].append(time.perf_counter() - started)
+            self.query_counts[str(name)].append(self.query_counter.count - queries_before)
+
+    def report(self) -> dict:
+        """操作ごとのレイテンシ分位点とクエリ数"""
+        result = {}
+        for name, values in sorted(self.latencies.items()):
+            latencies_ms = np.array(values) * 1000
+            queries = np.array(self.query_counts[name])
+            result[name] = {
+                'count': len(values),
+                'errors': self.errors.get(name, 0),
+                'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+                'p90_ms': round(float(np.percentile(latencies_ms, 90)), 3),
+                'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+                'max_ms': round(float(latencies_ms.max()), 3),
+                'queries_mean': round(float(queries.mean()), 2),
+                'queries_max': int(queries.max()),
+            }
+        return result
+
+    def run(self) -> dict:
+        """データ投入から計測までを実行して結果を返す"""
+        workdir = self.config.workdir or tempfile.mkdtemp(prefix="paraccoli_sim_")
+        original_cwd = os.getcwd()
+        os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+        os.chdir(workdir)  # 価格状態・フラグファイルを本番の data/ に書かないようにする
+        try:
+            self.seed_database()
+            if self.config.force_trading_hours:
+                with mock.patch.object(TradingHours, 'is_trading_hours', return_value=True):
+                    asyncio.run(self.run_operations())
+            else:
+                asyncio.run(self.run_operations())
+        finally:
+            os.chdir(original_cwd)
+
+        return {
+            'config': asdict(self.config),
+            'operations': self.report(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paraccoli 合成負荷シミュレーター")
+    parser.add_argument('--seed', type=int, default=SimulationConfig.seed)
+    parser.add_argument('--users', type=int, default=SimulationConfig.users)
+    parser.add_argument('--transactions', type=int, default=SimulationConfig.transactions)
+    parser.add_argument('--orders', type=int, default=SimulationConfig.pending_orders)
+    parser.add_argument('--operations', type=int, default=SimulationConfig.operations)
+    parser.add_argument('--output', help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    config = SimulationConfig(
+        seed=args.seed,
+        users=args.users,
+        transactions=args.transactions,
+        pending_orders=args.orders,
+        operations=args.operations,
+    )
+    result = LoadSimulator(config).run()
+    output = json.dumps(result, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
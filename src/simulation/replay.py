@@ -0,0 +1,453 @@
+"""価格モデルのリプレイ・バックテスト
+
+記録済みの期間（transactions / orders / price_history）または合成データを、
+シミュレーション時刻で PriceCalculator.calculate_price に流し込み、価格の推移と要因ごとの寄与を出力する。
+時刻は SimulatedClock、乱数はシード固定の RandomStreams を注入するため、同じ入力・シードなら同じ結果になる。
+再生は専用のインメモリSQLiteで行い、--source のDBや本番のDB・data/ には書き込まない。
+
+使い方:
+    # 記録済みの期間を再生
+    python -m src.simulation.replay --source sqlite:///paraccoli_local.db --start 2025-03-01T00:00 --hours 24
+    # 合成データで1日分
+    python -m src.simulation.replay --hours 24 --seed 7 --output replay.json
+"""
+# load_simulator の読み込みで Config の必須項目にダミー値が設定される
+from .load_simulator import FakeBot
+
+import argparse
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ..database.models import Base, User, Wallet, Transaction, Order, PriceHistory
+from ..utils.clock import RandomStreams, SimulatedClock, set_clock, set_random_streams
+from ..utils.logger import setup_logger
+
+# 再生中は INFO ログを抑える（--verbose で表示）
+QUIET_LOGGERS = (
+    'src.utils.price_calculator',
+    'src.utils.factor_pipeline',
+    'src.utils.event_manager',
+    'src.utils.price_checkpoint',
+    'src.utils.flag_store',
+    'src.utils.manipulation_detector',
+)
+
+
+@dataclass
+class ReplayConfig:
+    """リプレイ設定"""
+    seed: int = 42
+    start: Optional[datetime] = None  # 再生開始時刻（未指定なら前日0時）
+    hours: float = 24.0
+    step_minutes: float = 1.0  # 価格計算の間隔（本番の update_price_info と同じ1分）
+    source_url: Optional[str] = None  # 記録済みデータの接続先（未指定なら合成データ）
+    lookback_hours: float = 24.0  # 開始前に読み込む履歴（要因の集計窓）
+    # 合成データの設定
+    users: int = 200
+    trades_per_hour: float = 120.0
+    pending_orders: int = 100
+    initial_price: float = 100.0
+    price_volatility: float = 0.002  # 開始前の価格履歴の1分あたりの変動
+    trade_size_mu: float = 2.0
+    trade_size_sigma: float = 1.0
+    activity_skew: float = 1.1
+    transaction_mix: Dict[str, float] = field(default_factory=lambda: {
+        'buy': 0.45, 'sell': 0.40, 'mining': 0.10, 'transfer': 0.05,
+    })
+    workdir: Optional[str] = None
+    verbose: bool = False
+
+    @property
+    def start_time(self) -> datetime:
+        if self.start:
+            return self.start
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=1)
+
+    @property
+    def end_time(self) -> datetime:
+        return self.start_time + timedelta(hours=self.hours)
+
+
+@dataclass
+class ReplayTick:
+    """1回の価格計算の結果"""
+    timestamp: datetime
+    price: float
+    factors: Dict[str, float]
+    event: Optional[str] = None
+
+
+class MarketReplay:
+    """記録済み・合成の市場データをシミュレーション時刻で再生"""
+
+    def __init__(self, config: ReplayConfig = None):
+        self.config = config or ReplayConfig()
+        self.logger = setup_logger(__name__)
+        self.rng = np.random.default_rng(self.config.seed)
+        self.engine = create_engine(
+            'sqlite://',
+            connect_args={'check_same_thread': False},
+            poolclass=StaticPool,
+        )
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.clock = SimulatedClock(self.config.start_time)
+        # 開始時刻以降に順に書き込む行（時刻順）
+        self._pending_transactions = deque()
+        self._pending_orders = deque()
+        self._next_transaction_id = 1
+        self.ticks: List[ReplayTick] = []
+        self.calculator = None
+        self.event_manager = None
+
+    # ---------- データ準備 ----------
+
+    def load(self):
+        """再生用DBに開始前の履歴を書き込み、開始後の行を待ち行列に積む"""
+        Base.metadata.create_all(self.engine)
+        # 要因の集計窓（直近N時間）の範囲検索用
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("CREATE INDEX ix_replay_transactions_timestamp ON transactions (timestamp)")
+        db = self.Session()
+        try:
+            if self.config.source_url:
+                self._load_recorded(db)
+            else:
+                self._load_synthetic(db)
+            db.commit()
+        finally:
+            db.close()
+
+    def _load_recorded(self, db):
+        cfg = self.config
+        start, end = cfg.start_time, cfg.end_time
+        since = start - timedelta(hours=cfg.lookback_hours)
+        source = create_engine(cfg.source_url)
+        try:
+            with source.connect() as conn:
+                # 残高は現在のスナップショットしか残っていないため、そのまま使う
+                self._copy(db, User, conn.execute(select(User.__table__)).mappings())
+                self._copy(db, Wallet, conn.execute(select(Wallet.__table__)).mappings())
+
+                history = conn.execute(
+                    select(PriceHistory.__table__)
+                    .where(PriceHistory.timestamp < start)
+                    .order_by(PriceHistory.timestamp.desc())
+                    .limit(2048)
+                ).mappings().all()
+                self._copy(db, PriceHistory, reversed(history))
+
+                for row in conn.execute(
+                    select(Transaction.__table__)
+                    .where(Transaction.timestamp >= since, Transaction.timestamp < end)
+                    .order_by(Transaction.timestamp, Transaction.id)
+                ).mappings():
+                    self._queue_or_insert(db, Transaction, dict(row), start, self._pending_transactions)
+
+                # 注文は発注時刻に板へ載せる（その後の状態の変化は記録に残っていない）
+                for row in conn.execute(
+                    select(Order.__table__)
+                    .where(Order.timestamp < end)
+                    .order_by(Order.timestamp, Order.id)
+                ).mappings():
+                    self._queue_or_insert(db, Order, dict(row), start, self._pending_orders)
+        finally:
+            source.dispose()
+
+    def _copy(self, db, model, rows):
+        rows = [dict(row) for row in rows]
+        for offset in range(0, len(rows), 10_000):
+            db.execute(insert(model), rows[offset:offset + 10_000])
+
+    def _queue_or_insert(self, db, model, row, start, queue):
+        if row['timestamp'] < start:
+            db.execute(insert(model), [row])
+        else:
+            queue.append(row)
+
+    def _load_synthetic(self, db):
+        cfg = self.config
+        start, end = cfg.start_time, cfg.end_time
+        since = start - timedelta(hours=cfg.lookback_hours)
+
+        # ユーザーとウォレット（活動量はZipf分布）
+        ranks = np.arange(1, cfg.users + 1)
+        weights = 1.0 / np.power(ranks, cfg.activity_skew)
+        self.activity_weights = weights / weights.sum()
+        self.addresses = [f"PARC_{self.rng.bytes(16).hex()}" for _ in range(cfg.users)]
+        parc = np.round(self.rng.lognormal(6.0, 1.0, cfg.users), 2)
+        jpy = np.floor(self.rng.lognormal(12.0, 1.0, cfg.users)).astype(np.int64)
+        db.execute(insert(User), [
+            {'id': i + 1, 'discord_id': str(10**17 + i), 'created_at': since, 'message_count': 0}
+            for i in range(cfg.users)
+        ])
+        db.execute(insert(Wallet), [
+            {'id': i + 1, 'address': self.addresses[i], 'parc_balance': float(parc[i]),
+             'jpy_balance': int(jpy[i]), 'user_id': i + 1}
+            for i in range(cfg.users)
+        ])
+
+        # 開始前の価格履歴（1分足の幾何ブラウン運動）
+        minutes = int(cfg.lookback_hours * 60)
+        steps = self.rng.normal(0, cfg.price_volatility, minutes)
+        prices = cfg.initial_price * np.exp(np.cumsum(steps) - steps.sum())
+        db.execute(insert(PriceHistory), [
+            {'timestamp': start - timedelta(minutes=minutes - i), 'price': round(float(price), 2),
+             'volume': 0.0, 'market_cap': float(price) * 100_000_000}
+            for i, price in enumerate(prices)
+        ])
+
+        # 取引はポアソン到着（開始前の分はそのまま書き込み、開始後の分は待ち行列へ）
+        for row in self._synthetic_transactions(since, end, float(prices[-1])):
+            self._queue_or_insert(db, Transaction, row, start, self._pending_transactions)
+
+        # 開始時点の指値注文
+        owners = self.rng.choice(cfg.users, size=cfg.pending_orders, p=self.activity_weights)
+        spreads = self.rng.normal(0, 0.05, cfg.pending_orders)
+        amounts = np.maximum(1, np.floor(self.rng.lognormal(cfg.trade_size_mu, cfg.trade_size_sigma, cfg.pending_orders)))
+        sides = self.rng.choice(['buy', 'sell'], size=cfg.pending_orders)
+        if cfg.pending_orders:
+            db.execute(insert(Order), [
+                {'wallet_address': self.addresses[owner], 'amount': int(amount),
+                 'price': round(float(prices[-1]) * (1 + spread), 2), 'timestamp': start - timedelta(minutes=1),
+                 'order_type': 'limit', 'side': str(side), 'status': 'pending', 'filled_amount': 0}
+                for owner, side, spread, amount in zip(owners, sides, spreads, amounts)
+            ])
+
+    def _synthetic_transactions(self, since: datetime, end: datetime, price: float):
+        cfg = self.config
+        seconds = (end - since).total_seconds()
+        count = int(self.rng.poisson(cfg.trades_per_hour * seconds / 3600))
+        offsets = np.sort(self.rng.uniform(0, seconds, count))
+        types = list(cfg.transaction_mix.keys())
+        probabilities = np.array(list(cfg.transaction_mix.values()), dtype=float)
+        probabilities /= probabilities.sum()
+        tx_types = self.rng.choice(types, size=count, p=probabilities)
+        actors = self.rng.choice(cfg.users, size=count, p=self.activity_weights)
+        others = self.rng.integers(0, cfg.users, size=count)
+        amounts = np.round(self.rng.lognormal(cfg.trade_size_mu, cfg.trade_size_sigma, count), 2)
+
+        for offset, tx_type, actor, other, amount in zip(offsets, tx_types, actors, others, amounts):
+            address = self.addresses[actor]
+            row = {
+                'id': self._next_transaction_id,
+                'from_address': None,
+                'to_address': None,
+                'amount': float(amount),
+                'fee': None,
+                'price': None,
+                'timestamp': since + timedelta(seconds=float(offset)),
+                'transaction_type': str(tx_type),
+                'order_type': None,
+                'status': 'completed',
+            }
+            self._next_transaction_id += 1
+            # 実際のコマンドと同じアドレスの向きで記録する（価格は再生時の価格で埋める）
+            if tx_type == 'buy':
+                row.update(to_address=address, price=price, order_type='market')
+            elif tx_type == 'sell':
+                row.update(from_address=address, price=price, order_type='market')
+            elif tx_type == 'transfer':
+                row.update(from_address=address, to_address=self.addresses[other])
+            else:
+                row.update(to_address=address)
+            yield row
+
+    # ---------- 再生 ----------
+
+    def _build_calculator(self):
+        """シミュレーション時刻・固定シードで PriceCalculator と EventManager を作り直す"""
+        from ..utils.event_manager import EventManager
+        from ..utils.price_calculator import PriceCalculator
+
+        previous = set_clock(self.clock)
+        previous_streams = set_random_streams(RandomStreams(self.config.seed))
+        try:
+            bot = FakeBot()
+            bot.event_manager = EventManager(bot)
+            PriceCalculator._instance = None
+            PriceCalculator._initialized = False
+            calculator = PriceCalculator(bot)
+        finally:
+            set_clock(previous)
+            set_random_streams(previous_streams)
+
+        calculator.event_manager = bot.event_manager
+        # 要因は再生用DBのセッションで順に実行する
+        calculator.factor_pipeline.session_factory = self.Session
+        calculator.factor_pipeline.max_workers = 1
+        if not self.config.verbose:
+            for name in QUIET_LOGGERS:
+                logging.getLogger(name).setLevel(logging.WARNING)
+
+        db = self.Session()
+        try:
+            # 保存済みの価格状態ではなく、再生開始時点の価格履歴から始める
+            calculator.set_initial_price(db)
+        finally:
+            db.close()
+        self.calculator = calculator
+        self.event_manager = bot.event_manager
+
+    def _apply_due(self, db, now: datetime):
+        """現在時刻までの取引・注文を書き込み、売買は検出器へ渡す"""
+        orders = []
+        while self._pending_orders and self._pending_orders[0]['timestamp'] <= now:
+            orders.append(self._pending_orders.popleft())
+        if orders:
+            db.execute(insert(Order), orders)
+
+        trades = []
+        while self._pending_transactions and self._pending_transactions[0]['timestamp'] <= now:
+            row = self._pending_transactions.popleft()
+            if not self.config.source_url and row['transaction_type'] in ('buy', 'sell'):
+                row['price'] = self.calculator.base_price
+            trades.append(row)
+        if trades:
+            db.execute(insert(Transaction), trades)
+        db.commit()
+
+        for row in trades:
+            side = row['transaction_type']
+            if side in ('buy', 'sell'):
+                address = row['to_address'] if side == 'buy' else row['from_address']
+                self.calculator.observe_trade(db, row['id'], side, address, row['amount'], row['timestamp'])
+
+    def step(self, db) -> ReplayTick:
+        """1ティック分（取引の反映・イベント判定・価格計算・価格履歴の保存）"""
+        now = self.clock.now()
+        self._apply_due(db, now)
+
+        event_name = None
+        if self.event_manager.is_daily_event_due():
+            event = self.event_manager.trigger_event()
+            event_name = event['name'] if event else None
+
+        price = self.calculator.calculate_price(db)
+
+        volume = db.query(func.sum(Transaction.amount))\
+            .filter(
+                Transaction.timestamp >= now - timedelta(days=1),
+                Transaction.transaction_type.in_(['buy', 'sell'])
+            ).scalar() or 0
+        db.add(PriceHistory(timestamp=now, price=price, volume=volume, market_cap=price * volume))
+        db.commit()
+        self.calculator.record_price_tick(price, now)
+
+        tick = ReplayTick(now, price, dict(self.calculator.last_factors), event_name)
+        self.ticks.append(tick)
+        return tick
+
+    def run(self) -> dict:
+        """データ準備から再生までを実行して結果を返す"""
+        workdir = self.config.workdir or tempfile.mkdtemp(prefix="paraccoli_replay_")
+        original_cwd = os.getcwd()
+        os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+        os.chdir(workdir)  # 価格状態・フラグファイルを本番の data/ に書かないようにする
+        started = time.perf_counter()
+        try:
+            self.load()
+            self._build_calculator()
+            step = timedelta(minutes=self.config.step_minutes)
+            db = self.Session()
+            try:
+                while self.clock.now() < self.config.end_time:
+                    self.step(db)
+                    self.clock.advance(step)
+            finally:
+                db.close()
+        finally:
+            os.chdir(original_cwd)
+        self.elapsed = time.perf_counter() - started
+        return self.report()
+
+    # ---------- 集計 ----------
+
+    def factor_contributions(self) -> Dict[str, Dict[str, float]]:
+        """要因ごとの寄与（対数係数の合計＝価格への累積の効き方）"""
+        contributions = {}
+        for tick in self.ticks:
+            for name, value in tick.factors.items():
+                entry = contributions.setdefault(name, {'ticks': 0, 'log_sum': 0.0, 'min': value, 'max': value})
+                entry['ticks'] += 1
+                entry['log_sum'] += math.log(value) if value > 0 else 0.0
+                entry['min'] = min(entry['min'], value)
+                entry['max'] = max(entry['max'], value)
+        for entry in contributions.values():
+            entry['mean'] = math.exp(entry['log_sum'] / entry['ticks'])
+            entry['cumulative_pct'] = (math.exp(entry['log_sum']) - 1) * 100
+        return dict(sorted(contributions.items(), key=lambda item: -abs(item[1]['log_sum'])))
+
+    def report(self) -> dict:
+        prices = np.array([tick.price for tick in self.ticks])
+        summary = {}
+        if len(prices):
+            summary = {
+                'ticks': len(prices),
+                'open': float(prices[0]),
+                'close': float(prices[-1]),
+                'high': float(prices.max()),
+                'low': float(prices.min()),
+                'return_pct': float((prices[-1] / prices[0] - 1) * 100),
+                'events': [tick.event for tick in self.ticks if tick.event],
+                'elapsed_seconds': round(self.elapsed, 3) if hasattr(self, 'elapsed') else None,
+            }
+        return {
+            'config': asdict(self.config),
+            'summary': summary,
+            'factors': self.factor_contributions(),
+            'factor_timings_ms': self.calculator.factor_pipeline.stats() if self.calculator else {},
+            'path': [
+                {'timestamp': tick.timestamp.isoformat(), 'price': tick.price, 'factors': tick.factors}
+                for tick in self.ticks
+            ],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paraccoli 価格モデルのリプレイ・バックテスト")
+    parser.add_argument('--source', help="記録済みデータの接続先URL（未指定なら合成データ）")
+    parser.add_argument('--start', type=datetime.fromisoformat, help="再生開始時刻（例: 2025-03-01T00:00）")
+    parser.add_argument('--hours', type=float, default=ReplayConfig.hours)
+    parser.add_argument('--step', type=float, default=ReplayConfig.step_minutes, help="価格計算の間隔（分）")
+    parser.add_argument('--seed', type=int, default=ReplayConfig.seed)
+    parser.add_argument('--users', type=int, default=ReplayConfig.users)
+    parser.add_argument('--trades-per-hour', type=float, default=ReplayConfig.trades_per_hour)
+    parser.add_argument('--output', help="価格推移を含む結果を書き出すJSONファイル")
+    parser.add_argument('--verbose', action='store_true', help="価格計算のログを表示")
+    args = parser.parse_args()
+
+    config = ReplayConfig(
+        seed=args.seed,
+        start=args.start,
+        hours=args.hours,
+        step_minutes=args.step,
+        source_url=args.source,
+        users=args.users,
+        trades_per_hour=args.trades_per_hour,
+        verbose=args.verbose,
+    )
+    result = MarketReplay(config).run()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+    # 標準出力には価格推移を除いた概要を出す
+    result.pop('path')
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
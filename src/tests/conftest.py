@@ -2,6 +2,22 @@ import pytest
 import sys
 import os
 
+# テスト用のDB接続プロファイル（DBはインメモリSQLiteで完結させる）
+os.environ.setdefault('DB_PROFILE', 'test')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+# Configの必須項目（テストではDiscordに接続しないのでダミー値）
+for _key in (
+    'DISCORD_TOKEN', 'CLIENT_ID', 'CLIENT_SECRET', 'DISCORD_REGISTER_CHANNEL_ID',
+    'DISCORD_DAILY_CHANNEL_ID', 'DISCORD_MINING_CHANNEL_ID', 'DISCORD_LOG_CHANNEL_ID',
+    'DISCORD_CHART_CHANNEL_ID', 'DISCORD_RULES_CHANNEL_ID', 'DISCORD_HELP_CHANNEL_ID',
+    'DISCORD_WORDS_CHANNEL_ID', 'DISCORD_COMMANDS_CHANNEL_ID', 'DISCORD_EVENT_CHANNEL_ID',
+    'DISCORD_HISTORY_CHANNEL_ID', 'DISCORD_FORM_CHANNEL_ID', 'DISCORD_PREDICT_CHANNEL_ID',
+    'DISCORD_ADMIN_USER_ID', 'DISCORD_EXECUTIVE_ROLE_ID', 'DISCORD_FUNDMANAGER_ROLE_ID',
+    'DISCORD_SHAREHOLDER_ROLE_ID', 'DISCORD_EMPLOYEE_ROLE_ID', 'DISCORD_GUILD_ID',
+    'DISCORD_ROOKIE_CHANNEL_ID', 'DISCORD_REALTIME_CHART_CHANNEL_ID',
+):
+    os.environ.setdefault(_key, '1')
+
 # プロジェクトルートへのパスを追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
@@ -11,4 +27,13 @@ def event_loop():
     import asyncio
     loop = asyncio.get_event_loop_policy().new_event_loop()
     yield loop
-    loop.close()
\ No newline at end of file
+    loop.close()
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """ベンチマークは比較・保存を指定したときだけ計測する（通常の実行では1回ずつ呼んで結果だけ確認する）"""
+    if config.getoption("benchmark_disable", None) is None:
+        return  # pytest-benchmark 未インストール
+    measure = ("benchmark_enable", "benchmark_only", "benchmark_compare", "benchmark_save", "benchmark_autosave", "benchmark_json")
+    if not any(config.getoption(name) for name in measure):
+        config.option.benchmark_disable = True
@@ -0,0 +1,181 @@
+"""価格計算・約定・チャート・予測のホットパスのベンチマーク
+
+シード済みのインメモリSQLiteに対して pytest-benchmark で計測する。
+通常のテスト実行では各経路を1回ずつ呼んで結果だけ確認し（conftest.py）、
+計測とベースラインとの比較は明示したときだけ行う:
+    pytest src/tests/test_benchmarks.py --benchmark-compare=0001 --benchmark-compare-fail=min:100%
+計測するマシンを変えたらベースラインを保存し直す:
+    pytest src/tests/test_benchmarks.py --benchmark-save=baseline
+"""
+import asyncio
+import math
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from src.simulation.load_simulator import LoadSimulator, SimulationConfig
+from src.database.database import SessionLocal
+from src.database.models import Order, PriceHistory
+
+# 要因ごとの取りうる係数の範囲（price_calculator.py の各 _calculate_* の上下限）
+PRICE_FACTORS = {
+    "_calculate_market_depth": (1.0, 1.002),
+    "_calculate_support_resistance": (0.995, 1.005),
+    "_calculate_market_psychology": (0.96, 1.04),
+    "_calculate_whale_factor": (0.968, 1.008),
+    "_calculate_burn_effect": (1.0, 1.02),
+    "_calculate_holding_effect": (0.998, 1.01),
+    "_calculate_mint_impact": (1.0, 1.02),
+    "_calculate_transaction_effect": (0.99, 1.02),
+    "_calculate_large_trade_impact": (0.95, 1.05),
+    "_calculate_inactivity_penalty": (0.985, 1.002),
+}
+
+
+@pytest.fixture(scope="session")
+def seeded_env(tmp_path_factory):
+    """シード済みDBと擬似Bot（作業ディレクトリは一時ディレクトリ）"""
+    workdir = tmp_path_factory.mktemp("bench")
+    os.makedirs(workdir / "data", exist_ok=True)
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+
+    simulator = LoadSimulator(SimulationConfig(
+        seed=1234,
+        users=500,
+        transactions=50_000,
+        pending_orders=0,
+        price_history_minutes=3 * 24 * 60,
+        operations=0,
+        workdir=str(workdir),
+    ))
+    simulator.seed_database()
+    bot, commands_cog, tasks_cog = simulator._build_bot()
+    yield simulator, bot, tasks_cog
+
+    os.chdir(original_cwd)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.rollback()
+    session.close()
+
+
+@pytest.fixture
+def price_history(seeded_env, db):
+    """シード済みの直近2時間の価格履歴"""
+    return db.query(PriceHistory)\
+        .filter(PriceHistory.timestamp >= datetime.now() - timedelta(hours=2))\
+        .order_by(PriceHistory.timestamp.asc())\
+        .all()
+
+
+class TestPricingBenchmarks:
+    def test_calculate_price(self, benchmark, seeded_env, db):
+        _, bot, _ = seeded_env
+        price = benchmark(bot.price_calculator.calculate_price, db)
+        assert price > 0
+
+    @pytest.mark.parametrize("factor", PRICE_FACTORS)
+    def test_price_factor(self, benchmark, seeded_env, db, factor):
+        _, bot, _ = seeded_env
+        result = benchmark(getattr(bot.price_calculator, factor), db)
+        low, high = PRICE_FACTORS[factor]
+        assert math.isfinite(result)
+        assert low <= result <= high
+
+    def test_detect_wash_trading(self, benchmark, seeded_env, db):
+        _, bot, _ = seeded_env
+        benchmark(bot.price_calculator._detect_wash_trading, db)
+
+
+class TestOrderBenchmarks:
+    @pytest.mark.parametrize("pending", [100, 1000])
+    def test_process_orders(self, benchmark, seeded_env, pending):
+        simulator, bot, tasks_cog = seeded_env
+        price = bot.price_calculator.get_latest_random_price()
+
+        def setup():
+            # 毎ラウンド、現在価格で約定する指値注文を作り直す
+            session = SessionLocal()
+            try:
+                session.query(Order).filter(Order.status == 'pending').delete()
+                for i in range(pending):
+                    side = 'buy' if i % 2 == 0 else 'sell'
+                    session.add(Order(
+                        wallet_address=simulator.addresses[i % len(simulator.addresses)],
+                        amount=1,
+                        price=price * (1.05 if side == 'buy' else 0.95),
+                        order_type='limit',
+                        side=side,
+                        status='pending',
+                        filled_amount=0,
+                    ))
+                session.commit()
+            finally:
+                session.close()
+
+        def run():
+            asyncio.run(tasks_cog.process_orders.coro(tasks_cog))
+
+        benchmark.pedantic(run, setup=setup, rounds=5, iterations=1)
+
+
+class TestChartBenchmarks:
+    @pytest.mark.parametrize("minutes", [10, 30, 60])
+    def test_create_price_chart(self, benchmark, price_history, tmp_path, minutes):
+        from src.utils.chart_builder import ChartBuilder
+        save_path = str(tmp_path / f"chart_{minutes}.png")
+        benchmark(ChartBuilder.create_price_chart, price_history, save_path, minutes)
+
+    def test_create_realtime_chart(self, benchmark, seeded_env, price_history, tmp_path):
+        from src.utils.chart_builder import ChartBuilder
+        _, bot, _ = seeded_env
+        calculator = bot.price_calculator
+        save_path = str(tmp_path / "realtime.png")
+        benchmark(
+            ChartBuilder.create_realtime_chart,
+            price_history,
+            calculator.get_latest_random_price(),
+            calculator.base_price,
+            calculator.price_range,
+            save_path,
+        )
+
+
+class TestPredictionBenchmarks:
+    @pytest.mark.parametrize("model_type", ["linear", "prophet", "xgboost", "ensemble", "lstm", "hybrid"])
+    def test_predict_price(self, benchmark, seeded_env, model_type):
+        from src.utils.price_predictor import PricePredictor
+        predictor = PricePredictor()
+        if model_type in ("lstm", "hybrid") and predictor.lstm_model is None:
+            pytest.skip("学習済みモデルがありません")
+
+        result = benchmark(lambda: asyncio.run(predictor.predict_price(10, model_type)))
+        assert 'success' in result
+
+
+class TestWebSocketBenchmarks:
+    class _FakeWebSocket:
+        def __init__(self):
+            self.received = 0
+
+        async def send_json(self, data):
+            self.received += 1
+
+    @pytest.mark.parametrize("clients", [10, 100, 1000])
+    def test_notify_price_update(self, benchmark, clients):
+        market_socket = pytest.importorskip("src.websocket.market_socket")
+        sockets = [self._FakeWebSocket() for _ in range(clients)]
+        market_socket.active_connections[:] = sockets
+        try:
+            benchmark(lambda: asyncio.run(market_socket.notify_price_update({"price": 100.0})))
+        finally:
+            market_socket.active_connections.clear()
+        assert all(s.received > 0 for s in sockets)
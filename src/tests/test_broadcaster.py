@@ -0,0 +1,72 @@
+"""DM一斉送信エンジンのテスト"""
+import asyncio
+from datetime import datetime
+
+import discord
+
+from src.database.database import SessionLocal, init_db
+from src.database.models import BroadcastJob, User
+from src.simulation.load_simulator import FakeBot
+from src.utils.broadcaster import Broadcaster
+
+
+def _add_users(count, opt_out=()):
+    db = SessionLocal()
+    try:
+        users = [
+            User(discord_id=str(810_000 + i), created_at=datetime.now(), dm_opt_out=i in opt_out)
+            for i in range(count)
+        ]
+        db.add_all(users)
+        db.commit()
+        return [(u.id, u.discord_id) for u in users]
+    finally:
+        db.close()
+
+
+def _finish_other_jobs():
+    db = SessionLocal()
+    try:
+        db.query(BroadcastJob).update({BroadcastJob.status: "completed"})
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_broadcast_skips_opted_out_users_and_resumes_from_cursor():
+    init_db()
+    _finish_other_jobs()
+    db = SessionLocal()
+    existing = {u for (u,) in db.query(User.discord_id)}
+    db.close()
+    users = _add_users(6, opt_out={1})
+
+    bot = FakeBot()
+    broadcaster = Broadcaster(bot, rate=1000, concurrency=3, batch_size=2)
+    embed = discord.Embed(title="テストイベント", description="価格が変動します")
+
+    async def scenario():
+        job_id = await broadcaster.enqueue(embed)
+        assert await broadcaster.process_pending() == 1
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    received = {str(uid) for uid, user in bot._users.items() if user.sent}
+    expected = {discord_id for i, (_, discord_id) in enumerate(users) if i != 1}
+    assert received - existing == expected
+
+    db = SessionLocal()
+    try:
+        job = db.get(BroadcastJob, job_id)
+        assert job.status == "completed" and job.cursor == users[-1][0]
+        assert job.sent_count == job.total_recipients
+        # 再起動前に途中まで送っていたジョブは cursor の続きから送る
+        db.add(BroadcastJob(kind="event", payload='{"title": "再開"}', status="running",
+                            cursor=users[3][0], started_at=datetime.utcnow(), total_recipients=2))
+        db.commit()
+    finally:
+        db.close()
+
+    resumed_bot = FakeBot()
+    asyncio.run(Broadcaster(resumed_bot, rate=1000).process_pending())
+    assert {str(uid) for uid in resumed_bot._users} == {discord_id for _, discord_id in users[4:]}
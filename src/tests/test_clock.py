@@ -0,0 +1,75 @@
+"""時刻・乱数の取得元のテスト"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.utils.clock import JST, _Clock, RandomStreams, SimulatedClock, SystemClock, get_clock, set_clock
+from src.utils.factor_pipeline import FactorPipeline
+from src.utils.trading_hours import TradingHours
+
+
+def test_tick_pins_now_until_the_outermost_block_exits():
+    clock = SystemClock()
+    with clock.tick() as pinned:
+        with clock.tick():
+            assert clock.now() is pinned
+        assert clock.time() == pinned.timestamp()
+        assert clock.now_jst() is clock.now_jst()
+    assert clock.now() >= pinned
+    assert clock._pinned is None
+
+
+def test_tick_pin_is_visible_only_to_its_own_context_and_factor_workers():
+    clock = SimulatedClock(datetime(2025, 3, 3, 9, 0))
+    seen = {}
+
+    class _Session:
+        def close(self):
+            pass
+
+    pipeline = FactorPipeline(session_factory=_Session, default_workers=2)
+    pipeline.register('now', "時刻", lambda db: seen.setdefault('worker', clock.now()) and 1.0, requires=('db',))
+    try:
+        with clock.tick() as pinned:
+            clock.advance(timedelta(minutes=5))
+            # ほかのスレッドは固定されていない時刻を見る
+            other = threading.Thread(target=lambda: seen.setdefault('thread', clock.now()))
+            other.start()
+            other.join()
+            pipeline.run(db=object())
+            assert clock.now() == pinned
+    finally:
+        pipeline.shutdown()
+    assert seen == {'thread': datetime(2025, 3, 3, 9, 5), 'worker': datetime(2025, 3, 3, 9, 0)}
+
+
+def test_clock_base_requires_read_and_jst_conversion():
+    class _Partial(_Clock):
+        def _read(self):
+            return datetime.now()
+
+    with pytest.raises(TypeError):
+        _Partial()
+
+
+def test_simulated_clock_drives_trading_hours_in_jst():
+    clock = SimulatedClock(datetime(2025, 3, 3, 9, 30))
+    previous = set_clock(clock)
+    try:
+        assert TradingHours.get_current_time() == JST.localize(datetime(2025, 3, 3, 9, 30))
+        assert TradingHours.get_session_name() == "前場"
+        clock.advance(timedelta(hours=2, minutes=30))  # 昼休み
+        assert TradingHours.get_session_name() == "取引時間外"
+    finally:
+        set_clock(previous)
+    assert get_clock() is previous
+
+
+def test_named_streams_are_reproducible_and_independent():
+    first, second = RandomStreams(7), RandomStreams(7)
+    # 別の用途で乱数を消費しても系列はずれない
+    first.generator('events').random(100)
+    assert first.generator('pricing').random(5).tolist() == second.generator('pricing').random(5).tolist()
+    assert first.generator('pricing') is first.generator('pricing')
+    assert RandomStreams(8).generator('pricing').random() != RandomStreams(7).generator('pricing').random()
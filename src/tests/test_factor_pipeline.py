@@ -0,0 +1,88 @@
+"""価格変動要因パイプラインのテスト"""
+import threading
+import time
+
+import pytest
+
+from src.utils.factor_pipeline import FactorPipeline
+
+
+class _Session:
+    def close(self):
+        pass
+
+
+def _slow(value, seconds):
+    def compute(db):
+        time.sleep(seconds)
+        return value
+    return compute
+
+
+def test_factors_run_in_order_and_overrun_falls_back(monkeypatch):
+    monkeypatch.setenv('PRICE_FACTORS_DISABLED', 'disabled')
+    monkeypatch.setenv('PRICE_FACTOR_BUDGETS', 'slow=1')
+    pipeline = FactorPipeline()
+    pipeline.register('noise', "ノイズ", lambda db: 1.01, requires=('snapshot',))
+    pipeline.register('slow', "遅い要因", _slow(1.05, 0.02), requires=('snapshot',))
+    pipeline.register('disabled', "無効", lambda db: 2.0)
+    pipeline.register('db_only', "DB要因", lambda db: 0.99, requires=('db',))
+
+    result = pipeline.run(db=None)
+
+    # DBなしではDB要因を省略し、予算超過は影響なし
+    assert result.factors == {"ノイズ": 1.01, "遅い要因": 1.0}
+    assert result.overrun == ['slow']
+    assert pipeline.stats()['slow']['overruns'] == 1
+    assert pipeline.run(db=object()).factors["DB要因"] == 0.99
+
+    with pytest.raises(ValueError):
+        pipeline.register('bad', "不明", lambda db: 1.0, requires=('network',))
+
+
+def test_io_factors_run_concurrently_with_their_own_sessions():
+    pipeline = FactorPipeline(session_factory=_Session, default_workers=4)
+    pipeline.register('a', "A", _slow(1.01, 0.1), requires=('db',))
+    pipeline.register('b', "B", _slow(1.02, 0.1), requires=('db',))
+    pipeline.register('c', "C", _slow(1.03, 0.1), requires=('order_book',))
+    pipeline.register('stuck', "遅延", _slow(1.5, 0.5), requires=('db',), budget_ms=50)
+
+    result = pipeline.run(db=object())
+    pipeline.shutdown()
+
+    assert result.factors == {"A": 1.01, "B": 1.02, "C": 1.03, "遅延": 1.0}
+    assert result.elapsed_ms < 300
+    assert result.overrun == ['stuck']
+
+
+def test_overrun_factor_is_not_resubmitted_while_still_running():
+    calls = []
+    release = threading.Event()
+
+    def stuck(db):
+        calls.append(1)
+        release.wait(2)
+        return 1.5
+
+    pipeline = FactorPipeline(session_factory=_Session, default_workers=2)
+    pipeline.register('stuck', "遅延", stuck, requires=('db',), budget_ms=20)
+    try:
+        first = pipeline.run(db=object())
+        second = pipeline.run(db=object())
+
+        # 予算を超えた計算は走り続けるが、次のティックでは重ねて投入しない
+        assert first.overrun == ['stuck'] and second.skipped == ['stuck']
+        assert second.factors == {"遅延": 1.0}
+        assert len(calls) == 1 and pipeline.running() == ['stuck']
+        assert pipeline.stats()['stuck']['skipped'] == 1
+
+        release.set()
+        for _ in range(100):
+            if not pipeline.running():
+                break
+            time.sleep(0.01)
+        assert pipeline.run(db=object()).factors == {"遅延": 1.5}
+        assert len(calls) == 2
+    finally:
+        release.set()
+        pipeline.shutdown()
@@ -0,0 +1,45 @@
+"""永続フラグのバイナリ保存（FlagStore）のテスト"""
+import json
+
+from src.utils.flag_store import FlagStore
+
+
+def test_journal_survives_reload_and_compaction(tmp_path):
+    store = FlagStore(str(tmp_path))
+    store.load()
+    assert store.update([5, 3, 9, 3]) == 3
+    store.flush()
+
+    reloaded = FlagStore(str(tmp_path))
+    assert reloaded.load() == 3
+    assert 3 in reloaded and 4 not in reloaded
+
+    reloaded.compact()
+    assert (tmp_path / FlagStore.JOURNAL_NAME).stat().st_size == 0
+    reloaded.add(1)
+
+    again = FlagStore(str(tmp_path))
+    again.load()
+    assert sorted(again) == [1, 3, 5, 9]
+
+
+def test_truncated_journal_record_is_ignored(tmp_path):
+    store = FlagStore(str(tmp_path))
+    store.load()
+    store.update([1, 2])
+    store.close()
+    with open(tmp_path / FlagStore.JOURNAL_NAME, 'ab') as f:
+        f.write(b'\x01\x02\x03')  # 書き込み途中で落ちた半端なレコード
+
+    reloaded = FlagStore(str(tmp_path))
+    assert reloaded.load() == 2
+
+
+def test_legacy_json_is_migrated(tmp_path):
+    with open(tmp_path / FlagStore.LEGACY_JSON_NAME, 'w') as f:
+        json.dump({'transactions': ['7', '8', 'test_1']}, f)
+
+    store = FlagStore(str(tmp_path))
+    assert store.load() == 2
+    assert (tmp_path / FlagStore.SNAPSHOT_NAME).exists()
+    assert 8 in store
@@ -0,0 +1,52 @@
+"""Discord ID の識別情報キャッシュのテスト"""
+from datetime import datetime
+
+from sqlalchemy import event
+
+from src.database.database import SessionLocal, engine, init_db
+from src.database.models import User, Wallet
+from src.utils.identity_cache import IdentityCache
+
+
+def _register(db, discord_id, address):
+    user = User(discord_id=discord_id, created_at=datetime.now())
+    db.add(user)
+    db.flush()
+    db.add(Wallet(address=address, parc_balance=10, jpy_balance=1000, user=user))
+    db.commit()
+    return user.id
+
+
+def test_lookups_hit_the_cache_and_evict_least_recently_used():
+    init_db()
+    db = SessionLocal()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    try:
+        ids = {f"identity-{i}": _register(db, f"identity-{i}", f"PARC_identity_{i}") for i in range(3)}
+        cache = IdentityCache(max_entries=2)
+
+        first = cache.lookup(db, "identity-0")
+        assert (first.user_id, first.wallet_address, first.has_cleared) == (ids["identity-0"], "PARC_identity_0", False)
+
+        event.listen(engine, "before_cursor_execute", listener)
+        assert cache.lookup(db, "identity-0") == first
+        assert cache.discord_id_for_address(db, "PARC_identity_0") == "identity-0"
+        assert statements == []  # キャッシュ済みならクエリなし
+        event.remove(engine, "before_cursor_execute", listener)
+
+        cache.lookup(db, "identity-1")
+        cache.lookup(db, "identity-2")  # 最も古い identity-0 が追い出される
+        assert len(cache) == 2 and cache.misses == 3
+
+        assert cache.wallet(db, "identity-1", for_update=True).address == "PARC_identity_1"
+        assert cache.lookup(db, "unregistered") is None
+
+        cache.set_cleared("identity-1", True)
+        assert cache.lookup(db, "identity-1").has_cleared
+        cache.invalidate("identity-1")
+        assert cache.lookup(db, "identity-1").has_cleared is False
+    finally:
+        if event.contains(engine, "before_cursor_execute", listener):
+            event.remove(engine, "before_cursor_execute", listener)
+        db.close()
@@ -0,0 +1,54 @@
+"""テクニカル指標エンジンのテスト"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from src.utils.indicator_engine import IndicatorEngine
+
+
+def _filled(prices, capacity=16):
+    engine = IndicatorEngine(capacity)
+    start = datetime(2025, 1, 1, 10, 0)
+    engine.extend((start + timedelta(minutes=i), p) for i, p in enumerate(prices))
+    return engine, start
+
+
+def test_ring_buffer_keeps_latest_prices_in_order():
+    prices = [float(i) for i in range(1, 41)]
+    engine, start = _filled(prices, capacity=16)
+
+    assert len(engine) == 16
+    assert engine.latest(5).tolist() == prices[-5:]
+    assert engine.latest(100).tolist() == prices[-16:]
+    assert engine.since(start + timedelta(minutes=35)).tolist() == prices[35:]
+    assert engine.last_price() == 40.0
+
+
+def test_indicators_match_reference_formulas():
+    rng = np.random.default_rng(7)
+    prices = list(100 + rng.normal(0, 1, 30).cumsum())
+    engine, start = _filled(prices, capacity=64)
+
+    changes = np.diff(prices[-14:])
+    gain = changes[changes > 0].sum() / len(changes)
+    loss = -changes[changes < 0].sum() / len(changes)
+    assert engine.rsi(14) == pytest.approx(100 - 100 / (1 + gain / loss))
+
+    assert engine.sma(5) == pytest.approx(np.mean(prices[-5:]))
+    ema = prices[0]
+    for price in prices[1:]:
+        ema += 2 / 6 * (price - ema)
+    assert engine.ema(5) == pytest.approx(ema)
+
+    recent = prices[-5:]
+    assert engine.momentum(5) == pytest.approx(
+        sum(1 if b > a else -1 for a, b in zip(recent, recent[1:])) / 4)
+    recent = np.array(prices[-10:])
+    assert engine.volatility(10) == pytest.approx(np.std(np.diff(recent) / recent[:-1]))
+
+    hist, edges = np.histogram(prices, bins=20)
+    assert engine.support_resistance(start, bins=20) == (
+        pytest.approx(edges[np.argmax(hist)]), pytest.approx(edges[np.argmax(hist) + 1]))
+    assert engine.trend(start) == pytest.approx((prices[-1] - prices[0]) / prices[0])
+    assert IndicatorEngine().rsi(14) is None
@@ -0,0 +1,61 @@
+"""残高台帳のテスト"""
+from datetime import datetime
+
+import pytest
+
+from src.database import ledger
+from src.database.database import SessionLocal, init_db
+from src.database.ledger import InsufficientBalance, Posting, WalletNotFound
+from src.database.models import Transaction, User, Wallet
+
+
+def _add_wallet(db, name, parc, jpy):
+    user = User(discord_id=f"ledger-{name}", created_at=datetime.now())
+    db.add(user)
+    db.flush()
+    db.add(Wallet(address=f"PARC_ledger_{name}", parc_balance=parc, jpy_balance=jpy, user_id=user.id))
+    db.commit()
+    return f"PARC_ledger_{name}"
+
+
+def test_transfer_updates_both_wallets_and_records_entries():
+    init_db()
+    db = SessionLocal()
+    try:
+        alice, bob = _add_wallet(db, "alice", 500, 1000), _add_wallet(db, "bob", 0, 0)
+        sender = db.query(Wallet).filter(Wallet.address == alice).one()
+
+        tx = Transaction(from_address=alice, to_address=bob, amount=300, fee=1, transaction_type="transfer")
+        balances = ledger.apply(db, [Posting(alice, parc=-301), Posting(bob, parc=300)], [tx])
+        db.commit()
+
+        assert balances[alice].parc == 199 and balances[bob].parc == 300
+        assert tx.id is not None
+        # セッションに読み込み済みの Wallet も新しい残高になる
+        assert sender.parc_balance == 199 and sender.jpy_balance == 1000
+        assert ledger.balance_of(db, bob).parc == 300
+    finally:
+        db.close()
+
+
+def test_insufficient_balance_leaves_wallet_untouched():
+    init_db()
+    db = SessionLocal()
+    try:
+        carol = _add_wallet(db, "carol", 50, 100)
+        with pytest.raises(InsufficientBalance) as excinfo:
+            ledger.apply(db, [Posting(carol, parc=10, jpy=-101)])
+        assert excinfo.value.currency == "jpy" and excinfo.value.available == 100
+        db.rollback()
+        assert ledger.balance_of(db, carol).jpy == 100
+
+        with pytest.raises(WalletNotFound):
+            ledger.apply(db, [Posting("PARC_ledger_missing", parc=1)])
+        db.rollback()
+
+        # ペナルティは0で止まる
+        balances = ledger.apply(db, [Posting(carol, parc=-100, floor_at_zero=True)])
+        db.commit()
+        assert balances[carol].parc == 0
+    finally:
+        db.close()
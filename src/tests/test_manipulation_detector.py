@@ -0,0 +1,40 @@
+"""ストリーム型市場操作検出器のテスト"""
+from datetime import datetime, timedelta
+
+from src.utils.manipulation_detector import StreamingManipulationDetector
+
+
+def _feed(detector, address, count, start, step=timedelta(minutes=1), amount=10, first_id=1):
+    detections = []
+    for i in range(count):
+        side = 'buy' if i % 2 == 0 else 'sell'
+        detections.extend(detector.observe(first_id + i, side, address, amount, start + step * i))
+    return detections
+
+
+def test_wash_trading_is_detected_on_the_triggering_trade():
+    detector = StreamingManipulationDetector()
+    start = datetime(2025, 1, 1, 10, 0)
+
+    assert _feed(detector, "PARC_a", 10, start) == []
+    detections = detector.observe(11, 'buy', "PARC_a", 10, start + timedelta(minutes=10))
+
+    assert [d.manipulation_type for d in detections] == ['wash_trading']
+    assert detections[0].transaction_ids == list(range(1, 12))
+    # 検出済みの取引で再検出しない
+    assert detector.observe(12, 'sell', "PARC_a", 10, start + timedelta(minutes=11)) == []
+
+
+def test_trades_outside_the_window_are_expired():
+    detector = StreamingManipulationDetector()
+    start = datetime(2025, 1, 1, 10, 0)
+
+    # 3時間の窓に10件を超えて入らない間隔
+    detections = _feed(detector, "PARC_b", 30, start, step=timedelta(minutes=20))
+
+    assert [d for d in detections if d.manipulation_type == 'wash_trading'] == []
+
+    # 24時間以上経過すると状態ごと破棄される
+    detector.observe(100, 'buy', "PARC_c", 10, start + timedelta(days=2))
+    assert detector.stats()['tracked_addresses'] == 1
+    assert detector.stats()['window_transactions'] == 1
@@ -0,0 +1,77 @@
+"""市場統計スナップショットのテスト"""
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.database.database import SessionLocal, init_db
+from src.database.models import PriceHistory, Transaction, User, Wallet
+from src.utils.market_stats import MarketStatsService
+
+
+def test_refresh_matches_full_aggregates_and_counts_incrementally():
+    init_db()
+    db = SessionLocal()
+    try:
+        for i, (parc, jpy) in enumerate([(10, 200_000_000), (5_000_000, 1_000), (300, 50_000)]):
+            user = User(discord_id=f"stats-{i}", created_at=datetime.now(), message_count=i)
+            db.add(user)
+            db.flush()
+            db.add(Wallet(address=f"PARC_stats_{i}", parc_balance=parc, jpy_balance=jpy, user_id=user.id))
+        db.add(PriceHistory(price=123.0, timestamp=datetime(2030, 1, 1)))
+        db.commit()
+
+        service = MarketStatsService(max_age=60)
+        first = service.refresh(db)
+        assert first.total_transactions == db.query(func.count(Transaction.id)).scalar()
+        assert first.price == 123.0
+        assert first.total_supply == db.query(func.sum(Wallet.parc_balance)).scalar()
+        # 総資産 = PARC時価 + JPY の順
+        assets = [entry.total_assets for entry in first.asset_ranking]
+        assert assets == sorted(assets, reverse=True)
+        assert first.parc_ranking[0].discord_id == "stats-1"
+        assert {"stats-0", "stats-1"} <= set(first.clear_candidates)
+        assert not service.is_stale()
+
+        # 追記分だけを集計して加算する
+        db.add_all(Transaction(to_address="PARC_stats_2", amount=1, transaction_type="mining") for _ in range(3))
+        db.add(PriceHistory(price=99999.0, timestamp=datetime(2030, 1, 2)))
+        db.add(PriceHistory(price=0.5, timestamp=datetime(2000, 1, 1)))
+        db.query(User).filter(User.discord_id == "stats-0").update({User.has_cleared: True})
+        db.commit()
+
+        second = service.refresh(db)
+        assert second.total_transactions == first.total_transactions + 3
+        assert second.total_transactions == db.query(func.count(Transaction.id)).scalar()
+        assert (second.price, second.all_time_high, second.all_time_low) == (99999.0, 99999.0, 0.5)
+        assert "stats-0" not in second.clear_candidates
+        assert service.snapshot is second
+    finally:
+        db.close()
+
+
+def test_rows_committed_late_with_lower_ids_are_still_counted():
+    init_db()
+    db = SessionLocal()
+    try:
+        base = (db.query(func.max(Transaction.id)).scalar() or 0) + 100
+        db.add(Transaction(id=base + 10, amount=1, transaction_type="mining"))
+        db.commit()
+
+        # 最新の id から遅延分の範囲は集計済みにしないので、後からコミットされた小さい id も数える
+        lagged = MarketStatsService(max_age=60, id_lag=50, recount_interval=3600)
+        lagged.refresh(db)
+        db.add(Transaction(id=base + 5, amount=1, transaction_type="mining"))
+        db.commit()
+        total = db.query(func.count(Transaction.id)).scalar()
+        assert lagged.refresh(db).total_transactions == total
+
+        # 遅延の範囲より古い id で漏れた行は全件集計で拾い直す
+        eager = MarketStatsService(max_age=60, id_lag=0, recount_interval=3600)
+        eager.refresh(db)
+        db.add(Transaction(id=base + 1, amount=1, transaction_type="mining"))
+        db.commit()
+        assert eager.refresh(db).total_transactions == total
+        eager.recount_interval = 0
+        assert eager.refresh(db).total_transactions == total + 1
+    finally:
+        db.close()
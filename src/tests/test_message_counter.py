@@ -0,0 +1,71 @@
+"""メッセージ数の書き込み遅延カウンターのテスト"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from src.database.database import SessionLocal, init_db
+from src.database.models import User
+from src.utils.message_counter import MessageCounter
+
+
+def _user_counts(ids):
+    db = SessionLocal()
+    try:
+        return {u.discord_id: u.message_count for u in db.query(User).filter(User.discord_id.in_(ids))}
+    finally:
+        db.close()
+
+
+def test_counts_are_buffered_and_flushed_in_one_update():
+    init_db()
+    ids = [f"msgcounter-{i}" for i in range(3)]
+    db = SessionLocal()
+    db.add_all(User(discord_id=i, message_count=10, created_at=datetime.now()) for i in ids)
+    db.commit()
+    db.close()
+
+    counter = MessageCounter(SessionLocal, flush_interval=0)
+    for _ in range(4):
+        counter.increment(ids[0])
+    counter.increment(ids[1], 2)
+    counter.increment("msgcounter-unknown")
+
+    # 反映前はDBを触らない
+    assert _user_counts(ids) == {ids[0]: 10, ids[1]: 10, ids[2]: 10}
+    assert counter.pending(ids[0]) == 4
+
+    counter.flush()
+    assert _user_counts(ids) == {ids[0]: 14, ids[1]: 12, ids[2]: 10}
+    assert counter.flushes == 1 and counter.flushed_messages == 7
+
+    # /mine は未反映分を取り出して自分で反映する
+    counter.increment(ids[2], 5)
+    assert counter.drain(ids[2]) == 5
+    assert counter.pending(ids[2]) == 0
+
+
+def test_claimed_counts_return_to_the_counter_when_commit_fails():
+    init_db()
+    counter = MessageCounter(SessionLocal, flush_interval=0)
+    counter.increment("msgcounter-claim", 7)
+
+    db = SessionLocal()
+    db.add(User(discord_id="msgcounter-dup", created_at=datetime.now()))
+    db.commit()
+    try:
+        # /mine と同じく、取り出した分を使ってコミットする途中で失敗させる
+        with pytest.raises(IntegrityError):
+            with counter.claim("msgcounter-claim") as unflushed:
+                assert unflushed == 7 and counter.pending("msgcounter-claim") == 0
+                db.add(User(discord_id="msgcounter-dup", created_at=datetime.now()))
+                db.commit()
+        db.rollback()
+    finally:
+        db.close()
+    assert counter.pending("msgcounter-claim") == 7
+
+    # コミットできれば取り出した分は戻らない
+    with counter.claim("msgcounter-claim") as unflushed:
+        assert unflushed == 7
+    assert counter.pending("msgcounter-claim") == 0
@@ -0,0 +1,101 @@
+"""指値注文のライフサイクルのテスト"""
+from datetime import datetime
+
+from src.database import ledger
+from src.database.database import SessionLocal, init_db
+from src.database.ledger import Posting, balance_of
+from src.database.models import Order, OrderFill, User, Wallet
+from src.utils.order_lifecycle import escrow_jpy, refund_on_cancel, settle_crossing_orders
+from src.utils.order_matching import execute_market_order
+
+
+def _place(db, name, side, amount, price, parc=0, jpy=0):
+    """ウォレットを作り、/buy・/sell の指値注文と同じく資金を拘束して発注する"""
+    user = User(discord_id=f"lifecycle-{name}", created_at=datetime.now())
+    db.add(user)
+    db.flush()
+    address = f"PARC_lifecycle_{name}"
+    db.add(Wallet(address=address, parc_balance=parc, jpy_balance=jpy, user_id=user.id))
+    db.flush()
+    order = Order(wallet_address=address, amount=amount, price=price, timestamp=datetime.now(),
+                  order_type="limit", side=side, status="pending", filled_amount=0)
+    escrow = Posting(address, jpy=-escrow_jpy(amount, price)) if side == "buy" else Posting(address, parc=-amount)
+    ledger.apply(db, [escrow], [order])
+    db.commit()
+    return address, order.id
+
+
+def test_escrowed_buy_fills_partially_then_fully_without_double_debit():
+    init_db()
+    db = SessionLocal()
+    try:
+        buyer, order_id = _place(db, "buyer", "buy", 10, 100.0, jpy=2000)
+        seller, _ = _place(db, "seller", "sell", 0.01, 1000.0, parc=4.01)
+        assert balance_of(db, buyer).jpy == 2000 - escrow_jpy(10, 100.0)
+
+        # 成行の売り4 PARCが指値で部分約定
+        execute_market_order(db, seller, "sell", 4, 90.0)
+        db.commit()
+        order = db.get(Order, order_id)
+        assert (order.status, order.filled_amount) == ("partially_filled", 4)
+
+        # チャート価格が指値より下がった: 残り6 PARCを80円で約定し、差額を返す
+        fills = settle_crossing_orders(db, 80.0)
+        db.commit()
+        fill = next(f for f in fills if f.order_id == order_id)
+        assert (fill.amount, fill.status) == (6, "filled")
+        db.refresh(order)
+        assert (order.status, order.filled_amount) == ("filled", 10)
+        assert [f.source for f in db.query(OrderFill).filter(OrderFill.order_id == order_id).order_by(OrderFill.id)] == ["book", "market"]
+
+        balance = balance_of(db, buyer)
+        paid_book = 400 + 1  # 4 × 100円 + 手数料
+        paid_market = 480 + 1  # 6 × 80円 + 手数料
+        assert balance.parc == 10
+        assert balance.jpy == 2000 - paid_book - paid_market
+    finally:
+        db.close()
+
+
+def test_cancel_refunds_only_the_unfilled_escrow():
+    init_db()
+    db = SessionLocal()
+    try:
+        seller, order_id = _place(db, "ask", "sell", 5, 120.0, parc=5)
+        buyer, _ = _place(db, "bid", "buy", 0.01, 1.0, jpy=10_000)
+        execute_market_order(db, buyer, "buy", 2, 150.0)
+        db.commit()
+
+        order = db.get(Order, order_id)
+        ledger.apply(db, [refund_on_cancel(order)])
+        order.status = "cancelled"
+        db.commit()
+        assert balance_of(db, seller).parc == 3
+        assert balance_of(db, seller).jpy == 240 - 1
+    finally:
+        db.close()
+
+
+def test_settlement_skips_orders_that_cannot_be_written():
+    init_db()
+    db = SessionLocal()
+    try:
+        buyer, good = _place(db, "settle-ok", "buy", 2, 70.0, jpy=1000)
+        # ウォレットが消えた注文（外部キー導入前のデータ）は約定できないが、ほかの注文の約定を止めない
+        db.connection().exec_driver_sql("PRAGMA foreign_keys=OFF")
+        ghost = Order(wallet_address="PARC_lifecycle_ghost", amount=3, price=70.0, timestamp=datetime.now(),
+                      order_type="limit", side="buy", status="pending", filled_amount=0)
+        db.add(ghost)
+        db.commit()
+        db.connection().exec_driver_sql("PRAGMA foreign_keys=ON")
+        db.commit()
+
+        fills = settle_crossing_orders(db, 60.0)
+        db.commit()
+        assert [f.order_id for f in fills] == [good]
+        assert db.get(Order, good).status == "filled"
+        assert (db.get(Order, ghost.id).status, db.get(Order, ghost.id).filled_amount) == ("pending", 0)
+        assert db.query(OrderFill).filter(OrderFill.order_id == ghost.id).count() == 0
+        assert balance_of(db, buyer).parc == 2
+    finally:
+        db.close()
@@ -0,0 +1,89 @@
+"""成行注文の板約定のテスト"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database.database import SessionLocal, init_db
+from src.database.ledger import InsufficientBalance, balance_of
+from src.database.models import Order, User, Wallet
+from src.utils.order_matching import execute_market_order
+
+
+def _add_wallet(db, name, parc=0, jpy=0):
+    user = User(discord_id=f"matching-{name}", created_at=datetime.now())
+    db.add(user)
+    db.flush()
+    address = f"PARC_matching_{name}"
+    db.add(Wallet(address=address, parc_balance=parc, jpy_balance=jpy, user_id=user.id))
+    return address
+
+
+def _add_order(db, address, side, amount, price, timestamp):
+    order = Order(wallet_address=address, amount=amount, price=price, timestamp=timestamp,
+                  order_type="limit", side=side, status="pending", filled_amount=0)
+    db.add(order)
+    db.flush()
+    return order.id
+
+
+def test_market_buy_walks_asks_by_price_then_time_and_falls_back():
+    init_db()
+    db = SessionLocal()
+    try:
+        taker = _add_wallet(db, "taker", jpy=100_000)
+        maker_a, maker_b = _add_wallet(db, "maker-a"), _add_wallet(db, "maker-b")
+        base = datetime(2025, 1, 1, 9, 0)
+        late = _add_order(db, maker_a, "sell", 5, 90.0, base + timedelta(minutes=1))
+        early = _add_order(db, maker_b, "sell", 5, 90.0, base)
+        cheap = _add_order(db, maker_b, "sell", 3, 80.0, base + timedelta(minutes=5))
+        too_high = _add_order(db, maker_a, "sell", 10, 120.0, base)
+        own = _add_order(db, taker, "sell", 10, 50.0, base)
+        db.commit()
+
+        execution = execute_market_order(db, taker, "buy", 20, 100.0)
+        db.commit()
+
+        # 80円 → 90円（古い順）→ 残りは合成価格の100円
+        assert [(f.order_id, f.amount, f.price) for f in execution.fills] == [
+            (cheap, 3, 80.0), (early, 5, 90.0), (late, 5, 90.0)
+        ]
+        assert execution.matched_amount == 13
+        assert execution.gross == 3 * 80 + 10 * 90 + 7 * 100
+        assert execution.balance.parc == 20
+        assert execution.balance.jpy == 100_000 - execution.gross - execution.fee
+
+        statuses = {o.id: (o.status, o.filled_amount) for o in db.query(Order).filter(Order.id.in_([late, early, cheap, too_high, own]))}
+        assert statuses[cheap] == ("filled", 3) and statuses[late] == ("filled", 5)
+        assert statuses[too_high] == ("pending", 0) and statuses[own] == ("pending", 0)
+        # 売り注文側はPARCが拘束済みなので代金だけを受け取る
+        assert balance_of(db, maker_b).jpy == (3 * 80 - 1) + (5 * 90 - 1)
+    finally:
+        db.close()
+
+
+def test_partial_fill_and_insufficient_balance_rolls_back_matches():
+    init_db()
+    db = SessionLocal()
+    try:
+        taker = _add_wallet(db, "seller", parc=4)
+        maker = _add_wallet(db, "bidder")
+        bid = _add_order(db, maker, "buy", 10, 110.0, datetime(2025, 1, 1, 9, 0))
+        db.commit()
+
+        execution = execute_market_order(db, taker, "sell", 4, 100.0)
+        db.commit()
+        assert execution.matched_amount == 4 and execution.average_price == 110.0
+        order = db.get(Order, bid)
+        assert (order.status, order.filled_amount) == ("partially_filled", 4)
+        assert [(f.amount, f.price, f.source) for f in order.fills] == [(4, 110.0, "book")]
+        assert balance_of(db, maker).parc == 4
+
+        # PARCが足りなければ板の約定も残らない
+        with pytest.raises(InsufficientBalance):
+            with db.begin_nested():
+                execute_market_order(db, taker, "sell", 5, 100.0)
+        db.commit()
+        db.refresh(order)
+        assert order.filled_amount == 4 and balance_of(db, maker).parc == 4
+    finally:
+        db.close()
@@ -0,0 +1,14 @@
+"""コネクションプール計測のテスト"""
+from src.database.database import PoolMonitor, engine
+
+
+def test_average_wait_covers_all_checkouts_beyond_the_sample_window():
+    monitor = PoolMonitor("test", sample_size=10)
+    monitor.pool = engine.pool
+    for _ in range(25):
+        monitor.record_wait(0.002)
+
+    snapshot = monitor.snapshot()
+    # 平均は起動からの累計、p95 は直近のサンプルから計算する
+    assert round(snapshot['avg_wait_ms'], 6) == 2.0
+    assert round(snapshot['p95_wait_ms'], 6) == 2.0
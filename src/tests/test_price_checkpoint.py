@@ -0,0 +1,41 @@
+"""価格状態チェックポイントのテスト"""
+import json
+
+from src.utils.price_checkpoint import PriceCheckpointer
+
+
+def _state(base):
+    return {"base_price": base, "min_price": base * 0.9, "max_price": base * 1.1}
+
+
+def test_round_trip_and_coalescing(tmp_path):
+    path = str(tmp_path / "price_state.json")
+    checkpointer = PriceCheckpointer(path, min_interval=60)
+
+    checkpointer.save(_state(100.0))  # 初回は即時に書き込む
+    checkpointer.save(_state(101.0))
+    checkpointer.save(_state(102.0))
+    assert checkpointer.writes == 1
+    assert checkpointer.coalesced == 1
+
+    checkpointer.flush()
+    assert checkpointer.writes == 2
+    assert PriceCheckpointer(path).load()["base_price"] == 102.0
+    assert not (tmp_path / "price_state.json.tmp").exists()
+
+
+def test_invalid_checkpoint_is_rejected(tmp_path):
+    path = tmp_path / "price_state.json"
+    checkpointer = PriceCheckpointer(str(path), min_interval=0)
+    checkpointer.save(_state(100.0))
+
+    payload = json.loads(path.read_text())
+    payload["base_price"] = 150.0  # チェックサムと一致しない改変
+    path.write_text(json.dumps(payload))
+    assert checkpointer.load() is None
+
+    path.write_text('{"base_price": 100')  # 書き込み途中で壊れたファイル
+    assert checkpointer.load() is None
+
+    path.write_text(json.dumps({"base_price": 100.0, "min_price": 120.0, "max_price": 130.0}))
+    assert checkpointer.load() is None
@@ -0,0 +1,33 @@
+"""価格モデルのリプレイのテスト"""
+from datetime import datetime, timedelta
+
+from src.simulation.replay import MarketReplay, ReplayConfig
+from src.utils.clock import SystemClock, get_clock
+
+
+def _replay(tmp_path, seed):
+    config = ReplayConfig(
+        seed=seed,
+        start=datetime(2025, 3, 1, 9, 0),
+        hours=1,
+        step_minutes=5,
+        users=30,
+        trades_per_hour=60,
+        pending_orders=10,
+        workdir=str(tmp_path / f"replay_{seed}"),
+    )
+    return MarketReplay(config).run()
+
+
+def test_replay_is_deterministic_in_simulated_time(tmp_path):
+    first = _replay(tmp_path, seed=3)
+    second = _replay(tmp_path, seed=3)
+
+    assert [tick['timestamp'] for tick in first['path']] == [
+        (datetime(2025, 3, 1, 9, 0) + timedelta(minutes=5 * i)).isoformat() for i in range(12)
+    ]
+    assert [tick['price'] for tick in first['path']] == [tick['price'] for tick in second['path']]
+    assert "市場深度" in first['factors'] and first['factors']["市場深度"]['ticks'] == 12
+    assert first['factor_timings_ms']['transactions']['calls'] == 12
+    # 再生後はシステム時刻に戻っている
+    assert isinstance(get_clock(), SystemClock)
@@ -0,0 +1,62 @@
+"""取引セッションカレンダーのテスト"""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from src.utils import session_calendar
+from src.utils.clock import JST, SimulatedClock
+from src.utils.session_calendar import SessionCalendar, parse_sessions
+
+
+def _jst(*args):
+    return JST.localize(datetime(*args))
+
+
+def test_state_and_next_event_by_bisect():
+    calendar = SessionCalendar(holidays=[date(2025, 3, 4)])
+
+    assert calendar.current_session(_jst(2025, 3, 3, 9, 0)).name == "前場"
+    assert calendar.current_session(_jst(2025, 3, 3, 11, 30)) is None
+    assert calendar.current_session(_jst(2025, 3, 3, 15, 29)).key == "afternoon"
+    assert calendar.next_transition(_jst(2025, 3, 3, 11, 30)).event == "afternoon_start"
+    # 休場日は飛ばして翌営業日の前場開始
+    transition = calendar.next_transition(_jst(2025, 3, 3, 16, 0))
+    assert (transition.event, transition.at) == ("morning_start", _jst(2025, 3, 5, 9, 0))
+    assert calendar.current_session(_jst(2025, 3, 4, 10, 0)) is None
+
+    assert calendar.near_transition('end', 'morning', 60, _jst(2025, 3, 3, 11, 30, 45))
+    assert not calendar.near_transition('start', 'any', 60, _jst(2025, 3, 3, 11, 30, 45))
+
+
+def test_configured_sessions_are_validated():
+    sessions = parse_sessions("08:00-10:00, 13:00-14:00, 20:00-21:00")
+    assert [s.key for s in sessions] == ["morning", "afternoon", "session3"]
+    assert SessionCalendar(sessions).is_open(_jst(2025, 3, 3, 20, 30))
+    with pytest.raises(ValueError):
+        SessionCalendar(parse_sessions("09:00-12:00,11:00-13:00"))
+    with pytest.raises(ValueError):
+        parse_sessions("9時-11時")
+
+
+def test_watch_notifies_subscribers_at_each_transition(monkeypatch):
+    clock = SimulatedClock(datetime(2025, 3, 3, 11, 0))
+    calendar = SessionCalendar(clock=clock)
+    received = []
+
+    async def fake_sleep(seconds):
+        clock.advance(timedelta(seconds=seconds))
+
+    async def on_transition(transition):
+        received.append((transition.event, clock.now().time().isoformat()))
+        if len(received) == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(session_calendar.asyncio, 'sleep', fake_sleep)
+    calendar.subscribe(on_transition)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(calendar.watch())
+
+    assert received == [
+        ("morning_end", "11:30:00"), ("afternoon_start", "12:30:00"), ("afternoon_end", "15:30:00"),
+    ]
@@ -0,0 +1,34 @@
+"""スパム検知と警告回数のテスト"""
+from src.utils.spam_guard import SpamGuard, WarningCounter
+
+
+def test_burst_and_duplicate_detection_in_fixed_window():
+    guard = SpamGuard(max_users=100)
+
+    # 10秒間隔の異なるメッセージはスパムではない
+    assert not any(guard.observe(1, f"msg {i}", now=i * 10.0) for i in range(10))
+    # 5秒以内に5件
+    assert [guard.observe(2, f"burst {i}", now=100 + i) for i in range(5)] == [False] * 4 + [True]
+    # 直近5件のうち先頭と同じ本文が3件
+    contents = ["hello", "a", "hello", "b", "hello"]
+    assert [guard.observe(3, c, now=200 + i * 10) for i, c in enumerate(contents)][-1] is True
+    # 1分より古いメッセージは判定に使わない
+    guard.observe(4, "same", now=300)
+    assert not any(guard.observe(4, "same", now=361 + i * 10) for i in range(4))
+
+
+def test_idle_users_are_evicted():
+    guard = SpamGuard(max_users=3)
+    for user_id in range(10):
+        guard.observe(user_id, "hi", now=float(user_id))
+    assert len(guard) == 3
+
+    guard.observe(99, "hi", now=1000.0)
+    assert len(guard) == 1
+
+    warnings = WarningCounter(reset_seconds=600, max_users=100)
+    assert [warnings.add(1, now=t) for t in (0, 10, 20)] == [1, 2, 3]
+    assert warnings.get(1, now=619) == 3
+    assert warnings.add(1, now=700) == 1  # 10分経過でリセット
+    warnings.add(2, now=2000)
+    assert len(warnings) == 1
@@ -0,0 +1,59 @@
+"""取引のグループコミットのテスト"""
+import asyncio
+from datetime import datetime
+
+from src.database import ledger
+from src.database.database import SessionLocal, init_db
+from src.database.ledger import InsufficientBalance, Posting
+from src.database.models import Transaction, User, Wallet
+from src.database.trade_pipeline import TradePipeline
+
+
+def _add_wallets(count):
+    db = SessionLocal()
+    try:
+        addresses = []
+        for i in range(count):
+            user = User(discord_id=f"pipeline-{i}", created_at=datetime.now())
+            db.add(user)
+            db.flush()
+            db.add(Wallet(address=f"PARC_pipeline_{i}", parc_balance=0, jpy_balance=1000, user_id=user.id))
+            addresses.append(f"PARC_pipeline_{i}")
+        db.commit()
+        return addresses
+    finally:
+        db.close()
+
+
+def test_concurrent_trades_share_commits_and_fail_independently():
+    init_db()
+    addresses = _add_wallets(8)
+    pipeline = TradePipeline(window_ms=20, max_batch=100)
+
+    def buy(address, jpy):
+        tx = Transaction(to_address=address, amount=1, transaction_type="buy", order_type="market")
+        return pipeline.submit(ledger.apply, [Posting(address, parc=1, jpy=-jpy)], [tx])
+
+    async def scenario():
+        # 1件だけ残高不足（1000円しかないウォレットから2000円）
+        jobs = [buy(address, 2000 if i == 3 else 100) for i, address in enumerate(addresses)]
+        return await asyncio.gather(*jobs, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert isinstance(results[3], InsufficientBalance)
+    for i, balances in enumerate(results):
+        if i != 3:
+            assert balances[addresses[i]].jpy == 900
+    assert pipeline.stats()['batches'] == 1 and pipeline.stats()['jobs'] == 8
+
+    db = SessionLocal()
+    try:
+        rows = dict(db.query(Wallet.address, Wallet.jpy_balance).filter(Wallet.address.in_(addresses)))
+        assert rows[addresses[3]] == 1000
+        assert all(rows[address] == 900 for i, address in enumerate(addresses) if i != 3)
+        # 失敗した取引の記録は残らない
+        assert db.query(Transaction).filter(Transaction.to_address == addresses[3]).count() == 0
+    finally:
+        db.close()
+
@@ -0,0 +1,127 @@
+"""取引履歴のキーセットページングと件数キャッシュのテスト"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, text
+
+from src.database.database import SessionLocal, init_db
+from src.database.models import Transaction, User, Wallet
+from src.database.trade_pipeline import TradePipeline
+from src.utils.transaction_history import TransactionCountCache, history_page, page_cursor, transaction_counts
+
+
+def _setup_wallets(db):
+    wallets = []
+    for i in range(2):
+        user = User(discord_id=f"history-{i}", created_at=datetime.now())
+        db.add(user)
+        db.flush()
+        wallet = Wallet(address=f"PARC_history_{i}", parc_balance=0, jpy_balance=0, user_id=user.id)
+        db.add(wallet)
+        wallets.append(wallet.address)
+    db.commit()
+    return wallets
+
+
+def test_keyset_pages_match_full_ordering_and_counts_follow_commits():
+    init_db()
+    db = SessionLocal()
+    try:
+        me, other = _setup_wallets(db)
+        base = datetime(2025, 1, 1, 12, 0)
+        for i in range(23):
+            # 同じ時刻の行を混ぜて id で順序が決まることを確かめる
+            timestamp = base + timedelta(minutes=i // 3)
+            if i % 4 == 0:
+                tx = Transaction(from_address=me, to_address=other, amount=i, timestamp=timestamp, transaction_type="transfer")
+            elif i % 4 == 1:
+                tx = Transaction(from_address=other, to_address=me, amount=i, timestamp=timestamp, transaction_type="transfer")
+            elif i % 4 == 2:
+                tx = Transaction(from_address=me, to_address=me, amount=i, timestamp=timestamp, transaction_type="transfer")
+            else:
+                tx = Transaction(to_address=me, amount=i, timestamp=timestamp, transaction_type="mining")
+            db.add(tx)
+        db.add(Transaction(from_address=other, amount=99, timestamp=base, transaction_type="sell"))
+        db.commit()
+
+        expected = [tx.id for tx in db.query(Transaction)
+                    .filter(or_(Transaction.from_address == me, Transaction.to_address == me))
+                    .order_by(Transaction.timestamp.desc(), Transaction.id.desc())]
+        assert len(expected) == 23
+
+        pages, cursor = [], None
+        while True:
+            page = history_page(db, me, 5, before=cursor)
+            if not page:
+                break
+            pages.extend(tx.id for tx in page)
+            cursor = page_cursor(page)
+        assert pages == expected
+        # 起点が分からない深いページへの直接指定
+        assert [tx.id for tx in history_page(db, me, 5, offset=15)] == expected[15:20]
+
+        cache = TransactionCountCache(max_entries=10)
+        assert cache.get(db, me) == 23 and cache.get(db, other) == 13
+        transaction_counts.invalidate()
+        assert transaction_counts.get(db, me) == 23
+
+        # コミットされた書き込みだけが件数に反映される
+        db.add(Transaction(from_address=me, to_address=other, amount=1, transaction_type="transfer"))
+        db.flush()
+        db.rollback()
+        assert transaction_counts.get(db, me) == 23
+        db.add(Transaction(from_address=me, to_address=other, amount=1, transaction_type="transfer"))
+        db.commit()
+        misses = transaction_counts.misses
+        assert transaction_counts.get(db, me) == 24
+        assert transaction_counts.misses == misses  # 数え直さずに加算済み
+    finally:
+        db.close()
+
+
+def test_counts_follow_only_the_outer_commit_of_a_trade_batch():
+    init_db()
+    db = SessionLocal()
+    try:
+        user = User(discord_id="history-batch", created_at=datetime.now())
+        db.add(user)
+        db.flush()
+        address = "PARC_history_batch"
+        db.add(Wallet(address=address, parc_balance=0, jpy_balance=0, user_id=user.id))
+        db.commit()
+        transaction_counts.invalidate()
+        assert transaction_counts.get(db, address) == 0
+    finally:
+        db.close()
+
+    def record(session, fail=False):
+        session.add(Transaction(to_address=address, amount=1, transaction_type="mining"))
+        session.flush()
+        if fail:
+            raise ValueError("巻き戻す")
+
+    def break_commit(session):
+        # 外部キーの確認をコミット時まで遅らせ、SAVEPOINT は通るがコミットで失敗させる
+        session.execute(text("PRAGMA defer_foreign_keys=ON"))
+        session.add(Transaction(to_address="PARC_history_missing", amount=1, transaction_type="mining"))
+        session.flush()
+
+    pipeline = TradePipeline(window_ms=20)
+
+    async def scenario(*jobs):
+        return await asyncio.gather(*(pipeline.submit(*job) for job in jobs), return_exceptions=True)
+
+    db = SessionLocal()
+    try:
+        # コミットに失敗したバッチの分は、解放済みの SAVEPOINT の分も含めて加算しない
+        results = asyncio.run(scenario((record,), (break_commit,)))
+        assert all(isinstance(result, Exception) for result in results)
+        assert transaction_counts.get(db, address) == 0
+
+        # 巻き戻した SAVEPOINT の分だけを除いて加算する
+        asyncio.run(scenario((record,), (record, True), (record,)))
+        misses = transaction_counts.misses
+        assert transaction_counts.get(db, address) == 2
+        assert transaction_counts.misses == misses
+    finally:
+        db.close()
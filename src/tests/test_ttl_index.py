@@ -0,0 +1,44 @@
+"""有効期限付き索引（TTLIndex）のテスト"""
+from src.utils.ttl_index import TTLIndex
+
+
+def test_keys_expire_in_deadline_order():
+    index = TTLIndex(ttl=10, max_size=100, clock=lambda: 0)
+    index.add("a", now=0)
+    index.add("b", now=5)
+    index.add("c", ttl=1, now=0)
+
+    assert index.expire(now=10) == 2  # a, c
+    assert index.keys() == ["b"]
+    assert index.expire(now=15) == 1
+    assert len(index) == 0
+
+
+def test_refresh_extends_deadline():
+    index = TTLIndex(ttl=10, clock=lambda: 0)
+    index.add("a", value=1, now=0)
+    index.add("a", value=2, now=8)  # 期限を18へ延長
+
+    assert index.expire(now=12) == 0
+    assert index.get("a", now=12) == 2
+    assert index.expire(now=18) == 1
+
+
+def test_size_is_capped_by_evicting_earliest_deadline():
+    index = TTLIndex(ttl=100, max_size=3, clock=lambda: 0)
+    for i in range(5):
+        index.add(i, value=i, now=i)
+
+    assert len(index) == 3
+    assert sorted(key for key, _ in index.items()) == [2, 3, 4]
+    assert index.stats()['evicted'] == 2
+
+
+def test_expire_respects_budget():
+    index = TTLIndex(ttl=1, clock=lambda: 0)
+    for i in range(10):
+        index.add(i, now=0)
+
+    assert index.expire(now=5, budget=4) == 4
+    assert index.expire(now=5, budget=4) == 4
+    assert index.expire(now=5) == 2
@@ -0,0 +1,87 @@
+"""ウォッシュトレード検出のフラグ永続化（flagged_transactions）のテスト"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database.database import SessionLocal, init_db
+from src.database.models import FlaggedTransaction, Transaction, Wallet
+from src.utils.price_calculator import PriceCalculator
+
+
+@pytest.fixture
+def calculator(tmp_path, monkeypatch):
+    # フラグファイルや価格状態は一時ディレクトリに書き出す
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    init_db()
+    PriceCalculator._instance = None
+    PriceCalculator._initialized = False
+    calculator = PriceCalculator()
+    yield calculator
+    PriceCalculator._instance = None
+    PriceCalculator._initialized = False
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def _seed_wash_trades(db, address, count=12):
+    db.add(Wallet(address=address, parc_balance=0, jpy_balance=0))
+    db.flush()
+    now = datetime.now()
+    for i in range(count):
+        side = 'buy' if i % 2 == 0 else 'sell'
+        db.add(Transaction(
+            from_address=address,
+            to_address=address,
+            amount=10,
+            fee=0,
+            price=100.0,
+            timestamp=now - timedelta(minutes=i),
+            transaction_type=side,
+            order_type='market',
+            status='completed',
+        ))
+    db.commit()
+    return [tx.id for tx in db.query(Transaction.id).filter(Transaction.from_address == address)]
+
+
+def test_detected_transactions_are_persisted_as_permanent_flags(calculator, db):
+    # 11件目の取引で検出条件（10件超）を満たす
+    tx_ids = _seed_wash_trades(db, "PARC_wash_test_1", count=11)
+
+    assert calculator._detect_wash_trading(db) is True
+
+    flags = db.query(FlaggedTransaction)\
+        .filter(FlaggedTransaction.transaction_id.in_(tx_ids))\
+        .all()
+    assert {flag.transaction_id for flag in flags} == set(tx_ids)
+    assert all(flag.expires_at is None for flag in flags)
+    # メモリ上のIDもTransaction.idと同じ整数で保持する
+    assert all(tx_id in calculator.permanently_flagged_transactions for tx_id in tx_ids)
+
+
+def test_flagged_transactions_are_excluded_by_anti_join(calculator, db):
+    tx_ids = _seed_wash_trades(db, "PARC_wash_test_2")
+    calculator._record_flags(db, tx_ids[:5], "wash_trading")
+    calculator._record_flags(
+        db, tx_ids[5:8], "high_frequency_trading",
+        expires_at=datetime.now() - timedelta(seconds=1)
+    )
+
+    remaining = db.query(Transaction.id)\
+        .filter(
+            Transaction.from_address == "PARC_wash_test_2",
+            calculator._unflagged_condition()
+        ).all()
+    # 永続フラグは除外され、期限切れの一時フラグは除外されない
+    assert {row.id for row in remaining} == set(tx_ids[5:])
+
+    assert calculator._purge_expired_flags(db) >= 3
+    assert db.query(FlaggedTransaction)\
+        .filter(FlaggedTransaction.transaction_id.in_(tx_ids[5:8]))\
+        .count() == 0
@@ -0,0 +1,244 @@
+"""DM一斉送信エンジン
+
+イベント通知などの全ユーザー宛てDMを broadcast_jobs テーブルのジョブとして積み、
+バックグラウンドのワーカーが users.id 順のキーセットページングで送信する。
+- 受信拒否（users.dm_opt_out）はSQLで除外する
+- 送信はトークンバケットで全体のレートを、セマフォで同時実行数を制限し、
+  Discordのグローバル制限（50リクエスト/秒）に余裕を残して対話コマンドを妨げない
+- ユーザーオブジェクトはクライアントのキャッシュ → LRU → fetch_user の順に引く
+- バッチごとに送信済みの users.id を記録するため、再起動後は続きから送る
+
+環境変数:
+    BROADCAST_RATE         1秒あたりの送信リクエスト数の上限（既定25）
+    BROADCAST_CONCURRENCY  同時に送信するDM数（既定5）
+    BROADCAST_BATCH_SIZE   1回に読み込む宛先数（既定200）
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import discord
+from sqlalchemy import update
+
+from ..database.database import run_db
+from ..database.models import BroadcastJob, User
+from .logger import setup_logger
+
+
+class TokenBucket:
+    """一定レートでトークンが補充されるバケット（イベントループ内で使う）"""
+
+    def __init__(self, rate: float, capacity: float = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """トークンを1つ取得（足りなければ補充まで待つ）"""
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _recipients_query(db, cursor: int):
+    return db.query(User.id, User.discord_id)\
+        .filter(User.id > cursor, User.dm_opt_out == False)  # noqa: E712
+
+
+class Broadcaster:
+    """broadcast_jobs のジョブを順に送信するワーカー"""
+
+    USER_CACHE_SIZE = 10000  # fetch_user で取得したユーザーの保持数
+
+    def __init__(self, bot, rate: float = None, concurrency: int = None, batch_size: int = None):
+        self.bot = bot
+        self.logger = setup_logger(__name__)
+        self.rate = float(os.getenv('BROADCAST_RATE', '25')) if rate is None else rate
+        self.concurrency = int(os.getenv('BROADCAST_CONCURRENCY', '5')) if concurrency is None else concurrency
+        self.batch_size = int(os.getenv('BROADCAST_BATCH_SIZE', '200')) if batch_size is None else batch_size
+        self._bucket = TokenBucket(self.rate)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._users: "OrderedDict[int, discord.abc.User]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # ---------- ジョブの登録 ----------
+
+    async def enqueue(self, embed: discord.Embed, kind: str = "event") -> int:
+        """Embedを全ユーザー宛てのジョブとして登録し、ジョブIDを返す"""
+        payload = json.dumps(embed.to_dict(), ensure_ascii=False)
+
+        def _insert(db):
+            job = BroadcastJob(kind=kind, payload=payload, status="pending", cursor=0)
+            db.add(job)
+            db.flush()
+            return job.id
+
+        async with run_db() as db:
+            job_id = await db.run(_insert)
+        self._wakeup.set()
+        return job_id
+
+    async def cancel(self, job_id: int) -> bool:
+        """未完了のジョブを中止（送信中のバッチは最後まで送る）"""
+        def _cancel(db):
+            return db.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(("pending", "running")))
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            ).rowcount
+
+        async with run_db() as db:
+            return await db.run(_cancel) > 0
+
+    # ---------- ワーカー ----------
+
+    def start(self):
+        """ワーカーを起動（未完了のジョブがあれば続きから送る）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """ワーカーを停止（進捗はバッチごとに保存済み）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.process_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"一斉送信エラー: {e}", exc_info=True)
+            await self._wakeup.wait()
+
+    async def process_pending(self) -> int:
+        """未完了のジョブを古い順にすべて送信し、処理したジョブ数を返す"""
+        processed = 0
+        while True:
+            async with run_db(commit=False) as db:
+                job = await db.run(self._next_job)
+            if job is None:
+                return processed
+            await self._run_job(*job)
+            processed += 1
+
+    @staticmethod
+    def _next_job(db) -> Optional[Tuple[int, str, int]]:
+        row = db.query(BroadcastJob.id, BroadcastJob.payload, BroadcastJob.cursor)\
+            .filter(BroadcastJob.status.in_(("pending", "running")))\
+            .order_by(BroadcastJob.id)\
+            .first()
+        return tuple(row) if row else None
+
+    @staticmethod
+    def _start_job(db, job_id: int, cursor: int):
+        """ジョブを送信中にする（初回のみ宛先数を数える）"""
+        job = db.get(BroadcastJob, job_id)
+        if job is None or job.status not in ("pending", "running"):
+            return None
+        if job.started_at is None:
+            job.started_at = datetime.utcnow()
+            job.total_recipients = _recipients_query(db, cursor).count()
+        job.status = "running"
+        return job.total_recipients
+
+    def _load_batch(self, db, cursor: int) -> List[Tuple[int, str]]:
+        return [tuple(row) for row in _recipients_query(db, cursor).order_by(User.id).limit(self.batch_size)]
+
+    @staticmethod
+    def _record_progress(db, job_id: int, cursor: int, sent: int, failed: int, done: bool) -> bool:
+        """進捗を保存（中止されていれば False）"""
+        values = {
+            'cursor': cursor,
+            'sent_count': BroadcastJob.sent_count + sent,
+            'failed_count': BroadcastJob.failed_count + failed,
+        }
+        if done:
+            values.update(status="completed", finished_at=datetime.utcnow())
+        return db.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.status == "running")
+            .values(**values)
+        ).rowcount > 0
+
+    async def _run_job(self, job_id: int, payload: str, cursor: int):
+        embed = discord.Embed.from_dict(json.loads(payload))
+        async with run_db() as db:
+            total = await db.run(self._start_job, job_id, cursor)
+        if total is None:
+            return
+        self.logger.info(
+            f"一斉送信開始: job={job_id} 宛先{total}件（見込み {total / self.rate:.0f}秒）"
+        )
+
+        while True:
+            async with run_db(commit=False) as db:
+                batch = await db.run(self._load_batch, cursor)
+            if batch:
+                results = await asyncio.gather(*(self._send(discord_id, embed) for _, discord_id in batch))
+                cursor = batch[-1][0]
+                sent = sum(results)
+                failed = len(results) - sent
+            else:
+                sent = failed = 0
+            async with run_db() as db:
+                active = await db.run(self._record_progress, job_id, cursor, sent, failed, not batch)
+            if not batch:
+                self.logger.info(f"一斉送信完了: job={job_id}")
+                return
+            if not active:
+                self.logger.info(f"一斉送信を中止しました: job={job_id}")
+                return
+
+    async def _send(self, discord_id: str, embed: discord.Embed) -> bool:
+        async with self._semaphore:
+            try:
+                user = await self._resolve_user(int(discord_id))
+                if user is None:
+                    return False
+                await self._bucket.acquire()
+                await user.send(embed=embed)
+                return True
+            except (discord.HTTPException, ValueError) as e:
+                # DM拒否・退会済みなどは失敗として数えて続ける
+                self.logger.debug(f"DM送信エラー (User ID: {discord_id}): {e}")
+                return False
+
+    async def _resolve_user(self, user_id: int):
+        """ユーザーオブジェクトを取得（キャッシュになければ fetch_user）"""
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return user
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+            return user
+        await self._bucket.acquire()
+        user = await self.bot.fetch_user(user_id)
+        if user is not None:
+            self._users[user_id] = user
+            while len(self._users) > self.USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+        return user
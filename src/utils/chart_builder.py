@@ -10,12 +10,12 @@ import pandas as pd
 from datetime import datetime, timedelta, timezone
 import pytz
 import os
-import random
 import matplotlib.font_manager as fm
 from matplotlib.collections import LineCollection
 from matplotlib.colors import LinearSegmentedColormap
 from discord import Embed, Colour
 from ..utils.trading_hours import TradingHours
+from ..utils.clock import get_clock, get_random_streams
 import platform
 
 def setup_fonts():
@@ -164,11 +164,16 @@ class ChartBuilder:
             
         print(f"ChartBuilder 初期化完了: 履歴データ数={len(ChartBuilder._realtime_history)}件")
 
+    @staticmethod
+    def _rng():
+        """補間価格用の乱数ストリーム"""
+        return get_random_streams().generator('chart')
+
     @staticmethod
     def set_calculated_price(price, timestamp=None):
         """価格計算で算出された実際の価格を設定"""
         if timestamp is None:
-            timestamp = datetime.now()
+            timestamp = get_clock().now()
             
         # タイムゾーン情報が無い場合は追加
         if timestamp.tzinfo is None:
@@ -186,7 +191,7 @@ class ChartBuilder:
     def update_realtime_history(price, timestamp=None):
         """10秒ごとの価格履歴を更新する"""
         if timestamp is None:
-            timestamp = datetime.now()
+            timestamp = get_clock().now()
         
         # タイムゾーン情報が無い場合は追加
         if timestamp.tzinfo is None:
@@ -196,7 +201,7 @@ class ChartBuilder:
         ChartBuilder._realtime_history.append((timestamp, price))
         
         # 厳密に10分間のデータのみを保持
-        current_time = datetime.now().astimezone()
+        current_time = get_clock().now().astimezone()
         cutoff_time = current_time - timedelta(minutes=10)
         
         # 10分以上前のデータを削除
@@ -213,7 +218,7 @@ class ChartBuilder:
     def generate_interpolated_price(current_time=None):
         """計算価格間を補間したランダム値を生成"""
         if current_time is None:
-            current_time = datetime.now().astimezone()
+            current_time = get_clock().now().astimezone()
             
         # 計算価格が設定されていない場合はNoneを返す
         if ChartBuilder._latest_calculated_price is None or ChartBuilder._latest_calculated_time is None:
@@ -234,7 +239,7 @@ class ChartBuilder:
         max_price_change = 0.05  # 最大±5%
         
         # 前回のデータからの変化率（±0.5%まで）
-        variation_from_last = random.uniform(-0.005, 0.005)  # ±0.5%のランダム変動
+        variation_from_last = ChartBuilder._rng().uniform(-0.005, 0.005)  # ±0.5%のランダム変動
         
         # 前回の価格に小さな変動を適用
         new_price = last_price * (1 + variation_from_last)
@@ -243,7 +248,7 @@ class ChartBuilder:
         if elapsed_seconds < 60:  # 1分以内は計算価格を基準に
             # 1分以内は計算価格を基準に、少しずつランダム変動
             max_variation = min(0.02, elapsed_seconds / 300)  # 最大2%まで、経過時間に応じて増加
-            new_price = ChartBuilder._latest_calculated_price * (1 + random.uniform(-max_variation, max_variation))
+            new_price = ChartBuilder._latest_calculated_price * (1 + ChartBuilder._rng().uniform(-max_variation, max_variation))
         else:
             # 1分以上経過した場合は前回値からの変動を主体に
             # 計算値からの変動は最大±5%を超えないようにする
@@ -271,7 +276,7 @@ class ChartBuilder:
         """
         
         # 指定期間のデータのみ使用
-        cutoff_time = datetime.now() - timedelta(minutes=minutes)
+        cutoff_time = get_clock().now() - timedelta(minutes=minutes)
         filtered_history = [p for p in price_history if p.timestamp > cutoff_time]
         
         if not filtered_history:
@@ -284,7 +289,7 @@ class ChartBuilder:
         
         # データの準備
         # ローカルタイムゾーンを使用
-        local_tz = datetime.now().astimezone().tzinfo
+        local_tz = get_clock().now().astimezone().tzinfo
         dates = [p.timestamp.replace(tzinfo=local_tz) if p.timestamp.tzinfo is None else p.timestamp for p in filtered_history]
         prices = [p.price for p in filtered_history]
         current_price = prices[-1] if prices else 0
@@ -514,7 +519,7 @@ class ChartBuilder:
         print(f"create_realtime_chart 実行: リアルタイム履歴データ数={len(ChartBuilder._realtime_history)}")
         
         # 現在時刻を取得
-        now = datetime.now().astimezone()
+        now = get_clock().now().astimezone()
         local_tz = now.tzinfo
         
         # 2段組のグラフを作成
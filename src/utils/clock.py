@@ -0,0 +1,185 @@
+"""時刻・乱数の取得元
+
+価格計算・イベント・取引時間・チャートは datetime.now() / time.time() / random の代わりにここから取る。
+通常はシステム時刻を返し、リプレイ・バックテストではシミュレーション時刻に差し替える。
+tick() の間は現在時刻を固定し、1ティック内の処理がすべて同じ「現在」を見るようにする
+（固定はコンテキスト変数で持ち、ほかのスレッド・タスクには影響しない）。
+乱数は用途ごとの名前付き numpy.random.Generator で、シードを固定すると再現できる。
+
+環境変数:
+    RANDOM_SEED  乱数ストリームのシード（未設定ならOSのエントロピー）
+"""
+import abc
+import contextvars
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+import pytz
+
+# 日本時間（毎回 pytz.timezone を引かないようにキャッシュ）
+JST = pytz.timezone('Asia/Tokyo')
+
+
+class _Pin:
+    """tick() で固定した時刻（日本時間は必要になったときに変換）"""
+    __slots__ = ('now', 'jst')
+
+    def __init__(self, now: datetime):
+        self.now = now
+        self.jst: Optional[datetime] = None
+
+
+class _Clock(abc.ABC):
+    """現在時刻の固定（tick）を共通で扱う基底クラス
+
+    固定した時刻はコンテキスト変数に持つので、見えるのは tick() を呼んだ処理
+    （とそのコンテキストをコピーしたワーカー）だけで、ほかのスレッド・タスクはそのまま現在時刻を見る。
+    """
+
+    def __init__(self):
+        self._pin: contextvars.ContextVar[Optional[_Pin]] = contextvars.ContextVar(
+            f'clock_pin_{id(self)}', default=None
+        )
+
+    @abc.abstractmethod
+    def _read(self) -> datetime:
+        """固定していないときの現在時刻"""
+
+    @abc.abstractmethod
+    def _to_jst(self, when: datetime) -> datetime:
+        """時刻を日本時間（タイムゾーン付き）に変換"""
+
+    @property
+    def _pinned(self) -> Optional[datetime]:
+        pin = self._pin.get()
+        return pin.now if pin is not None else None
+
+    def now(self) -> datetime:
+        pin = self._pin.get()
+        return pin.now if pin is not None else self._read()
+
+    def time(self) -> float:
+        return self.now().timestamp()
+
+    def now_jst(self) -> datetime:
+        """現在の日本時間（タイムゾーン付き）"""
+        pin = self._pin.get()
+        if pin is not None:
+            if pin.jst is None:
+                pin.jst = self._to_jst(pin.now)
+            return pin.jst
+        return self._to_jst(self._read())
+
+    @contextmanager
+    def tick(self):
+        """ブロックの間、このコンテキストの現在時刻を固定する（入れ子では外側の時刻を使う）"""
+        pin = self._pin.get()
+        if pin is not None:
+            yield pin.now
+            return
+        pin = _Pin(self._read())
+        token = self._pin.set(pin)
+        try:
+            yield pin.now
+        finally:
+            self._pin.reset(token)
+
+
+class SystemClock(_Clock):
+    """システム時刻"""
+
+    def _read(self) -> datetime:
+        return datetime.now()
+
+    def _to_jst(self, when: datetime) -> datetime:
+        # ナイーブな時刻はシステムのローカル時刻として変換
+        return when.astimezone(JST)
+
+    def time(self) -> float:
+        pinned = self._pinned
+        return pinned.timestamp() if pinned is not None else time.time()
+
+
+class SimulatedClock(_Clock):
+    """手動で進めるシミュレーション時刻（ナイーブな時刻は日本時間として扱う）"""
+
+    def __init__(self, start: datetime):
+        super().__init__()
+        self._now = start
+
+    def _read(self) -> datetime:
+        return self._now
+
+    def _to_jst(self, when: datetime) -> datetime:
+        return JST.localize(when) if when.tzinfo is None else when.astimezone(JST)
+
+    def advance(self, delta: timedelta) -> datetime:
+        self._now += delta
+        return self._now
+
+    def set(self, when: datetime):
+        self._now = when
+
+
+class RandomStreams:
+    """名前付きの乱数ストリーム
+
+    同じシード・同じ名前なら同じ系列になり、ストリーム同士は独立している
+    （ある用途の乱数の使用回数が変わっても他の用途の系列はずれない）。
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self.seed = seed
+        self._root = np.random.SeedSequence(seed)
+        self._generators: Dict[str, np.random.Generator] = {}
+        self._lock = threading.Lock()
+
+    def generator(self, name: str) -> np.random.Generator:
+        """用途名に対応する Generator（同じ名前には同じインスタンスを返す）"""
+        with self._lock:
+            generator = self._generators.get(name)
+            if generator is None:
+                sequence = np.random.SeedSequence(
+                    self._root.entropy, spawn_key=(zlib.crc32(name.encode('utf-8')),)
+                )
+                generator = self._generators[name] = np.random.default_rng(sequence)
+            return generator
+
+
+def _seed_from_env() -> Optional[int]:
+    value = os.getenv('RANDOM_SEED', '').strip()
+    return int(value) if value else None
+
+
+_clock = SystemClock()
+_streams = RandomStreams(_seed_from_env())
+
+
+def get_clock():
+    """現在の時刻の取得元"""
+    return _clock
+
+
+def set_clock(clock):
+    """時刻の取得元を差し替え、以前のものを返す（生成済みのインスタンスには影響しない）"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def get_random_streams() -> RandomStreams:
+    """現在の乱数ストリーム"""
+    return _streams
+
+
+def set_random_streams(streams: RandomStreams) -> RandomStreams:
+    """乱数ストリームを差し替え、以前のものを返す（生成済みのインスタンスには影響しない）"""
+    global _streams
+    previous, _streams = _streams, streams
+    return previous
@@ -559,7 +559,10 @@ class EmbedBuilder:
             name="📝 その他のコマンド",
             value="""**/form <カテゴリ> <内容>:**
 - 開発者への問い合わせ
-- バグ報告/改善提案等""",
+- バグ報告/改善提案等
+
+    **/dm <on/off>:**
+- イベント通知DMの受信設定""",
             inline=False
         )
 
@@ -1,24 +1,27 @@
-import random
 import discord
-from datetime import datetime, time, timedelta, timezone
+from datetime import datetime, time, timedelta
 import asyncio
 from discord import Embed, Color
 import pytz
-from ..database.models import Event, User
+from ..database.models import Event
 from ..database.database import SessionLocal
 from ..utils.logger import setup_logger, Logger
 from ..utils.embed_builder import EmbedBuilder
 from .event_types import EventTypes
 from ..utils.config import Config
+from ..utils.clock import get_clock, get_random_streams
 
 
 class EventManager:
     def __init__(self, bot=None):
         """EventManagerの初期化"""
         self.bot = bot
+        # 時刻と乱数の取得元（リプレイではシミュレーション時刻・固定シードに差し替える）
+        self.clock = get_clock()
+        self.rng = get_random_streams().generator('events')
         self.cooldown_hours = 0.5  # 30分に変更
         self.last_event_time = None
-        self.last_daily_event = datetime.now().date()
+        self.last_daily_event = self.clock.now().date()
         self.current_event = None
         self.remaining_effects = []
         self.logger = Logger(__name__)
@@ -54,35 +57,38 @@ class EventManager:
                 await channel.send(embed=embed)
 
             # 全ユーザーにDM通知
-            db = SessionLocal()
-            try:
-                users = db.query(User).all()
-                for user in users:
-                    try:
-                        member = await self.bot.fetch_user(int(user.discord_id))
-                        if member:
-                            await member.send(embed=embed)
-                    except Exception as e:
-                        self.logger.error(f"DM送信エラー: {str(e)}")
-            finally:
-                db.close()
+            await self._broadcast(embed)
 
         except Exception as e:
             self.logger.error(f"イベント通知エラー: {str(e)}")
 
+    async def _broadcast(self, embed: Embed):
+        """全ユーザーへのDMを一斉送信ジョブとして登録（送信はBroadcasterが行う）"""
+        broadcaster = getattr(self.bot, 'broadcaster', None)
+        if broadcaster is None:
+            return
+        job_id = await broadcaster.enqueue(embed, kind="event")
+        self.logger.info(f"イベント通知のDM送信を登録しました: job={job_id}")
+
     async def check_daily_event(self):
         """1日1回のイベントチェック"""
-        now = datetime.now()
-        
+        if self.is_daily_event_due():
+            return await self.trigger_and_notify_event()
+        return None
+
+    def is_daily_event_due(self) -> bool:
+        """今日のイベントを発生させる時刻か（該当すれば今日は実施済みとして記録）"""
+        now = self.clock.now()
+
         # 日付が変わっていて、まだ今日のイベントが発生していない場合
         if now.date() > self.last_daily_event:
             # ランダムな時間（9:00-21:00の間）を選択
-            target_hour = random.randint(9, 20)
+            target_hour = int(self.rng.integers(9, 21))
             if now.hour >= target_hour:
                 self.last_daily_event = now.date()
-                return await self.trigger_and_notify_event()
+                return True
 
-        return None
+        return False
 
     async def trigger_and_notify_event(self):
         """イベントの発生と通知を行う"""
@@ -97,7 +103,7 @@ class EventManager:
 
     def can_trigger_event(self) -> bool:
         """イベント発生条件のチェック"""
-        now = datetime.now()
+        now = self.clock.now()
         
         # クールダウン時間を30分に変更
         if self.last_event_time:
@@ -132,19 +138,19 @@ class EventManager:
             return None
 
         # イベントをランダムに選択
-        event_type = EventTypes.get_random_event()
-        total_change = random.randint(
+        event_type = EventTypes.get_random_event(self.rng)
+        total_change = int(self.rng.integers(
             event_type.min_change,
-            event_type.max_change
-        )
+            event_type.max_change + 1
+        ))
 
         # ネガティブイベントの場合、より多くの分割回数を設定
         if total_change < 0:
-            split_count = random.randint(12, 16)  # ネガティブは12-16回に分割
+            split_count = int(self.rng.integers(12, 17))  # ネガティブは12-16回に分割
             # 1回あたりの最大変動を制限
             max_change_per_step = -8.0  # 最大8%の下落に制限
         else:
-            split_count = random.randint(6, 10)   # ポジティブは6-10回に分割
+            split_count = int(self.rng.integers(6, 11))  # ポジティブは6-10回に分割
             max_change_per_step = 10.0  # 上昇は10%まで許容
 
         self.remaining_effects = []
@@ -158,13 +164,13 @@ class EventManager:
             if total_change < 0:
                 # ネガティブの場合
                 effect = max(
-                    base_effect * random.uniform(0.7, 1.3),
+                    base_effect * self.rng.uniform(0.7, 1.3),
                     max_change_per_step
                 )
             else:
                 # ポジティブの場合
                 effect = min(
-                    base_effect * random.uniform(0.7, 1.3),
+                    base_effect * self.rng.uniform(0.7, 1.3),
                     max_change_per_step
                 )
 
@@ -186,7 +192,7 @@ class EventManager:
             "total_steps": split_count
         }
 
-        self.last_event_time = datetime.now(timezone.utc)
+        self.last_event_time = self.clock.now()  # can_trigger_event のナイーブな現在時刻と比較する
         self.logger.info(
             f"イベント発生: {event_type.name}\n"
             f"目標変動率: {total_change:+.2f}%\n"
@@ -205,7 +211,7 @@ class EventManager:
         """イベント情報を生成"""
         # EmbedBuilderからイベント情報を取得
         events = EmbedBuilder.EVENT_INFO["positive" if change_percent > 0 else "negative"]
-        event = random.choice(events)
+        event = events[int(self.rng.integers(len(events)))]
         
         return {
             "name": event["name"],
@@ -306,18 +312,7 @@ class EventManager:
                 if channel:
                     await channel.send(embed=embed)
 
-                db = SessionLocal()
-                try:
-                    users = db.query(User).all()
-                    for user in users:
-                        try:
-                            discord_user = await self.bot.fetch_user(int(user.discord_id))
-                            if discord_user:
-                                await discord_user.send(embed=embed)
-                        except Exception as e:
-                            self.logger.error(f"DM送信エラー (User ID: {user.discord_id}): {str(e)}")
-                finally:
-                    db.close()
+                await self._broadcast(embed)
 
         except Exception as e:
             self.logger.error(f"イベント通知エラー: {str(e)}")
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from typing import List, Dict
-import random
+
+from .clock import get_random_streams
 
 @dataclass
 class EventType:
@@ -129,15 +130,16 @@ class EventTypes:
     }
 
     @staticmethod
-    def get_random_event() -> EventType:
-        """確率重み付けを考慮してランダムなイベントを取得"""
+    def get_random_event(rng=None) -> EventType:
+        """確率重み付けを考慮してランダムなイベントを取得（rngで乱数源を指定可能）"""
+        rng = rng if rng is not None else get_random_streams().generator('events')
         # ポジティブ/ネガティブをランダムに選択
-        event_type = random.choice(["positive", "negative"])
+        event_type = str(rng.choice(["positive", "negative"]))
         events = EventTypes.EVENTS[event_type]
         
         # 確率に基づいてイベントを選択
         total_prob = sum(event.probability for event in events)
-        r = random.uniform(0, total_prob)
+        r = rng.uniform(0, total_prob)
         
         cumulative_prob = 0
         for event in events:
@@ -148,19 +150,20 @@ class EventTypes:
         return events[-1]  # 万が一の場合は最後のイベントを返す
 
     @staticmethod
-    def split_effect(total_change: float) -> List[float]:
+    def split_effect(total_change: float, rng=None) -> List[float]:
         """イベントの効果を複数回に分割"""
+        rng = rng if rng is not None else get_random_streams().generator('events')
         effects = []
         
         # 分割回数をランダムに決定（5-10回）
-        num_splits = random.randint(5, 10)
+        num_splits = int(rng.integers(5, 11))
         
         # 一回あたりの基本変動率を計算
         base_change = total_change / num_splits
         remaining_change = total_change
         
         # 初回は大きめの変動（基本変動の-1.5 ~ 2.0倍）
-        initial_factor = random.uniform(-1.5, 2.0)
+        initial_factor = rng.uniform(-1.5, 2.0)
         first_change = min(base_change * initial_factor, remaining_change)
         effects.append(first_change)
         remaining_change -= first_change
@@ -171,7 +174,7 @@ class EventTypes:
                 effects.append(remaining_change)
             else:
                 # ランダムな比率で残りを分配（残額の10-30%）
-                change = min(remaining_change * random.uniform(0.1, 0.3), remaining_change)
+                change = min(remaining_change * rng.uniform(0.1, 0.3), remaining_change)
                 effects.append(change)
                 remaining_change -= change
         
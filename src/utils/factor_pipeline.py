@@ -0,0 +1,268 @@
+"""価格変動要因のプラグインパイプライン
+
+要因ごとに名前・表示名・計算関数と必要なデータ（db / order_book / indicators / snapshot）を登録し、
+価格計算のティックで登録順に実行する。DBを読む要因は別セッションで並列に実行でき、
+要因ごとに処理時間を計測して、時間予算を超えた要因は 1.0（影響なし）として扱う。
+予算を超えた計算は、開始前なら取り消し、実行中なら終わるまで追跡する。前回の計算がまだ動いている
+要因は次のティックで投入せずに 1.0 とするので、遅い要因がワーカーとセッションを積み増すことはない。
+
+環境変数:
+    PRICE_FACTORS_DISABLED  無効にする要因名（カンマ区切り）例: whale,holding
+    PRICE_FACTOR_BUDGETS    要因ごとの時間予算（ミリ秒）例: holding=50,transactions=100
+    PRICE_FACTOR_WORKERS    DB要因の並列数（1なら呼び出し元のセッションで順に実行）
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .logger import setup_logger
+
+# I/Oを伴う（DBセッションが必要な）依存データ
+IO_REQUIREMENTS = frozenset({'db', 'order_book'})
+KNOWN_REQUIREMENTS = IO_REQUIREMENTS | {'indicators', 'snapshot'}
+
+
+@dataclass
+class PricingFactor:
+    """価格変動要因の定義"""
+    name: str  # 設定で使う識別子
+    label: str  # ログ・結果の表示名
+    compute: Callable[[object], float]  # DBセッション（またはNone）を受け取り係数を返す
+    requires: FrozenSet[str] = frozenset()
+    budget_ms: Optional[float] = None  # 時間予算（Noneなら無制限）
+    enabled: bool = True
+
+    @property
+    def needs_io(self) -> bool:
+        return bool(self.requires & IO_REQUIREMENTS)
+
+
+@dataclass
+class FactorStats:
+    """要因ごとの計測値"""
+    calls: int = 0
+    total_ms: float = 0.0
+    last_ms: float = 0.0
+    max_ms: float = 0.0
+    overruns: int = 0
+    skipped: int = 0  # 前回の計算が終わっておらず投入しなかった回数
+    errors: int = 0
+
+    def record(self, elapsed_ms: float):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'calls': self.calls,
+            'avg_ms': self.total_ms / self.calls if self.calls else 0.0,
+            'last_ms': self.last_ms,
+            'max_ms': self.max_ms,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
+
+
+@dataclass
+class PipelineResult:
+    """1ティック分の実行結果"""
+    factors: Dict[str, float] = field(default_factory=dict)  # 表示名 -> 係数（登録順）
+    timings: Dict[str, float] = field(default_factory=dict)  # 要因名 -> ミリ秒
+    overrun: List[str] = field(default_factory=list)  # 予算超過で1.0にした要因名
+    skipped: List[str] = field(default_factory=list)  # 前回の計算が実行中のため1.0にした要因名
+    elapsed_ms: float = 0.0
+
+
+def _parse_budgets(value: str) -> Dict[str, float]:
+    budgets = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, ms = item.partition('=')
+        try:
+            budgets[name.strip()] = float(ms)
+        except ValueError:
+            continue
+    return budgets
+
+
+class FactorPipeline:
+    """価格変動要因の登録と実行"""
+
+    def __init__(self, session_factory: Callable = None, default_workers: int = 1):
+        self.logger = setup_logger(__name__)
+        self._factors: Dict[str, PricingFactor] = {}
+        self._stats: Dict[str, FactorStats] = {}
+        self._lock = threading.Lock()
+        self.session_factory = session_factory
+        self.max_workers = max(1, int(os.getenv('PRICE_FACTOR_WORKERS', str(default_workers))))
+        self._executor = None
+        self._inflight: Dict[str, Future] = {}  # 要因名 -> 実行中（または投入待ち）の計算
+        self._disabled = set(filter(None, (name.strip() for name in os.getenv('PRICE_FACTORS_DISABLED', '').split(','))))
+        self._budgets = _parse_budgets(os.getenv('PRICE_FACTOR_BUDGETS', ''))
+
+    # 登録と設定
+
+    def register(self, name: str, label: str, compute: Callable, requires=(), budget_ms: float = None):
+        """要因を登録（同名は置き換え）。環境変数の無効化・予算が優先される"""
+        requires = frozenset(requires)
+        unknown = requires - KNOWN_REQUIREMENTS
+        if unknown:
+            raise ValueError(f"未知の依存データです: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self._factors[name] = PricingFactor(
+                name=name,
+                label=label,
+                compute=compute,
+                requires=requires,
+                budget_ms=self._budgets.get(name, budget_ms),
+                enabled=name not in self._disabled,
+            )
+            self._stats.setdefault(name, FactorStats())
+
+    def set_budget(self, name: str, budget_ms: Optional[float]):
+        self._factors[name].budget_ms = budget_ms
+
+    def set_enabled(self, name: str, enabled: bool):
+        self._factors[name].enabled = enabled
+
+    def factors(self) -> List[PricingFactor]:
+        with self._lock:
+            return list(self._factors.values())
+
+    # 実行
+
+    def run(self, db=None) -> PipelineResult:
+        """有効な要因をすべて実行（DBがなければDB要因は省略）"""
+        started = time.perf_counter()
+        result = PipelineResult()
+        factors = [f for f in self.factors() if f.enabled and (db is not None or not f.needs_io)]
+        values: Dict[str, float] = {}
+
+        # DB要因は別セッションで並列に開始しておく（前回の計算が実行中なら投入しない）
+        futures = {}
+        busy = set()
+        if self.max_workers > 1 and self.session_factory is not None:
+            for factor in factors:
+                if not factor.needs_io:
+                    continue
+                future = self._submit(factor)
+                if future is None:
+                    busy.add(factor.name)
+                else:
+                    futures[factor.name] = (time.perf_counter(), future)
+
+        for factor in factors:
+            if factor.name in busy:
+                values[factor.name] = self._skip(factor, result)
+            elif factor.name not in futures:
+                values[factor.name] = self._run_inline(factor, db, result)
+
+        for factor in factors:
+            if factor.name in futures:
+                submitted, future = futures[factor.name]
+                values[factor.name] = self._collect(factor, submitted, future, result)
+
+        # 表示順は登録順
+        for factor in factors:
+            result.factors[factor.label] = values[factor.name]
+        result.elapsed_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    def _run_inline(self, factor: PricingFactor, db, result: PipelineResult) -> float:
+        started = time.perf_counter()
+        try:
+            value = factor.compute(db)
+        except Exception as e:
+            self.logger.error(f"価格要因 {factor.name} の計算エラー: {e}")
+            self._stats[factor.name].errors += 1
+            value = 1.0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return self._finish(factor, value, elapsed_ms, result)
+
+    def _submit(self, factor: PricingFactor) -> Optional[Future]:
+        """ワーカーに投入する（前回の計算が終わっていなければ None）"""
+        with self._lock:
+            previous = self._inflight.get(factor.name)
+            if previous is not None and not previous.done():
+                return None
+            # tick() で固定した時刻などが見えるよう、呼び出し元のコンテキストで実行する
+            context = contextvars.copy_context()
+            future = self._get_executor().submit(context.run, self._run_with_session, factor)
+            self._inflight[factor.name] = future
+        future.add_done_callback(lambda done, name=factor.name: self._release(name, done))
+        return future
+
+    def _release(self, name: str, future: Future):
+        with self._lock:
+            if self._inflight.get(name) is future:
+                del self._inflight[name]
+
+    def _skip(self, factor: PricingFactor, result: PipelineResult) -> float:
+        self._stats[factor.name].skipped += 1
+        result.skipped.append(factor.name)
+        self.logger.warning(f"価格要因 {factor.name} は前回の計算が実行中のため省略します（影響なしとして扱います）")
+        return 1.0
+
+    def running(self) -> List[str]:
+        """計算が終わっていない要因名（予算超過後も実行中のものを含む）"""
+        with self._lock:
+            return [name for name, future in self._inflight.items() if not future.done()]
+
+    def _run_with_session(self, factor: PricingFactor) -> Tuple[float, float]:
+        session = self.session_factory()
+        started = time.perf_counter()
+        try:
+            return factor.compute(session), (time.perf_counter() - started) * 1000
+        finally:
+            session.close()
+
+    def _collect(self, factor: PricingFactor, submitted: float, future, result: PipelineResult) -> float:
+        timeout = None
+        if factor.budget_ms is not None:
+            timeout = max(0.0, factor.budget_ms / 1000 - (time.perf_counter() - submitted))
+        try:
+            value, elapsed_ms = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # 待たずに影響なしとして扱う。開始前なら取り消し、実行中なら終わるまで次の投入を止める
+            future.cancel()
+            elapsed_ms = (time.perf_counter() - submitted) * 1000
+            return self._finish(factor, 1.0, elapsed_ms, result, timed_out=True)
+        except Exception as e:
+            self.logger.error(f"価格要因 {factor.name} の計算エラー: {e}")
+            self._stats[factor.name].errors += 1
+            value, elapsed_ms = 1.0, (time.perf_counter() - submitted) * 1000
+        return self._finish(factor, value, elapsed_ms, result)
+
+    def _finish(self, factor: PricingFactor, value: float, elapsed_ms: float, result: PipelineResult,
+                timed_out: bool = False) -> float:
+        stats = self._stats[factor.name]
+        stats.record(elapsed_ms)
+        result.timings[factor.name] = elapsed_ms
+        if timed_out or (factor.budget_ms is not None and elapsed_ms > factor.budget_ms):
+            stats.overruns += 1
+            result.overrun.append(factor.name)
+            self.logger.warning(
+                f"価格要因 {factor.name} が時間予算を超過しました: {elapsed_ms:.1f}ms > {factor.budget_ms:.1f}ms（影響なしとして扱います）"
+            )
+            return 1.0
+        return value
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='price-factor')
+        return self._executor
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """要因ごとの計測値"""
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
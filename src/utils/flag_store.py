@@ -0,0 +1,199 @@
+"""永続フラグ（トランザクションID）のバイナリ保存
+
+スナップショットはソート済みint64配列（16バイトのヘッダ付き）で、JSONを解析せずにO(n)で読み込む。
+追加分は追記専用のジャーナルに8バイトずつ書き、一定量たまったらスナップショットへ統合して
+一時ファイル + fsync + rename で置き換える。保存コストはフラグの累計件数に比例して増えない。
+"""
+import json
+import os
+import struct
+import threading
+from typing import Iterable, Iterator, Set
+
+import numpy as np
+
+from .logger import setup_logger
+
+_MAGIC = b'PFLG'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIQ')  # マジック, バージョン, 件数
+_RECORD = np.dtype('<i8')
+
+
+class FlagStore:
+    """ソート済みスナップショット + 追記ジャーナルによる整数ID集合"""
+
+    SNAPSHOT_NAME = 'permanent_flags.bin'
+    JOURNAL_NAME = 'permanent_flags.journal'
+    LEGACY_JSON_NAME = 'permanent_flags.json'
+    COMPACT_MIN_ENTRIES = 4096  # ジャーナルがこの件数とスナップショットの1/4の大きい方を超えたら統合
+
+    def __init__(self, directory: str):
+        self.logger = setup_logger(__name__)
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_NAME)
+        self.journal_path = os.path.join(directory, self.JOURNAL_NAME)
+        self.legacy_path = os.path.join(directory, self.LEGACY_JSON_NAME)
+        self._lock = threading.RLock()
+        self._snapshot = np.empty(0, dtype=_RECORD)
+        self._pending: Set[int] = set()  # ジャーナルにのみ存在するID
+        self._journal = None
+
+    # 読み込み
+
+    def load(self):
+        """スナップショットとジャーナルを読み込む（旧JSONしかなければ変換する）"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._close_journal()
+            self._snapshot = self._read_snapshot()
+            self._pending = set()
+
+            if not os.path.exists(self.snapshot_path) and os.path.exists(self.legacy_path):
+                self._pending.update(self._read_legacy_json())
+                self.logger.info(f"旧形式の永続フラグ {len(self._pending)}件をバイナリ形式へ移行します")
+
+            self._pending.update(self._read_journal())
+            self._pending.difference_update(self._snapshot_members(self._pending))
+            if self._pending and not os.path.exists(self.snapshot_path):
+                self.compact()
+            return len(self)
+
+    def _read_snapshot(self) -> np.ndarray:
+        if not os.path.exists(self.snapshot_path):
+            return np.empty(0, dtype=_RECORD)
+        with open(self.snapshot_path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError(f"永続フラグのヘッダが不正です: {self.snapshot_path}")
+            magic, version, count = _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"永続フラグの形式が不正です: {self.snapshot_path}")
+            data = np.fromfile(f, dtype=_RECORD, count=count)
+        if len(data) != count:
+            raise ValueError(f"永続フラグの件数が一致しません: {len(data)}/{count}")
+        return data
+
+    def _read_journal(self) -> Iterable[int]:
+        if not os.path.exists(self.journal_path):
+            return []
+        size = os.path.getsize(self.journal_path)
+        # 書き込み途中で落ちた末尾の半端なレコードは捨てる
+        complete = size - size % _RECORD.itemsize
+        if complete != size:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(complete)
+        return np.fromfile(self.journal_path, dtype=_RECORD).tolist()
+
+    def _read_legacy_json(self) -> Iterable[int]:
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [int(tx) for tx in data.get('transactions', []) if str(tx).lstrip('-').isdigit()]
+
+    # 書き込み
+
+    def add(self, tx_id: int) -> bool:
+        """IDを追加（新規ならジャーナルへ追記してTrue）"""
+        return self.update([tx_id]) == 1
+
+    def update(self, tx_ids: Iterable[int]) -> int:
+        """複数のIDを追加し、新規に追加した件数を返す"""
+        with self._lock:
+            new_ids = []
+            for tx_id in tx_ids:
+                tx_id = int(tx_id)
+                if tx_id in self._pending or self._in_snapshot(tx_id):
+                    continue
+                self._pending.add(tx_id)
+                new_ids.append(tx_id)
+            if new_ids:
+                journal = self._open_journal()
+                journal.write(np.asarray(new_ids, dtype=_RECORD).tobytes())
+                journal.flush()
+                if len(self._pending) >= max(self.COMPACT_MIN_ENTRIES, len(self._snapshot) // 4):
+                    self.compact()
+            return len(new_ids)
+
+    def flush(self, compact: bool = False):
+        """ジャーナルをディスクへ同期（必要ならスナップショットへ統合）"""
+        with self._lock:
+            if compact and self._pending:
+                self.compact()
+            elif self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+
+    def compact(self):
+        """ジャーナルをスナップショットへ統合し、アトミックに置き換える"""
+        with self._lock:
+            merged = np.union1d(self._snapshot, np.fromiter(self._pending, dtype=_RECORD, count=len(self._pending)))
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, len(merged)))
+                merged.astype(_RECORD, copy=False).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self._fsync_directory()
+
+            # スナップショットに含まれたのでジャーナルを空にする
+            self._close_journal()
+            with open(self.journal_path, 'wb') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._snapshot = merged
+            self._pending = set()
+            self.logger.info(f"永続フラグを統合しました: {len(merged)}件")
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        return self._journal
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _fsync_directory(self):
+        # Windowsではディレクトリをopenできないため省略
+        if os.name != 'posix':
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._close_journal()
+
+    # 参照
+
+    def _in_snapshot(self, tx_id: int) -> bool:
+        index = np.searchsorted(self._snapshot, tx_id)
+        return index < len(self._snapshot) and self._snapshot[index] == tx_id
+
+    def _snapshot_members(self, tx_ids: Iterable[int]) -> Set[int]:
+        return {tx_id for tx_id in tx_ids if self._in_snapshot(tx_id)}
+
+    def __contains__(self, tx_id) -> bool:
+        try:
+            tx_id = int(tx_id)
+        except (TypeError, ValueError):
+            return False
+        with self._lock:
+            return tx_id in self._pending or self._in_snapshot(tx_id)
+
+    def __len__(self) -> int:
+        return len(self._snapshot) + len(self._pending)
+
+    def __iter__(self) -> Iterator[int]:
+        with self._lock:
+            snapshot = self._snapshot
+            pending = list(self._pending)
+        for tx_id in snapshot:
+            yield int(tx_id)
+        yield from pending
@@ -0,0 +1,131 @@
+"""Discord ID → ユーザー・ウォレットの識別情報キャッシュ
+
+コマンドやイベントのたびに User を discord_id で検索し、さらに user.wallet を遅延読み込みする
+2回のクエリを避けるため、(user_id, wallet_id, wallet_address, has_cleared) をLRUで保持する。
+ID・アドレスは登録後に変わらないため、残高などの値は保持しない（残高を扱う処理は wallet() で行をロックして読む）。
+/register・管理者によるID変更・ゲームのリセットで無効化する。
+
+環境変数:
+    IDENTITY_CACHE_SIZE  保持するユーザー数の上限（既定10000）
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from ..database.models import User, Wallet
+
+
+class Identity(NamedTuple):
+    """ユーザーの識別情報"""
+    user_id: int
+    wallet_id: Optional[int]
+    wallet_address: Optional[str]
+    has_cleared: bool
+
+
+class IdentityCache:
+    """discord_id をキーにした識別情報のLRUキャッシュ"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = int(os.getenv('IDENTITY_CACHE_SIZE', '10000')) if max_entries is None else max_entries
+        self._entries: "OrderedDict[str, Identity]" = OrderedDict()
+        self._by_address = {}  # wallet_address -> discord_id
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, db: Session, discord_id: str) -> Optional[Identity]:
+        """識別情報を取得（未登録なら None。未登録は保持しない）"""
+        discord_id = str(discord_id)
+        with self._lock:
+            identity = self._entries.get(discord_id)
+            if identity is not None:
+                self._entries.move_to_end(discord_id)
+                self.hits += 1
+                return identity
+            self.misses += 1
+
+        row = db.query(User.id, Wallet.id, Wallet.address, User.has_cleared)\
+            .outerjoin(Wallet, Wallet.user_id == User.id)\
+            .filter(User.discord_id == discord_id)\
+            .first()
+        if row is None:
+            return None
+        identity = Identity(row[0], row[1], row[2], bool(row[3]))
+        self._store(discord_id, identity)
+        return identity
+
+    def user(self, db: Session, discord_id: str) -> Optional[User]:
+        """User を主キーで取得（セッションに読み込み済みならクエリなし）"""
+        identity = self.lookup(db, discord_id)
+        return db.get(User, identity.user_id) if identity else None
+
+    def wallet(self, db: Session, discord_id: str, for_update: bool = False) -> Optional[Wallet]:
+        """Wallet を主キーで取得（for_update=True で行をロックして最新の残高を読む）"""
+        identity = self.lookup(db, discord_id)
+        if identity is None or identity.wallet_id is None:
+            return None
+        if for_update:
+            return db.get(Wallet, identity.wallet_id, with_for_update=True, populate_existing=True)
+        return db.get(Wallet, identity.wallet_id)
+
+    def discord_id_for_address(self, db: Session, wallet_address: str) -> Optional[str]:
+        """ウォレットアドレスから Discord ID を取得"""
+        with self._lock:
+            discord_id = self._by_address.get(wallet_address)
+            if discord_id is not None and discord_id in self._entries:
+                self._entries.move_to_end(discord_id)
+                self.hits += 1
+                return discord_id
+            self.misses += 1
+
+        row = db.query(User.discord_id, User.id, Wallet.id, User.has_cleared)\
+            .join(Wallet, Wallet.user_id == User.id)\
+            .filter(Wallet.address == wallet_address)\
+            .first()
+        if row is None:
+            return None
+        self._store(row[0], Identity(row[1], row[2], wallet_address, bool(row[3])))
+        return row[0]
+
+    def set_cleared(self, discord_id: str, has_cleared: bool):
+        """クリアフラグの変更を反映"""
+        discord_id = str(discord_id)
+        with self._lock:
+            identity = self._entries.get(discord_id)
+            if identity is not None:
+                self._entries[discord_id] = identity._replace(has_cleared=has_cleared)
+
+    def _store(self, discord_id: str, identity: Identity):
+        with self._lock:
+            previous = self._entries.pop(discord_id, None)
+            if previous is not None and previous.wallet_address:
+                self._by_address.pop(previous.wallet_address, None)
+            self._entries[discord_id] = identity
+            if identity.wallet_address:
+                self._by_address[identity.wallet_address] = discord_id
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted.wallet_address:
+                    self._by_address.pop(evicted.wallet_address, None)
+
+    def invalidate(self, discord_id: str = None):
+        """指定ユーザー（省略時はすべて）の識別情報を破棄"""
+        with self._lock:
+            if discord_id is None:
+                self._entries.clear()
+                self._by_address.clear()
+                return
+            identity = self._entries.pop(str(discord_id), None)
+            if identity is not None and identity.wallet_address:
+                self._by_address.pop(identity.wallet_address, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# プロセス全体で共有するキャッシュ
+identity_cache = IdentityCache()
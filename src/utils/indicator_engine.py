@@ -0,0 +1,141 @@
+"""テクニカル指標エンジン
+
+直近の価格をNumPyのリングバッファに保持し、価格ティックごとに追記する。
+RSI・SMA/EMA・モメンタム・ボラティリティ・サポート/レジスタンスはすべて同じバッファから
+ベクトル演算（EMAは追記時の逐次更新）で求め、指標の計算ではDBを参照しない。
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+class IndicatorEngine:
+    """リングバッファ上の価格系列から指標を計算"""
+
+    def __init__(self, capacity: int = 2048, ema_spans: Iterable[int] = (5, 20)):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._prices = np.zeros(capacity, dtype=np.float64)
+        self._times = np.zeros(capacity, dtype=np.float64)  # UNIX時刻（秒）
+        self._head = 0  # 次に書き込む位置
+        self._count = 0
+        # EMAは追記のたびに更新する
+        self._ema: Dict[int, Optional[float]] = {span: None for span in ema_spans}
+
+    def push(self, price: float, timestamp: datetime = None):
+        """価格を1件追記（時刻が巻き戻った場合は直前の時刻に揃える）"""
+        ts = (timestamp or datetime.now()).timestamp()
+        price = float(price)
+        with self._lock:
+            if self._count and ts < self._times[self._head - 1]:
+                ts = self._times[self._head - 1]
+            self._prices[self._head] = price
+            self._times[self._head] = ts
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            for span, value in self._ema.items():
+                alpha = 2.0 / (span + 1)
+                self._ema[span] = price if value is None else value + alpha * (price - value)
+
+    def extend(self, rows: Iterable[Tuple[datetime, float]]):
+        """(時刻, 価格) を古い順にまとめて追記"""
+        for timestamp, price in rows:
+            self.push(price, timestamp)
+
+    def clear(self):
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            for span in self._ema:
+                self._ema[span] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    # 系列の取り出し（いずれも古い順）
+
+    def _ordered(self, array: np.ndarray, n: int) -> np.ndarray:
+        n = min(n, self._count)
+        start = (self._head - n) % self.capacity
+        if start + n <= self.capacity:
+            return array[start:start + n].copy()
+        return np.concatenate((array[start:], array[:self._head]))
+
+    def latest(self, n: int) -> np.ndarray:
+        """直近n件の価格"""
+        with self._lock:
+            return self._ordered(self._prices, n)
+
+    def since(self, cutoff: datetime) -> np.ndarray:
+        """指定時刻以降の価格"""
+        with self._lock:
+            times = self._ordered(self._times, self._count)
+            prices = self._ordered(self._prices, self._count)
+        return prices[np.searchsorted(times, cutoff.timestamp(), side='left'):]
+
+    def last_price(self) -> Optional[float]:
+        with self._lock:
+            return float(self._prices[self._head - 1]) if self._count else None
+
+    # 指標
+
+    def sma(self, period: int) -> Optional[float]:
+        prices = self.latest(period)
+        return float(prices.mean()) if len(prices) else None
+
+    def ema(self, span: int) -> Optional[float]:
+        """追記時に更新しているEMA（未登録の期間は系列から計算）"""
+        with self._lock:
+            if span in self._ema:
+                return self._ema[span]
+        prices = self.latest(self.capacity)
+        if not len(prices):
+            return None
+        alpha = 2.0 / (span + 1)
+        weights = (1 - alpha) ** np.arange(len(prices) - 1, -1, -1)
+        weights[1:] *= alpha
+        return float(np.dot(weights, prices))
+
+    def rsi(self, period: int = 14) -> Optional[float]:
+        """直近period件の価格によるRSI（0-100、データ不足ならNone）"""
+        prices = self.latest(period)
+        if len(prices) < period:
+            return None
+        changes = np.diff(prices)
+        avg_gain = changes.clip(min=0).mean()
+        avg_loss = (-changes).clip(min=0).mean()
+        if avg_loss == 0:
+            return 100.0
+        return float(100 - 100 / (1 + avg_gain / avg_loss))
+
+    def momentum(self, period: int = 5) -> Optional[float]:
+        """直近period件の上昇・下落の向きの平均（-1〜1）"""
+        prices = self.latest(period)
+        if len(prices) < 2:
+            return None
+        return float(np.where(np.diff(prices) > 0, 1.0, -1.0).mean())
+
+    def volatility(self, period: int = 10) -> Optional[float]:
+        """直近period件の変化率の標準偏差"""
+        prices = self.latest(period)
+        if len(prices) < 2:
+            return None
+        return float(np.std(np.diff(prices) / prices[:-1]))
+
+    def support_resistance(self, cutoff: datetime, bins: int = 20) -> Optional[Tuple[float, float]]:
+        """指定時刻以降の価格ヒストグラムで最も集中した価格帯（下端, 上端）"""
+        prices = self.since(cutoff)
+        if not len(prices):
+            return None
+        hist, edges = np.histogram(prices, bins=bins)
+        peak = int(np.argmax(hist))
+        return float(edges[peak]), float(edges[peak + 1])
+
+    def trend(self, cutoff: datetime) -> Optional[float]:
+        """指定時刻以降の始値から終値への変化率"""
+        prices = self.since(cutoff)
+        if not len(prices):
+            return None
+        return float((prices[-1] - prices[0]) / prices[0])
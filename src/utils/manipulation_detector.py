@@ -0,0 +1,257 @@
+"""取引ログを逐次処理する市場操作検出器
+
+買い・売りのトランザクションが書き込まれるたびに observe() へ渡すと、
+アドレスごとのスライディングウィンドウ（売買量・件数・取引間隔）を更新し、
+条件を満たした時点で検出結果を返す。価格計算のティックでは集計クエリを発行しない。
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from .logger import setup_logger
+
+
+@dataclass
+class Detection:
+    """検出結果"""
+    manipulation_type: str  # wash_trading, high_frequency_trading, small_distributed_trading
+    address: str
+    transaction_ids: List[int]
+    stats: Dict[str, float] = field(default_factory=dict)
+
+
+class _AddressWindow:
+    """アドレス単位のウィンドウ状態"""
+    __slots__ = (
+        'wash_events', 'buy_amount', 'sell_amount',
+        'recent_events', 'small_count',
+        'last_timestamp', 'avg_interval',
+    )
+
+    def __init__(self):
+        # ウォッシュトレード判定用（短い窓）: (時刻, ID, 売買, 数量)
+        self.wash_events = deque()
+        self.buy_amount = 0.0
+        self.sell_amount = 0.0
+        # 高頻度・小口判定用（長い窓）: (時刻, ID, 小口か)
+        self.recent_events = deque()
+        self.small_count = 0
+        # 取引間隔（指数移動平均、秒）
+        self.last_timestamp: Optional[datetime] = None
+        self.avg_interval: Optional[float] = None
+
+    def is_empty(self) -> bool:
+        return not self.wash_events and not self.recent_events
+
+
+class StreamingManipulationDetector:
+    """アドレス別スライディングウィンドウによる市場操作検出"""
+
+    # ウォッシュトレード: 3時間で10件超、売買一致率70%超
+    WASH_WINDOW = timedelta(hours=3)
+    WASH_MIN_TRANSACTIONS = 10
+    WASH_MATCH_RATIO = 0.7
+
+    # 高頻度取引: 24時間でユーザー平均10件超（操作スコア0.6超）かつ本人が10件超
+    RECENT_WINDOW = timedelta(hours=24)
+    HIGH_FREQUENCY_MIN_TRANSACTIONS = 10
+    HIGH_FREQUENCY_SCORE = 0.6
+
+    # 小口分散取引: 小口率70%超・参加者5人未満・20件超で、本人の小口が5件超
+    SMALL_TRADE_RATIO = 0.5  # 平均取引サイズに対する小口の閾値
+    SMALL_DISTRIBUTED_RATIO = 0.7
+    SMALL_DISTRIBUTED_MAX_USERS = 5
+    SMALL_DISTRIBUTED_MIN_TRANSACTIONS = 20
+    SMALL_DISTRIBUTED_MIN_PER_ADDRESS = 5
+
+    INTERVAL_SMOOTHING = 0.2  # 取引間隔EMAの係数
+
+    def __init__(self):
+        self.logger = setup_logger(__name__)
+        self._lock = threading.Lock()
+        self._addresses: Dict[str, _AddressWindow] = {}
+        # 全体の24時間窓: (時刻, アドレス, 数量, 小口か)
+        self._recent = deque()
+        self._recent_amount = 0.0
+        self._recent_small = 0
+        self._recent_per_address: Dict[str, int] = {}
+        self._last_timestamp: Optional[datetime] = None
+        self.observed = 0
+        self.detections = 0
+
+    def observe(self, tx_id: int, side: str, address: str, amount: float,
+                timestamp: datetime = None) -> List[Detection]:
+        """取引を1件取り込み、新たに成立した検出を返す"""
+        if side not in ('buy', 'sell') or not address:
+            return []
+        timestamp = timestamp or datetime.now()
+        amount = float(amount or 0)
+
+        with self._lock:
+            # 時刻が巻き戻った取引（ウォームアップとの重複など）は現在時刻として扱う
+            if self._last_timestamp and timestamp < self._last_timestamp:
+                timestamp = self._last_timestamp
+            self._last_timestamp = timestamp
+            self._expire(timestamp)
+
+            # 小口判定は取り込み前の窓平均を基準にする
+            count = len(self._recent)
+            average = self._recent_amount / count if count else amount
+            is_small = count > 0 and amount < average * self.SMALL_TRADE_RATIO
+
+            # 判定対象のアドレスだけは短い窓も最新の時刻で切り詰める
+            self._expire_address(address, timestamp)
+            window = self._addresses.get(address)
+            if window is None:
+                window = self._addresses[address] = _AddressWindow()
+
+            if window.last_timestamp is not None:
+                interval = (timestamp - window.last_timestamp).total_seconds()
+                if window.avg_interval is None:
+                    window.avg_interval = interval
+                else:
+                    window.avg_interval += self.INTERVAL_SMOOTHING * (interval - window.avg_interval)
+            window.last_timestamp = timestamp
+
+            window.wash_events.append((timestamp, tx_id, side, amount))
+            if side == 'buy':
+                window.buy_amount += amount
+            else:
+                window.sell_amount += amount
+            window.recent_events.append((timestamp, tx_id, is_small))
+            if is_small:
+                window.small_count += 1
+
+            self._recent.append((timestamp, address, amount, is_small))
+            self._recent_amount += amount
+            if is_small:
+                self._recent_small += 1
+            self._recent_per_address[address] = self._recent_per_address.get(address, 0) + 1
+            self.observed += 1
+
+            detections = self._evaluate(address, window)
+            self.detections += len(detections)
+            return detections
+
+    def _evaluate(self, address: str, window: _AddressWindow) -> List[Detection]:
+        """取り込んだアドレスについて各条件を判定"""
+        detections = []
+
+        # ウォッシュトレード
+        tx_count = len(window.wash_events)
+        if tx_count > self.WASH_MIN_TRANSACTIONS and window.buy_amount > 0 and window.sell_amount > 0:
+            ratio = min(window.buy_amount, window.sell_amount) / max(window.buy_amount, window.sell_amount)
+            if ratio > self.WASH_MATCH_RATIO:
+                detections.append(Detection(
+                    'wash_trading',
+                    address,
+                    [event[1] for event in window.wash_events],
+                    {
+                        'tx_count': tx_count,
+                        'buy_amount': window.buy_amount,
+                        'sell_amount': window.sell_amount,
+                        'ratio': ratio,
+                        'avg_interval': window.avg_interval or 0.0,
+                    }
+                ))
+                # フラグ付けした取引は窓から外し、同じ取引で再検出しない
+                window.wash_events.clear()
+                window.buy_amount = 0.0
+                window.sell_amount = 0.0
+
+        total = len(self._recent)
+        unique_users = len(self._recent_per_address)
+
+        # 高頻度取引
+        tx_per_user = total / unique_users if unique_users else 0
+        score = min((tx_per_user - 10) / 5, 1.0) if tx_per_user > 10 else 0
+        if score > self.HIGH_FREQUENCY_SCORE and len(window.recent_events) > self.HIGH_FREQUENCY_MIN_TRANSACTIONS:
+            detections.append(Detection(
+                'high_frequency_trading',
+                address,
+                [event[1] for event in window.recent_events],
+                {
+                    'tx_count': len(window.recent_events),
+                    'total_transactions': total,
+                    'unique_users': unique_users,
+                    'tx_per_user': tx_per_user,
+                    'score': score,
+                    'avg_interval': window.avg_interval or 0.0,
+                }
+            ))
+            window.recent_events.clear()
+            window.small_count = 0
+
+        # 小口分散取引
+        small_ratio = self._recent_small / total if total else 0
+        if (small_ratio > self.SMALL_DISTRIBUTED_RATIO
+                and unique_users < self.SMALL_DISTRIBUTED_MAX_USERS
+                and total > self.SMALL_DISTRIBUTED_MIN_TRANSACTIONS
+                and window.small_count > self.SMALL_DISTRIBUTED_MIN_PER_ADDRESS):
+            small_ids = [event[1] for event in window.recent_events if event[2]]
+            detections.append(Detection(
+                'small_distributed_trading',
+                address,
+                small_ids,
+                {
+                    'tx_count': len(small_ids),
+                    'total_transactions': total,
+                    'unique_users': unique_users,
+                    'small_ratio': small_ratio,
+                    'avg_amount': self._recent_amount / total if total else 0.0,
+                }
+            ))
+            window.recent_events = deque(event for event in window.recent_events if not event[2])
+            window.small_count = 0
+
+        return detections
+
+    def _expire(self, now: datetime):
+        """窓から外れた取引を先頭から取り除く（取り込み1件あたり償却O(1)）"""
+        recent_cutoff = now - self.RECENT_WINDOW
+        while self._recent and self._recent[0][0] < recent_cutoff:
+            _, address, amount, is_small = self._recent.popleft()
+            self._recent_amount -= amount
+            if is_small:
+                self._recent_small -= 1
+            remaining = self._recent_per_address.get(address, 0) - 1
+            if remaining > 0:
+                self._recent_per_address[address] = remaining
+            else:
+                self._recent_per_address.pop(address, None)
+            self._expire_address(address, now)
+
+    def _expire_address(self, address: str, now: datetime):
+        """アドレス単位の窓を期限切れにし、空になれば状態ごと破棄"""
+        window = self._addresses.get(address)
+        if window is None:
+            return
+        wash_cutoff = now - self.WASH_WINDOW
+        while window.wash_events and window.wash_events[0][0] < wash_cutoff:
+            _, _, side, amount = window.wash_events.popleft()
+            if side == 'buy':
+                window.buy_amount -= amount
+            else:
+                window.sell_amount -= amount
+        if not window.wash_events:
+            window.buy_amount = 0.0
+            window.sell_amount = 0.0
+        recent_cutoff = now - self.RECENT_WINDOW
+        while window.recent_events and window.recent_events[0][0] < recent_cutoff:
+            _, _, is_small = window.recent_events.popleft()
+            if is_small:
+                window.small_count -= 1
+        if window.is_empty() and address not in self._recent_per_address:
+            del self._addresses[address]
+
+    def stats(self) -> Dict[str, int]:
+        """現在の状態の概要"""
+        with self._lock:
+            return {
+                'observed': self.observed,
+                'detections': self.detections,
+                'tracked_addresses': len(self._addresses),
+                'window_transactions': len(self._recent),
+            }
@@ -0,0 +1,222 @@
+"""市場統計・資産ランキングのメモリ上スナップショット
+
+/stats・/rich・Botのステータス表示のたびに全テーブルを集計しないよう、
+集計結果を MarketSnapshot としてメモリに保持し、1分に1回のバックグラウンド集計で差し替える。
+同じ集計で、取引をしていなくても価格変動で総資産が1億円に達した未クリアユーザーも拾う。
+追記のみのテーブル（取引件数、価格の最高値・最安値）は集計済みの id より後の行だけを集計する。
+MySQL の自動採番はコミット順ではないので、最新の id から MARKET_STATS_ID_LAG 件以内の行は
+毎回集計し直して集計済みに含めない（後からコミットされた小さい id の行も数える）。
+それでも漏れた行は MARKET_STATS_RECOUNT_INTERVAL ごとの全件集計で拾い直す。
+コマンドからは snapshot をそのまま読むので、値は最大 MARKET_STATS_MAX_AGE 秒古い。
+
+環境変数:
+    MARKET_STATS_MAX_AGE  これより古いスナップショットは読む前に集計し直す（秒、既定60）
+    MARKET_STATS_ID_LAG   集計済みにせず毎回集計し直す最新の id の件数（既定1000）
+    MARKET_STATS_RECOUNT_INTERVAL  全件を集計し直す間隔（秒、既定3600）
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database.database import run_db
+from ..database.models import Order, PriceHistory, Transaction, User, Wallet
+from .clock import get_clock
+from .order_lifecycle import OPEN_STATUSES
+
+INITIAL_PRICE = 100.0  # 価格履歴がないときの表示価格
+GAME_CLEAR_ASSETS = 100_000_000  # 億り人の条件（ParaccoliEvents.check_game_clear と同じ）
+
+
+def _combine(pick, current, new):
+    """集計済みの値と新しい行の集計を合わせる（どちらも None ならば None）"""
+    if new is None:
+        return current
+    return new if current is None else pick(current, new)
+
+
+@dataclass(frozen=True)
+class RankingEntry:
+    """ランキングの1行"""
+    discord_id: str
+    parc_balance: float
+    jpy_balance: int
+    total_assets: float
+    has_cleared: bool
+
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    """ある時点の市場統計"""
+    refreshed_at: datetime
+    price: float
+    all_time_high: float
+    all_time_low: float
+    total_users: int
+    total_wallets: int
+    total_supply: float
+    total_mined: int
+    total_transactions: int
+    volume_24h: float
+    pending_orders: int
+    most_active: Optional[Tuple[str, int]]  # (discord_id, message_count)
+    parc_ranking: Tuple[RankingEntry, ...]
+    jpy_ranking: Tuple[RankingEntry, ...]
+    asset_ranking: Tuple[RankingEntry, ...]  # PARC時価 + JPY の総資産順
+    clear_candidates: Tuple[str, ...]  # 総資産が条件に達した未クリアユーザーの discord_id
+
+
+class MarketStatsService:
+    """市場統計の集計とスナップショットの提供"""
+
+    RANKING_SIZE = 3  # PARC・JPYランキングの件数
+    ASSET_RANKING_SIZE = 10  # 総資産ランキングの件数
+
+    def __init__(self, max_age: float = None, id_lag: int = None, recount_interval: float = None):
+        self.max_age = float(os.getenv('MARKET_STATS_MAX_AGE', '60')) if max_age is None else max_age
+        self.id_lag = int(os.getenv('MARKET_STATS_ID_LAG', '1000')) if id_lag is None else id_lag
+        self.recount_interval = (
+            float(os.getenv('MARKET_STATS_RECOUNT_INTERVAL', '3600')) if recount_interval is None else recount_interval
+        )
+        self.snapshot: Optional[MarketSnapshot] = None
+        self._refreshed_at = 0.0  # time.monotonic()
+        self._lock = threading.Lock()
+        self._reset_incremental()
+
+    def _reset_incremental(self):
+        self._recounted_at = time.monotonic()
+        self._last_price_id = 0
+        self._all_time_high = None
+        self._all_time_low = None
+        self._last_transaction_id = 0
+        self._transaction_count = 0
+
+    def invalidate(self):
+        """スナップショットと差分集計の状態を破棄（DBの差し替え時など）"""
+        with self._lock:
+            self.snapshot = None
+            self._refreshed_at = 0.0
+            self._reset_incremental()
+
+    def is_stale(self) -> bool:
+        return self.snapshot is None or time.monotonic() - self._refreshed_at > self.max_age
+
+    async def get(self) -> MarketSnapshot:
+        """スナップショットを取得（古ければ集計し直す）"""
+        snapshot = self.snapshot
+        if snapshot is not None and not self.is_stale():
+            return snapshot
+        return await self.refresh_async()
+
+    async def refresh_async(self) -> MarketSnapshot:
+        async with run_db(commit=False) as db:
+            return await db.run(self.refresh)
+
+    def refresh(self, db: Session) -> MarketSnapshot:
+        """全統計を1回で集計してスナップショットを差し替える"""
+        with self._lock:
+            now = get_clock().now()
+            if time.monotonic() - self._recounted_at > self.recount_interval:
+                self._reset_incremental()
+
+            # 価格（最高値・最安値は集計済みの値と、それより後の行）
+            latest = db.query(PriceHistory.price)\
+                .order_by(PriceHistory.timestamp.desc())\
+                .first()
+            price = latest[0] if latest else INITIAL_PRICE
+            high, low, last_price_id = db.query(
+                func.max(PriceHistory.price), func.min(PriceHistory.price), func.max(PriceHistory.id)
+            ).filter(PriceHistory.id > self._last_price_id).one()
+            all_time_high = _combine(max, self._all_time_high, high)
+            all_time_low = _combine(min, self._all_time_low, low)
+            safe_price_id = (last_price_id or 0) - self.id_lag
+            if safe_price_id > self._last_price_id:
+                high, low = db.query(func.max(PriceHistory.price), func.min(PriceHistory.price))\
+                    .filter(PriceHistory.id > self._last_price_id, PriceHistory.id <= safe_price_id)\
+                    .one()
+                self._all_time_high = _combine(max, self._all_time_high, high)
+                self._all_time_low = _combine(min, self._all_time_low, low)
+                self._last_price_id = safe_price_id
+
+            # 取引件数（集計済みの件数と、それより後の行）
+            new_transactions, last_transaction_id = db.query(func.count(Transaction.id), func.max(Transaction.id))\
+                .filter(Transaction.id > self._last_transaction_id)\
+                .one()
+            transaction_count = self._transaction_count + new_transactions
+            safe_transaction_id = (last_transaction_id or 0) - self.id_lag
+            if safe_transaction_id > self._last_transaction_id:
+                self._transaction_count += db.query(func.count(Transaction.id))\
+                    .filter(Transaction.id > self._last_transaction_id, Transaction.id <= safe_transaction_id)\
+                    .scalar() or 0
+                self._last_transaction_id = safe_transaction_id
+
+            total_users, total_mined = db.query(func.count(User.id), func.sum(User.total_mined)).one()
+            total_wallets, total_supply = db.query(func.count(Wallet.id), func.sum(Wallet.parc_balance)).one()
+            volume_24h = db.query(func.sum(Transaction.amount))\
+                .filter(
+                    Transaction.timestamp >= now - timedelta(days=1),
+                    Transaction.transaction_type.in_(['buy', 'sell'])
+                ).scalar() or 0
+            pending_orders = db.query(func.count(Order.id))\
+                .filter(Order.status.in_(OPEN_STATUSES))\
+                .scalar() or 0
+            most_active = db.query(User.discord_id, User.message_count)\
+                .order_by(User.message_count.desc())\
+                .first()
+
+            snapshot = MarketSnapshot(
+                refreshed_at=now,
+                price=price,
+                all_time_high=all_time_high if all_time_high is not None else price,
+                all_time_low=all_time_low if all_time_low is not None else price,
+                total_users=total_users or 0,
+                total_wallets=total_wallets or 0,
+                total_supply=total_supply or 0,
+                total_mined=total_mined or 0,
+                total_transactions=transaction_count,
+                volume_24h=volume_24h,
+                pending_orders=pending_orders,
+                most_active=tuple(most_active) if most_active else None,
+                parc_ranking=self._ranking(db, price, Wallet.parc_balance, Wallet.parc_balance > 0, self.RANKING_SIZE),
+                jpy_ranking=self._ranking(db, price, Wallet.jpy_balance, Wallet.jpy_balance > 0, self.RANKING_SIZE),
+                asset_ranking=self._ranking(
+                    db, price, Wallet.parc_balance * price + Wallet.jpy_balance, None, self.ASSET_RANKING_SIZE
+                ),
+                clear_candidates=tuple(
+                    discord_id for (discord_id,) in db.query(User.discord_id)
+                    .join(Wallet, Wallet.user_id == User.id)
+                    .filter(
+                        Wallet.parc_balance * price + Wallet.jpy_balance >= GAME_CLEAR_ASSETS,
+                        User.has_cleared.isnot(True)
+                    )
+                ),
+            )
+            self.snapshot = snapshot
+            self._refreshed_at = time.monotonic()
+            return snapshot
+
+    @staticmethod
+    def _ranking(db: Session, price: float, order_key, condition, limit: int) -> Tuple[RankingEntry, ...]:
+        query = db.query(User.discord_id, Wallet.parc_balance, Wallet.jpy_balance, User.has_cleared)\
+            .join(Wallet, Wallet.user_id == User.id)
+        if condition is not None:
+            query = query.filter(condition)
+        return tuple(
+            RankingEntry(
+                discord_id=discord_id,
+                parc_balance=parc or 0,
+                jpy_balance=jpy or 0,
+                total_assets=(parc or 0) * price + (jpy or 0),
+                has_cleared=bool(has_cleared),
+            )
+            for discord_id, parc, jpy, has_cleared in query.order_by(order_key.desc()).limit(limit)
+        )
+
+
+# プロセス全体で共有する統計
+market_stats = MarketStatsService()
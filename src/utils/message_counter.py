@@ -0,0 +1,120 @@
+"""メッセージ数の書き込み遅延カウンター
+
+チャットのメッセージごとにDBを更新せず、ユーザーごとの件数をメモリに貯めて
+一定間隔（とBot終了時）に CASE 式の一括 UPDATE でまとめて加算する。
+/mine は claim() で未反映分を取り出し、自分のトランザクションで報酬に含める
+（コミットまでに失敗したら取り出した分はカウンターに戻す）。
+
+環境変数:
+    MESSAGE_COUNT_FLUSH_INTERVAL  一括反映の間隔（秒、既定5秒）
+"""
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+
+from sqlalchemy import case, update
+
+from ..database.models import User
+from .logger import setup_logger
+
+
+class MessageCounter:
+    """ユーザーごとのメッセージ数をまとめてDBに反映する"""
+
+    FLUSH_CHUNK_SIZE = 500  # 1回の UPDATE で扱うユーザー数
+
+    def __init__(self, session_factory: Callable, flush_interval: float = None):
+        self.logger = setup_logger(__name__)
+        self.session_factory = session_factory
+        self.flush_interval = (
+            float(os.getenv('MESSAGE_COUNT_FLUSH_INTERVAL', '5.0')) if flush_interval is None else flush_interval
+        )
+        self._lock = threading.Lock()  # _pending の保護
+        self._flush_lock = threading.Lock()  # 反映中の書き込みと drain() の順序付け
+        self._pending: Dict[str, int] = {}
+        self._timer = None
+        self.flushes = 0
+        self.flushed_messages = 0
+        # 未反映分をプロセス終了時に書き出す
+        atexit.register(self.flush)
+
+    def increment(self, discord_id: str, count: int = 1):
+        """メッセージ数を加算（I/Oは発生しない）"""
+        with self._lock:
+            self._pending[discord_id] = self._pending.get(discord_id, 0) + count
+            if self._timer is None and self.flush_interval > 0:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self, discord_id: str) -> int:
+        """未反映のメッセージ数"""
+        with self._lock:
+            return self._pending.get(discord_id, 0)
+
+    def drain(self, discord_id: str) -> int:
+        """未反映分を取り出す（反映中の書き込みがあれば完了を待つ）"""
+        with self._flush_lock:
+            with self._lock:
+                return self._pending.pop(discord_id, 0)
+
+    def restore(self, discord_id: str, count: int):
+        """drain() で取り出した分を戻す（反映に失敗したとき）"""
+        if count:
+            self.increment(discord_id, count)
+
+    @contextmanager
+    def claim(self, discord_id: str) -> Iterator[int]:
+        """未反映分を取り出し、ブロック内で例外が起きたら戻す（ブロックの最後でコミットする）"""
+        count = self.drain(discord_id)
+        try:
+            yield count
+        except BaseException:
+            self.restore(discord_id, count)
+            raise
+
+    def flush(self):
+        """未反映分を一括で加算する"""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self._write(pending)
+                self.flushes += 1
+                self.flushed_messages += sum(pending.values())
+            except Exception as e:
+                self.logger.error(f"メッセージ数の反映エラー: {e}")
+                # 失敗分は次回の反映に回す
+                with self._lock:
+                    for discord_id, count in pending.items():
+                        self._pending[discord_id] = self._pending.get(discord_id, 0) + count
+
+    def _write(self, pending: Dict[str, int]):
+        items = list(pending.items())
+        db = self.session_factory()
+        try:
+            for start in range(0, len(items), self.FLUSH_CHUNK_SIZE):
+                chunk = dict(items[start:start + self.FLUSH_CHUNK_SIZE])
+                db.execute(
+                    update(User)
+                    .where(User.discord_id.in_(list(chunk)))
+                    .values(message_count=User.message_count + case(chunk, value=User.discord_id, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def close(self):
+        """終了時の反映"""
+        self.flush()
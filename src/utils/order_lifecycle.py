@@ -0,0 +1,215 @@
+"""指値注文のライフサイクル（状態遷移・資金拘束・約定記録）
+
+状態は pending → partially_filled → filled と進み、未約定分が残っていればいつでも cancelled にできる。
+発注時に資金を拘束（ledger で引き落とし）し、約定・取消ではその拘束分から精算する。
+- 買い: 指値 × 数量 + 手数料0.1% の円を拘束。約定時はPARCを受け取り、指値より安く約定した差額を返す
+- 売り: 数量ぶんのPARCを拘束。約定時は約定代金から手数料を引いた円を受け取る
+- 拘束額は escrow_jpy(約定済み量) の差分で消費するので、全量約定・取消までの合計は発注時の拘束額に一致する
+約定は1回ごとに OrderFill に記録する。1回の約定処理で変わった注文だけをまとめて UPDATE する
+（全量約定した注文は1文、部分約定した注文は CASE 式の1文。部分約定は成行注文1件につき最大1件）。
+チャート価格での約定（settle_crossing_orders）はまず全件を1つの SAVEPOINT で書き込み、
+失敗したら注文ごとの SAVEPOINT でやり直して、書き込めない注文だけを飛ばす。
+"""
+import math
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from ..database import ledger
+from ..database.ledger import Balance, LedgerError, Posting
+from ..database.models import Order, OrderFill, Transaction
+from .clock import get_clock
+from .logger import setup_logger
+
+PENDING = 'pending'
+PARTIALLY_FILLED = 'partially_filled'
+FILLED = 'filled'
+CANCELLED = 'cancelled'
+OPEN_STATUSES = (PENDING, PARTIALLY_FILLED)
+
+FEE_RATE = 0.001  # 0.1%
+
+orders = Order.__table__
+
+logger = setup_logger(__name__)
+
+
+class OrderConflict(LedgerError):
+    """読み込んだ後にほかの処理が注文を更新していた"""
+
+
+class OpenOrder(NamedTuple):
+    """約定処理で使う注文の列"""
+    id: int
+    wallet_address: str
+    side: str
+    price: float
+    amount: float
+    filled_amount: float
+
+    @property
+    def remaining(self) -> float:
+        return round((self.amount or 0) - (self.filled_amount or 0), 2)
+
+
+OPEN_ORDER_COLUMNS = (Order.id, Order.wallet_address, Order.side, Order.price, Order.amount, Order.filled_amount)
+
+
+@dataclass(frozen=True)
+class LimitFill:
+    """指値注文の約定1回分"""
+    order_id: int
+    side: str
+    wallet_address: str
+    amount: float
+    price: float
+    fee: float
+    total: float  # 買いは支払額、売りは受取額（手数料込み）
+    filled_amount: float  # 約定後の約定済み量
+    status: str
+    posting: Posting
+    entries: Tuple[object, ...]
+    transaction: Transaction
+    balance: Optional[Balance] = None
+
+    @property
+    def transaction_id(self) -> int:
+        return self.transaction.id
+
+
+def status_for(amount: float, filled_amount: float) -> str:
+    if filled_amount <= 0:
+        return PENDING
+    if round(amount - filled_amount, 2) <= 0:
+        return FILLED
+    return PARTIALLY_FILLED
+
+
+def escrow_jpy(amount: float, price: float) -> int:
+    """買い注文が amount ぶんに拘束する円（/buy の指値注文と同じ計算）"""
+    cost = math.floor(amount * price)
+    return cost + math.ceil(cost * FEE_RATE)
+
+
+def refund_on_cancel(order) -> Posting:
+    """取消時に返す拘束分（未約定分）"""
+    if order.side == 'buy':
+        return Posting(order.wallet_address, jpy=escrow_jpy(order.amount, order.price)
+                       - escrow_jpy(order.filled_amount or 0, order.price))
+    return Posting(order.wallet_address, parc=round(order.amount - (order.filled_amount or 0), 2))
+
+
+def fill(order: OpenOrder, quantity: float, price: float, now: datetime, source: str) -> LimitFill:
+    """order を quantity だけ price で約定させたときの記帳・記録を作る（書き込みは apply_fills）"""
+    filled = round((order.filled_amount or 0) + quantity, 2)
+    gross = math.floor(quantity * price)
+    if order.side == 'buy':
+        # 拘束分から支払い、指値より安く約定した差額を返す
+        consumed = escrow_jpy(filled, order.price) - escrow_jpy(order.filled_amount or 0, order.price)
+        total = min(gross + math.ceil(gross * FEE_RATE), consumed)
+        fee = total - gross
+        posting = Posting(order.wallet_address, parc=quantity, jpy=consumed - total)
+        transaction = Transaction(to_address=order.wallet_address, amount=quantity, price=price, fee=fee,
+                                  transaction_type="buy", order_type="limit", timestamp=now, status="completed")
+    else:
+        fee = math.ceil(gross * FEE_RATE)
+        total = gross - fee
+        posting = Posting(order.wallet_address, jpy=total)
+        transaction = Transaction(from_address=order.wallet_address, amount=quantity, price=price, fee=fee,
+                                  transaction_type="sell", order_type="limit", timestamp=now, status="completed")
+
+    entries = (
+        transaction,
+        Transaction(from_address=order.wallet_address, amount=fee, transaction_type="fee", timestamp=now),
+        OrderFill(order_id=order.id, amount=quantity, price=price, fee=fee, source=source, timestamp=now),
+    )
+    return LimitFill(
+        order_id=order.id, side=order.side, wallet_address=order.wallet_address, amount=quantity, price=price,
+        fee=fee, total=total, filled_amount=filled, status=status_for(order.amount, filled),
+        posting=posting, entries=entries, transaction=transaction,
+    )
+
+
+def update_orders(db: Session, fills: Iterable[LimitFill]):
+    """約定した注文だけを更新（全量約定は1文、部分約定は CASE 式の1文）"""
+    latest: Dict[int, LimitFill] = {}
+    for limit_fill in fills:
+        latest[limit_fill.order_id] = limit_fill  # 同じ注文の約定は最後のものが最新
+    completed = [order_id for order_id, f in latest.items() if f.status == FILLED]
+    partial = {order_id: f for order_id, f in latest.items() if f.status != FILLED}
+
+    updated = 0
+    if completed:
+        # 約定処理のほとんどは全量約定なので、CASE 式を使わず件数に比例しない1文で済ませる
+        updated += db.execute(
+            update(orders)
+            .where(orders.c.id.in_(completed), orders.c.status.in_(OPEN_STATUSES))
+            .values(status=FILLED, filled_amount=orders.c.amount)
+        ).rowcount
+    if partial:
+        updated += db.execute(
+            update(orders)
+            .where(orders.c.id.in_(list(partial)), orders.c.status.in_(OPEN_STATUSES))
+            .values(
+                filled_amount=case({order_id: f.filled_amount for order_id, f in partial.items()}, value=orders.c.id),
+                status=case({order_id: f.status for order_id, f in partial.items()}, value=orders.c.id),
+            )
+        ).rowcount
+    if updated != len(latest):
+        raise OrderConflict("約定処理中に注文が更新されました")
+
+
+def apply_fills(db: Session, fills: List[LimitFill], postings: Iterable[Posting] = (),
+                entries: Iterable[object] = ()) -> Dict[str, Balance]:
+    """注文の更新・記帳・記録をまとめて書き込む（postings / entries は同時に記帳する相手側の分）"""
+    update_orders(db, fills)
+    all_entries = list(entries)
+    for limit_fill in fills:
+        all_entries.extend(limit_fill.entries)
+    return ledger.apply(db, [*postings, *(f.posting for f in fills)], all_entries)
+
+
+def _settle(db: Session, open_orders: List[OpenOrder], price: float, now: datetime) -> List[LimitFill]:
+    """open_orders の未約定分を1つの SAVEPOINT で約定させる"""
+    fills = [fill(order, order.remaining, price, now, source="market") for order in open_orders]
+    with db.begin_nested():
+        balances = apply_fills(db, fills)
+    return [replace(f, balance=balances.get(f.wallet_address)) for f in fills]
+
+
+def settle_crossing_orders(db: Session, current_price: float) -> List[LimitFill]:
+    """チャート価格に届いた指値注文の未約定分を約定させる（process_orders の1回分）
+
+    書き込めない注文（ウォレットがない・残高が足りないなど）はログに残して飛ばし、ほかの注文は約定させる。
+    """
+    now = get_clock().now()
+    crossing = db.query(*OPEN_ORDER_COLUMNS)\
+        .filter(
+            Order.status.in_(OPEN_STATUSES),
+            Order.order_type == 'limit',
+            ((Order.side == 'buy') & (Order.price >= current_price))
+            | ((Order.side == 'sell') & (Order.price <= current_price))
+        )\
+        .order_by(Order.id)\
+        .with_for_update()\
+        .all()
+    open_orders = [order for order in map(OpenOrder._make, crossing) if order.remaining > 0]
+    if not open_orders:
+        return []
+
+    try:
+        return _settle(db, open_orders, current_price, now)
+    except Exception as e:
+        logger.warning(f"指値注文の一括約定に失敗したため1件ずつ約定します: {e}")
+
+    # 巻き戻した SAVEPOINT の記録は使えないので、注文ごとに作り直す
+    settled: List[LimitFill] = []
+    for order in open_orders:
+        try:
+            settled.extend(_settle(db, [order], current_price, now))
+        except Exception as e:
+            logger.error(f"指値注文 #{order.id} の約定に失敗しました: {e}")
+    return settled
@@ -0,0 +1,142 @@
+"""成行注文を板（未約定の指値注文）に当てる約定エンジン
+
+成行注文はまず反対側の指値注文と価格・時間優先で約定させ、残りだけを合成価格（チャートの現在価格）で約定させる。
+- 買いは合成価格以下の売り注文を安い順、売りは合成価格以上の買い注文を高い順に当てる（同じ価格なら古い順）
+- 指値注文は自分の指値で約定し、部分約定は order_lifecycle で partially_filled と OrderFill に記録する（自分の注文には当てない）
+- 指値注文側の資金は発注時に拘束済みなので、拘束分から精算する
+- 板は ix_orders_book の順に ORDER_MATCH_BATCH 件ずつ読み、注文の更新は1文の UPDATE、
+  残高は ledger.apply でウォレットごとに1文、取引記録は1回の flush で書く
+
+trade_pipeline.submit(execute_market_order, ...) から呼び、1件の成行注文を1つの SAVEPOINT で約定させる。
+成行注文側の残高が足りなければ InsufficientBalance で板の約定ごと巻き戻る。
+
+環境変数:
+    ORDER_MATCH_BATCH  板を一度に読む件数（既定100）
+"""
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database.ledger import Balance, Posting
+from ..database.models import Order, Transaction
+from . import order_lifecycle
+from .order_lifecycle import FEE_RATE, OPEN_ORDER_COLUMNS, OPEN_STATUSES, OpenOrder
+
+MATCH_BATCH = int(os.getenv('ORDER_MATCH_BATCH', '100'))
+
+
+@dataclass(frozen=True)
+class MatchedFill:
+    """板の指値注文1件との約定"""
+    order_id: int
+    maker_address: str
+    amount: float
+    price: float
+    completed: bool  # この約定で注文がすべて埋まったか
+
+
+@dataclass(frozen=True)
+class Execution:
+    """成行注文の約定結果"""
+    side: str
+    amount: float
+    average_price: float
+    gross: int  # 約定代金（円未満切り捨て）
+    fee: int
+    net: int  # 買いは支払額、売りは受取額（手数料込み）
+    fills: Tuple[MatchedFill, ...]
+    transaction_id: int
+    balance: Balance
+
+    @property
+    def matched_amount(self) -> float:
+        return round(sum(fill.amount for fill in self.fills), 2)
+
+
+def _resting_orders(db: Session, side: str, address: str, limit_price: float, offset: int):
+    """反対側の指値注文を価格・時間優先で読む"""
+    query = db.query(*OPEN_ORDER_COLUMNS)\
+        .filter(
+            Order.side == ('sell' if side == 'buy' else 'buy'),
+            Order.status.in_(OPEN_STATUSES),
+            Order.order_type == 'limit',
+            Order.wallet_address != address,
+        )
+    if side == 'buy':
+        query = query.filter(Order.price <= limit_price).order_by(Order.price.asc(), Order.timestamp.asc(), Order.id.asc())
+    else:
+        query = query.filter(Order.price >= limit_price).order_by(Order.price.desc(), Order.timestamp.asc(), Order.id.asc())
+    return [OpenOrder._make(row) for row in query.with_for_update().offset(offset).limit(MATCH_BATCH)]
+
+
+def match(db: Session, side: str, address: str, amount: float,
+          fallback_price: float) -> List[Tuple[OpenOrder, float]]:
+    """amount に達するまで板から約定相手と数量を選ぶ（書き込みはしない）"""
+    matches: List[Tuple[OpenOrder, float]] = []
+    remaining = round(amount, 2)
+    offset = 0
+    while remaining > 0:
+        rows = _resting_orders(db, side, address, fallback_price, offset)
+        for order in rows:
+            if order.remaining <= 0:
+                continue
+            quantity = min(order.remaining, remaining)
+            matches.append((order, quantity))
+            remaining = round(remaining - quantity, 2)
+            if remaining <= 0:
+                break
+        if len(rows) < MATCH_BATCH:
+            break
+        offset += MATCH_BATCH
+    return matches
+
+
+def execute_market_order(db: Session, address: str, side: str, amount: float, fallback_price: float) -> Execution:
+    """成行注文を板と合成価格で約定させて記帳する（コミットは呼び出し側）"""
+    now = datetime.now()
+    amount = round(amount, 2)
+    # 板の指値注文は自分の指値で約定する
+    maker_fills = [
+        order_lifecycle.fill(order, quantity, order.price, now, source="book")
+        for order, quantity in match(db, side, address, amount, fallback_price)
+    ]
+    fills = tuple(
+        MatchedFill(f.order_id, f.wallet_address, f.amount, f.price, f.status == order_lifecycle.FILLED)
+        for f in maker_fills
+    )
+    matched = round(sum(fill.amount for fill in fills), 2)
+    remainder = round(amount - matched, 2)
+
+    gross = math.floor(sum(fill.amount * fill.price for fill in fills) + remainder * fallback_price)
+    fee = math.ceil(gross * FEE_RATE)
+    average_price = gross / amount if amount else fallback_price
+
+    if side == 'buy':
+        net = gross + fee
+        taker = Posting(address, parc=amount, jpy=-net)
+        transaction = Transaction(to_address=address, amount=amount, fee=fee, price=average_price,
+                                  transaction_type="buy", order_type="market", timestamp=now, status="completed")
+        entries = [transaction]
+    else:
+        net = gross - fee
+        taker = Posting(address, parc=-amount, jpy=net)
+        transaction = Transaction(from_address=address, amount=amount, fee=fee, price=average_price,
+                                  transaction_type="sell", timestamp=now, status="completed")
+        entries = [transaction, Transaction(from_address=address, amount=fee, transaction_type="fee", timestamp=now)]
+
+    balances: Dict[str, Balance] = order_lifecycle.apply_fills(db, maker_fills, [taker], entries)
+    return Execution(
+        side=side,
+        amount=amount,
+        average_price=average_price,
+        gross=gross,
+        fee=fee,
+        net=net,
+        fills=fills,
+        transaction_id=transaction.id,
+        balance=balances[address],
+    )
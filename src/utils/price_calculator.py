@@ -1,24 +1,36 @@
 import math
-import random
 from datetime import datetime, timedelta
-from ..database.models import Transaction, PriceHistory, Wallet, User, Order
+from ..database.models import Transaction, PriceHistory, Wallet, User, Order, FlaggedTransaction
 from ..utils.logger import Logger, setup_logger
-from ..database.database import SessionLocal
-from sqlalchemy import func, case
+from ..database.database import SessionLocal, IS_SQLITE
+from sqlalchemy import func, exists, or_, insert
 from ..utils.event_manager import EventManager
 from sqlalchemy.orm import Session
-import numpy as np
 from ..utils.config import Config
+from ..utils.manipulation_detector import StreamingManipulationDetector
+from ..utils.ttl_index import TTLIndex
+from ..utils.flag_store import FlagStore
+from ..utils.price_checkpoint import PriceCheckpointer
+from ..utils.indicator_engine import IndicatorEngine
+from ..utils.factor_pipeline import FactorPipeline
+from ..utils.clock import get_clock, get_random_streams
+from ..utils.order_lifecycle import OPEN_STATUSES
 import asyncio
-import time
 import os
-import json
+import threading
 
 
 class PriceCalculator:
     _instance = None
     _initialized = False
 
+    # 検出状態（トランザクションID・アドレス・警告ID）ごとの保持件数の上限
+    DETECTION_STATE_MAX_ENTRIES = int(os.getenv('DETECTION_STATE_MAX_ENTRIES', '100000'))
+    # 1回のクリーンアップで期限切れ処理する最大件数
+    DETECTION_CLEANUP_BUDGET = 1000
+    WARNING_KEY_TTL = 86400  # 内容ベースの重複警告キーの保持期間（秒）
+    INDICATOR_BUFFER_SIZE = 2048  # 指標用に保持する価格ティック数（1分間隔で24時間分以上）
+
     def __new__(cls, bot=None):
         if cls._instance is None:
             cls._instance = super(PriceCalculator, cls).__new__(cls)
@@ -35,7 +47,15 @@ class PriceCalculator:
         if not PriceCalculator._initialized:
             self._initialize(bot)
             self.config = Config() # 設定ファイルの読み込み
-            self.price_history = []  # 価格履歴のキャッシュ
+            # 価格履歴のキャッシュ（テクニカル指標はここから計算し、DBを参照しない）
+            self.indicators = IndicatorEngine(self.INDICATOR_BUFFER_SIZE)
+            self._indicators_warmed = False
+            # 価格変動要因のレジストリ（要因ごとの計測・時間予算・無効化）
+            # SQLiteは接続を共有するため、DB要因の並列実行はMySQLのみ既定で有効にする
+            self.factor_pipeline = FactorPipeline(SessionLocal, default_workers=1 if IS_SQLITE else 4)
+            self._register_default_factors()
+            self.last_factors = {}  # 直近の価格計算で使った要因（表示名 -> 係数）
+            self.last_factor_timings = {}  # 直近の要因ごとの処理時間（ミリ秒）
             self.volatility_window = 24  # ボラティリティ計算期間（時間）
             self.trend_memory = []  # トレンド分析用のメモリ
             
@@ -43,31 +63,38 @@ class PriceCalculator:
             if not self._load_price_state():
                 # 保存した状態がない場合はDBから最新価格を取得
                 try:
-                    from ..database.database import SessionLocal
                     db = SessionLocal()
                     self.set_initial_price(db)
                     db.close()
                     self.logger.info("DBから初期価格を設定しました")
+                    # 再構築した状態をチェックポイントとして残す
+                    self._save_price_state(force=True)
                 except Exception as e:
                     self.logger.error(f"DB初期価格設定エラー: {e}")
 
             self.market_state = 'normal'  # normal, bullish, bearish, volatile
-            self.last_state_change = datetime.now()
+            self.last_state_change = self.clock.now()
             self.momentum_threshold = 0.02  # モメンタム閾値
             self.event_manager = bot.event_manager if bot else EventManager()
 
             # 市場操作検出用の変数を追加・改良
             self.detected_transactions = set()  # 検出済みの警告IDを保存
-            self.detected_transaction_ids = set()  # 検出済みトランザクションIDを保存
-            self.detected_addresses = {}  # 検出済みアドレスと検出時刻を保存
-            self._detection_timestamps = {}  # トランザクションID: 検出時刻 のマッピング
             self.last_manipulation_warning = {}  # 最後に警告を送信した時刻（タイプ別）
             self.manipulation_cooldown = 3600  # 同じタイプの警告を再送信するまでの待機時間（秒）
             self.detection_expiry = 86400  # 検出状態の有効期間（秒）
-            self.last_warnings_cleanup = datetime.now()
+            self.last_warnings_cleanup = self.clock.now()
+            # 検出状態は有効期限付きの索引で保持（期限切れ・上限超過は古いものから削除）
+            self.detected_transaction_ids = TTLIndex(self.detection_expiry, self.DETECTION_STATE_MAX_ENTRIES, clock=self.clock.time)  # 検出済みトランザクションID
+            self.detected_addresses = TTLIndex(self.detection_expiry, self.DETECTION_STATE_MAX_ENTRIES, clock=self.clock.time)  # 検出済みアドレス: 検出時刻
             # 検出済みトランザクションの価格影響を一度だけ適用
-            self.applied_transaction_effects = set()  # 価格効果を既に適用したトランザクションID
-            self.processed_warnings = set()  # 処理済みの警告ID（データ型別・期間別）
+            self.last_applied_transaction_id = 0  # 価格効果を適用済みのトランザクションIDの上限（これ以下は適用済み）
+            self._flags_synced = False  # ファイルの永続フラグをflagged_transactionsへ反映済みか
+            # 取引の書き込み時に市場操作を検出するストリーム検出器
+            self.manipulation_detector = StreamingManipulationDetector()
+            self._detector_warmed = False
+            self._detector_lock = threading.RLock()  # 検出器は DB スレッドから呼ばれるので1件ずつ流す
+            self._pending_wash_detection = False  # 前回のティック以降にウォッシュトレード警告が出たか
+            self.processed_warnings = TTLIndex(self.WARNING_KEY_TTL, self.DETECTION_STATE_MAX_ENTRIES, clock=self.clock.time)  # 処理済みの警告ID（データ型別・期間別）
             # self.permanently_flagged_transactions = set()  # この行を削除または修正
             # クラス変数のフラグを読み込むだけ
             self._load_permanent_flags()
@@ -75,7 +102,7 @@ class PriceCalculator:
             # ランダム価格を保持するリスト
             self.random_prices = []
             # 最後にランダム価格を更新した時間
-            self.last_random_price_update = datetime.now()
+            self.last_random_price_update = self.clock.now()
             # ランダム価格更新間隔（秒）
             self.random_price_update_interval = 10
         else:
@@ -83,6 +110,24 @@ class PriceCalculator:
             if bot:
                 self.bot = bot
                 self.event_manager = bot.event_manager if hasattr(bot, 'event_manager') else self.event_manager
+    def _schedule_coroutine(self, coro):
+        """非同期処理を予約（DBスレッドから呼ばれた場合はBotのイベントループへ渡す）"""
+        try:
+            asyncio.get_running_loop().create_task(coro)
+            return
+        except RuntimeError:
+            pass
+
+        try:
+            loop = self.bot.loop if self.bot else None
+            if loop and loop.is_running():
+                asyncio.run_coroutine_threadsafe(coro, loop)
+                return
+        except AttributeError:
+            pass
+        # 実行できるループがない場合は破棄
+        coro.close()
+
     @property
     def permanently_flagged_transactions(self):
         # クラス変数を返す
@@ -100,6 +145,9 @@ class PriceCalculator:
 
     def _initialize(self, bot=None):
         """初期化処理"""
+        # 時刻と乱数の取得元（リプレイではシミュレーション時刻・固定シードに差し替える）
+        self.clock = get_clock()
+        self.rng = get_random_streams().generator('pricing')
         self.total_supply = 100_000_000
         self.launch_date = datetime(2025, 1, 1)
         self.logger = setup_logger(__name__)
@@ -113,11 +161,13 @@ class PriceCalculator:
         # 現在のランダム価格を保持
         self.current_random_price = self._base_price
         # 最後にランダム価格を更新した時間
-        self.last_random_price_update = datetime.now()
+        self.last_random_price_update = self.clock.now()
         # ランダム価格更新間隔（秒）
         self.random_price_update_interval = 10
         # EventManagerの初期化
         self.event_manager = EventManager(bot) if bot else None
+        # 価格状態のチェックポイント（計算結果ごとにアトミックに保存）
+        self.price_checkpointer = PriceCheckpointer()
         self.logger.info(f"PriceCalculator initialized - Base Price: ¥{self._base_price:,.2f}")
 
     @property
@@ -183,14 +233,19 @@ class PriceCalculator:
             raise
 
     def calculate_price(self, db: Session = None) -> float:
-        """価格計算"""
+        """価格計算（計算中は現在時刻を固定し、すべての要因が同じ時刻を見る）"""
+        with self.clock.tick():
+            return self._calculate_price(db)
+
+    def _calculate_price(self, db: Session = None) -> float:
+        """価格計算の本体"""
         try:
             self.logger.info("価格計算を開始...")
             self.logger.info(f"基準価格: ¥{self._base_price:,.2f}")
             
             # 前回価格を記録
             previous_price = self._base_price
-            # 市場操作チェック
+            # 市場操作チェック（永続フラグの同期・検出済みの掃除もここで1回だけ行い、並列に動く要因からは行わない）
             if db:
                 wash_trading_detected = self._detect_wash_trading(db)
             else:
@@ -198,9 +253,6 @@ class PriceCalculator:
             
             self.logger.info(f"ウォッシュトレード検出：現在の永続フラグ数: {len(self.permanently_flagged_transactions)}")
             
-            # 価格変動要因の計算
-            factors = {}
-            
             # 価格操作が検出された場合の影響抑制
             price_suppression = 1.0
             if db:
@@ -208,55 +260,15 @@ class PriceCalculator:
                     # ウォッシュトレードが検出された場合、価格変動を50%抑制
                     price_suppression = 0.5
             
-            # 市場深度の計算
-            depth_factor = self._calculate_market_depth(db)
-            factors["市場深度"] = depth_factor
-            
-            # サポート/レジスタンスの計算
-            support_resistance = self._calculate_support_resistance(db)
-            factors["価格帯"] = support_resistance
-            
-            # 市場心理の計算
-            psychology = self._calculate_market_psychology(db)
-            factors["市場心理"] = psychology
-            
-            # その他の要因計算
-            if db:
-                whale = self._calculate_whale_factor(db)
-                burn = self._calculate_burn_effect(db)
-                holding = self._calculate_holding_effect(db)
-                mint = self._calculate_mint_impact(db)
-                volume = self._calculate_transaction_effect(db)
-                large_trades = self._calculate_large_trade_impact(db)
-                
-                factors.update({
-                    "クジラ": whale,
-                    "バーン効果": burn,
-                    "保有効果": holding,
-                    "新規発行": mint,
-                    "取引量": volume,
-                    "大口取引": large_trades
-                })
-            
-            # イベントの影響
-            event_change = self.event_manager.get_next_price_target() or 0.0  # None の場合は 0.0
-            if event_change != 0:
-                event_impact = self._calculate_event_impact(event_change)
-                factors["イベント"] = event_impact
-            else:
-                factors["イベント"] = 1.0
-                
-            # 取引量が少ない場合、緩やかに価格を下げる
-            inactivity_factor = self._calculate_inactivity_penalty(db)
-            factors["取引不活性"] = inactivity_factor
-            
-            # ランダムノイズ（±1%程度）
-            noise = self._calculate_market_factors()
-            factors["ノイズ"] = noise
-    
-            # 短期的な価格変動
-            short_term = self._calculate_short_term_fluctuation()
-            factors["短期変動"] = short_term
+            # 登録済みの価格変動要因を実行（要因ごとに計測し、時間予算の超過は影響なし）
+            self._ensure_indicators(db)
+            pipeline_result = self.factor_pipeline.run(db)
+            factors = dict(pipeline_result.factors)
+            slowest = max(pipeline_result.timings.items(), key=lambda item: item[1], default=None)
+            self.logger.info(
+                f"価格要因: {len(factors)}件 {pipeline_result.elapsed_ms:.1f}ms"
+                + (f"（最長: {slowest[0]} {slowest[1]:.1f}ms）" if slowest else "")
+            )
             
             # 低価格時（1円以下）の上昇バイアスを追加
             low_price_bias = 1.0
@@ -279,7 +291,7 @@ class PriceCalculator:
                 if abs(change_percent) > 0.01:  # 0.01%以上の変動がある
                     all_factors_unchanged = False
                     
-                self.logger.info(f"{factor_name}: {change_percent:+.2f}% (×{factor_value:.4f})")
+                self.logger.debug(f"{factor_name}: {change_percent:+.2f}% (×{factor_value:.4f})")
         
             
             # 価格計算
@@ -287,7 +299,7 @@ class PriceCalculator:
             # すべての要因に変動がないか、変動が非常に小さい場合は強制的に変動を加える
             if all_factors_unchanged or abs(new_price - previous_price) / previous_price < 0.002:
                 # 0.5%～1.5%のランダムな変動を付加
-                forced_change = random.uniform(0.005, 0.015) * (-1 if random.random() < 0.5 else 1)
+                forced_change = self.rng.uniform(0.005, 0.015) * (-1 if self.rng.random() < 0.5 else 1)
                 new_price = previous_price * (1 + forced_change)
                 self.logger.warning(f"強制的な価格変動を追加: {forced_change*100:+.2f}% (変動なし状態を防止)")
                 
@@ -296,7 +308,7 @@ class PriceCalculator:
             
             # 高価格帯での下落バイアス（100円以上の時）
             if self._base_price >= 100.0:
-                high_price_bias = random.uniform(0.01, 0.03) * -1  # -1%～-3%のランダムな下落
+                high_price_bias = self.rng.uniform(0.01, 0.03) * -1  # -1%～-3%のランダムな下落
                 new_price = new_price * (1 + high_price_bias)
                 self.logger.info(f"高価格時の下落バイアス: {high_price_bias*100:+.2f}%")
             
@@ -317,6 +329,10 @@ class PriceCalculator:
             price_change = ((new_price - self._base_price) / self._base_price) * 100
             self.logger.info(f"最終価格: ¥{new_price:,.2f} ({price_change:+.2f}%)")
             
+            # リプレイ・分析用に今回の要因を保持
+            self.last_factors = factors
+            self.last_factor_timings = pipeline_result.timings
+
             # 価格帯更新
             self._update_price_range(new_price)
             
@@ -326,6 +342,23 @@ class PriceCalculator:
             self.logger.error(f"価格計算エラー: {e}", exc_info=True)
             return self._base_price  # エラー時は基準価格を返す
 
+    def _register_default_factors(self):
+        """既定の価格変動要因を登録（登録順が合成とログの順序）"""
+        register = self.factor_pipeline.register
+        register('depth', "市場深度", self._calculate_market_depth, requires=('order_book',))
+        register('support_resistance', "価格帯", self._calculate_support_resistance, requires=('indicators',))
+        register('psychology', "市場心理", self._calculate_market_psychology, requires=('indicators', 'db'))
+        register('whale', "クジラ", self._calculate_whale_factor, requires=('db',))
+        register('burn', "バーン効果", self._calculate_burn_effect, requires=('db',))
+        register('holding', "保有効果", self._calculate_holding_effect, requires=('db',))
+        register('mint', "新規発行", self._calculate_mint_impact, requires=('db',))
+        register('transactions', "取引量", self._calculate_transaction_effect, requires=('db',))
+        register('large_trades', "大口取引", self._calculate_large_trade_impact, requires=('db',))
+        register('event', "イベント", lambda db: self._calculate_event_factor(), requires=('snapshot',))
+        register('inactivity', "取引不活性", self._calculate_inactivity_penalty, requires=('db',))
+        register('noise', "ノイズ", lambda db: self._calculate_market_factors(), requires=('snapshot',))
+        register('short_term', "短期変動", lambda db: self._calculate_short_term_fluctuation(), requires=('snapshot',))
+
     def _calculate_market_depth(self, db: Session) -> float:
         """市場の深さ（流動性）を計算"""
         try:
@@ -333,7 +366,7 @@ class PriceCalculator:
                 return 1.0
 
             # 注文板の厚みを計算
-            orders = db.query(Order).filter(Order.status == 'pending').all()
+            orders = db.query(Order).filter(Order.status.in_(OPEN_STATUSES)).all()
             buy_depth = sum(o.amount for o in orders if o.side == 'buy')
             sell_depth = sum(o.amount for o in orders if o.side == 'sell')
             
@@ -348,25 +381,16 @@ class PriceCalculator:
     def _calculate_support_resistance(self, db: Session) -> float:
         """サポート/レジスタンスラインの影響を計算"""
         try:
-            if not db:
-                return 1.0
-
-            # 過去24時間の価格を取得
-            day_ago = datetime.now() - timedelta(hours=24)
-            prices = db.query(PriceHistory.price)\
-                .filter(PriceHistory.timestamp >= day_ago)\
-                .all()
+            self._ensure_indicators(db)
 
-            if not prices:
+            # 過去24時間の価格の集中帯を検出
+            day_ago = self.clock.now() - timedelta(hours=24)
+            band = self.indicators.support_resistance(day_ago, bins=20)
+            if band is None:
                 return 1.0
 
-            prices = [p.price for p in prices]
-            current = prices[0]
-
-            # 価格の集中帯を検出
-            hist, bins = np.histogram(prices, bins=20)
-            support = bins[np.argmax(hist)]
-            resistance = bins[np.argmax(hist) + 1]
+            support, resistance = band
+            current = self.indicators.last_price()
 
             # サポート/レジスタンス付近での価格反発効果
             if current < support:
@@ -449,7 +473,7 @@ class PriceCalculator:
                 'normal': 0.005,  # わずかな上昇バイアス
                 'bullish': 0.005,  # +0.5%上昇バイアス
                 'bearish': -0.001,  # -0.1%下落バイアス
-                'volatile': random.uniform(-0.01, 0.015)  # より大きな変動
+                'volatile': self.rng.uniform(-0.01, 0.015)  # より大きな変動
             }
 
             final_sentiment = sentiment + trend_impact + state_adjustments[self.market_state]
@@ -470,7 +494,7 @@ class PriceCalculator:
 
     def _update_market_state(self):
         """市場状態の更新"""
-        now = datetime.now()
+        now = self.clock.now()
         state_duration = (now - self.last_state_change).total_seconds() / 3600  # 時間単位
 
         # 状態遷移の最小時間（時間）
@@ -493,7 +517,7 @@ class PriceCalculator:
         trend_strength = abs(sum(t - 1.0 for t in recent_trend))
 
         # 状態遷移の確率計算
-        transition_prob = random.random()
+        transition_prob = self.rng.random()
         
         # 現在の状態に応じた遷移確率の調整
         if self.market_state == 'normal':
@@ -525,7 +549,7 @@ class PriceCalculator:
                 return 1.0
 
             # 直近1時間の大口取引を検出
-            hour_ago = datetime.now() - timedelta(hours=1)
+            hour_ago = self.clock.now() - timedelta(hours=1)
             avg_trade = db.query(func.avg(Transaction.amount))\
                 .filter(Transaction.timestamp >= hour_ago)\
                 .scalar() or 0
@@ -543,7 +567,7 @@ class PriceCalculator:
             impact = 1.0
             for trade in large_trades:
                 size_factor = math.log10(trade.amount / avg_trade)
-                time_factor = math.exp(-(datetime.now() - trade.timestamp).seconds / 3600)
+                time_factor = math.exp(-(self.clock.now() - trade.timestamp).seconds / 3600)
                 trade_impact = size_factor * time_factor * (0.01 if trade.transaction_type == 'buy' else -0.01)
                 impact += trade_impact
 
@@ -557,13 +581,13 @@ class PriceCalculator:
         """市場要因の計算"""
         try:
             # ベース変動: ±0.5%に抑制
-            base_change = random.uniform(-0.005, 0.005)
+            base_change = self.rng.uniform(-0.005, 0.005)
             
             # トレンド要因: ±0.3%
-            trend = random.uniform(-0.003, 0.003)
+            trend = self.rng.uniform(-0.003, 0.003)
             
             # ボラティリティ: ±0.2%
-            volatility = random.uniform(-0.002, 0.002)
+            volatility = self.rng.uniform(-0.002, 0.002)
             
             return 1.0 + base_change + trend + volatility
 
@@ -574,7 +598,7 @@ class PriceCalculator:
         """クジラ(大口保有者)の影響計算"""
         try:
             # 90%の確率で影響なし
-            if random.random() > 0.1:
+            if self.rng.random() > 0.1:
                 return 1.0
 
             # 上位3アドレスの保有量を取得
@@ -597,10 +621,10 @@ class PriceCalculator:
         """需給バランスに基づく価格係数"""
         try:
             # 現在の価格トレンドを考慮
-            current_trend = math.sin(time.time() / 14400) * 0.01  # 4時間周期で±1%
+            current_trend = math.sin(self.clock.time() / 14400) * 0.01  # 4時間周期で±1%
             
             # 24時間の取引データを取得
-            day_ago = datetime.now() - timedelta(hours=24)
+            day_ago = self.clock.now() - timedelta(hours=24)
             buys = db.query(func.sum(Transaction.amount))\
                 .filter(
                     Transaction.transaction_type == 'buy',
@@ -629,7 +653,7 @@ class PriceCalculator:
         """市場感情の計算"""
         try:
             # 直近24時間の取引を取得
-            yesterday = datetime.now() - timedelta(days=1)
+            yesterday = self.clock.now() - timedelta(days=1)
             buy_volume = db.query(func.sum(Transaction.amount))\
                 .filter(
                     Transaction.timestamp >= yesterday,
@@ -657,31 +681,42 @@ class PriceCalculator:
     def _get_market_trend(self, db) -> float:
         """市場トレンドの分析"""
         try:
-            # 過去24時間の価格データを取得
-            day_ago = datetime.now() - timedelta(hours=24)
-            prices = db.query(PriceHistory)\
-                .filter(PriceHistory.timestamp >= day_ago)\
-                .order_by(PriceHistory.timestamp.asc())\
-                .all()
+            self._ensure_indicators(db)
 
-            if not prices:
+            # 過去24時間の始値から終値へのトレンドを計算
+            day_ago = self.clock.now() - timedelta(hours=24)
+            trend = self.indicators.trend(day_ago)
+            if trend is None:
                 return 1.0
 
-            # トレンドを計算
-            start_price = prices[0].price
-            end_price = prices[-1].price
-            trend = (end_price - start_price) / start_price
-
             return 1.0 + (trend * 0.1)  # トレンドの影響を10%に抑制
 
         except Exception:
             return 1.0
 
+    def record_price_tick(self, price: float, timestamp: datetime = None):
+        """保存した価格ティックを指標エンジンへ追記"""
+        if self._indicators_warmed:
+            self.indicators.push(price, timestamp)
+
+    def _ensure_indicators(self, db: Session):
+        """初回のみ価格履歴から指標エンジンのバッファを埋める"""
+        if self._indicators_warmed or not db:
+            return
+        rows = db.query(PriceHistory.timestamp, PriceHistory.price)\
+            .order_by(PriceHistory.timestamp.desc())\
+            .limit(self.INDICATOR_BUFFER_SIZE)\
+            .all()
+        self.indicators.clear()
+        self.indicators.extend(reversed(rows))
+        self._indicators_warmed = True
+        self.logger.info(f"指標エンジンをウォームアップしました: {len(self.indicators)}件")
+
     def _get_trading_volume(self, db) -> float:
         """取引量に基づく価格係数"""
         try:
             # 24時間の取引量を取得
-            day_ago = datetime.now() - timedelta(hours=24)
+            day_ago = self.clock.now() - timedelta(hours=24)
             volume = db.query(func.sum(Transaction.amount))\
                 .filter(Transaction.timestamp >= day_ago)\
                 .scalar() or 0
@@ -696,20 +731,13 @@ class PriceCalculator:
     def _calculate_price_momentum(self, db) -> float:
         """価格モメンタムの計算"""
         try:
-            # 直近のモメンタムを計算
-            recent_prices = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .limit(5)\
-                .all()
+            self._ensure_indicators(db)
 
-            if len(recent_prices) < 2:
+            # 直近5件のモメンタムを計算
+            momentum = self.indicators.momentum(5)
+            if momentum is None:
                 return 1.0
 
-            momentum = sum(
-                1 if p1.price > p2.price else -1
-                for p1, p2 in zip(recent_prices[:-1], recent_prices[1:])
-            ) / (len(recent_prices) - 1)
-
             return 1.0 + (momentum * 0.01)  # モメンタムの影響を1%に抑制
 
         except Exception:
@@ -718,17 +746,14 @@ class PriceCalculator:
     def _calculate_moving_average(self, db) -> float:
         """移動平均の計算"""
         try:
-            prices = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .limit(20)\
-                .all()
-                
-            if len(prices) < 2:
+            self._ensure_indicators(db)
+
+            if len(self.indicators) < 2:
                 return 1.0
 
             # 5分移動平均と20分移動平均の比較
-            ma5 = sum(p.price for p in prices[:5]) / 5
-            ma20 = sum(p.price for p in prices) / len(prices)
+            ma5 = self.indicators.sma(5)
+            ma20 = self.indicators.sma(20)
             
             return 1.0 + ((ma5 / ma20 - 1) * 0.1)  # 最大10%の影響
 
@@ -738,36 +763,15 @@ class PriceCalculator:
     def _calculate_rsi(self, db) -> float:
         """RSIの計算"""
         try:
-            prices = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .limit(14)\
-                .all()
+            self._ensure_indicators(db)
 
-            if len(prices) < 14:
+            rsi = self.indicators.rsi(14)
+            if rsi is None:
                 return 1.0
 
-            gains = []
-            losses = []
-            
-            # 価格変動を計算
-            for i in range(len(prices) - 1):
-                change = prices[i].price - prices[i + 1].price
-                if change > 0:
-                    gains.append(change)
-                    losses.append(0)
-                else:
-                    gains.append(0)
-                    losses.append(abs(change))
+            if rsi >= 100:
+                return 1.02  # 強気シグナル（下落なし）
 
-            avg_gain = sum(gains) / len(gains)
-            avg_loss = sum(losses) / len(losses)
-            
-            if avg_loss == 0:
-                return 1.02  # 強気シグナル
-                
-            rs = avg_gain / avg_loss
-            rsi = 100 - (100 / (1 + rs))
-            
             # RSIに基づく価格係数（30-70が正常範囲）
             if rsi > 70:
                 return 0.998  # 売られ過ぎ
@@ -782,21 +786,12 @@ class PriceCalculator:
     def _calculate_volatility_index(self, db) -> float:
         """ボラティリティインデックスの計算"""
         try:
-            prices = db.query(PriceHistory)\
-                .order_by(PriceHistory.timestamp.desc())\
-                .limit(10)\
-                .all()
+            self._ensure_indicators(db)
 
-            if len(prices) < 2:
+            # 直近10件の価格変動率の標準偏差を計算
+            std_dev = self.indicators.volatility(10)
+            if std_dev is None:
                 return 1.0
-
-            # 価格変動の標準偏差を計算
-            changes = [
-                (p1.price - p2.price) / p2.price
-                for p1, p2 in zip(prices[:-1], prices[1:])
-            ]
-            
-            std_dev = np.std(changes)
             
             # ボラティリティに基づく係数を返す
             if std_dev > 0.02:  # 高ボラティリティ
@@ -813,7 +808,7 @@ class PriceCalculator:
         """トークン燃焼の影響計算"""
         try:
             # 24時間の燃焼量を取得
-            day_ago = datetime.now() - timedelta(days=1)
+            day_ago = self.clock.now() - timedelta(days=1)
             burned = db.query(func.sum(Transaction.fee))\
                 .filter(Transaction.timestamp >= day_ago)\
                 .scalar() or 0
@@ -828,19 +823,12 @@ class PriceCalculator:
     def _calculate_holding_effect(self, db: Session) -> float:
         """保有期間と取引活性度による市場効果の計算（操作防止対策付き）"""
         try:
-            now = datetime.now()
+            now = self.clock.now()
             day_ago = now - timedelta(hours=24)
             
-            # クリーンアップを実行
-            self._cleanup_detected_transactions()
-            
-            # 検出アドレスリスト
+            # 検出アドレスリスト（同期・クリーンアップはティックの開始時に _detect_wash_trading で実行済み）
             detected_addresses_list = list(self.detected_addresses.keys())
             
-            # _detection_timestampsがなければ初期化
-            if not hasattr(self, '_detection_timestamps'):
-                self._detection_timestamps = {}
-            
             # 検出クールダウンチェック
             if "high_frequency_trading" in self.last_manipulation_warning:
                 if (now - self.last_manipulation_warning["high_frequency_trading"]).total_seconds() < self.manipulation_cooldown:
@@ -852,8 +840,7 @@ class PriceCalculator:
                 .filter(
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
-                    ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 検出済みID除外
-                    ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
+                    self._unflagged_condition(),  # 検出済みID・永続フラグ除外
                     ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
                 ).scalar() or 0
                 
@@ -861,7 +848,7 @@ class PriceCalculator:
                 .filter(
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
-                    ~Transaction.id.in_(list(self.detected_transaction_ids))  # 検出済みトランザクションを除外
+                    self._unflagged_condition()  # 検出済みトランザクションを除外
                 ).scalar() or 0
             
             # ユーザーごとの平均取引回数
@@ -872,56 +859,8 @@ class PriceCalculator:
             if tx_per_user > 10:  # ユーザーあたり10回以上の取引は不自然
                 manipulation_score = min((tx_per_user - 10) / 5, 1.0)  # 10回を超えると徐々にスコア上昇
                 
-                # 高いマニピュレーションスコアで警告を送信（クールダウンが過ぎていれば）
-                should_send_warning = manipulation_score > 0.6 and self.bot
-                if should_send_warning:
-                    if "high_frequency_trading" not in self.last_manipulation_warning or \
-                    (now - self.last_manipulation_warning["high_frequency_trading"]).total_seconds() >= self.manipulation_cooldown:
-                        # 警告送信と時間記録
-                        self.last_manipulation_warning["high_frequency_trading"] = now
-                        
-                        # 高頻度取引ユーザーを特定
-                        high_frequency_users = db.query(
-                            Transaction.from_address, 
-                            func.count(Transaction.id).label('tx_count')
-                        ).filter(
-                            Transaction.timestamp >= day_ago,
-                            Transaction.transaction_type.in_(['buy', 'sell'])
-                        ).group_by(Transaction.from_address)\
-                        .having(func.count(Transaction.id) > 10)\
-                        .order_by(func.count(Transaction.id).desc())\
-                        .all()
-                        
-                        # 関連するトランザクションを検出対象として記録
-                        for addr, count in high_frequency_users:
-                            # この検出に関連するトランザクションIDを取得して記録
-                            recent_transactions = db.query(Transaction.id).filter(
-                                Transaction.from_address == addr,
-                                Transaction.timestamp >= day_ago,
-                                Transaction.transaction_type.in_(['buy', 'sell'])
-                            ).all()
-                            
-                            # トランザクションIDを記録（再検出防止）- ここを修正
-                            for tx in recent_transactions:
-                                self.detected_transaction_ids.add(tx.id)
-                                self._detection_timestamps[tx.id] = now  # タイムスタンプを記録
-                                
-                            # 検出済みアドレスとして記録
-                            self.detected_addresses[addr] = now
-                        
-                        details = (
-                            f"• 検出時刻: {now.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                            f"• 総取引数: {transactions}件\n"
-                            f"• ユニークユーザー数: {unique_users}人\n"
-                            f"• ユーザーあたり平均取引数: {tx_per_user:.1f}件\n"
-                            f"• 操作スコア: {manipulation_score:.2f}\n"
-                            f"• 高頻度取引ユーザー数: {len(high_frequency_users)}人"
-                        )
-                        
-                        asyncio.create_task(
-                            self._send_manipulation_warning("高頻度取引操作", details)
-                        )
-            
+                # 対象アドレスの検出とフラグ付けは取引の書き込み時にストリーム検出器が行う
+
             # 効果的な取引数（操作による影響を減らす）
             effective_tx = transactions / (1 + manipulation_score * 5)  # 高いマニピュレーションスコアで割引
                 
@@ -945,7 +884,7 @@ class PriceCalculator:
         """新規発行のインパクト計算"""
         try:
             # 24時間の新規発行量を取得
-            day_ago = datetime.now() - timedelta(days=1)
+            day_ago = self.clock.now() - timedelta(days=1)
             new_mints = db.query(func.sum(Transaction.amount))\
                 .filter(
                     Transaction.timestamp >= day_ago,
@@ -962,11 +901,10 @@ class PriceCalculator:
     def _calculate_transaction_effect(self, db: Session) -> float:
         """取引活性度による影響計算（市場操作防止機能付き）"""
         try:
-            day_ago = datetime.now() - timedelta(hours=24)
-            current_time = datetime.now()
+            day_ago = self.clock.now() - timedelta(hours=24)
             
-            # クリーンアップを実行
-            self._cleanup_detected_transactions()
+            # 同期・クリーンアップはティックの開始時に _detect_wash_trading で実行済み
+            # （要因は別スレッドで並列に動くので、ここでは検出状態を書き換えない）
             
             # デバッグログ：現在の永続フラグ数を出力
             self.logger.info(f"現在の永続フラグ数: {len(self.permanently_flagged_transactions)}")
@@ -984,34 +922,31 @@ class PriceCalculator:
                 .filter(
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
-                    ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                    ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 一時検出除外
-                    ~Transaction.id.in_(list(self.applied_transaction_effects)),  # 効果適用済み除外
+                    self._unflagged_condition(),  # 永続フラグ・一時検出を除外（flagged_transactionsとの反結合）
+                    Transaction.id > self.last_applied_transaction_id,  # 効果適用済み除外
                     ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
                 ).scalar() or 0
                 
-            # この計算で使用した通常の取引は「効果適用済み」として記録
-            normal_transactions = db.query(Transaction.id)\
+            # この計算で使用した通常の取引は「効果適用済み」として記録（最大IDを水位線として保持）
+            last_applied_id = db.query(func.max(Transaction.id))\
                 .filter(
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
-                    ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                    ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 一時検出除外
-                    ~Transaction.id.in_(list(self.applied_transaction_effects)),  # 効果適用済み除外
+                    self._unflagged_condition(),  # 永続フラグ・一時検出を除外（flagged_transactionsとの反結合）
+                    Transaction.id > self.last_applied_transaction_id,  # 効果適用済み除外
                     ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
-                ).all()
+                ).scalar()
             
             # 効果適用済みとして記録
-            for tx in normal_transactions:
-                self.applied_transaction_effects.add(tx.id)
+            if last_applied_id:
+                self.last_applied_transaction_id = last_applied_id
 
             # ユニークなウォレットアドレスの数を取得（検出済みアドレスと永続フラグを除外）
             unique_wallets = db.query(func.count(func.distinct(Transaction.from_address)))\
                 .filter(
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
-                    ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                    ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 一時検出除外
+                    self._unflagged_condition(),  # 永続フラグ・一時検出を除外（flagged_transactionsとの反結合）
                     ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
                 ).scalar() or 0
                 
@@ -1020,8 +955,7 @@ class PriceCalculator:
                 .filter(
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
-                    ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                    ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 一時検出除外
+                    self._unflagged_condition(),  # 永続フラグ・一時検出を除外（flagged_transactionsとの反結合）
                     ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
                 ).scalar() or 0
                 
@@ -1031,8 +965,7 @@ class PriceCalculator:
                     Transaction.timestamp >= day_ago,
                     Transaction.transaction_type.in_(['buy', 'sell']),
                     Transaction.amount < avg_transaction_size * 0.5,  # 平均の半分未満の取引
-                    ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                    ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 一時検出除外
+                    self._unflagged_condition(),  # 永続フラグ・一時検出を除外（flagged_transactionsとの反結合）
                     ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
                 ).scalar() or 0
             
@@ -1046,66 +979,8 @@ class PriceCalculator:
             if manipulation_risk:
                 self.logger.warning(f"市場操作の可能性を検出: 小口取引率={small_tx_ratio:.2f}, ユニークウォレット={unique_wallets}, 総取引={transactions}")
                 
-                # 警告をイベントチャンネルに送信（クールダウンが過ぎていれば）
-                if self.bot and (
-                    "small_distributed_trading" not in self.last_manipulation_warning or 
-                    (current_time - self.last_manipulation_warning["small_distributed_trading"]).total_seconds() >= self.manipulation_cooldown
-                ):
-                    # 小さな取引を多く行うユーザーを特定
-                    small_tx_users = db.query(
-                        Transaction.from_address, 
-                        func.count(Transaction.id).label('tx_count')
-                    ).filter(
-                        Transaction.timestamp >= day_ago,
-                        Transaction.transaction_type.in_(['buy', 'sell']),
-                        Transaction.amount < avg_transaction_size * 0.5,  # 平均の半分未満の取引
-                        ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                        ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
-                    ).group_by(Transaction.from_address)\
-                    .having(func.count(Transaction.id) > 5)\
-                    .all()
-                    
-                    # 検出対象のトランザクションIDリストを作成
-                    detected_tx_ids = []
-                    detected_addresses = []
-                    
-                    # 関連するトランザクションを検出対象として記録
-                    for addr, count in small_tx_users:
-                        # この検出に関連するトランザクションIDを取得して記録
-                        recent_transactions = db.query(Transaction.id).filter(
-                            Transaction.from_address == addr,
-                            Transaction.timestamp >= day_ago,
-                            Transaction.transaction_type.in_(['buy', 'sell']),
-                            Transaction.amount < avg_transaction_size * 0.5,  # 平均の半分未満の取引
-                            ~Transaction.id.in_(list(self.permanently_flagged_transactions))  # 永続フラグ除外
-                        ).all()
-                        
-                        # トランザクションIDをリストに追加
-                        for tx in recent_transactions:
-                            detected_tx_ids.append(tx.id)
-                        
-                        # 検出アドレスをリストに追加
-                        detected_addresses.append(addr)
-                    
-                    if detected_tx_ids:  # 検出したトランザクションがある場合のみ警告生成
-                        details = (
-                            f"• 検出時刻: {current_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                            f"• 総取引数: {transactions}件\n"
-                            f"• ユニークユーザー数: {unique_wallets}人\n"
-                            f"• 小口取引率: {small_tx_ratio:.2f}\n"
-                            f"• 平均取引サイズ: {avg_transaction_size:.2f} PARC\n"
-                            f"• 小口取引ユーザー数: {len(small_tx_users)}人\n"
-                            f"• 検出トランザクション数: {len(detected_tx_ids)}件"
-                        )
-                        
-                        # 共通の警告生成処理を使用（永続フラグ付け含む）
-                        warning_sent = self._generate_manipulation_warning(
-                            "small_distributed_trading",
-                            details,
-                            detected_tx_ids,
-                            detected_addresses
-                        )
-                    
+                # 対象アドレスの検出とフラグ付けは取引の書き込み時にストリーム検出器が行う
+
                 # 影響を大幅に削減（例: 通常の20%の影響に）
                 effective_transactions = transactions * 0.2
             else:
@@ -1128,7 +1003,7 @@ class PriceCalculator:
     def _calculate_inactivity_penalty(self, db: Session) -> float:
         """取引不活性によるペナルティ計算（操作防止対策付き）"""
         try:
-            hours_ago = datetime.now() - timedelta(hours=6)
+            hours_ago = self.clock.now() - timedelta(hours=6)
             
             # 取引件数とユニークユーザー数の両方を取得
             transaction_count = db.query(func.count(Transaction.id))\
@@ -1175,6 +1050,13 @@ class PriceCalculator:
         self._update_price_range(new_price)
         self.logger.info(f"Base price updated (legacy method) to: ¥{new_price:,.2f}")
 
+    def _calculate_event_factor(self) -> float:
+        """次のイベント変動を取り出して係数にする"""
+        event_change = self.event_manager.get_next_price_target() or 0.0  # None の場合は 0.0
+        if event_change != 0:
+            return self._calculate_event_impact(event_change)
+        return 1.0
+
     def _calculate_event_impact(self, event_change: float) -> float:
         """イベントの影響を計算"""
         try:
@@ -1203,7 +1085,7 @@ class PriceCalculator:
                 
                 # イベント終了時の通知
                 if not self.event_manager.remaining_effects:
-                    asyncio.create_task(
+                    self._schedule_coroutine(
                         self.event_manager._notify_event(event, is_final=True)
                     )
                     self.logger.info(
@@ -1221,7 +1103,7 @@ class PriceCalculator:
     def _calculate_noise_factor(self) -> float:
         """市場ノイズの計算（小さなランダム変動）"""
         # ノイズ幅を拡大：-0.8%から+0.8%のランダムなノイズ
-        noise = random.uniform(-0.008, 0.008)
+        noise = self.rng.uniform(-0.008, 0.008)
         
         # 価格帯に応じたノイズ調整
         if self._base_price >= 100.0:
@@ -1232,7 +1114,7 @@ class PriceCalculator:
             noise = noise * 1.2 + 0.002  # 最小-0.6%, 最大+1.0%
         
         # より細かい変動を追加
-        micro_noise = random.uniform(0.003, 0.006)
+        micro_noise = self.rng.uniform(0.003, 0.006)
         return 1.0 + noise + micro_noise
 
     def _calculate_short_term_fluctuation(self) -> float:
@@ -1259,7 +1141,7 @@ class PriceCalculator:
                 base_min = -0.015 * low_price_factor  # 低価格時は下振れが小さくなる
                 base_max = 0.012 * (2.0 - low_price_factor)  # 低価格時は上振れが大きくなる
             
-            base_fluctuation = random.uniform(base_min, base_max)
+            base_fluctuation = self.rng.uniform(base_min, base_max)
             
             # 急激な変動（スパイク）の確率と方向性を価格帯に応じて調整
             spike_chance = 0.12  # 基本確率を増加（8% → 12%）
@@ -1273,17 +1155,17 @@ class PriceCalculator:
                 up_chance = 0.5  # 通常時は50%の確率で上昇
 
             # スパイク強度も価格帯に応じて調整
-            if random.random() < spike_chance:
-                if random.random() < up_chance:
+            if self.rng.random() < spike_chance:
+                if self.rng.random() < up_chance:
                     # 上昇スパイク
-                    spike = random.uniform(0.002, 0.015)  # +0.2%～+1.5%
+                    spike = self.rng.uniform(0.002, 0.015)  # +0.2%～+1.5%
                 else:
                     # 下落スパイク
-                    spike = random.uniform(-0.025, -0.008)  # -2.5%～-0.8%
+                    spike = self.rng.uniform(-0.025, -0.008)  # -2.5%～-0.8%
                 base_fluctuation += spike
 
             # 周期変動の振幅を拡大
-            time_now = time.time()
+            time_now = self.clock.time()
             short_cycle = math.sin(time_now / 1800) * 0.008  # ±0.8%
             medium_cycle = math.cos(time_now / 7200) * 0.012  # ±1.2%
             long_cycle = math.sin(time_now / 28800) * 0.015  # ±1.5%
@@ -1300,12 +1182,12 @@ class PriceCalculator:
                 up_bias_chance = 0.2  # 20%の確率で上昇バイアス
                 down_bias_chance = 0.5  # 50%の確率で下落バイアス
                 
-                if random.random() < down_bias_chance:
-                    down_bias = -random.uniform(0.005, 0.015)  # -0.5%～-1.5%の下落バイアス
+                if self.rng.random() < down_bias_chance:
+                    down_bias = -self.rng.uniform(0.005, 0.015)  # -0.5%～-1.5%の下落バイアス
                     base_fluctuation += down_bias
             
-            if random.random() < up_bias_chance:
-                up_bias = random.uniform(0, up_bias_max)
+            if self.rng.random() < up_bias_chance:
+                up_bias = self.rng.uniform(0, up_bias_max)
             else:
                 up_bias = 0
 
@@ -1323,7 +1205,7 @@ class PriceCalculator:
                 return
 
             # 重複警告防止のための確認
-            current_time = datetime.now()
+            current_time = self.clock.now()
             
             # 時間ベースのキー (時間単位)
             time_key = f"{manipulation_type}_{current_time.strftime('%Y%m%d%H')}"
@@ -1338,8 +1220,8 @@ class PriceCalculator:
                 self.logger.info(f"重複警告のため送信をスキップ: {manipulation_type}")
                 return
 
-            # 処理済み記録を追加 (両方のキーを記録)
-            self.processed_warnings.add(time_key)
+            # 処理済み記録を追加 (時間キーは1時間、内容キーは1日保持)
+            self.processed_warnings.add(time_key, ttl=3600)
             self.processed_warnings.add(content_key)
             
             self.logger.info(f"市場操作警告を送信: {manipulation_type}")
@@ -1397,183 +1279,171 @@ class PriceCalculator:
             self.logger.error(f"市場操作警告送信エラー: {str(e)}", exc_info=True)
 
     def _detect_wash_trading(self, db: Session) -> bool:
-        """ウォッシュトレード（自己売買操作）の検出"""
-        try:
-            # クリーンアップを実行
-            self._cleanup_detected_transactions()
+        """ウォッシュトレード（自己売買操作）の検出
 
-            # クールダウンチェック
-            if self._is_in_cooldown("wash_trading"):
-                return False
-
-            # 3時間以内の取引を確認
-            hours_ago = datetime.now() - timedelta(hours=3)
-            current_time = datetime.now()
+        検出自体は取引の書き込み時にストリーム検出器が行うため、
+        ここでは前回のティック以降に警告が出たかどうかだけを返す。
+        """
+        try:
+            self._sync_permanent_flags(db)
+            self._cleanup_detected_transactions(db)
 
-            # デバッグログ：現在の永続フラグ数を出力
-            self.logger.info(f"ウォッシュトレード検出：現在の永続フラグ数: {len(self.permanently_flagged_transactions)}")
-            if self.permanently_flagged_transactions:
-                self.logger.debug(f"永続フラグID一覧: {list(self.permanently_flagged_transactions)[:5]}... 他{len(self.permanently_flagged_transactions)-5}件")
+            # 起動時のウォームアップに失敗していれば、ここで直近の取引を流し込む
+            self.warm_manipulation_detector(db)
 
-            # 検出アドレスリストを準備
-            detected_addresses_list = list(self.detected_addresses.keys())
+            detected = self._pending_wash_detection
+            self._pending_wash_detection = False
+            if detected:
+                self.logger.warning("ウォッシュトレード検出: 前回の価格計算以降に警告が発行されました")
+            return detected
 
-            # アドレスごとの買い取引と売り取引の量を集計
-            # 以下の順に除外条件を適用:
-            # 1. 永続的にフラグ付けされたトランザクションを除外
-            # 2. 検出済み（市場操作と判定）のトランザクションIDを除外
-            # 3. 検出済みアドレスの取引を除外
-            address_stats = db.query(
-                Transaction.from_address,
-                func.sum(case((Transaction.transaction_type == 'buy', Transaction.amount), else_=0)).label('buy_amount'),
-                func.sum(case((Transaction.transaction_type == 'sell', Transaction.amount), else_=0)).label('sell_amount'),
-                func.count(Transaction.id).label('tx_count')
-            ).filter(
-                Transaction.timestamp >= hours_ago,
-                Transaction.transaction_type.in_(['buy', 'sell']),
-                ~Transaction.id.in_(list(self.permanently_flagged_transactions)),  # 永続フラグ除外
-                ~Transaction.id.in_(list(self.detected_transaction_ids)),  # 一時検出除外
-                ~Transaction.from_address.in_(detected_addresses_list) if detected_addresses_list else True  # 検出済みアドレス除外
-            ).group_by(Transaction.from_address).all()
-            
-            # ウォッシュトレードの可能性がある取引を検出
-            for addr, buy_amount, sell_amount, tx_count in address_stats:
-                # 同一アドレスが短時間に多数の売買を行っている場合
-                if tx_count > 10 and buy_amount > 0 and sell_amount > 0:
-                    # 売買金額の差が小さい場合はウォッシュトレードの可能性
-                    ratio = min(buy_amount, sell_amount) / max(buy_amount, sell_amount)
-                    if ratio > 0.7:  # 70%以上の売買一致率
-                        self.logger.debug(f"ウォッシュトレード検出候補 - アドレス: {addr}, 購入量: {buy_amount:.2f}, 売却量: {sell_amount:.2f}, 比率: {ratio:.2f}")
-                        # 関連するトランザクションIDを取得（永続フラグを除外）
-                        recent_transactions = db.query(Transaction.id).filter(
-                            Transaction.from_address == addr,
-                            Transaction.timestamp >= hours_ago,
-                            Transaction.transaction_type.in_(['buy', 'sell']),
-                            ~Transaction.id.in_(list(self.permanently_flagged_transactions))  # 永続フラグを除外
-                        ).all()
-                        
-                        # 取得したトランザクションIDをリスト化
-                        tx_ids = [tx.id for tx in recent_transactions]
-                        
-                        # 検出対象のトランザクションがない場合はスキップ
-                        if not tx_ids:
-                            self.logger.info(f"アドレス {addr} はウォッシュトレードの疑いがありますが、未検出のトランザクションが見つかりません")
-                            continue
-                        
-                        # ユーザー情報取得
-                        user = db.query(User).join(Wallet).filter(Wallet.address == addr).first()
-                        user_id = user.discord_id if user else "不明"
-                        
-                        # 警告詳細の作成
-                        details = (
-                            f"• ユーザーID: {user_id}\n"
-                            f"• ウォレットアドレス: {addr}\n"
-                            f"• 検出時刻: {current_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                            f"• 取引回数: {tx_count}回\n"
-                            f"• 購入量: {buy_amount:.2f} PARC\n"
-                            f"• 売却量: {sell_amount:.2f} PARC\n"
-                            f"• 売買一致率: {ratio:.2f}\n"
-                            f"• 検出トランザクション数: {len(tx_ids)}件"
-                        )
-                        
-                        # 共通の警告生成処理を使用
-                        warning_sent = self._generate_manipulation_warning(
-                            "wash_trading",
-                            details,
-                            tx_ids,
-                            [addr]
-                        )
-                        
-                        # 警告が実際に送信された場合のみTrueを返す
-                        if warning_sent:
-                            self.logger.warning(f"ウォッシュトレード検出: アドレス {addr} の {len(tx_ids)} 件のトランザクションをフラグ付けしました")
-                            return True
-            
-            return False
-            
         except Exception as e:
             self.logger.error(f"ウォッシュトレード検出エラー: {str(e)}")
             return False
 
-    def _cleanup_detected_transactions(self):
-        """古い検出データをクリーンアップ"""
+    def observe_trade(self, db: Session, tx_id: int, side: str, address: str, amount: float,
+                      timestamp: datetime = None) -> bool:
+        """書き込まれた売買を検出器へ渡し、検出されればフラグ付けと警告を行う"""
         try:
-            current_time = datetime.now()
-            
-            # 最後のクリーンアップから1時間以上経過している場合のみ実行
-            if hasattr(self, 'last_warnings_cleanup') and \
-            (current_time - self.last_warnings_cleanup).total_seconds() < 3600:
-                return
-            
-            # permanently_flagged_transactions はクリーンアップしない（永続的に維持）
-            
-            # 長期間経過したトランザクションの効果適用フラグをクリア（週に1回程度）
-            if random.random() < 0.05:  # 5%の確率で実行（負荷軽減のため）
-                self.applied_transaction_effects = set()
-                self.logger.info("適用済み効果トランザクションIDをリセットしました")
-
-            # _detection_timestampsがなければ初期化
-            if not hasattr(self, '_detection_timestamps'):
-                self._detection_timestamps = {}
-
-            # 期限切れのトランザクションIDを特定
-            expired_ids = []
-            for tx_id, timestamp in self._detection_timestamps.items():
-                if (current_time - timestamp).total_seconds() >= self.detection_expiry:
-                    expired_ids.append(tx_id)
-            
-            # 期限切れのIDをセットから削除
-            for tx_id in expired_ids:
-                if tx_id in self.detected_transaction_ids:
-                    self.detected_transaction_ids.remove(tx_id)
-                if tx_id in self._detection_timestamps:
-                    del self._detection_timestamps[tx_id]
-                    
-            # 期限切れのアドレスも削除
-            expired_addresses = []
-            for addr, timestamp in self.detected_addresses.items():
-                if (current_time - timestamp).total_seconds() >= self.detection_expiry:
-                    expired_addresses.append(addr)
-                    
-            for addr in expired_addresses:
-                if addr in self.detected_addresses:
-                    del self.detected_addresses[addr]
-                    
-            # 処理済み警告のクリーンアップを改善
-            day_ago = current_time - timedelta(days=3)  # 3日前
-            old_warnings = set()
-            for warning_id in self.processed_warnings:
-                try:
-                    if '_' in warning_id:
-                        parts = warning_id.split('_')
-                        if len(parts) >= 2:
-                            # 時間ベースのキーの場合（YYYYMMDDHHフォーマット）
-                            if parts[1].isdigit() and len(parts[1]) >= 8:
-                                date_str = parts[1][:8]  # YYYYMMDDの部分を取得
-                                warning_date = datetime.strptime(date_str, '%Y%m%d')
-                                if warning_date < day_ago:
-                                    old_warnings.add(warning_id)
-                            # ハッシュベースのキーの場合はタイムスタンプを確認
-                            elif len(parts) >= 3 and parts[2].isdigit():
-                                date_str = parts[2][:8]  # YYYYMMDDの部分
-                                warning_date = datetime.strptime(date_str, '%Y%m%d')
-                                if warning_date < day_ago:
-                                    old_warnings.add(warning_id)
-                except Exception:
-                    continue
-                    
-            # 古い処理済み警告を削除
-            for warning_id in old_warnings:
-                if warning_id in self.processed_warnings:
-                    self.processed_warnings.remove(warning_id)
-                
-            self.last_warnings_cleanup = current_time
+            with self._detector_lock:
+                if not self._detector_warmed:
+                    # 起動時のウォームアップに失敗していた場合だけ。この取引もDBから読み込まれる
+                    self._warm_manipulation_detector(db)
+                    return False
+                detections = self.manipulation_detector.observe(tx_id, side, address, amount, timestamp or self.clock.now())
+                return self._handle_detections(db, detections)
+        except Exception as e:
+            self.logger.error(f"取引ストリーム検出エラー: {str(e)}")
+            return False
+
+    def warm_manipulation_detector(self, db: Session):
+        """検出器がまだ空なら直近の取引で埋める（Bot起動時に DB スレッドで呼ぶ）"""
+        with self._detector_lock:
+            if not self._detector_warmed:
+                self._warm_manipulation_detector(db)
+
+    def _warm_manipulation_detector(self, db: Session):
+        """直近24時間の未フラグ取引を検出器へ流し込む"""
+        since = self.clock.now() - StreamingManipulationDetector.RECENT_WINDOW
+        rows = db.query(
+            Transaction.id,
+            Transaction.transaction_type,
+            Transaction.from_address,
+            Transaction.to_address,
+            Transaction.amount,
+            Transaction.timestamp
+        ).filter(
+            Transaction.timestamp >= since,
+            Transaction.transaction_type.in_(['buy', 'sell']),
+            self._unflagged_condition()
+        ).order_by(Transaction.timestamp.asc(), Transaction.id.asc())\
+            .yield_per(1000)
+
+        detections = []
+        for tx_id, side, from_address, to_address, amount, timestamp in rows:
+            # 買いは受取側、売りは送金側のウォレットを取引主体とする
+            address = to_address if side == 'buy' else from_address
+            detections.extend(self.manipulation_detector.observe(tx_id, side, address, amount, timestamp))
+
+        self._detector_warmed = True
+        self.logger.info(f"市場操作検出器をウォームアップしました: {self.manipulation_detector.stats()}")
+        self._handle_detections(db, detections)
+
+    def _handle_detections(self, db: Session, detections: list) -> bool:
+        """検出結果ごとに警告を生成（クールダウン中は一時検出として記録のみ）"""
+        any_sent = False
+        now = self.clock.now()
+        for detection in detections:
+            if not detection.transaction_ids:
+                continue
+            user = db.query(User).join(Wallet).filter(Wallet.address == detection.address).first()
+            user_id = user.discord_id if user else "不明"
+            details = self._format_detection_details(detection, user_id, now)
+
+            sent = self._generate_manipulation_warning(
+                detection.manipulation_type,
+                details,
+                detection.transaction_ids,
+                [detection.address],
+                db=db
+            )
+            if sent:
+                any_sent = True
+                if detection.manipulation_type == "wash_trading":
+                    self._pending_wash_detection = True
+                self.logger.warning(
+                    f"{detection.manipulation_type}検出: アドレス {detection.address} の "
+                    f"{len(detection.transaction_ids)} 件のトランザクションをフラグ付けしました"
+                )
+            else:
+                # 警告は抑止しても、価格計算からは検出期間のあいだ除外する
+                for tx_id in detection.transaction_ids:
+                    self.detected_transaction_ids.add(tx_id)
+                self.detected_addresses.add(detection.address, now)
+                self._record_flags(
+                    db,
+                    detection.transaction_ids,
+                    detection.manipulation_type,
+                    expires_at=now + timedelta(seconds=self.detection_expiry)
+                )
+        return any_sent
+
+    @staticmethod
+    def _format_detection_details(detection, user_id: str, now: datetime) -> str:
+        """検出結果を警告用の詳細テキストに整形"""
+        stats = detection.stats
+        lines = [
+            f"• ユーザーID: {user_id}",
+            f"• ウォレットアドレス: {detection.address}",
+            f"• 検出時刻: {now.strftime('%Y-%m-%d %H:%M:%S')}",
+        ]
+        if detection.manipulation_type == "wash_trading":
+            lines += [
+                f"• 取引回数: {stats['tx_count']}回",
+                f"• 購入量: {stats['buy_amount']:.2f} PARC",
+                f"• 売却量: {stats['sell_amount']:.2f} PARC",
+                f"• 売買一致率: {stats['ratio']:.2f}",
+            ]
+        elif detection.manipulation_type == "high_frequency_trading":
+            lines += [
+                f"• 総取引数: {stats['total_transactions']}件",
+                f"• ユニークユーザー数: {stats['unique_users']}人",
+                f"• ユーザーあたり平均取引数: {stats['tx_per_user']:.1f}件",
+                f"• 操作スコア: {stats['score']:.2f}",
+            ]
+        else:
+            lines += [
+                f"• 総取引数: {stats['total_transactions']}件",
+                f"• ユニークユーザー数: {stats['unique_users']}人",
+                f"• 小口取引率: {stats['small_ratio']:.2f}",
+                f"• 平均取引サイズ: {stats['avg_amount']:.2f} PARC",
+            ]
+        if stats.get('avg_interval'):
+            lines.append(f"• 平均取引間隔: {stats['avg_interval']:.1f}秒")
+        lines.append(f"• 検出トランザクション数: {len(detection.transaction_ids)}件")
+        return "\n".join(lines)
+
+    def _cleanup_detected_transactions(self, db: Session = None):
+        """古い検出データをクリーンアップ（期限切れは索引の先頭から一定件数ずつ削除）"""
+        try:
+            budget = self.DETECTION_CLEANUP_BUDGET
+            expired_ids = self.detected_transaction_ids.expire(budget=budget)
+            expired_addresses = self.detected_addresses.expire(budget=budget)
+            old_warnings = self.processed_warnings.expire(budget=budget)
             if expired_ids or expired_addresses or old_warnings:
                 self.logger.info(
-                    f"検出データクリーンアップ完了: {len(expired_ids)}件のトランザクション、"
-                    f"{len(expired_addresses)}件のアドレス、{len(old_warnings)}件の警告IDを削除"
+                    f"検出データクリーンアップ完了: {expired_ids}件のトランザクション、"
+                    f"{expired_addresses}件のアドレス、{old_warnings}件の警告IDを削除"
                 )
-            
+
+            # permanently_flagged_transactions はクリーンアップしない（永続的に維持）
+
+            # flagged_transactionsの期限切れ一時フラグは1時間ごとに削除
+            current_time = self.clock.now()
+            if db is not None and (current_time - self.last_warnings_cleanup).total_seconds() >= 3600:
+                self._purge_expired_flags(db)
+                self.last_warnings_cleanup = current_time
+
         except Exception as e:
             self.logger.error(f"検出データクリーンアップエラー: {str(e)}")
 
@@ -1586,27 +1456,26 @@ class PriceCalculator:
             # 検出結果を記録
             for tx_id in transaction_data.get('transaction_ids', []):
                 self.detected_transaction_ids.add(tx_id)
-                self._detection_timestamps[tx_id] = datetime.now()
                 
             # 送信すべき警告があるか判定
             should_send_warning = (
                 manipulation_type not in self.last_manipulation_warning or
-                (datetime.now() - self.last_manipulation_warning[manipulation_type]).total_seconds() >= self.manipulation_cooldown
+                (self.clock.now() - self.last_manipulation_warning[manipulation_type]).total_seconds() >= self.manipulation_cooldown
             )
             
             if should_send_warning and self.bot:
                 # 警告送信をキュー
                 warning_details = transaction_data.get('details', '')
-                asyncio.create_task(
+                self._schedule_coroutine(
                     self._send_manipulation_warning(manipulation_type, warning_details)
                 )
-                self.last_manipulation_warning[manipulation_type] = datetime.now()
+                self.last_manipulation_warning[manipulation_type] = self.clock.now()
         
         return detected
 
     def _is_in_cooldown(self, manipulation_type: str) -> bool:
         """同種の警告がクールダウン中かどうかを判定"""
-        current_time = datetime.now()
+        current_time = self.clock.now()
         
         if manipulation_type in self.last_manipulation_warning:
             elapsed = (current_time - self.last_manipulation_warning[manipulation_type]).total_seconds()
@@ -1616,11 +1485,11 @@ class PriceCalculator:
 
         return False
 
-    def _generate_manipulation_warning(self, manipulation_type: str, details: str, transaction_ids: list, addresses: list) -> bool:
+    def _generate_manipulation_warning(self, manipulation_type: str, details: str, transaction_ids: list, addresses: list, db: Session = None) -> bool:
         """操作検出時の警告生成を一元化"""
         try:
             # 1. クールダウンチェック
-            current_time = datetime.now()
+            current_time = self.clock.now()
             if manipulation_type in self.last_manipulation_warning:
                 elapsed = (current_time - self.last_manipulation_warning[manipulation_type]).total_seconds()
                 if elapsed < self.manipulation_cooldown:
@@ -1634,7 +1503,7 @@ class PriceCalculator:
             self.logger.debug(f"永続フラグ追加前 - クラス変数: {len(self.__class__._permanently_flagged_transactions)}件, プロパティ: {len(self.permanently_flagged_transactions)}件")
             
             # 既に永続フラグ付けされているトランザクションかどうかをチェック
-            already_flagged = set(str(tx_id) for tx_id in transaction_ids).intersection(self.permanently_flagged_transactions)
+            already_flagged = [tx_id for tx_id in transaction_ids if int(tx_id) in self.permanently_flagged_transactions]
             if already_flagged:
                 self.logger.info(f"{len(already_flagged)}件のトランザクションは既にフラグ付け済みのため、再検出をスキップします")
                 return False
@@ -1643,34 +1512,30 @@ class PriceCalculator:
             self.logger.debug(f"フラグに追加するID: {transaction_ids[:5] if len(transaction_ids) > 5 else transaction_ids}")
             
             # 3. トランザクションIDを記録（一時的な検出と永続的なフラグ付けの両方）
-            before_count = len(self.permanently_flagged_transactions)
-            
             for tx_id in transaction_ids:
-                # 文字列に変換して一貫性を保証
-                str_tx_id = str(tx_id)
-                self.detected_transaction_ids.add(str_tx_id)
-                self._detection_timestamps[str_tx_id] = current_time
-                # クラス変数に直接アクセス
-                self.__class__._permanently_flagged_transactions.add(str_tx_id)  # 永続的にフラグ付け
-            
-            after_count = len(self.permanently_flagged_transactions)
-            added_count = after_count - before_count
+                # Transaction.idと同じ整数で保持
+                self.detected_transaction_ids.add(int(tx_id))
+            # 永続的にフラグ付け（FlagStoreではジャーナルへの追記のみ）
+            added_count = self.permanently_flagged_transactions.update(int(tx_id) for tx_id in transaction_ids)
+            if added_count is None:  # 読み込みに失敗してsetのままの場合
+                added_count = len(transaction_ids)
             
             self.logger.debug(f"永続フラグに追加した後: クラス変数={len(self.__class__._permanently_flagged_transactions)}件, プロパティ={len(self.permanently_flagged_transactions)}件")
             self.logger.debug(f"追加件数: {added_count}件 (期待: {len(transaction_ids)}件)")
 
             self.logger.info(f"{manipulation_type}: {added_count}件のトランザクションを永続的にフラグ付けしました")
 
-            # 永続フラグが更新されたら即座に保存
-            self._save_permanent_flags()
+            # 永続フラグが更新されたら即座に反映（ファイルは追加時にジャーナルへ追記済み）
+            if db is not None:
+                self._record_flags(db, transaction_ids, manipulation_type)
 
             # 4. アドレスを記録
             for addr in addresses:
-                self.detected_addresses[addr] = current_time
+                self.detected_addresses.add(addr, current_time)
 
             # 5. 警告送信
             if self.bot:
-                asyncio.create_task(
+                self._schedule_coroutine(
                     self._send_manipulation_warning(manipulation_type, details)
                 )
             
@@ -1700,103 +1565,143 @@ class PriceCalculator:
         
         return features
 
+    def _unflagged_condition(self, permanent_only: bool = False):
+        """フラグ付きトランザクションを除外する条件（flagged_transactionsとのNOT EXISTS反結合）"""
+        conditions = [FlaggedTransaction.transaction_id == Transaction.id]
+        if permanent_only:
+            conditions.append(FlaggedTransaction.expires_at.is_(None))
+        else:
+            conditions.append(or_(
+                FlaggedTransaction.expires_at.is_(None),
+                FlaggedTransaction.expires_at > self.clock.now()
+            ))
+        return ~exists().where(*conditions)
+
+    def _record_flags(self, db: Session, transaction_ids: list, flag_type: str, expires_at: datetime = None):
+        """検出したトランザクションをflagged_transactionsへ記録（expires_atがNoneなら永続）"""
+        tx_ids = sorted(set(int(tx_id) for tx_id in transaction_ids))
+        if not tx_ids:
+            return
+        try:
+            existing = db.query(FlaggedTransaction)\
+                .filter(FlaggedTransaction.transaction_id.in_(tx_ids))\
+                .all()
+            existing_ids = set()
+            for flag in existing:
+                existing_ids.add(flag.transaction_id)
+                # 永続フラグは一時検出で上書きしない
+                if flag.expires_at is not None:
+                    if expires_at is None or flag.expires_at < expires_at:
+                        flag.expires_at = expires_at
+                        flag.flag_type = flag_type
+
+            now = self.clock.now()
+            new_rows = [
+                {
+                    'transaction_id': tx_id,
+                    'flag_type': flag_type,
+                    'flagged_at': now,
+                    'expires_at': expires_at,
+                }
+                for tx_id in tx_ids if tx_id not in existing_ids
+            ]
+            if new_rows:
+                db.execute(insert(FlaggedTransaction), new_rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.logger.error(f"フラグ記録エラー: {str(e)}")
+
+    def _sync_permanent_flags(self, db: Session):
+        """ファイルの永続フラグとflagged_transactionsを一度だけ突き合わせる"""
+        if self._flags_synced:
+            return
+        try:
+            stored_ids = {
+                row[0] for row in db.query(FlaggedTransaction.transaction_id)
+                .filter(FlaggedTransaction.expires_at.is_(None))
+            }
+            file_ids = set(self.permanently_flagged_transactions)
+            missing = file_ids - stored_ids
+            if missing:
+                self._record_flags(db, list(missing), "permanent")
+                self.logger.info(f"{len(missing)}件の永続フラグをflagged_transactionsへ反映しました")
+            # DBにのみ存在するフラグもメモリへ取り込む
+            self.permanently_flagged_transactions.update(stored_ids)
+            self._flags_synced = True
+        except Exception as e:
+            self.logger.error(f"永続フラグ同期エラー: {str(e)}")
+
+    def _purge_expired_flags(self, db: Session):
+        """期限切れの一時検出フラグを削除"""
+        try:
+            deleted = db.query(FlaggedTransaction)\
+                .filter(
+                    FlaggedTransaction.expires_at.isnot(None),
+                    FlaggedTransaction.expires_at <= self.clock.now()
+                ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        except Exception as e:
+            db.rollback()
+            self.logger.error(f"期限切れフラグ削除エラー: {str(e)}")
+            return 0
+
+    def _flag_data_dir(self) -> str:
+        """永続フラグを保存するディレクトリ"""
+        # カレントディレクトリをチェック
+        if os.path.isdir("data"):
+            # 後から作業ディレクトリが変わっても同じ場所に書くよう絶対パスにする
+            return os.path.abspath("data")
+        # 相対パスでも見つからない場合は絶対パスを試す
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        flag_dir = os.path.join(base_dir, 'data')
+        os.makedirs(flag_dir, exist_ok=True)
+        return flag_dir
+
     def _load_permanent_flags(self):
         """永続的なフラグリストを読み込む"""
         try:
-            # カレントディレクトリをチェック
-            if os.path.isdir("data"):
-                flag_file = 'data/permanent_flags.json'
-            else:
-                # 相対パスでも見つからない場合は絶対パスを試す
-                base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                flag_file = os.path.join(base_dir, 'data', 'permanent_flags.json')
-                os.makedirs(os.path.dirname(flag_file), exist_ok=True)
-            
-            if os.path.exists(flag_file):
-                with open(flag_file, 'r') as f:
-                    data = json.load(f)
-                    # すべての要素を文字列として扱う
-                    tx_list = [str(tx) for tx in data.get('transactions', [])]
-                    
-                    # クラス変数に直接設定する（プロパティではなく）
-                    self.__class__._permanently_flagged_transactions = set(tx_list)
-                    self.logger.info(f"{len(self.__class__._permanently_flagged_transactions)}件の永続的にフラグ付けされたトランザクションを読み込みました")
-                    
-                    # 読み込んだ内容を表示（デバッグ用）
-                    if self.__class__._permanently_flagged_transactions:
-                        sample = list(self.__class__._permanently_flagged_transactions)[:3]
-                        self.logger.debug(f"読み込みサンプル: {sample}")
-            else:
-                self.logger.info(f"永続フラグファイル {flag_file} が見つかりません。新規に作成します。")
+            store = FlagStore(self._flag_data_dir())
+            count = store.load()
+            # クラス変数に直接設定する（プロパティではなく）
+            self.__class__._permanently_flagged_transactions = store
+            self.logger.info(f"{count}件の永続的にフラグ付けされたトランザクションを読み込みました: {store.snapshot_path}")
         except Exception as e:
             self.logger.error(f"永続的フラグの読み込みエラー: {str(e)}")
 
-    def _save_permanent_flags(self):
-        """永続的なフラグリストを保存する"""
+    def _save_permanent_flags(self, compact: bool = False):
+        """永続的なフラグリストを保存する（ジャーナルの同期、compact=Trueでスナップショットへ統合）"""
         try:
-            # 保存前のデバッグ情報
-            pft = getattr(self.__class__, '_permanently_flagged_transactions', set())
-            self.logger.info(f"保存前デバッグ: クラス変数内の永続フラグ数: {len(pft)}")
-            
-            # ファイルパスの解決
-            if os.path.isdir("data"):
-                flag_file = 'data/permanent_flags.json'
-            else:
-                # 相対パスでも見つからない場合は絶対パスを試す
-                base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                flag_dir = os.path.join(base_dir, 'data')
-                os.makedirs(flag_dir, exist_ok=True)
-                flag_file = os.path.join(flag_dir, 'permanent_flags.json')
-            
-            # すべての要素を文字列として保存
-            tx_list = [str(tx) for tx in self.permanently_flagged_transactions]
-            
-            # ファイルに保存
-            with open(flag_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'transactions': tx_list
-                }, f, ensure_ascii=False, indent=2)
-                
-            self.logger.info(f"{len(tx_list)}件の永続的にフラグ付けされたトランザクションを保存しました: {flag_file}")
-            
-            # 保存内容を表示（デバッグ用）
-            if tx_list:
-                sample = tx_list[:min(3, len(tx_list))]
-                self.logger.debug(f"保存サンプル: {sample}")
-                
+            store = self.permanently_flagged_transactions
+            if not isinstance(store, FlagStore):
+                # 読み込みに失敗していた場合はここでストアを作り直す
+                flagged = list(store)
+                self._load_permanent_flags()
+                store = self.permanently_flagged_transactions
+                store.update(flagged)
+            store.flush(compact=compact)
+            self.logger.info(f"{len(store)}件の永続的にフラグ付けされたトランザクションを保存しました")
         except Exception as e:
             self.logger.error(f"永続的フラグの保存エラー: {str(e)}", exc_info=True)
 
     def _test_permanent_flags(self):
         """永続フラグの保存/読込処理をテスト"""
         try:
-            # テストIDを追加
-            test_id = f"test_{int(time.time())}"
-            self.__class__._permanently_flagged_transactions.add(test_id)
-            
-            # 保存前のカウント
-            before_save = len(self.permanently_flagged_transactions)
+            store = self.permanently_flagged_transactions
+            before_save = len(store)
             self.logger.info(f"保存前のフラグ数: {before_save}件")
-            
-            # 保存
+
+            # 保存して別インスタンスで読み直す
             self._save_permanent_flags()
-            
-            # 現在のセットをクリア (読込テスト用)
-            old_set = self.__class__._permanently_flagged_transactions.copy()
-            self.__class__._permanently_flagged_transactions.clear()
-            
-            # 読み込み
-            self._load_permanent_flags()
-            after_load = len(self.permanently_flagged_transactions)
-            
+            reloaded = FlagStore(store.directory)
+            after_load = reloaded.load()
+            reloaded.close()
+
             self.logger.info(f"読込後のフラグ数: {after_load}件")
-            
-            # 以前の状態に戻す
             if after_load != before_save:
-                self.__class__._permanently_flagged_transactions = old_set
-                self._save_permanent_flags()
-                self.logger.warning("フラグの保存/読込でカウントが一致しないため元に戻しました")
-            
+                self.logger.warning("フラグの保存/読込でカウントが一致しません")
+
         except Exception as e:
             self.logger.error(f"永続フラグテストエラー: {str(e)}", exc_info=True)
 
@@ -1812,12 +1717,12 @@ class PriceCalculator:
             base_weight = 0.5  # 中心付近に価格が集まる確率
             
             # 重み付きランダム選択（中心に近い価格が出やすい）
-            if random.random() < base_weight:
+            if self.rng.random() < base_weight:
                 # 中心付近の価格
-                price = self._base_price + random.uniform(-0.03, 0.03) * self._base_price
+                price = self._base_price + self.rng.uniform(-0.03, 0.03) * self._base_price
             else:
                 # 範囲全体でのランダム価格
-                price = random.uniform(min_price, max_price)
+                price = self.rng.uniform(min_price, max_price)
             
             # 価格を範囲内に制限
             price = max(min(price, max_price), min_price)
@@ -1825,7 +1730,7 @@ class PriceCalculator:
             price = round(price, 2)
             
             self.current_random_price = price
-            self.last_random_price_update = datetime.now()
+            self.last_random_price_update = self.clock.now()
             
             self.logger.debug(f"ランダム価格を生成: {price}")
             return price
@@ -1833,20 +1738,20 @@ class PriceCalculator:
         except Exception as e:
             self.logger.error(f"ランダム価格生成エラー: {e}")
             # エラーの場合は基本価格を中心に小さな変動を持つ価格を生成
-            return round(self._base_price * (1 + random.uniform(-0.01, 0.01)), 2)
+            return round(self._base_price * (1 + self.rng.uniform(-0.01, 0.01)), 2)
 
     def get_current_random_price(self):
         """現在のランダム価格を取得（必要に応じて更新）"""
-        now = datetime.now()
+        now = self.clock.now()
         if not self.random_prices or (now - self.last_random_price_update).total_seconds() >= self.random_price_update_interval:
             self.generate_random_prices()
         
         # ランダムな価格を1つ選択
-        return random.choice(self.random_prices) if self.random_prices else self._base_price
+        return float(self.rng.choice(self.random_prices)) if self.random_prices else self._base_price
 
     def get_all_random_prices(self):
         """すべてのランダム価格を取得（必要に応じて更新）"""
-        now = datetime.now()
+        now = self.clock.now()
         if not self.random_prices or (now - self.last_random_price_update).total_seconds() >= self.random_price_update_interval:
             self.generate_random_prices()
         
@@ -1877,13 +1782,13 @@ class PriceCalculator:
                 base_weight = 0.5  # 中心付近に価格が集まる確率
                 
                 # 重み付きランダム選択（中心に近い価格が出やすい）
-                if random.random() < base_weight:
+                if self.rng.random() < base_weight:
                     # 中心付近の価格（バイアス付き）
                     biased_center = self._base_price * (1 + center_bias)
-                    price = biased_center + random.uniform(-0.04, 0.04) * self._base_price
+                    price = biased_center + self.rng.uniform(-0.04, 0.04) * self._base_price
                 else:
                     # 範囲全体でのランダム価格
-                    price = random.uniform(min_price, max_price)
+                    price = self.rng.uniform(min_price, max_price)
                 
                 # 価格を範囲内に制限
                 price = max(min(price, max_price), min_price)
@@ -1893,10 +1798,10 @@ class PriceCalculator:
             
             # 最新のランダム価格を更新
             self.random_prices = prices
-            self.last_random_price_update = datetime.now()
+            self.last_random_price_update = self.clock.now()
             
             # 単一の現在価格も更新（ランダムリストの中から選ぶ）
-            self.current_random_price = random.choice(prices)
+            self.current_random_price = float(self.rng.choice(prices))
             
             self.logger.debug(f"{count}個のランダム価格を生成: {prices}")
             return prices
@@ -1904,7 +1809,7 @@ class PriceCalculator:
         except Exception as e:
             self.logger.error(f"ランダム価格生成エラー: {e}")
             # エラーの場合は基本価格を中心に小さな変動を持つ価格リストを生成
-            fallback_prices = [round(self._base_price * (1 + random.uniform(-0.01, 0.01)), 2) for _ in range(count)]
+            fallback_prices = [round(self._base_price * (1 + self.rng.uniform(-0.01, 0.01)), 2) for _ in range(count)]
             self.random_prices = fallback_prices
             self.current_random_price = fallback_prices[0]
             return fallback_prices
@@ -1926,44 +1831,38 @@ class PriceCalculator:
             'change': ((current - self._base_price) / self._base_price) * 100
         }
 
-    def _save_price_state(self):
-        """現在の価格状態をファイルに保存"""
+    def _save_price_state(self, force: bool = False):
+        """現在の価格状態をチェックポイントとして保存（短い間隔の保存はまとめて書き込む）"""
         try:
-            price_state_file = "data/price_state.json"
-            os.makedirs(os.path.dirname(price_state_file), exist_ok=True)
-            
-            state_data = {
+            self.price_checkpointer.save({
                 "base_price": self._base_price,
                 "min_price": self._price_range['min'],
                 "max_price": self._price_range['max'],
-                "saved_at": datetime.now().isoformat()
-            }
-            
-            with open(price_state_file, "w") as f:
-                json.dump(state_data, f, indent=2)
-                
-            self.logger.info(f"価格状態を保存しました: ¥{self._base_price:,.2f}")
+                "current_random_price": getattr(self, 'current_random_price', self._base_price),
+            }, force=force)
+            self.logger.debug(f"価格状態を保存しました: ¥{self._base_price:,.2f}")
         except Exception as e:
             self.logger.error(f"価格状態の保存エラー: {e}")
 
     def _load_price_state(self):
-        """保存された価格状態を読み込む"""
+        """保存された価格状態を検証して読み込む（不正なら呼び出し側で価格履歴から再構築）"""
         try:
-            price_state_file = "data/price_state.json"
-            if os.path.exists(price_state_file):
-                with open(price_state_file, "r") as f:
-                    price_state = json.load(f)
-                    
-                if "base_price" in price_state:
-                    self._base_price = float(price_state["base_price"])
-                    self._price_range = {
-                        'min': float(price_state["min_price"]),
-                        'max': float(price_state["max_price"])
-                    }
-                    self.logger.info(f"保存された価格状態を読み込みました: ¥{self._base_price:,.2f}")
-                    return True
-                    
-            return False
+            price_state = self.price_checkpointer.load()
+            if not price_state:
+                return False
+
+            self._base_price = float(price_state["base_price"])
+            self._price_range = {
+                'min': float(price_state["min_price"]),
+                'max': float(price_state["max_price"])
+            }
+            current_random_price = price_state.get("current_random_price")
+            if current_random_price and self._price_range['min'] * 0.5 <= float(current_random_price) <= self._price_range['max'] * 1.5:
+                self.current_random_price = float(current_random_price)
+            else:
+                self.current_random_price = self._base_price
+            self.logger.info(f"保存された価格状態を読み込みました: ¥{self._base_price:,.2f}")
+            return True
         except Exception as e:
             self.logger.error(f"価格状態読み込みエラー: {e}")
             return False
@@ -1986,9 +1885,8 @@ class PriceCalculator:
             # 価格帯が更新されたらランダム価格も更新
             self.generate_random_prices()
             
-            # 重要な価格更新時に状態を保存（リソース節約のため確率的に）
-            if random.random() < 0.2:  # 20%の確率で保存
-                self._save_price_state()
+            # 価格計算の結果ごとに状態を保存（連続した更新はまとめて書き込まれる）
+            self._save_price_state()
             
         except Exception as e:
             self.logger.error(f"Error updating price range: {e}")
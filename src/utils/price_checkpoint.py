@@ -0,0 +1,142 @@
+"""価格状態のチェックポイント
+
+価格計算の結果ごとに基準価格・価格帯を保存する。書き込みは一時ファイル + fsync + rename で
+アトミックに行い、短い間隔の連続保存は最新の状態だけを書き出すようまとめる。
+読み込み時はチェックサムと値の整合性を検証し、不正なら呼び出し側が価格履歴から再構築する。
+"""
+import atexit
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from .logger import setup_logger
+
+CHECKPOINT_VERSION = 1
+REQUIRED_FIELDS = ('base_price', 'min_price', 'max_price')
+
+
+class PriceCheckpointer:
+    """価格状態のアトミックな保存と検証付きの読み込み"""
+
+    def __init__(self, path: str = "data/price_state.json", min_interval: float = None):
+        self.logger = setup_logger(__name__)
+        # 終了時の書き込みは作業ディレクトリが変わった後でも起こるため絶対パスで保持する
+        self.path = os.path.abspath(path)
+        # この間隔より短い連続保存はまとめて最新の状態だけを書く（秒）
+        self.min_interval = float(os.getenv('PRICE_CHECKPOINT_INTERVAL', '1.0')) if min_interval is None else min_interval
+        self._lock = threading.Lock()
+        self._pending: Optional[Dict[str, Any]] = None
+        self._timer: Optional[threading.Timer] = None
+        self._last_write = 0.0
+        self._sequence = 0
+        self.writes = 0
+        self.coalesced = 0
+        # 遅延中の状態をプロセス終了時に書き出す
+        atexit.register(self.flush)
+
+    def save(self, state: Dict[str, Any], force: bool = False):
+        """状態を保存（間隔内の保存は遅延させ、最後の状態だけを書き込む）"""
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = dict(state)
+            wait = self.min_interval - (time.monotonic() - self._last_write)
+            if force or wait <= 0:
+                self._write_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """保留中の状態があれば書き込む"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending is not None:
+                self._write_pending()
+
+    def _write_pending(self):
+        state, self._pending = self._pending, None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        try:
+            self._sequence += 1
+            payload = dict(state)
+            payload['version'] = CHECKPOINT_VERSION
+            payload['sequence'] = self._sequence
+            payload['saved_at'] = datetime.now().isoformat()
+            payload['checksum'] = self._checksum(payload)
+            self._atomic_write(payload)
+            self._last_write = time.monotonic()
+            self.writes += 1
+        except Exception as e:
+            self.logger.error(f"価格状態のチェックポイント保存エラー: {e}")
+
+    def _atomic_write(self, payload: Dict[str, Any]):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # Windowsではディレクトリをopenできないため省略
+        if os.name == 'posix':
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _checksum(payload: Dict[str, Any]) -> str:
+        body = {k: v for k, v in payload.items() if k != 'checksum'}
+        encoded = json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """保存された状態を検証して返す（存在しない・不正ならNone）"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"価格状態ファイルを読み込めません: {e}")
+            return None
+
+        problem = self.validate(payload)
+        if problem:
+            self.logger.error(f"価格状態ファイルが不正です: {problem}")
+            return None
+        self._sequence = max(self._sequence, int(payload.get('sequence', 0)))
+        return payload
+
+    def validate(self, payload: Dict[str, Any]) -> Optional[str]:
+        """不正な点があれば理由を返す"""
+        if not isinstance(payload, dict):
+            return "形式が不正"
+        for key in REQUIRED_FIELDS:
+            if key not in payload:
+                return f"{key}がありません"
+            try:
+                value = float(payload[key])
+            except (TypeError, ValueError):
+                return f"{key}が数値ではありません"
+            if not math.isfinite(value) or value <= 0:
+                return f"{key}が範囲外です: {value}"
+        if not float(payload['min_price']) <= float(payload['base_price']) <= float(payload['max_price']):
+            return "基準価格が価格帯の外です"
+        # チェックサム導入前のファイルはチェックサムなしで受け入れる
+        if 'checksum' in payload and payload['checksum'] != self._checksum(payload):
+            return "チェックサムが一致しません"
+        return None
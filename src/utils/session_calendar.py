@@ -0,0 +1,221 @@
+"""取引セッションのカレンダー
+
+日付ごとのセッション境界（開始・終了時刻）を一度だけ計算してキャッシュし、
+現在のセッション・次のイベントの判定は境界の二分探索で答える。
+セッションの切り替わりは subscribe() で登録したコールバックに watch() から通知する（ポーリング不要）。
+
+環境変数:
+    TRADING_SESSIONS  取引セッション（開始-終了のカンマ区切り）例: 09:00-11:30,12:30-15:30
+    TRADING_HOLIDAYS  休場日（カンマ区切り）例: 2025-01-01,2025-01-02
+"""
+import asyncio
+import inspect
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from .clock import JST, get_clock
+from .logger import setup_logger
+
+
+@dataclass(frozen=True)
+class TradingSession:
+    """1つの取引セッション"""
+    key: str  # morning / afternoon / session3 ...
+    name: str  # 表示名（前場 / 後場）
+    start: time
+    end: time
+
+
+@dataclass(frozen=True)
+class SessionTransition:
+    """セッションの開始・終了イベント"""
+    event: str  # morning_start / morning_end など（TradingHours.get_next_event と同じ識別子）
+    session: TradingSession
+    at: datetime  # 日本時間（タイムゾーン付き）
+
+    @property
+    def is_start(self) -> bool:
+        return self.event.endswith('_start')
+
+
+# 既定の取引時間: 前場 9:00-11:30、後場 12:30-15:30
+DEFAULT_SESSIONS = (
+    TradingSession('morning', "前場", time(9, 0), time(11, 30)),
+    TradingSession('afternoon', "後場", time(12, 30), time(15, 30)),
+)
+_SESSION_NAMES = (('morning', "前場"), ('afternoon', "後場"))
+
+
+def parse_sessions(value: str) -> Tuple[TradingSession, ...]:
+    """"09:00-11:30,12:30-15:30" 形式のセッション設定を解析"""
+    sessions = []
+    for index, item in enumerate(filter(None, (part.strip() for part in value.split(',')))):
+        try:
+            start, end = (time.fromisoformat(part.strip()) for part in item.split('-'))
+        except ValueError:
+            raise ValueError(f"取引セッションの形式が不正です: {item}（例: 09:00-11:30）")
+        key, name = _SESSION_NAMES[index] if index < len(_SESSION_NAMES) else (f"session{index + 1}", f"第{index + 1}セッション")
+        sessions.append(TradingSession(key, name, start, end))
+    return tuple(sessions)
+
+
+def parse_holidays(value: str) -> frozenset:
+    """"2025-01-01,2025-01-02" 形式の休場日を解析"""
+    try:
+        return frozenset(date.fromisoformat(part.strip()) for part in value.split(',') if part.strip())
+    except ValueError as e:
+        raise ValueError(f"休場日の形式が不正です: {e}（例: 2025-01-01）")
+
+
+def _to_jst(when: datetime) -> datetime:
+    return JST.localize(when) if when.tzinfo is None else when.astimezone(JST)
+
+
+class SessionCalendar:
+    """取引セッションの境界を日付ごとに前計算して判定するカレンダー"""
+
+    CACHE_DAYS = 8  # キャッシュする日数
+    MAX_LOOKAHEAD_DAYS = 366  # 次のイベントを探す最大日数（休場日が続く場合）
+    MAX_SLEEP_SECONDS = 300  # watch() で一度に待つ最大秒数（時刻の変更に追従するため）
+
+    def __init__(self, sessions: Iterable[TradingSession] = None, holidays: Iterable[date] = None, clock=None):
+        self.logger = setup_logger(__name__)
+        if sessions is None:
+            sessions = parse_sessions(os.getenv('TRADING_SESSIONS', '')) or DEFAULT_SESSIONS
+        self.sessions = tuple(sorted(sessions, key=lambda s: s.start))
+        for session in self.sessions:
+            if session.start >= session.end:
+                raise ValueError(f"取引セッションの開始が終了より後です: {session.name}")
+        for previous, session in zip(self.sessions, self.sessions[1:]):
+            if session.start < previous.end:
+                raise ValueError(f"取引セッションが重なっています: {previous.name} / {session.name}")
+        self.holidays = frozenset(holidays) if holidays is not None else parse_holidays(os.getenv('TRADING_HOLIDAYS', ''))
+        self._clock = clock  # None なら呼び出し時点の get_clock() を使う
+        self._days: "OrderedDict[date, Tuple[List[datetime], List[SessionTransition]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable] = []
+
+    def now(self) -> datetime:
+        return (self._clock or get_clock()).now_jst()
+
+    def is_holiday(self, day: date) -> bool:
+        return day in self.holidays
+
+    def _day(self, day: date) -> Tuple[List[datetime], List[SessionTransition]]:
+        """その日の境界時刻（昇順）と対応するイベント"""
+        with self._lock:
+            cached = self._days.get(day)
+            if cached is not None:
+                self._days.move_to_end(day)
+                return cached
+            bounds, transitions = [], []
+            if not self.is_holiday(day):
+                for session in self.sessions:
+                    for kind, at in (('start', session.start), ('end', session.end)):
+                        moment = JST.localize(datetime.combine(day, at))
+                        bounds.append(moment)
+                        transitions.append(SessionTransition(f"{session.key}_{kind}", session, moment))
+            self._days[day] = (bounds, transitions)
+            if len(self._days) > self.CACHE_DAYS:
+                self._days.popitem(last=False)
+            return bounds, transitions
+
+    def transitions(self, day: date) -> List[SessionTransition]:
+        """その日のセッションイベント（休場日は空）"""
+        return list(self._day(day)[1])
+
+    # 判定
+
+    def current_session(self, now: datetime = None) -> Optional[TradingSession]:
+        """取引中のセッション（時間外は None）"""
+        now = _to_jst(now) if now is not None else self.now()
+        bounds, transitions = self._day(now.date())
+        index = bisect_right(bounds, now)
+        # 開始と終了が交互に並ぶので、奇数番目ならセッション中
+        return transitions[index - 1].session if index % 2 == 1 else None
+
+    def is_open(self, now: datetime = None) -> bool:
+        return self.current_session(now) is not None
+
+    def next_transition(self, now: datetime = None, kind: str = None) -> Optional[SessionTransition]:
+        """現在より後の最初のイベント（kind に 'start' / 'end' を指定すると種類で絞る）"""
+        now = _to_jst(now) if now is not None else self.now()
+        day = now.date()
+        for offset in range(self.MAX_LOOKAHEAD_DAYS):
+            bounds, transitions = self._day(day + timedelta(days=offset))
+            start = bisect_right(bounds, now) if offset == 0 else 0
+            for transition in transitions[start:]:
+                if kind is None or transition.event.endswith(f"_{kind}"):
+                    return transition
+        return None
+
+    def transitions_between(self, start: datetime, end: datetime) -> List[SessionTransition]:
+        """start 以上 end 以下のイベント"""
+        start, end = _to_jst(start), _to_jst(end)
+        result = []
+        day = start.date()
+        while day <= end.date():
+            bounds, transitions = self._day(day)
+            result.extend(transitions[bisect_left(bounds, start):bisect_right(bounds, end)])
+            day += timedelta(days=1)
+        return result
+
+    def near_transition(self, kind: str, session_key: str = "any", tolerance_seconds: float = 60,
+                        now: datetime = None) -> bool:
+        """指定のイベント（開始 / 終了）の前後 tolerance_seconds 秒以内か"""
+        now = _to_jst(now) if now is not None else self.now()
+        tolerance = timedelta(seconds=tolerance_seconds)
+        return any(
+            transition.event.endswith(f"_{kind}") and session_key in ("any", transition.session.key)
+            for transition in self.transitions_between(now - tolerance, now + tolerance)
+        )
+
+    def session_bounds(self, day: date, session_key: str) -> Optional[Tuple[datetime, datetime]]:
+        """その日のセッションの開始・終了時刻（休場日・未定義は None）"""
+        bounds = [t.at for t in self._day(day)[1] if t.session.key == session_key]
+        return (bounds[0], bounds[1]) if bounds else None
+
+    def session_by_name(self, name: str) -> Optional[TradingSession]:
+        return next((session for session in self.sessions if session.name == name), None)
+
+    # 購読
+
+    def subscribe(self, callback: Callable[[SessionTransition], object]) -> Callable[[], None]:
+        """セッションの切り替わりで呼ぶコールバックを登録（コルーチン関数も可）。解除関数を返す"""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback) if callback in self._subscribers else None
+
+    async def wait_for_transition(self) -> SessionTransition:
+        """次のイベントの時刻まで待ち、そのイベントを返す"""
+        while True:
+            now = self.now()
+            transition = self.next_transition(now)
+            if transition is None:
+                await asyncio.sleep(self.MAX_SLEEP_SECONDS)
+                continue
+            remaining = (transition.at - now).total_seconds()
+            if remaining > self.MAX_SLEEP_SECONDS:
+                # 長い待ちは分割し、途中で時刻が変わっても追従する
+                await asyncio.sleep(self.MAX_SLEEP_SECONDS)
+                continue
+            await asyncio.sleep(max(0.0, remaining))
+            if self.now() >= transition.at:
+                return transition
+
+    async def watch(self):
+        """セッションの切り替わりを購読者に通知し続ける"""
+        while True:
+            transition = await self.wait_for_transition()
+            self.logger.info(f"取引セッションの切り替わり: {transition.event} ({transition.at:%Y-%m-%d %H:%M})")
+            for callback in list(self._subscribers):
+                try:
+                    result = callback(transition)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    self.logger.error(f"セッション通知の処理エラー: {e}", exc_info=True)
@@ -0,0 +1,134 @@
+"""スパム検知と警告回数の管理
+
+ユーザーごとに直近のメッセージ時刻と本文ハッシュを固定長の deque で保持し、
+1件あたり O(1) で連投・同一メッセージの繰り返しを判定する。
+一定時間発言のないユーザーは最終発言順（OrderedDict）の先頭から捨てるため、
+メモリは「これまでの全ユーザー」ではなく「最近発言したユーザー」の数で頭打ちになる。
+
+環境変数:
+    SPAM_TRACKED_USERS_MAX  状態を保持するユーザー数の上限（既定10000）
+"""
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Hashable
+
+
+class _MessageWindow:
+    """1ユーザー分の直近メッセージ"""
+    __slots__ = ('times', 'hashes', 'counts', 'last_seen')
+
+    def __init__(self, size: int):
+        self.times = deque(maxlen=size)
+        self.hashes = deque(maxlen=size)
+        self.counts: Dict[int, int] = {}  # ウィンドウ内の本文ハッシュごとの件数
+        self.last_seen = 0.0
+
+
+def _max_users() -> int:
+    return int(os.getenv('SPAM_TRACKED_USERS_MAX', '10000'))
+
+
+def _evict(entries: "OrderedDict", cutoff: float, max_users: int):
+    """最終発言が cutoff より前のユーザーと、上限を超えた古いユーザーを捨てる"""
+    while entries:
+        _, oldest = next(iter(entries.items()))
+        if oldest.last_seen >= cutoff and len(entries) <= max_users:
+            break
+        entries.popitem(last=False)
+
+
+class SpamGuard:
+    """直近 window 件のメッセージによる連投・重複検知"""
+
+    def __init__(self, window: int = 5, burst_seconds: float = 5, duplicate_limit: int = 3,
+                 history_seconds: float = 60, max_users: int = None, clock: Callable[[], float] = time.monotonic):
+        self.window = window  # 判定に使う直近の件数
+        self.burst_seconds = burst_seconds  # window 件がこの秒数以内なら連投
+        self.duplicate_limit = duplicate_limit  # 同一メッセージがこの件数以上なら重複
+        self.history_seconds = history_seconds  # これより古いメッセージは判定に使わない
+        self.max_users = _max_users() if max_users is None else max_users
+        self._clock = clock
+        self._users: "OrderedDict[Hashable, _MessageWindow]" = OrderedDict()
+
+    def observe(self, user_id: Hashable, content: str, now: float = None) -> bool:
+        """メッセージを記録し、スパムなら True"""
+        now = self._clock() if now is None else now
+        state = self._users.pop(user_id, None)
+        if state is None:
+            state = _MessageWindow(self.window)
+        self._users[user_id] = state
+        state.last_seen = now
+
+        # 満杯なら押し出される最古のメッセージの件数を減らす
+        if len(state.hashes) == self.window:
+            dropped = state.hashes[0]
+            remaining = state.counts[dropped] - 1
+            if remaining:
+                state.counts[dropped] = remaining
+            else:
+                del state.counts[dropped]
+        digest = hash(content)
+        state.hashes.append(digest)
+        state.times.append(now)
+        state.counts[digest] = state.counts.get(digest, 0) + 1
+
+        _evict(self._users, now - self.history_seconds, self.max_users)
+        return self._is_spam(state, now)
+
+    def _is_spam(self, state: _MessageWindow, now: float) -> bool:
+        # 直近 window 件がすべて判定期間内にあるときだけ判定する
+        if len(state.times) < self.window or state.times[0] < now - self.history_seconds:
+            return False
+        # 最初のメッセージと同じ本文が duplicate_limit 件以上
+        if state.counts[state.hashes[0]] >= self.duplicate_limit:
+            return True
+        return state.times[-1] - state.times[0] <= self.burst_seconds
+
+    def forget(self, user_id: Hashable):
+        self._users.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+class _WarningState:
+    __slots__ = ('count', 'last_seen')
+
+    def __init__(self):
+        self.count = 0
+        self.last_seen = 0.0
+
+
+class WarningCounter:
+    """ユーザーごとの警告回数（最後の警告から reset_seconds 経過でリセット）"""
+
+    def __init__(self, reset_seconds: float = 600, max_users: int = None, clock: Callable[[], float] = time.monotonic):
+        self.reset_seconds = reset_seconds
+        self.max_users = _max_users() if max_users is None else max_users
+        self._clock = clock
+        self._users: "OrderedDict[Hashable, _WarningState]" = OrderedDict()
+
+    def add(self, user_id: Hashable, now: float = None) -> int:
+        """警告を1回加算し、現在の回数を返す"""
+        now = self._clock() if now is None else now
+        # 期限切れのユーザーは先に捨てるので、残っていれば期間内の警告
+        _evict(self._users, now - self.reset_seconds, self.max_users)
+        state = self._users.pop(user_id, None) or _WarningState()
+        self._users[user_id] = state
+        state.count += 1
+        state.last_seen = now
+        return state.count
+
+    def get(self, user_id: Hashable, now: float = None) -> int:
+        now = self._clock() if now is None else now
+        state = self._users.get(user_id)
+        if state is None or state.last_seen < now - self.reset_seconds:
+            return 0
+        return state.count
+
+    def reset(self, user_id: Hashable):
+        self._users.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._users)
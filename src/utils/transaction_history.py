@@ -0,0 +1,191 @@
+"""ウォレットごとの取引履歴のページングと件数キャッシュ
+
+/history のページは (timestamp, id) の降順でキーセットページングする。
+from_address / to_address それぞれの複合インデックスを使う2つの検索を UNION ALL し、
+前ページ最後の行より古いものだけを読むため、何ページ目でも1ページ分のコストで済む。
+全件数はアドレスごとにLRUで保持し、取引の書き込み（ORMのコミット）時に加算する。
+加算するのは一番外側のトランザクションのコミット時だけで、巻き戻した SAVEPOINT の分は含めない。
+Core の一括 INSERT（シミュレーターの投入など）は反映されないため、その後は invalidate() する。
+
+環境変数:
+    HISTORY_COUNT_CACHE_SIZE  件数を保持するアドレス数の上限（既定10000）
+"""
+import os
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, event, func, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from ..database.models import Transaction
+
+# ページの境界（そのページ最後の行の timestamp, id）
+HistoryCursor = Tuple[datetime, int]
+
+
+def _sent_filter(address: str):
+    return Transaction.from_address == address
+
+
+def _received_filter(address: str):
+    # 自分宛ての送金は送信側で数えるので受信側からは除く
+    return and_(
+        Transaction.to_address == address,
+        or_(Transaction.from_address != address, Transaction.from_address.is_(None)),
+    )
+
+
+def _before(cursor: Optional[HistoryCursor]):
+    if cursor is None:
+        return None
+    timestamp, tx_id = cursor
+    return or_(
+        Transaction.timestamp < timestamp,
+        and_(Transaction.timestamp == timestamp, Transaction.id < tx_id),
+    )
+
+
+def history_page(db: Session, address: str, limit: int, before: HistoryCursor = None,
+                 offset: int = 0) -> List[Transaction]:
+    """address の取引を新しい順に limit 件取得
+
+    before を渡すとその行より古いものから読む（キーセット）。
+    before が分からない深いページに直接飛ぶ場合だけ offset を使う。
+    """
+    newest_first = (Transaction.timestamp.desc(), Transaction.id.desc())
+    branches = []
+    for condition in (_sent_filter(address), _received_filter(address)):
+        query = select(Transaction.id, Transaction.timestamp).where(condition)
+        boundary = _before(before)
+        if boundary is not None:
+            query = query.where(boundary)
+        # 各インデックスから必要な件数だけ読む
+        branches.append(select(query.order_by(*newest_first).limit(offset + limit).subquery()))
+    merged = union_all(*branches).subquery()
+
+    return db.query(Transaction)\
+        .join(merged, Transaction.id == merged.c.id)\
+        .order_by(merged.c.timestamp.desc(), merged.c.id.desc())\
+        .offset(offset)\
+        .limit(limit)\
+        .all()
+
+
+def page_cursor(transactions: List[Transaction]) -> Optional[HistoryCursor]:
+    """次ページの起点（ページ最後の行）"""
+    if not transactions:
+        return None
+    last = transactions[-1]
+    return last.timestamp, last.id
+
+
+class TransactionCountCache:
+    """アドレスごとの取引件数のLRUキャッシュ"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = int(os.getenv('HISTORY_COUNT_CACHE_SIZE', '10000')) if max_entries is None else max_entries
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, address: str) -> int:
+        """取引件数（キャッシュになければインデックスで数える）"""
+        with self._lock:
+            count = self._counts.get(address)
+            if count is not None:
+                self._counts.move_to_end(address)
+                self.hits += 1
+                return count
+            self.misses += 1
+
+        count = sum(
+            db.query(func.count(Transaction.id)).filter(condition).scalar() or 0
+            for condition in (_sent_filter(address), _received_filter(address))
+        )
+        with self._lock:
+            self._counts[address] = count
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def apply(self, deltas: Counter):
+        """コミットされた増減を保持中のアドレスにだけ反映"""
+        with self._lock:
+            for address, delta in deltas.items():
+                if address in self._counts:
+                    self._counts[address] += delta
+
+    def invalidate(self, address: str = None):
+        """指定アドレス（省略時はすべて）の件数を破棄"""
+        with self._lock:
+            if address is None:
+                self._counts.clear()
+            else:
+                self._counts.pop(address, None)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+# プロセス全体で共有するキャッシュ
+transaction_counts = TransactionCountCache()
+
+_PENDING_KEY = 'transaction_count_deltas'
+_SAVEPOINTS_KEY = 'transaction_count_savepoints'
+
+
+def _addresses(tx: Transaction):
+    addresses = {tx.from_address, tx.to_address}
+    addresses.discard(None)
+    return addresses
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_transaction_writes(session, flush_context):
+    """フラッシュされた取引の増減を一番外側のコミットまで保留する"""
+    deltas = None
+    for instances, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in instances:
+            if isinstance(obj, Transaction):
+                deltas = deltas if deltas is not None else session.info.setdefault(_PENDING_KEY, Counter())
+                for address in _addresses(obj):
+                    deltas[address] += sign
+
+
+@event.listens_for(Session, 'after_transaction_create')
+def _mark_savepoint(session, transaction):
+    """SAVEPOINT の開始時点の保留分を覚えておく（巻き戻したらそこまで戻す）"""
+    if transaction.nested:
+        session.info.setdefault(_SAVEPOINTS_KEY, {})[transaction] = Counter(session.info.get(_PENDING_KEY, ()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_transaction_writes(session):
+    # after_commit は SAVEPOINT の解放でも呼ばれるので、そのときは外側のコミットまで保留したままにする
+    if session.in_nested_transaction():
+        session.info.get(_SAVEPOINTS_KEY, {}).pop(session.get_nested_transaction(), None)
+        return
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        transaction_counts.apply(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_transaction_writes(session):
+    if session.in_nested_transaction():
+        snapshot = session.info.get(_SAVEPOINTS_KEY, {}).pop(session.get_nested_transaction(), None)
+        if snapshot is not None:
+            session.info[_PENDING_KEY] = snapshot
+            return
+    session.info.pop(_PENDING_KEY, None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_transaction_writes(session, transaction):
+    # 一番外側のトランザクションが終わったら、反映しなかった分も含めて片付ける
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+        session.info.pop(_SAVEPOINTS_KEY, None)
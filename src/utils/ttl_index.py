@@ -0,0 +1,125 @@
+"""有効期限付きのキー索引
+
+キーごとの有効期限をヒープで管理し、期限切れの削除をO(log n)で行う。
+件数の上限を超えた場合は期限の近いものから捨てるため、長期稼働でもメモリが増え続けない。
+"""
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+class TTLIndex:
+    """ヒープ順の有効期限付きキー集合（値も保持できる）"""
+
+    def __init__(self, ttl: float, max_size: int = 100_000, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.RLock()
+        # key -> (期限, 値, 世代)
+        self._entries: Dict[Hashable, Tuple[float, Any, int]] = {}
+        # (期限, 世代, key)。更新・削除で古くなった要素は世代の不一致で読み飛ばす
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._generation = itertools.count()
+        self.expired_count = 0
+        self.evicted_count = 0
+
+    def add(self, key: Hashable, value: Any = None, ttl: float = None, now: float = None):
+        """キーを追加（既存なら期限と値を更新）"""
+        now = self._clock() if now is None else now
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            generation = next(self._generation)
+            self._entries[key] = (expires_at, value, generation)
+            heapq.heappush(self._heap, (expires_at, generation, key))
+            while len(self._entries) > self.max_size:
+                self._pop_earliest()
+                self.evicted_count += 1
+            self._maybe_compact()
+
+    def get(self, key: Hashable, default: Any = None, now: float = None) -> Any:
+        """有効なキーの値を取得"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                return default
+            return entry[1]
+
+    def discard(self, key: Hashable):
+        """キーを削除（ヒープ側は期限切れ処理で読み飛ばす）"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def expire(self, now: float = None, budget: Optional[int] = None) -> int:
+        """期限切れのキーを削除し、削除件数を返す（budgetで1回あたりの処理件数を制限）"""
+        now = self._clock() if now is None else now
+        removed = 0
+        processed = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                if budget is not None and processed >= budget:
+                    break
+                expires_at, generation, key = heapq.heappop(self._heap)
+                processed += 1
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] == generation:
+                    del self._entries[key]
+                    removed += 1
+            self.expired_count += removed
+        return removed
+
+    def _pop_earliest(self):
+        """期限が最も近い有効なキーを捨てる"""
+        while self._heap:
+            _, generation, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == generation:
+                del self._entries[key]
+                return
+
+    def _maybe_compact(self):
+        """古い要素がヒープの大半を占めたら作り直す"""
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = [(entry[0], entry[2], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys())
+
+    def keys(self) -> List[Hashable]:
+        """有効なキーの一覧"""
+        now = self._clock()
+        with self._lock:
+            return [key for key, entry in self._entries.items() if entry[0] > now]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """有効なキーと値の一覧"""
+        now = self._clock()
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items() if entry[0] > now]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._heap.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """件数と累計の削除数"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'heap_size': len(self._heap),
+                'max_size': self.max_size,
+                'expired': self.expired_count,
+                'evicted': self.evicted_count,
+            }
@@ -1,8 +1,11 @@
 import discord
 from discord import Embed
 from ..database.database import SessionLocal
-from ..database.models import Company, User, CompanyMember, CompanyShare, CompanyTransaction,  CompanyEventParticipant, CompanyEvent
+from ..database.models import Company, CompanyMember, CompanyShare, CompanyTransaction,  CompanyEventParticipant, CompanyEvent
 from ..utils.embed_builder import EmbedBuilder
+from ..utils.identity_cache import identity_cache
+from ..database import ledger
+from ..database.ledger import Posting
 from sqlalchemy.orm import Session
 from ..utils.config import Config
 import math
@@ -148,12 +151,13 @@ class DividendApprovalView(discord.ui.View):
             .all()
 
         # 配当金を分配
+        postings = []
         for share in shares:
             dividend_amount = self.amount * (share.share_percentage / 100)
             
             # ユーザーのウォレットに配当金を追加
             user = share.user
-            user.wallet.parc_balance += dividend_amount
+            postings.append(Posting(user.wallet.address, parc=dividend_amount))
 
             # トランザクション記録
             tx = CompanyTransaction(
@@ -163,6 +167,7 @@ class DividendApprovalView(discord.ui.View):
                 description=f"Dividend payment to {user.discord_id}"
             )
             db.add(tx)
+        ledger.apply(db, postings)
 
         # 会社の資産から配当金を差し引く
         company.total_assets -= self.amount
@@ -278,11 +283,11 @@ class EventParticipationView(discord.ui.View):
                 return
 
             # 参加者の確認
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
+            user = identity_cache.lookup(db, str(interaction.user.id))
             existing = db.query(CompanyEventParticipant)\
                 .filter(
                     CompanyEventParticipant.event_id == self.event_id,
-                    CompanyEventParticipant.user_id == user.id
+                    CompanyEventParticipant.user_id == user.user_id
                 ).first()
 
             if existing:
@@ -294,7 +299,7 @@ class EventParticipationView(discord.ui.View):
             # 参加登録
             participant = CompanyEventParticipant(
                 event_id=self.event_id,
-                user_id=user.id
+                user_id=user.user_id
             )
             db.add(participant)
             db.commit()
@@ -335,11 +340,11 @@ class EventParticipationView(discord.ui.View):
     async def cancel_participation(self, interaction: discord.Interaction, button: discord.ui.Button):
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.discord_id == str(interaction.user.id)).first()
+            user = identity_cache.lookup(db, str(interaction.user.id))
             participant = db.query(CompanyEventParticipant)\
                 .filter(
                     CompanyEventParticipant.event_id == self.event_id,
-                    CompanyEventParticipant.user_id == user.id
+                    CompanyEventParticipant.user_id == user.user_id
                 ).first()
 
             if not participant:
@@ -1,7 +1,8 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import base64
+import hmac
 import os
 import logging
 import asyncio
@@ -9,7 +10,7 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 from sqlalchemy import func
-from ..database.database import SessionLocal
+from ..database.database import SessionLocal, get_pool_stats, get_db_executor_stats
 from ..database.models import PriceHistory, Transaction
 from ..utils.chart_builder import ChartBuilder
 import matplotlib.pyplot as plt
@@ -237,6 +238,27 @@ async def get_latest_market_data():
     # データがない場合は従来のエンドポイントにリダイレクト
     return await get_market_data()
 
+# 内部向けAPIは INTERNAL_API_TOKEN が設定されたときだけ公開し、X-Internal-Token ヘッダーで照合する
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+async def get_db_pool_stats(x_internal_token: Optional[str] = Header(None)):
+    """このプロセスのDB接続プール計測値を取得するAPIエンドポイント"""
+    if not x_internal_token or not hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN):
+        return JSONResponse(
+            status_code=401,
+            content={"success": False, "error": "認証に失敗しました"}
+        )
+    return {
+        "success": True,
+        "data": {
+            "pool": get_pool_stats(),
+            "executor": get_db_executor_stats()
+        }
+    }
+
+if INTERNAL_API_TOKEN:
+    app.add_api_route("/api/internal/db-pool", get_db_pool_stats, methods=["GET"])
+
 # WebSocketサーバーを開始する関数
 async def start_server(host="0.0.0.0", port=8000):
     """FastAPI WebSocketサーバーを開始"""